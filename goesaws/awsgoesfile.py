@@ -1,18 +1,34 @@
 import os
 import re
 
-from datetime import datetime
+from datetime import datetime, timedelta
+
+import chunkindex
+from hdf5header import HDF5Header, RangeReader
+
+
+# Matches the start, end, & creation timestamps embedded in GOES-R series
+# filenames. Ex: _s20192181500281_e20192181500352_c20192181500415
+_fname_time_re = re.compile(r'_s(\d{13})(\d)_e(\d{13})(\d)_c(\d{13})(\d)')
+
+# Matches the platform ID in GOES-R series filenames. Ex: _G16_
+_fname_sat_re = re.compile(r'_G(\d{2})_s\d')
+
 
 
 class AwsGoesFile(object):
 
-    def __init__(self, key, shortfname, scan_time):
+    def __init__(self, key, shortfname, scan_time, satellite=None, size=None):
         super(AwsGoesFile, self).__init__()
         self.key = key
         self.shortfname = shortfname
         self.scan_time = scan_time
+        self.satellite = satellite
+        self.size = size
         self.awspath = None
         self.filename = None
+        self.start_time = None
+        self.end_time = None
         if self.key is not None:
             self._parse_key()
 
@@ -20,6 +36,76 @@ class AwsGoesFile(object):
 
     def _parse_key(self):
         self.awspath, self.filename = os.path.split(self.key)
+        self.start_time, self.end_time = _parse_fname_times(self.filename)
+        if (self.satellite is None):
+            match = _fname_sat_re.search(self.filename)
+            if (match is not None):
+                self.satellite = 'goes{}'.format(match.group(1))
+
+
+
+    def read_header(self, conn, satellite=None, initial_size=65536):
+        """
+        Reads the netCDF4 (HDF5) header of the file with ranged GETs, without
+        downloading the file. The first request reads 'initial_size' bytes and
+        each further request, made only if the header extends past the bytes
+        read so far, is twice as large as the previous one
+
+        Parameters
+        ----------
+        conn : GoesAWSInterface
+            Connection whose S3 client is used
+        satellite : str, optional
+            Only used if the file isn't tagged with its satellite. Default: None
+        initial_size : int, optional
+            Size of the first request in bytes. Default: 64 KB
+
+        Returns
+        -------
+        header : HDF5Header
+            'attrs' holds the global attributes, 'dimensions' & 'variables'
+            are read on first access
+        """
+        if (self.satellite is not None):
+            satellite = self.satellite
+
+        fetch = lambda start, end: conn._get_object_range(satellite, self.key, start, end)
+
+        return HDF5Header(RangeReader(fetch, size=self.size, initial_size=initial_size))
+
+
+
+    def read_variable(self, conn, name, window=None, cachedir=None, satellite=None, threads=8,
+            mask_and_scale=False):
+        """
+        Reads a window of a variable with ranged GETs of only the chunks it
+        overlaps. The chunk references of the file are cached in 'cachedir'
+
+        Parameters
+        ----------
+        conn : GoesAWSInterface
+        name : str
+            Variable name. Ex: 'CMI'
+        window : tuple of slice, optional
+            One slice per dimension. Default: None (the whole variable)
+        cachedir : str, optional
+            Directory the chunk references are cached in. Default: None
+        satellite : str, optional
+            Only used if the file isn't tagged with its satellite. Default: None
+        threads : int, optional
+            Number of concurrent ranged GETs. Default: 8
+        mask_and_scale : bool, optional
+            Apply scale_factor & add_offset and replace fill values with NaN.
+            Default: False
+
+        Returns
+        -------
+        numpy array
+        """
+        index = chunkindex.get_chunk_index(conn, self, cachedir=cachedir, satellite=satellite)
+
+        return index.read(conn, name, window=window, threads=threads,
+                          mask_and_scale=mask_and_scale)
 
 
 
@@ -38,3 +124,33 @@ class AwsGoesFile(object):
 
     def __repr__(self):
         return '<AwsGoesFile object - {}>'.format(self.shortfname)
+
+
+
+def _parse_fname_times(fname):
+    """
+    Parses the scan start & end times out of a GOES-R series filename
+
+    Parameters
+    ----------
+    fname : str
+        Filename, with or without the AWS prefix.
+        Ex: OR_GLM-L2-LCFA_G16_s20192441600000_e20192441600200_c20192441600227.nc
+
+    Returns
+    -------
+    tuple of (datetime, datetime)
+        Scan start & end times, to the tenth of a second. (None, None) if the
+        filename does not contain the timestamps
+    """
+    match = _fname_time_re.search(fname)
+
+    if (match is None):
+        return None, None
+
+    start = datetime.strptime(match.group(1), '%Y%j%H%M%S')
+    start += timedelta(milliseconds=100 * int(match.group(2)))
+    end = datetime.strptime(match.group(3), '%Y%j%H%M%S')
+    end += timedelta(milliseconds=100 * int(match.group(4)))
+
+    return start, end
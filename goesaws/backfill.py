@@ -0,0 +1,363 @@
+"""
+Author: Matt Nicholson
+
+Checkpointed runner for long range downloads (backfills).
+
+Everything a backfill does is recorded in an append-only SQLite journal: the
+hours it plans to cover, the files each hour listing returned, and every file
+that finished downloading. When a crashed or interrupted backfill is started
+again with the same journal it resumes where it stopped. Hours that were
+already listed & closed are not listed again, and files already journaled as
+complete are not checked or downloaded again.
+
+The journal can be opened by another process while the backfill runs to check
+its progress & ETA.
+
+Example
+-------
+> python goesaws.py --backfill 'backfill.db' --start '06-01-2019-00:00' --end '09-01-2019-00:00' -p 'CMIP' --sector 'C' --chan '13' -dl -o 'path/to/download'
+> python goesaws.py --backfill 'backfill.db' --progress
+"""
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import concurrent.futures
+
+from awsgoesfile import AwsGoesFile
+from goesawsinterface import HOUR_SETTLE_TIME
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    params TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hours (
+    satellite TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    PRIMARY KEY (satellite, hour)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    satellite TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    closed INTEGER NOT NULL,
+    listed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY,
+    satellite TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    size INTEGER,
+    scan_time TEXT,
+    shortfname TEXT,
+    in_range INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS completed (
+    key TEXT PRIMARY KEY,
+    filepath TEXT NOT NULL,
+    completed REAL NOT NULL
+);
+"""
+
+
+
+class BackfillJournal(object):
+    """
+    Append-only SQLite journal of a backfill's state
+
+    Parameters
+    ----------
+    path : str
+        Path of the SQLite database. Created if it doesn't exist
+    """
+
+    def __init__(self, path):
+        super(BackfillJournal, self).__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        # WAL lets progress() be called from another process mid-run
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+
+
+    def close(self):
+        self._conn.close()
+
+
+
+    def set_params(self, params):
+        """
+        Records the backfill's query parameters, or checks them against the ones
+        already recorded so a journal isn't resumed with a different query
+        """
+        row = self._conn.execute('SELECT params FROM job WHERE id = 0').fetchone()
+        encoded = json.dumps(params, sort_keys=True)
+
+        if (row is None):
+            self._conn.execute('INSERT INTO job (id, params) VALUES (0, ?)', (encoded,))
+            self._conn.commit()
+        elif (row[0] != encoded):
+            raise ValueError('Journal {} belongs to a different backfill: {}'.format(self.path,
+                                                                                   row[0]))
+
+
+
+    def get_params(self):
+        row = self._conn.execute('SELECT params FROM job WHERE id = 0').fetchone()
+        if (row is None):
+            return None
+        return json.loads(row[0])
+
+
+
+    def start_run(self):
+        self._conn.execute('INSERT INTO runs (started) VALUES (?)', (time.time(),))
+        self._conn.commit()
+
+
+
+    def plan_hours(self, satellite, hours):
+        self._conn.executemany('INSERT OR IGNORE INTO hours (satellite, hour) VALUES (?, ?)',
+                               [(satellite, _format_hour(x)) for x in hours])
+        self._conn.commit()
+
+
+
+    def get_closed_hours(self):
+        """
+        Returns
+        -------
+        set of (str, str)
+            (satellite, hour) of every hour whose final listing is journaled
+        """
+        rows = self._conn.execute('SELECT DISTINCT satellite, hour FROM listings WHERE closed = 1')
+        return set(rows.fetchall())
+
+
+
+    def record_listing(self, satellite, hour, awsgoesfiles, closed):
+        hour = _format_hour(hour)
+        self._conn.executemany('INSERT OR IGNORE INTO files (key, satellite, hour, size, scan_time, '
+                               'shortfname) VALUES (?, ?, ?, ?, ?, ?)',
+                               [(x.key, satellite, hour, x.size, x.scan_time, x.shortfname)
+                                for x in awsgoesfiles])
+        self._conn.execute('INSERT INTO listings (satellite, hour, closed, listed) VALUES (?, ?, ?, ?)',
+                           (satellite, hour, int(closed), time.time()))
+        self._conn.commit()
+
+
+
+    def mark_in_range(self, awsgoesfiles):
+        """
+        Flags the journaled files that lie in the backfill's range. Hour
+        listings are journaled whole, but the range rarely starts & ends on
+        the hour, so only these files count towards the progress
+        """
+        self._conn.executemany('UPDATE files SET in_range = 1 WHERE key = ?',
+                               [(x.key,) for x in awsgoesfiles])
+        self._conn.commit()
+
+
+
+    def get_files(self):
+        """
+        Returns
+        -------
+        list of AwsGoesFile objects
+            Every file journaled by an hour listing
+        """
+        rows = self._conn.execute('SELECT key, shortfname, scan_time, satellite, size FROM files')
+        return [AwsGoesFile(key, shortfname, scan_time, satellite=satellite, size=size)
+                for key, shortfname, scan_time, satellite, size in rows.fetchall()]
+
+
+
+    def get_completed(self):
+        """
+        Returns
+        -------
+        set of str
+            Keys of every file journaled as downloaded
+        """
+        return set(x[0] for x in self._conn.execute('SELECT key FROM completed').fetchall())
+
+
+
+    def record_completed(self, localgoesfile):
+        self._conn.execute('INSERT OR IGNORE INTO completed (key, filepath, completed) VALUES (?, ?, ?)',
+                           (localgoesfile.key, localgoesfile.filepath, time.time()))
+        self._conn.commit()
+
+
+
+    def progress(self):
+        """
+        Summarizes the backfill's progress. Only the files in the range are
+        counted, see mark_in_range()
+
+        Returns
+        -------
+        dict
+            'hours_planned', 'hours_listed', 'files_total', 'files_completed',
+            'bytes_total', 'bytes_completed', 'bytes_per_sec' (download rate
+            of the current run), & 'eta_sec' (None until a rate is known)
+        """
+        q = self._conn.execute
+        hours_planned = q('SELECT COUNT(*) FROM hours').fetchone()[0]
+        hours_listed = q('SELECT COUNT(DISTINCT satellite || hour) FROM listings').fetchone()[0]
+        files_total, bytes_total = q('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files '
+                                     'WHERE in_range = 1').fetchone()
+        files_completed, bytes_completed = q('SELECT COUNT(*), COALESCE(SUM(f.size), 0) FROM completed c '
+                                             'JOIN files f ON f.key = c.key '
+                                             'WHERE f.in_range = 1').fetchone()
+
+        run_started = q('SELECT MAX(started) FROM runs').fetchone()[0]
+        bytes_per_sec = None
+        eta_sec = None
+
+        if (run_started is not None):
+            run_bytes = q('SELECT COALESCE(SUM(f.size), 0) FROM completed c JOIN files f '
+                          'ON f.key = c.key WHERE c.completed >= ?', (run_started,)).fetchone()[0]
+            elapsed = time.time() - run_started
+            if (run_bytes > 0 and elapsed > 0):
+                bytes_per_sec = run_bytes / elapsed
+                eta_sec = (bytes_total - bytes_completed) / bytes_per_sec
+
+        return {'hours_planned': hours_planned,
+                'hours_listed': hours_listed,
+                'files_total': files_total,
+                'files_completed': files_completed,
+                'bytes_total': bytes_total,
+                'bytes_completed': bytes_completed,
+                'bytes_per_sec': bytes_per_sec,
+                'eta_sec': eta_sec}
+
+
+
+class BackfillRunner(object):
+    """
+    Runs a get_avail_images_in_range + download() job against a journal
+
+    >>> runner = BackfillRunner(conn, 'backfill.db')
+    >>> results = runner.run('goes16', 'abi', '06-01-2019-00:00', '09-01-2019-00:00',
+    >>>                      'path/to/download', product='CMIP', sector='C', channel='13')
+    """
+
+    def __init__(self, conn, journal_path):
+        super(BackfillRunner, self).__init__()
+        self.conn = conn
+        self.journal = BackfillJournal(journal_path)
+
+
+
+    def run(self, satellite, sensor, start, end, basepath, product=None, sector=None,
+            channel=None, keep_aws_folders=False, threads=6):
+        """
+        Lists & downloads every file in the range, resuming from the journal
+
+        Parameters
+        ----------
+        satellite : str or list of str
+        sensor : str
+            Valid: 'abi' & 'glm'
+        start : str
+            Format: MM-DD-YYYY-HH:MM
+        end : str
+            Format: MM-DD-YYYY-HH:MM
+        basepath : str
+            Path to download the data files to
+        product : str, optional
+        sector : str, optional
+        channel : str, optional
+        keep_aws_folders : bool, optional
+            Passed through to download(). Default is False
+        threads : int, optional
+            Number of threads used to list & download. Default is 6
+
+        Returns
+        -------
+        downloadresults : DownloadResults
+            Results of the files downloaded by this run
+        """
+        if (not isinstance(satellite, (list, tuple))):
+            satellite = [satellite]
+
+        self.journal.set_params({'satellite': list(satellite), 'sensor': sensor, 'start': start,
+                                 'end': end, 'product': product, 'sector': sector,
+                                 'channel': channel})
+        self.journal.start_run()
+
+        start_dt = datetime.strptime(start, '%m-%d-%Y-%H:%M')
+        end_dt = datetime.strptime(end, '%m-%d-%Y-%H:%M')
+        if (sensor == 'glm'):
+            # The three GLM files for the end minute begin after 'end_dt'
+            hours = list(self.conn._hour_range(start_dt, end_dt + timedelta(minutes=1)))
+        else:
+            hours = list(self.conn._hour_range(start_dt, end_dt))
+
+        for sat in satellite:
+            self.journal.plan_hours(sat, hours)
+
+        self._list_hours(satellite, sensor, hours, product, sector, channel, threads)
+
+        # Range filtering needs the files in listing order, one satellite at a time
+        journaled = sorted(self.journal.get_files(), key=lambda x: (x.satellite, x.key))
+        completed = self.journal.get_completed()
+        in_range = []
+
+        for sat in satellite:
+            sat_files = [x for x in journaled if x.satellite == sat]
+            in_range.extend(self.conn._filter_images_in_range(sat_files, sensor, start_dt, end_dt))
+
+        self.journal.mark_in_range(in_range)
+        pending = [x for x in in_range if x.key not in completed]
+
+        print('Backfill: {} files in range, {} already completed'.format(
+              len(pending) + len(completed), len(completed)))
+
+        return self.conn.download(None, pending, basepath, keep_aws_folders=keep_aws_folders,
+                                  threads=threads, callback=self.journal.record_completed)
+
+
+
+    def progress(self):
+        return self.journal.progress()
+
+
+
+    def close(self):
+        self.journal.close()
+
+
+
+    def _list_hours(self, satellites, sensor, hours, product, sector, channel, threads):
+        """
+        Lists every planned hour that doesn't have a closed listing in the
+        journal yet, journaling the results as each listing completes
+        """
+        closed_hours = self.journal.get_closed_hours()
+        settled = datetime.utcnow() - HOUR_SETTLE_TIME
+        to_list = [(sat, hour) for sat in satellites for hour in hours
+                   if (sat, _format_hour(hour)) not in closed_hours]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            future_listing = {executor.submit(self.conn._get_avail_images_safe, sat, sensor, hour,
+                                              product, sector, channel): (sat, hour)
+                              for sat, hour in to_list}
+
+            for future in concurrent.futures.as_completed(future_listing):
+                sat, hour = future_listing[future]
+                closed = (hour + timedelta(hours=1) <= settled)
+                self.journal.record_listing(sat, hour, future.result(), closed)
+
+
+
+def _format_hour(hour):
+    return hour.strftime('%Y-%m-%dT%H')
@@ -0,0 +1,170 @@
+"""
+Author: Matt Nicholson
+
+Conversion of ABI L1b radiances to reflectance & brightness temperature.
+
+Bands 1 - 6 are converted to reflectance factor with the 'kappa0' variable
+of the file, & bands 7 - 16 to brightness temperature (K) with the Planck
+function coefficients ('planck_fk1', 'planck_fk2', 'planck_bc1', &
+'planck_bc2'), as described in the GOES-R Product User Guide:
+
+    refl = kappa0 * Rad
+    BT = (fk2 / ln(fk1 / Rad + 1) - bc1) / bc2
+
+Rad is read a block of rows at a time & converted in place in the float32
+output array, so no full size temporaries are made. Passing a memory-mapped
+output keeps the memory used to about one block.
+
+>>> bt = localgoesfile.calibrate()
+>>> paths = calibrate_files(localgoesfiles, 'path/to/npy', workers=4)
+"""
+import multiprocessing
+import os
+
+import concurrent.futures
+import numpy as np
+from netCDF4 import Dataset
+
+
+# Highest band converted to reflectance. Higher bands are emissive
+MAX_REFLECTIVE_BAND = 6
+
+PLANCK_VARS = ['planck_fk1', 'planck_fk2', 'planck_bc1', 'planck_bc2']
+
+# Rows of Rad read & converted at a time
+ROWS_PER_BLOCK = 512
+
+
+
+def read_coefficients(ds):
+    """
+    Reads the band & conversion coefficients of an L1b file
+
+    Parameters
+    ----------
+    ds : netCDF4 Dataset
+
+    Returns
+    -------
+    dict
+        'band_id' & either 'kappa0' or the Planck coefficients
+    """
+    if ('Rad' not in ds.variables or 'band_id' not in ds.variables):
+        raise ValueError('{} is not an ABI L1b radiance file'.format(ds.filepath()))
+
+    coefs = {'band_id': int(np.ravel(ds.variables['band_id'][:])[0])}
+
+    if (coefs['band_id'] <= MAX_REFLECTIVE_BAND):
+        names = ['kappa0']
+    else:
+        names = PLANCK_VARS
+
+    for name in names:
+        if (name not in ds.variables):
+            raise ValueError('{} has no {} variable'.format(ds.filepath(), name))
+        coefs[name] = float(ds.variables[name][:])
+
+    return coefs
+
+
+
+def calibrate(filepath, out=None, rows_per_block=ROWS_PER_BLOCK):
+    """
+    Converts the radiances of an L1b file to reflectance or brightness
+    temperature
+
+    Parameters
+    ----------
+    filepath : str
+    out : numpy array, optional
+        float32 array of the shape of Rad to write to, ex: a memory map.
+        Default: None (allocated)
+    rows_per_block : int, optional
+        Rows converted at a time. Default: 512
+
+    Returns
+    -------
+    numpy array
+        float32 reflectance (bands 1 - 6) or brightness temperature in K
+        (bands 7 - 16). NaN where Rad is missing
+    """
+    with Dataset(filepath, 'r') as ds:
+        coefs = read_coefficients(ds)
+        rad = ds.variables['Rad']
+
+        if (out is None):
+            out = np.empty(rad.shape, dtype=np.float32)
+        elif (out.shape != rad.shape or out.dtype != np.float32):
+            raise ValueError('out must be a float32 array of shape {}'.format(rad.shape))
+
+        for start in range(0, rad.shape[0], rows_per_block):
+            block = out[start:start + rows_per_block]
+            block[...] = np.ma.filled(rad[start:start + rows_per_block], np.nan)
+            _convert_block(block, coefs)
+
+    return out
+
+
+
+def calibrate_files(localgoesfiles, outdir, workers=None, rows_per_block=ROWS_PER_BLOCK):
+    """
+    Converts several L1b files in a process pool. Each result is written to
+    '<outdir>/<filename>.npy', so the arrays don't go through the pool
+
+    Parameters
+    ----------
+    localgoesfiles : list of LocalGoesFile objects
+    outdir : str
+    workers : int, optional
+        Number of processes. Default: None (number of CPUs)
+    rows_per_block : int, optional
+        Rows converted at a time. Default: 512
+
+    Returns
+    -------
+    paths : list of str
+        Path of the .npy file of each file, in the order of 'localgoesfiles'
+    """
+    if (not os.path.isdir(outdir)):
+        os.makedirs(outdir)
+
+    filepaths = [x.filepath for x in localgoesfiles]
+    npy_paths = [os.path.join(outdir, os.path.basename(x) + '.npy') for x in filepaths]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(_calibrate_to_npy, filepaths, npy_paths,
+                                 [rows_per_block] * len(filepaths)))
+
+
+
+def _calibrate_to_npy(filepath, npy_path, rows_per_block):
+    with Dataset(filepath, 'r') as ds:
+        shape = ds.variables['Rad'].shape
+
+    tmp_path = npy_path[:-len('.npy')] + '.tmp.npy'
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+    calibrate(filepath, out=out, rows_per_block=rows_per_block)
+    out.flush()
+    del out
+    os.replace(tmp_path, npy_path)
+
+    return npy_path
+
+
+
+def _convert_block(block, coefs):
+    """
+    Converts a block of radiances in place
+    """
+    if ('kappa0' in coefs):
+        block *= np.float32(coefs['kappa0'])
+        return
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.divide(np.float32(coefs['planck_fk1']), block, out=block)
+        block += 1
+        np.log(block, out=block)
+        np.divide(np.float32(coefs['planck_fk2']), block, out=block)
+        block -= np.float32(coefs['planck_bc1'])
+        block /= np.float32(coefs['planck_bc2'])
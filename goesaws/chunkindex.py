@@ -0,0 +1,392 @@
+"""
+Author: Matt Nicholson
+
+Byte-offset references to the HDF5 chunks of files in the AWS bucket, for
+reading a window of a variable without downloading the whole file.
+
+The index is built from the file's header & chunk B-trees, read with ranged
+GETs (see hdf5header.py), and holds the address, size, & filter mask of every
+chunk of every variable, similar to a kerchunk reference set. It is cached as
+JSON, so the metadata of a file is only read once. Reading a window then only
+fetches the chunks it overlaps, with parallel ranged GETs, and decodes them
+locally (deflate, shuffle, fletcher32).
+
+>>> index = get_chunk_index(conn, awsgoesfile, cachedir='path/to/refs')
+>>> cmi = index.read(conn, 'CMI', (slice(1000, 1100), slice(2000, 2200)))
+
+or, through the AwsGoesFile:
+
+>>> cmi = awsgoesfile.read_variable(conn, 'CMI', (slice(1000, 1100), slice(2000, 2200)),
+>>>                                 cachedir='path/to/refs', mask_and_scale=True)
+"""
+import base64
+import itertools
+import json
+import os
+import threading
+import zlib
+
+import concurrent.futures
+import numpy as np
+
+from hdf5header import read_btree1_chunks
+
+
+FILTER_DEFLATE = 1
+FILTER_SHUFFLE = 2
+FILTER_FLETCHER32 = 3
+
+INDEX_VERSION = 1
+
+
+
+class ChunkIndex(object):
+    """
+    Chunk references of one file
+
+    Parameters
+    ----------
+    refs : dict
+        'key', 'satellite', 'size', & 'variables', which maps each variable
+        name to its 'shape', 'dtype', 'chunks', 'filters', 'fill_value',
+        'attrs', & 'refs' ('i.j' chunk index -> [address, size, filter mask])
+    """
+
+    def __init__(self, refs):
+        super(ChunkIndex, self).__init__()
+        self.refs = refs
+        self.key = refs['key']
+        self.satellite = refs['satellite']
+        self.variables = refs['variables']
+
+
+
+    def save(self, path):
+        # Unique per writer, since threads may index the same file at once
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.refs, f)
+        os.replace(tmp_path, path)
+
+
+
+    def read(self, conn, name, window=None, threads=8, mask_and_scale=False):
+        """
+        Reads a window of a variable, fetching only the chunks it overlaps
+
+        Parameters
+        ----------
+        conn : GoesAWSInterface
+            Connection whose S3 client is used
+        name : str
+            Variable name. Ex: 'CMI'
+        window : tuple of slice, optional
+            One slice per dimension. Default: None (the whole variable)
+        threads : int, optional
+            Number of concurrent ranged GETs. Default: 8
+        mask_and_scale : bool, optional
+            If True, the scale_factor & add_offset attributes are applied and
+            fill values are replaced with NaN, like netCDF4 does by default.
+            Default: False (the packed values are returned)
+
+        Returns
+        -------
+        numpy array
+        """
+        var = self.variables[name]
+        shape = tuple(var['shape'])
+        chunks = tuple(var['chunks'])
+        dtype = np.dtype(var['dtype'])
+
+        if (window is None):
+            window = tuple(slice(None) for _ in shape)
+        elif (not isinstance(window, tuple)):
+            window = (window,)
+
+        if (len(window) != len(shape)):
+            raise ValueError('Window must have one slice per dimension of {}'.format(name))
+
+        bounds = [w.indices(n) for w, n in zip(window, shape)]
+        starts = [b[0] for b in bounds]
+        stops = [max(b[1], b[0]) for b in bounds]
+        steps = tuple(slice(None, None, b[2]) for b in bounds)
+        if (any(b[2] < 1 for b in bounds)):
+            raise ValueError('Only positive slice steps are supported')
+
+        fill_value = var['fill_value'] if var['fill_value'] is not None else 0
+        out = np.full([stop - start for start, stop in zip(starts, stops)], fill_value,
+                      dtype=dtype)
+
+        chunk_ranges = [range(start // c, (stop - 1) // c + 1) if stop > start else range(0)
+                        for start, stop, c in zip(starts, stops, chunks)]
+        to_fetch = []
+        for chunk_pos in itertools.product(*chunk_ranges):
+            ref = var['refs'].get('.'.join(str(x) for x in chunk_pos))
+            if (ref is not None):
+                to_fetch.append((chunk_pos, ref))
+
+        fetch = lambda item: (item[0], self._fetch_chunk(conn, var, item[1]))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            for chunk_pos, chunk in executor.map(fetch, to_fetch):
+                src = []
+                dst = []
+                for i, start, stop, c in zip(chunk_pos, starts, stops, chunks):
+                    lo = max(start, i * c)
+                    hi = min(stop, (i + 1) * c)
+                    src.append(slice(lo - i * c, hi - i * c))
+                    dst.append(slice(lo - start, hi - start))
+                out[tuple(dst)] = chunk[tuple(src)]
+
+        out = out[steps]
+
+        if (mask_and_scale):
+            out = _mask_and_scale(out, var, fill_value)
+
+        return out
+
+
+
+    def read_points(self, conn, name, index, threads=8, mask_and_scale=False):
+        """
+        Reads scattered elements of a variable, fetching each chunk holding
+        one or more of them once
+
+        Parameters
+        ----------
+        conn : GoesAWSInterface
+        name : str
+            Variable name. Ex: 'CMI'
+        index : tuple of int arrays
+            One array of element indices per dimension, ex: (rows, cols)
+        threads : int, optional
+            Number of concurrent ranged GETs. Default: 8
+        mask_and_scale : bool, optional
+            See read(). Default: False
+
+        Returns
+        -------
+        numpy array
+            1-D, one value per element
+        """
+        var = self.variables[name]
+        chunks = np.array(var['chunks'], dtype=np.int64)
+        dtype = np.dtype(var['dtype'])
+        index = np.stack([np.asarray(x, dtype=np.int64) for x in index], axis=-1)
+
+        fill_value = var['fill_value'] if var['fill_value'] is not None else 0
+        out = np.full(len(index), fill_value, dtype=dtype)
+
+        chunk_pos, inverse = np.unique(index // chunks, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        refs = [var['refs'].get('.'.join(str(x) for x in pos)) for pos in chunk_pos.tolist()]
+        to_fetch = [i for i, ref in enumerate(refs) if ref is not None]
+
+        fetch = lambda i: (i, self._fetch_chunk(conn, var, refs[i]))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            for i, chunk in executor.map(fetch, to_fetch):
+                sel = np.nonzero(inverse == i)[0]
+                local = index[sel] - chunk_pos[i] * chunks
+                out[sel] = chunk[tuple(local.T)]
+
+        if (mask_and_scale):
+            out = _mask_and_scale(out, var, fill_value)
+
+        return out
+
+
+
+    def _fetch_chunk(self, conn, var, ref):
+        """
+        Fetches & decodes one chunk of a variable
+
+        Returns
+        -------
+        numpy array
+            Of the chunk shape
+        """
+        dtype = np.dtype(var['dtype'])
+        chunks = tuple(var['chunks'])
+
+        if (isinstance(ref, str)):
+            raw = base64.b64decode(ref)
+        else:
+            address, size, mask = ref
+            raw = conn._get_object_range(self.satellite, self.key, address, address + size - 1)
+            raw = _decode_chunk(raw, var['filters'], mask, dtype.itemsize)
+
+        return np.frombuffer(raw, dtype=dtype, count=int(np.prod(chunks))).reshape(chunks)
+
+
+
+def build_chunk_index(header, awsgoesfile):
+    """
+    Builds the chunk references of every numeric variable of a file
+
+    Parameters
+    ----------
+    header : HDF5Header
+        Header of the file, see AwsGoesFile.read_header()
+    awsgoesfile : AwsGoesFile
+
+    Returns
+    -------
+    ChunkIndex
+    """
+    variables = {}
+
+    for name, var in header.variables.items():
+        if (var.dtype is None or var.dtype.kind not in 'iuf'):
+            continue
+
+        layout = var.layout
+        refs = {}
+
+        if (layout.get('class') == 'chunked'):
+            chunks = var.chunks
+            if (not header.is_undefined(layout['address'])):
+                for offset, address, size, mask in read_btree1_chunks(header, layout['address'],
+                                                                       len(var.shape)):
+                    chunk_pos = [o // c for o, c in zip(offset, chunks)]
+                    refs['.'.join(str(x) for x in chunk_pos)] = [address, size, mask]
+        elif (layout.get('class') == 'contiguous'):
+            chunks = var.shape
+            if (not header.is_undefined(layout['address'])):
+                refs['.'.join('0' for _ in var.shape)] = [layout['address'], layout['size'], 0]
+        elif (layout.get('class') == 'compact'):
+            chunks = var.shape
+            refs['.'.join('0' for _ in var.shape)] = base64.b64encode(layout['data']).decode('ascii')
+        else:
+            continue
+
+        fill_value = None if var.fill_value is None else var.fill_value.item()
+        if ('_FillValue' in var.attrs):
+            fill_value = np.asarray(var.attrs['_FillValue']).item()
+
+        variables[name] = {'shape': list(var.shape),
+                           'dtype': var.dtype.str,
+                           'chunks': list(chunks),
+                           'filters': [[fid, list(values)] for fid, values in var.filters],
+                           'fill_value': fill_value,
+                           'attrs': _json_attrs(var.attrs),
+                           'refs': refs}
+
+    return ChunkIndex({'version': INDEX_VERSION,
+                       'key': awsgoesfile.key,
+                       'satellite': awsgoesfile.satellite,
+                       'size': awsgoesfile.size,
+                       'variables': variables})
+
+
+
+def get_chunk_index(conn, awsgoesfile, cachedir=None, satellite=None):
+    """
+    Gets the chunk references of a file, from the cache if it has been
+    indexed before
+
+    Parameters
+    ----------
+    conn : GoesAWSInterface
+    awsgoesfile : AwsGoesFile
+    cachedir : str, optional
+        Directory the indexes are cached in as '<filename>.json'.
+        Default: None (not cached)
+    satellite : str, optional
+        Only used if the file isn't tagged with its satellite. Default: None
+
+    Returns
+    -------
+    ChunkIndex
+    """
+    path = None
+    if (cachedir is not None):
+        path = os.path.join(cachedir, awsgoesfile.filename + '.json')
+        if (os.path.exists(path)):
+            with open(path, 'r') as f:
+                refs = json.load(f)
+            if (refs.get('version') == INDEX_VERSION):
+                return ChunkIndex(refs)
+
+    header = awsgoesfile.read_header(conn, satellite=satellite)
+    index = build_chunk_index(header, awsgoesfile)
+    if (index.satellite is None):
+        index.satellite = index.refs['satellite'] = satellite
+
+    if (path is not None):
+        # Several threads may create the directory at once
+        os.makedirs(cachedir, exist_ok=True)
+        index.save(path)
+
+    return index
+
+
+
+def _decode_chunk(raw, filters, mask, itemsize):
+    """
+    Undoes a chunk's filter pipeline, last filter first. Filters whose bit is
+    set in 'mask' were skipped when the chunk was written
+    """
+    for i in reversed(range(len(filters))):
+        if (mask & (1 << i)):
+            continue
+
+        filter_id = filters[i][0]
+        if (filter_id == FILTER_DEFLATE):
+            raw = zlib.decompress(raw)
+        elif (filter_id == FILTER_SHUFFLE):
+            raw = _unshuffle(raw, itemsize)
+        elif (filter_id == FILTER_FLETCHER32):
+            raw = raw[:-4]
+        else:
+            raise ValueError('Unsupported HDF5 filter {}'.format(filter_id))
+
+    return raw
+
+
+
+def _mask_and_scale(values, var, fill_value):
+    """
+    Applies scale_factor & add_offset & replaces fill values with NaN
+    """
+    attrs = var['attrs']
+    mask = (values == fill_value)
+    # Packed 8 & 16 bit integers fit in float32 without loss
+    values = values.astype(np.float32 if values.dtype.itemsize <= 2 else np.float64)
+    values *= attrs.get('scale_factor', 1.0)
+    values += attrs.get('add_offset', 0.0)
+    values[mask] = np.nan
+
+    return values
+
+
+
+def _unshuffle(raw, itemsize):
+    """
+    Reverses the HDF5 shuffle filter, which stores the first byte of every
+    element, then the second byte of every element, ...
+    """
+    if (itemsize == 1):
+        return raw
+
+    count = len(raw) // itemsize
+    body = np.frombuffer(raw, dtype=np.uint8, count=count * itemsize)
+    unshuffled = body.reshape(itemsize, count).T.tobytes()
+
+    return unshuffled + raw[count * itemsize:]
+
+
+
+def _json_attrs(attrs):
+    """
+    Converts attribute values to JSON types
+    """
+    converted = {}
+
+    for name, value in attrs.items():
+        if (isinstance(value, (np.ndarray, np.generic))):
+            value = value.tolist()
+        if (isinstance(value, (str, int, float, list))):
+            converted[name] = value
+
+    return converted
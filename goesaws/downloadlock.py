@@ -0,0 +1,308 @@
+"""
+Author: Matt Nicholson
+
+Cross-process coordination for downloads into a shared directory (NFS,
+Lustre, or a local disk shared by several worker processes).
+
+A file is claimed by creating '<file>.part' with O_EXCL, which succeeds for
+exactly one process, even on NFSv3+. The claimant holds an advisory flock on
+the .part file while it writes the data into it, then renames it over the
+final path, so readers never see a partial file. Other processes that find a
+.part file wait for the final file to appear instead of downloading it again.
+
+A claim is considered stale, and is broken, if its owner died (the advisory
+lock is free) or if the .part file has not been written to for 'stale_after'
+seconds. Lustre must be mounted with '-o flock' for the advisory locks to work
+across clients; without it, claims still fall back to the mtime check.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Seconds an unlocked .part file is given before it is considered abandoned.
+# Covers the gap between its O_EXCL creation & the owner locking it
+_LOCK_GRACE = 10
+
+# .part files claimed by this process. Advisory locks don't exclude threads of
+# the same process on every filesystem, so our own claims are never probed
+_owned = set()
+_owned_lock = threading.Lock()
+
+
+
+class FileClaimTimeout(Exception):
+    def __init__(self, message, filepath):
+        super(FileClaimTimeout, self).__init__(message)
+        self.filepath = filepath
+
+
+
+class FileClaim(object):
+    """
+    Exclusive claim on producing a file
+
+    >>> claim = FileClaim(filepath)
+    >>> if claim.acquire():
+    >>>     try:
+    >>>         claim.fileobj.write(data)
+    >>>         claim.commit()
+    >>>     except:
+    >>>         claim.abort()
+    >>>         raise
+    """
+
+    def __init__(self, filepath, stale_after=600):
+        super(FileClaim, self).__init__()
+        self.filepath = filepath
+        self.part_path = filepath + '.part'
+        self.stale_after = stale_after
+        self.fileobj = None
+
+
+
+    def acquire(self):
+        """
+        Tries to claim the file
+
+        Returns
+        -------
+        bool
+            True if the claim was made. The data should then be written to
+            self.fileobj and the claim committed or aborted
+        """
+        try:
+            fd = os.open(self.part_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+
+        if (fcntl is not None):
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+        with _owned_lock:
+            _owned.add(self.part_path)
+
+        self.fileobj = os.fdopen(fd, 'wb')
+        return True
+
+
+
+    def commit(self):
+        """
+        Moves the completed .part file into place & releases the claim
+        """
+        try:
+            self.fileobj.flush()
+            os.fsync(self.fileobj.fileno())
+
+            if (not self._owns_path()):
+                raise OSError('Claim on {} was broken by another process'.format(self.filepath))
+
+            os.replace(self.part_path, self.filepath)
+        finally:
+            self._release()
+
+
+
+    def abort(self):
+        """
+        Discards the .part file & releases the claim
+        """
+        try:
+            if (self._owns_path()):
+                os.unlink(self.part_path)
+        except OSError:
+            pass
+        finally:
+            self._release()
+
+
+
+    def is_stale(self):
+        """
+        Checks whether another process' claim on the file has been abandoned
+
+        Returns
+        -------
+        (st_ino, st_mtime) tuple or None
+            Inode & modification time of the .part file that was found stale,
+            to be passed to break_stale(). None if the claim isn't stale
+        """
+        with _owned_lock:
+            if (self.part_path in _owned):
+                return None
+
+        try:
+            fd = os.open(self.part_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+
+        try:
+            st = os.fstat(fd)
+            stale = (st.st_ino, st.st_mtime)
+            age = time.time() - st.st_mtime
+
+            if (age > self.stale_after):
+                return stale
+
+            if (fcntl is None or age < _LOCK_GRACE):
+                return None
+
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                # Nobody holds the lock, so the owner is gone
+                return stale
+            except OSError:
+                return None
+        finally:
+            os.close(fd)
+
+
+
+    def break_stale(self, stale):
+        """
+        Removes an abandoned .part file so the file can be claimed again.
+        Only the .part file that was found to be stale is removed, never one
+        created by a process that recovered it first.
+
+        Parameters
+        ----------
+        stale : (st_ino, st_mtime) tuple
+            Returned by is_stale()
+        """
+        try:
+            fd = os.open(self.part_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+
+        try:
+            st = os.fstat(fd)
+            # Inodes are reused, so a new claim may only differ by its mtime
+            if ((st.st_ino, st.st_mtime) != tuple(stale)):
+                # Broken & claimed again by another process since
+                return
+
+            if (fcntl is not None):
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Still locked, so only a hung owner (mtime check) is broken
+                    if (time.time() - st.st_mtime <= self.stale_after):
+                        return
+
+            current = os.stat(self.part_path)
+            if ((current.st_ino, current.st_mtime) == (st.st_ino, st.st_mtime)):
+                os.unlink(self.part_path)
+        except FileNotFoundError:
+            pass
+        finally:
+            os.close(fd)
+
+
+
+    def wait(self, poll_interval=1.0, timeout=None):
+        """
+        Waits for another process to finish the file
+
+        Parameters
+        ----------
+        poll_interval : float, optional
+            Seconds between checks. Default: 1
+        timeout : float, optional
+            Seconds to wait before giving up. Default: None (no limit)
+
+        Returns
+        -------
+        bool
+            True if the final file appeared. False if the claim disappeared
+            without producing it or went stale, in which case the caller should
+            try to claim the file itself
+        """
+        start = time.time()
+
+        while True:
+            if (os.path.exists(self.filepath)):
+                return True
+
+            if (not os.path.exists(self.part_path)):
+                # The owner may have just renamed it into place
+                return os.path.exists(self.filepath)
+
+            stale = self.is_stale()
+            if (stale is not None):
+                self.break_stale(stale)
+                return False
+
+            if (timeout is not None and time.time() - start > timeout):
+                raise FileClaimTimeout('Timed out waiting for {}'.format(self.filepath),
+                                       self.filepath)
+
+            time.sleep(poll_interval)
+
+
+
+    def _owns_path(self):
+        try:
+            return os.fstat(self.fileobj.fileno()).st_ino == os.stat(self.part_path).st_ino
+        except OSError:
+            return False
+
+
+
+    def _release(self):
+        with _owned_lock:
+            _owned.discard(self.part_path)
+
+        if (self.fileobj is not None):
+            # Closing the file also releases the advisory lock
+            self.fileobj.close()
+            self.fileobj = None
+
+
+
+def fetch_once(filepath, fetch, stale_after=600, poll_interval=1.0, timeout=None):
+    """
+    Produces 'filepath' with 'fetch' unless it already exists or another
+    process is already producing it, in which case that process is waited on
+
+    Parameters
+    ----------
+    filepath : str
+        Final path of the file
+    fetch : callable
+        Called with a binary file object to write the data to
+    stale_after : float, optional
+        Seconds without a write after which another process' claim is broken.
+        Default: 600
+    poll_interval : float, optional
+        Seconds between checks while waiting on another process. Default: 1
+    timeout : float, optional
+        Seconds to wait on another process before giving up. Default: None
+
+    Returns
+    -------
+    bool
+        True if this call fetched the file, False if it already existed or
+        was fetched by another process
+    """
+    claim = FileClaim(filepath, stale_after=stale_after)
+
+    while (not os.path.exists(filepath)):
+        if (claim.acquire()):
+            try:
+                fetch(claim.fileobj)
+                claim.commit()
+            except:
+                claim.abort()
+                raise
+            return True
+
+        if (claim.wait(poll_interval=poll_interval, timeout=timeout)):
+            return False
+
+    return False
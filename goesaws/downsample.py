@@ -0,0 +1,298 @@
+"""
+Author: Matt Nicholson
+
+Block averaging of the 0.5 km & 1 km ABI bands to the 2 km grid.
+
+Band 2 is sampled at 0.5 km & bands 1, 3, & 5 at 1 km, so they are on grids
+4 & 2 times finer than the other bands. Each 2 km pixel is the mean of the
+factor x factor block of finer pixels it covers, which keeps the pixel
+centers of the 2 km fixed grid. The image is read a block of chunk rows at a
+time & averaged in float32 into a preallocated output, so the full resolution
+image is never held:
+
+>>> with Dataset('path/to/band2.nc') as ds:
+>>>     cmi = downsample(ds.variables['CMI'], downsample_factor(2))
+
+Downsampler can be given to GoesAWSInterface.download() to write the 2 km
+version of the files as they are downloaded:
+
+>>> conn.download('goes16', imgs, 'path/to/download', postprocess=Downsampler())
+
+Missing pixels are left out of the means. Quality flags (integer variables
+without scaling, ex: DQF) take the worst, ie largest, flag of the block.
+"""
+import os
+import shutil
+
+import numpy as np
+from netCDF4 import Dataset
+
+from subset import _copy_variable
+
+
+# ABI band -> nominal resolution at the sub-satellite point, in km
+BAND_RESOLUTION_KM = {1: 1., 2: 0.5, 3: 1., 4: 2., 5: 1., 6: 2., 7: 2., 8: 2., 9: 2., 10: 2.,
+                      11: 2., 12: 2., 13: 2., 14: 2., 15: 2., 16: 2.}
+
+TARGET_KM = 2.
+
+IMAGE_DIMS = ('y', 'x')
+
+# Attributes of packed variables that don't apply to the averaged values
+PACKING_ATTRS = ['scale_factor', 'add_offset', '_FillValue', '_Unsigned', 'valid_range']
+
+
+
+class Downsampler(object):
+    """
+    Post-download stage that writes the downsampled version of a file.
+    Picklable, so it can run in a process pool
+
+    Parameters
+    ----------
+    target_km : float, optional
+        Resolution to bring the bands to. Must be a whole multiple of the
+        band resolutions. Default: 2.
+    """
+
+    def __init__(self, target_km=TARGET_KM):
+        super(Downsampler, self).__init__()
+        self.target_km = float(target_km)
+
+
+
+    def __call__(self, filepath, out_path=None):
+        """
+        Parameters
+        ----------
+        filepath : str
+            Downloaded ABI file. Files already at 'target_km' are copied
+            as is
+        out_path : str, optional
+            Path to write the downsampled file to. Default: None ('filepath'
+            is replaced)
+
+        Returns
+        -------
+        out_path : str
+        """
+        out_path = out_path or filepath
+        tmp_path = out_path + '.downsample'
+        try:
+            if (downsample_file(filepath, tmp_path, self.target_km)):
+                os.replace(tmp_path, out_path)
+            elif (out_path != filepath):
+                # Copied through the temporary path too, download() reuses
+                # any output it finds
+                shutil.copyfile(filepath, tmp_path)
+                os.replace(tmp_path, out_path)
+        finally:
+            if (os.path.exists(tmp_path)):
+                os.remove(tmp_path)
+
+        return out_path
+
+
+
+def downsample_factor(band, target_km=TARGET_KM):
+    """
+    Gets the block size bringing a band to a resolution
+
+    Parameters
+    ----------
+    band : int
+        ABI band, 1 - 16
+    target_km : float, optional
+        Default: 2.
+
+    Returns
+    -------
+    int
+    """
+    if (band not in BAND_RESOLUTION_KM):
+        raise ValueError('Invalid ABI band {}'.format(band))
+
+    ratio = target_km / BAND_RESOLUTION_KM[band]
+    factor = int(round(ratio))
+    if (factor < 1 or abs(ratio - factor) > 1e-6):
+        raise ValueError('{} km is not a whole multiple of the {} km resolution of band {}'.format(
+                         target_km, BAND_RESOLUTION_KM[band], band))
+
+    return factor
+
+
+
+def downsample(var, factor, out=None, reduce='mean'):
+    """
+    Downsamples a 2-D variable by an integer factor, a block of chunk rows at
+    a time. Trailing rows & columns that don't fill a block are dropped
+
+    Parameters
+    ----------
+    var : netCDF4 Variable
+    factor : int
+    out : numpy array, optional
+        Array of shape (ny // factor, nx // factor) to write to, ex: a
+        memory map. Must be float32 for means. Default: None (allocated)
+    reduce : str, optional
+        'mean' averages the values read, ignoring missing pixels. 'max' takes
+        the largest value of each block, ex: for quality flags read with
+        auto masking off. Default: 'mean'
+
+    Returns
+    -------
+    numpy array
+        float32 means, NaN where a whole block is missing, or the block
+        maxima in the dtype of the variable
+    """
+    ny, nx = var.shape
+    height, width = ny // factor, nx // factor
+    dtype = np.float32 if reduce == 'mean' else var.dtype
+
+    if (out is None):
+        out = np.empty((height, width), dtype=dtype)
+    elif (out.shape != (height, width) or out.dtype != dtype):
+        raise ValueError('out must be a {} array of shape {}'.format(np.dtype(dtype),
+                                                                     (height, width)))
+
+    chunking = var.chunking()
+    chunk_rows = ny if chunking in (None, 'contiguous') else chunking[0]
+    # Whole blocks of chunk rows, so each chunk is decompressed once
+    rows_per_read = factor * max(1, chunk_rows // factor)
+
+    for start in range(0, height * factor, rows_per_read):
+        stop = min(start + rows_per_read, height * factor)
+        block = var[start:stop, :width * factor]
+        if (reduce == 'mean'):
+            out[start // factor:stop // factor] = block_mean(
+                np.ma.filled(block.astype(np.float32), np.nan), factor)
+        else:
+            out[start // factor:stop // factor] = np.asarray(block).reshape(
+                (stop - start) // factor, factor, width, factor).max(axis=(1, 3))
+
+    return out
+
+
+
+def block_mean(block, factor):
+    """
+    Means of the factor x factor blocks of a 2-D float32 array, ignoring NaN
+
+    Parameters
+    ----------
+    block : numpy array
+        Its shape must be a multiple of 'factor'
+    factor : int
+
+    Returns
+    -------
+    numpy array
+        float32, NaN where a whole block is NaN
+    """
+    valid = ~np.isnan(block)
+    height, width = block.shape[0] // factor, block.shape[1] // factor
+
+    sums = np.where(valid, block, np.float32(0)).reshape(height, factor, width, factor).sum(
+        axis=(1, 3), dtype=np.float32)
+    counts = valid.reshape(height, factor, width, factor).sum(axis=(1, 3))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts.astype(np.float32)
+
+
+
+def downsample_file(src_path, dst_path, target_km=TARGET_KM):
+    """
+    Writes the downsampled version of a single band ABI file. Image
+    variables are written as unpacked float32 with NaN fill, & the 'x' & 'y'
+    coordinates as the centers of the blocks
+
+    Parameters
+    ----------
+    src_path : str
+    dst_path : str
+    target_km : float, optional
+        Default: 2.
+
+    Returns
+    -------
+    bool
+        False if the file is already at 'target_km' & nothing was written
+    """
+    with Dataset(src_path, 'r') as src:
+        if ('band_id' not in src.variables):
+            raise ValueError('{} is not a single band ABI file'.format(src_path))
+        if ('downsample_km' in src.ncattrs() and float(src.downsample_km) == target_km):
+            return False
+
+        band = int(np.ravel(src.variables['band_id'][:])[0])
+        factor = downsample_factor(band, target_km)
+        if (factor == 1):
+            return False
+
+        with Dataset(dst_path, 'w', format='NETCDF4') as dst:
+            dst.setncatts({name: src.getncattr(name) for name in src.ncattrs()})
+            dst.downsample_km = target_km
+            dst.downsample_factor = np.int32(factor)
+
+            for name, dim in src.dimensions.items():
+                if (dim.isunlimited()):
+                    size = None
+                elif (name in IMAGE_DIMS):
+                    size = len(dim) // factor
+                else:
+                    size = len(dim)
+                dst.createDimension(name, size)
+
+            for name, var in src.variables.items():
+                if (var.dimensions == IMAGE_DIMS):
+                    _downsample_variable(var, dst, factor)
+                elif (len(var.dimensions) == 1 and var.dimensions[0] in IMAGE_DIMS):
+                    _downsample_coordinate(var, dst, factor)
+                else:
+                    _copy_variable(var, dst, {})
+
+    return True
+
+
+
+def _downsample_variable(var, dst, factor):
+    attrs = {name: var.getncattr(name) for name in var.ncattrs()}
+    chunking = var.chunking()
+    chunksizes = None
+    if (chunking is not None and chunking != 'contiguous'):
+        chunksizes = [max(1, min(c, n // factor)) for c, n in zip(chunking, var.shape)]
+
+    if (var.dtype.kind in 'iu' and 'scale_factor' not in attrs):
+        var.set_auto_maskandscale(False)
+        out = dst.createVariable(var.name, var.datatype, var.dimensions,
+                                 fill_value=attrs.pop('_FillValue', None), zlib=True,
+                                 chunksizes=chunksizes)
+        out.setncatts(attrs)
+        out.set_auto_maskandscale(False)
+        out[:] = downsample(var, factor, reduce='max')
+        return
+
+    for name in PACKING_ATTRS:
+        attrs.pop(name, None)
+    out = dst.createVariable(var.name, np.float32, var.dimensions, fill_value=np.float32(np.nan),
+                             zlib=True, chunksizes=chunksizes)
+    out.setncatts(attrs)
+    out.set_auto_maskandscale(False)
+    var.set_auto_maskandscale(True)
+    out[:] = downsample(var, factor)
+
+
+
+def _downsample_coordinate(var, dst, factor):
+    attrs = {name: var.getncattr(name) for name in var.ncattrs()}
+    for name in PACKING_ATTRS:
+        attrs.pop(name, None)
+
+    var.set_auto_maskandscale(True)
+    values = np.ma.filled(var[:].astype(np.float64), np.nan)
+    n = len(values) // factor
+
+    out = dst.createVariable(var.name, np.float64, var.dimensions)
+    out.setncatts(attrs)
+    out[:] = values[:n * factor].reshape(n, factor).mean(axis=1)
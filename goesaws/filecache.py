@@ -0,0 +1,280 @@
+"""
+Author: Matt Nicholson
+
+Size-bounded local cache of downloaded files.
+
+The cache keeps an index of the files it manages, keyed by AWS key, so a
+lookup is a dict access instead of a directory walk. The index is kept in
+recency order (policy='lru') or insertion order (policy='age'), which makes
+picking the next file to evict O(1). When the files on disk exceed the byte
+quota, or are older than 'max_age', the least recently used (or oldest) files
+that aren't pinned are deleted. Entries can also be directories, ex: Zarr
+stores written by transcode.Transcoder, which are sized & deleted whole.
+
+The index is saved to '.goesaws-cache.json' in the cache directory. It is
+meant to be used by one process at a time.
+
+>>> cache = FileCache('path/to/cache', max_bytes=50 * 1024**3)
+>>> results = conn.download('goes16', imgs, None, cache=cache)
+>>> with cache.pinned(results.success):
+>>>     ...use the files...
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+
+INDEX_FNAME = '.goesaws-cache.json'
+
+
+
+class FileCache(object):
+    """
+    Parameters
+    ----------
+    basepath : str
+        Directory the cached files are downloaded to. The index is kept here
+    max_bytes : int
+        Byte quota of the cache
+    policy : str, optional
+        'lru' - evict the least recently used files first
+        'age' - evict the files that were added first
+        Default: 'lru'
+    max_age : float, optional
+        Seconds after which a file is evicted regardless of the quota. With
+        policy='lru' the age is measured from the last use, with policy='age'
+        from when the file was added. Default: None
+    """
+
+    def __init__(self, basepath, max_bytes, policy='lru', max_age=None):
+        super(FileCache, self).__init__()
+
+        if (policy not in ['lru', 'age']):
+            raise ValueError("Invalid policy parameter. Must be 'lru' or 'age'")
+
+        self.basepath = basepath
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.max_age = max_age
+        self.index_path = os.path.join(basepath, INDEX_FNAME)
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._pins = Counter()
+        self._lock = threading.RLock()
+
+        if (not os.path.isdir(basepath)):
+            os.makedirs(basepath)
+
+        self._load()
+
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+
+    def get(self, key):
+        """
+        Looks up a cached file & marks it as used
+
+        Parameters
+        ----------
+        key : str
+            AWS key of the file
+
+        Returns
+        -------
+        filepath : str or None
+            Local path of the file, or None on a cache miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None):
+                return None
+
+            if (not os.path.exists(entry['filepath'])):
+                # Deleted behind the cache's back
+                self._remove(key, delete=False)
+                return None
+
+            entry['used'] = time.time()
+            if (self.policy == 'lru'):
+                self._entries.move_to_end(key)
+
+            return entry['filepath']
+
+
+
+    def add(self, key, filepath, size=None):
+        """
+        Adds a file to the cache, then evicts files as needed to get back under
+        the quota
+
+        Parameters
+        ----------
+        key : str
+            AWS key of the file
+        filepath : str
+            Local path of the file, or of a directory
+        size : int, optional
+            Size of the file in bytes. Read from disk if not given
+        """
+        if (size is None):
+            size = path_size(filepath)
+
+        now = time.time()
+
+        with self._lock:
+            if (key in self._entries):
+                self._remove(key, delete=False)
+
+            self._entries[key] = {'filepath': filepath, 'size': size, 'used': now, 'added': now}
+            self.total_bytes += size
+            self.evict()
+
+
+
+    def pin(self, key):
+        """
+        Protects a file from eviction until it is unpinned. Pins are counted,
+        so a file pinned twice must be unpinned twice
+        """
+        with self._lock:
+            self._pins[key] += 1
+
+
+
+    def unpin(self, key):
+        with self._lock:
+            self._pins[key] -= 1
+            if (self._pins[key] <= 0):
+                del self._pins[key]
+
+
+
+    @contextmanager
+    def pinned(self, goesfiles):
+        """
+        Context manager that pins AwsGoesFile or LocalGoesFile objects while
+        they are in use
+        """
+        keys = [x.key for x in goesfiles]
+        for key in keys:
+            self.pin(key)
+
+        try:
+            yield
+        finally:
+            for key in keys:
+                self.unpin(key)
+
+
+
+    def evict(self):
+        """
+        Deletes unpinned files, oldest (or least recently used) first, until
+        the cache is under its quota & holds no files older than max_age
+
+        Returns
+        -------
+        evicted : list of str
+            Keys of the evicted files
+        """
+        evicted = []
+
+        with self._lock:
+            if (self.max_age is not None):
+                cutoff = time.time() - self.max_age
+                field = 'used' if self.policy == 'lru' else 'added'
+                for key, entry in list(self._entries.items()):
+                    if (entry[field] >= cutoff):
+                        # Entries are in recency/insertion order, the rest are newer
+                        break
+                    if (key not in self._pins):
+                        self._remove(key, delete=True)
+                        evicted.append(key)
+
+            if (self.total_bytes > self.max_bytes):
+                for key in list(self._entries):
+                    if (self.total_bytes <= self.max_bytes):
+                        break
+                    if (key not in self._pins):
+                        self._remove(key, delete=True)
+                        evicted.append(key)
+
+        return evicted
+
+
+
+    def save(self):
+        """
+        Writes the index to disk. The write is atomic, so a crash can't leave
+        a torn index behind
+        """
+        with self._lock:
+            entries = [[key, x['filepath'], x['size'], x['used'], x['added']]
+                       for key, x in self._entries.items()]
+
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'policy': self.policy, 'entries': entries}, f)
+        os.replace(tmp_path, self.index_path)
+
+
+
+    def _load(self):
+        if (not os.path.exists(self.index_path)):
+            return
+
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+
+        entries = index['entries']
+        if (index.get('policy') != self.policy):
+            order = 3 if self.policy == 'lru' else 4
+            entries.sort(key=lambda x: x[order])
+
+        for key, filepath, size, used, added in entries:
+            self._entries[key] = {'filepath': filepath, 'size': size, 'used': used, 'added': added}
+            self.total_bytes += size
+
+
+
+    def _remove(self, key, delete):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry['size']
+
+        if (delete):
+            try:
+                if (os.path.isdir(entry['filepath'])):
+                    shutil.rmtree(entry['filepath'])
+                else:
+                    os.remove(entry['filepath'])
+            except FileNotFoundError:
+                pass
+
+
+
+def path_size(path):
+    """
+    Size of a file, or of all the files under a directory, in bytes
+    """
+    if (not os.path.isdir(path)):
+        return os.path.getsize(path)
+
+    size = 0
+    for dirpath, _, fnames in os.walk(path):
+        for fname in fnames:
+            size += os.path.getsize(os.path.join(dirpath, fname))
+
+    return size
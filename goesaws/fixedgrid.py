@@ -0,0 +1,218 @@
+"""
+Author: Matt Nicholson
+
+ABI fixed grid projection.
+
+ABI images are stored on a geostationary fixed grid, with the x & y
+coordinates given as scan angles (radians) & the projection described by the
+'goes_imager_projection' variable. The formulas are those of the GOES-R
+Product User Guide (PUG), Volume 4, section 4.2.8.
+
+>>> with Dataset(filepath) as ds:
+>>>     geometry = read_geometry(ds)
+>>> rows, cols = bbox_window(geometry, (25., 35., -100., -85.))
+
+The row/column window of a lat/lon box only depends on the geometry of the
+grid, which is the same for every file of a satellite & sector, so it is
+cached.
+"""
+import functools
+from collections import namedtuple
+
+import numpy as np
+
+
+# Projection & grid of a file. Hashable, so it can key caches
+FixedGridGeometry = namedtuple('FixedGridGeometry',
+                               ['lon_0', 'height', 'semi_major', 'semi_minor',
+                                'x_offset', 'x_scale', 'nx', 'y_offset', 'y_scale', 'ny'])
+
+PROJECTION_VAR = 'goes_imager_projection'
+
+# Points sampled along each side of a lat/lon box when mapping it to the grid
+BBOX_SAMPLES = 65
+
+
+
+def read_geometry(ds):
+    """
+    Reads the fixed grid geometry of an ABI file
+
+    Parameters
+    ----------
+    ds : netCDF4 Dataset
+
+    Returns
+    -------
+    FixedGridGeometry
+    """
+    if (PROJECTION_VAR not in ds.variables or 'x' not in ds.variables or 'y' not in ds.variables):
+        raise ValueError('{} is not on the ABI fixed grid'.format(ds.filepath()))
+
+    proj = ds.variables[PROJECTION_VAR]
+    x = _read_scaled(ds.variables['x'])
+    y = _read_scaled(ds.variables['y'])
+
+    # The coordinates are evenly spaced, so the first & last values give the
+    # scale whether or not they are packed
+    x_scale = (x[-1] - x[0]) / (len(x) - 1) if len(x) > 1 else 0.
+    y_scale = (y[-1] - y[0]) / (len(y) - 1) if len(y) > 1 else 0.
+
+    return FixedGridGeometry(lon_0=float(proj.longitude_of_projection_origin),
+                             height=float(proj.perspective_point_height + proj.semi_major_axis),
+                             semi_major=float(proj.semi_major_axis),
+                             semi_minor=float(proj.semi_minor_axis),
+                             x_offset=float(x[0]), x_scale=float(x_scale), nx=len(x),
+                             y_offset=float(y[0]), y_scale=float(y_scale), ny=len(y))
+
+
+
+def latlon_to_scan(geometry, lat, lon):
+    """
+    Converts geodetic latitude & longitude (degrees) to scan angles
+
+    Parameters
+    ----------
+    geometry : FixedGridGeometry
+    lat : float or numpy array
+    lon : float or numpy array
+
+    Returns
+    -------
+    x, y : numpy arrays
+        Scan angles in radians. NaN where the point isn't visible from the
+        satellite
+    """
+    a = geometry.semi_major
+    b = geometry.semi_minor
+    h = geometry.height
+
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lon_0 = np.radians(geometry.lon_0)
+
+    e2 = (a ** 2 - b ** 2) / a ** 2
+    phi_c = np.arctan((b ** 2 / a ** 2) * np.tan(lat))
+    r_c = b / np.sqrt(1 - e2 * np.cos(phi_c) ** 2)
+
+    s_x = h - r_c * np.cos(phi_c) * np.cos(lon - lon_0)
+    s_y = -r_c * np.cos(phi_c) * np.sin(lon - lon_0)
+    s_z = r_c * np.sin(phi_c)
+
+    x = np.arcsin(-s_y / np.sqrt(s_x ** 2 + s_y ** 2 + s_z ** 2))
+    y = np.arctan(s_z / s_x)
+
+    hidden = h * (h - s_x) < s_y ** 2 + (a ** 2 / b ** 2) * s_z ** 2
+    x = np.where(hidden, np.nan, x)
+    y = np.where(hidden, np.nan, y)
+
+    return x, y
+
+
+
+def scan_to_latlon(geometry, x, y):
+    """
+    Converts scan angles to geodetic latitude & longitude
+
+    Parameters
+    ----------
+    geometry : FixedGridGeometry
+    x : float or numpy array
+        Scan angle in radians
+    y : float or numpy array
+        Elevation angle in radians
+
+    Returns
+    -------
+    lat, lon : numpy arrays
+        Degrees. NaN where the line of sight misses the Earth
+    """
+    a = geometry.semi_major
+    b = geometry.semi_minor
+    h = geometry.height
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    quad_a = np.sin(x) ** 2 + np.cos(x) ** 2 * (np.cos(y) ** 2 + (a ** 2 / b ** 2) * np.sin(y) ** 2)
+    quad_b = -2 * h * np.cos(x) * np.cos(y)
+    quad_c = h ** 2 - a ** 2
+
+    disc = quad_b ** 2 - 4 * quad_a * quad_c
+    with np.errstate(invalid='ignore'):
+        r_s = (-quad_b - np.sqrt(disc)) / (2 * quad_a)
+
+    s_x = r_s * np.cos(x) * np.cos(y)
+    s_y = -r_s * np.sin(x)
+    s_z = r_s * np.cos(x) * np.sin(y)
+
+    lat = np.degrees(np.arctan((a ** 2 / b ** 2) * s_z / np.sqrt((h - s_x) ** 2 + s_y ** 2)))
+    lon = geometry.lon_0 - np.degrees(np.arctan(s_y / (h - s_x)))
+
+    return lat, lon
+
+
+
+@functools.lru_cache(maxsize=256)
+def bbox_window(geometry, bbox):
+    """
+    Gets the smallest row & column window of a grid holding a lat/lon box.
+    Cached per geometry & box
+
+    Parameters
+    ----------
+    geometry : FixedGridGeometry
+    bbox : tuple of float
+        (lat_min, lat_max, lon_min, lon_max) in degrees. The box crosses the
+        antimeridian if lon_min > lon_max
+
+    Returns
+    -------
+    rows, cols : slice
+        Window of the 'y' & 'x' dimensions
+
+    Raises
+    ------
+    ValueError
+        If the box doesn't overlap the grid
+    """
+    lat_min, lat_max, lon_min, lon_max = bbox
+    if (lon_max < lon_min):
+        lon_max += 360.
+
+    # The edges of a lat/lon box aren't straight lines on the fixed grid, so
+    # the whole box is sampled rather than its corners
+    lat, lon = np.meshgrid(np.linspace(lat_min, lat_max, BBOX_SAMPLES),
+                           np.linspace(lon_min, lon_max, BBOX_SAMPLES))
+    x, y = latlon_to_scan(geometry, lat, lon)
+
+    visible = np.isfinite(x)
+    if (not visible.any()):
+        raise ValueError('Box {} is not visible from the satellite'.format(bbox))
+
+    cols = (x[visible] - geometry.x_offset) / geometry.x_scale
+    rows = (y[visible] - geometry.y_offset) / geometry.y_scale
+
+    col_start = max(int(np.floor(cols.min())), 0)
+    col_stop = min(int(np.ceil(cols.max())) + 1, geometry.nx)
+    row_start = max(int(np.floor(rows.min())), 0)
+    row_stop = min(int(np.ceil(rows.max())) + 1, geometry.ny)
+
+    if (col_start >= col_stop or row_start >= row_stop):
+        raise ValueError('Box {} does not overlap the grid'.format(bbox))
+
+    return slice(row_start, row_stop), slice(col_start, col_stop)
+
+
+
+def _read_scaled(var):
+    """
+    Reads a coordinate with its scale_factor & add_offset applied, whatever
+    the auto scaling setting of the variable is
+    """
+    auto_scale = var.scale
+    var.set_auto_scale(True)
+    try:
+        return np.asarray(var[:], dtype=np.float64)
+    finally:
+        var.set_auto_scale(auto_scale)
@@ -0,0 +1,156 @@
+"""
+Author: Matt Nicholson
+
+Cached latitude & longitude arrays of ABI fixed grids.
+
+The lat/lon of every pixel of a file only depends on its grid: the
+sub-satellite longitude, the resolution, & the extent and center of the
+sector (mesoscale sectors move, so their center is part of the grid). They are
+computed once per grid, saved as .npy files, & memory-mapped, so the arrays
+of a full disk image cost a page fault rather than millions of trig
+operations. An LRU of the open memory maps sits in front of the files.
+
+>>> cache = LatLonCache('path/to/latlon')
+>>> lat, lon = cache.get(geometry, satellite='goes16')
+
+or, from a downloaded file:
+
+>>> lat, lon = localgoesfile.latlon(cache)
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from fixedgrid import scan_to_latlon
+
+
+# Rows of the grid converted at a time, which bounds the float64 temporaries
+ROWS_PER_BLOCK = 512
+
+
+
+class LatLonCache(object):
+    """
+    Parameters
+    ----------
+    cachedir : str
+        Directory the .npy files are written to
+    max_entries : int, optional
+        Number of grids kept open in memory. Default: 8
+    """
+
+    def __init__(self, cachedir, max_entries=8):
+        super(LatLonCache, self).__init__()
+        self.cachedir = cachedir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if (not os.path.isdir(cachedir)):
+            os.makedirs(cachedir)
+
+
+
+    def get(self, geometry, satellite=None):
+        """
+        Gets the lat/lon arrays of a grid, computing them on first use
+
+        Parameters
+        ----------
+        geometry : FixedGridGeometry
+            See fixedgrid.read_geometry()
+        satellite : str, optional
+            Only used to name the cache file. Default: None
+
+        Returns
+        -------
+        lat, lon : numpy arrays
+            float32 arrays of shape (ny, nx), read-only views of the memory
+            mapped file. NaN off the Earth's disk
+        """
+        name = grid_name(geometry, satellite)
+
+        with self._lock:
+            latlon = self._entries.get(name)
+            if (latlon is not None):
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return latlon[0], latlon[1]
+
+        path = os.path.join(self.cachedir, name + '.npy')
+        if (not os.path.exists(path)):
+            write_latlon(path, geometry)
+            self.misses += 1
+
+        latlon = np.load(path, mmap_mode='r')
+
+        with self._lock:
+            self._entries[name] = latlon
+            self._entries.move_to_end(name)
+            while (len(self._entries) > self.max_entries):
+                self._entries.popitem(last=False)
+
+        return latlon[0], latlon[1]
+
+
+
+def grid_name(geometry, satellite=None):
+    """
+    Name of the cache file of a grid. Ex: 'goes16_lon-75.0_56urad_x-31360_y86240_2500x1500'
+
+    Parameters
+    ----------
+    geometry : FixedGridGeometry
+    satellite : str, optional
+
+    Returns
+    -------
+    str
+    """
+    # The grid center is the mesoscale sector center, & along with the size
+    # tells the fixed sectors apart
+    x_center = geometry.x_offset + geometry.x_scale * (geometry.nx - 1) / 2.
+    y_center = geometry.y_offset + geometry.y_scale * (geometry.ny - 1) / 2.
+
+    name = 'lon{:.1f}_{}urad_x{}_y{}_{}x{}'.format(geometry.lon_0,
+                                                   int(round(abs(geometry.x_scale) * 1e6)),
+                                                   int(round(x_center * 1e6)),
+                                                   int(round(y_center * 1e6)),
+                                                   geometry.nx, geometry.ny)
+    if (satellite is not None):
+        name = '{}_{}'.format(satellite, name)
+
+    return name
+
+
+
+def write_latlon(path, geometry):
+    """
+    Computes the lat/lon of every pixel of a grid & saves them as one
+    (2, ny, nx) float32 .npy file. The write is atomic, so concurrent
+    writers & readers never see a partial file
+
+    Parameters
+    ----------
+    path : str
+    geometry : FixedGridGeometry
+    """
+    tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    latlon = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                       shape=(2, geometry.ny, geometry.nx))
+
+    x = geometry.x_offset + geometry.x_scale * np.arange(geometry.nx)
+    for start in range(0, geometry.ny, ROWS_PER_BLOCK):
+        stop = min(start + ROWS_PER_BLOCK, geometry.ny)
+        y = geometry.y_offset + geometry.y_scale * np.arange(start, stop)
+        lat, lon = scan_to_latlon(geometry, x[np.newaxis, :], y[:, np.newaxis])
+        latlon[0, start:stop] = lat
+        latlon[1, start:stop] = lon
+
+    latlon.flush()
+    del latlon
+    os.replace(tmp_path, path)
@@ -0,0 +1,360 @@
+"""
+Author: Matt Nicholson
+
+Streaming aggregation of GLM L2 LCFA files into time bins.
+
+GLM writes one small LCFA file every 20 seconds. The aggregator takes files
+as they are downloaded, decodes their flash, group, & event variables in a
+process pool, & appends them to growable buffers per satellite & time bin.
+A bin is emitted, as one set of arrays or one netCDF file, as soon as all of
+its files have been added, or when the aggregator is closed. Files of a bin
+that was already emitted, & files added twice, are logged & dropped.
+
+>>> aggregator = GlmAggregator(bin_minutes=5, outdir='path/to/bins')
+>>> conn.download('goes16', glm_files, 'path/to/download', callback=aggregator.add)
+>>> aggregator.close()
+
+Flash & group ids are only unique within a file, so each record is tagged
+with the index of its file within the bin ('flash_file', 'group_file', &
+'event_file'), which keeps the parent ids resolvable.
+"""
+import multiprocessing
+import os
+from collections import OrderedDict
+from datetime import timedelta
+
+import concurrent.futures
+import numpy as np
+from netCDF4 import Dataset
+
+
+FLASH_VARS = ['flash_id', 'flash_time_offset_of_first_event', 'flash_time_offset_of_last_event',
+              'flash_lat', 'flash_lon', 'flash_area', 'flash_energy', 'flash_quality_flag']
+
+GROUP_VARS = ['group_id', 'group_time_offset', 'group_lat', 'group_lon', 'group_area',
+              'group_energy', 'group_parent_flash_id', 'group_quality_flag']
+
+EVENT_VARS = ['event_id', 'event_time_offset', 'event_lat', 'event_lon', 'event_energy',
+              'event_parent_group_id']
+
+# Variable prefix -> dimension of the LCFA files
+DIMENSIONS = OrderedDict([('flash', 'number_of_flashes'),
+                          ('group', 'number_of_groups'),
+                          ('event', 'number_of_events')])
+
+# GLM writes a file every 20 seconds
+FILES_PER_MINUTE = 3
+
+
+
+class GrowableArray(object):
+    """
+    1-D array with amortized O(1) appends. The buffer is preallocated &
+    doubled when full, so filling it copies each value about twice
+
+    Parameters
+    ----------
+    dtype : numpy dtype
+    capacity : int, optional
+        Initial size of the buffer. Default: 4096
+    """
+
+    def __init__(self, dtype, capacity=4096):
+        super(GrowableArray, self).__init__()
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+
+
+    def __len__(self):
+        return self._size
+
+
+
+    def extend(self, values):
+        values = np.asarray(values)
+        end = self._size + len(values)
+
+        if (end > len(self._data)):
+            capacity = max(end, 2 * len(self._data))
+            data = np.empty(capacity, dtype=self._data.dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+
+        self._data[self._size:end] = values
+        self._size = end
+
+
+
+    @property
+    def values(self):
+        """
+        View of the filled part of the buffer
+        """
+        return self._data[:self._size]
+
+
+
+class GlmAggregator(object):
+    """
+    Parameters
+    ----------
+    bin_minutes : int, optional
+        Length of the time bins in minutes. Bins are aligned to the hour.
+        Default: 5
+    variables : list of str, optional
+        LCFA variables to aggregate. Default: FLASH_VARS + GROUP_VARS + EVENT_VARS
+    outdir : str, optional
+        If given, each bin is written to
+        '<outdir>/GLM-LCFA_<satellite>_<bin start>_<bin_minutes>min.nc'.
+        Default: None
+    on_bin : callable, optional
+        Called with (satellite, bin start datetime, dict of variable name ->
+        numpy array) for each bin. Default: None
+    workers : int, optional
+        Number of decoding processes. Default: None (number of CPUs)
+    """
+
+    def __init__(self, bin_minutes=5, variables=None, outdir=None, on_bin=None, workers=None):
+        super(GlmAggregator, self).__init__()
+        if (bin_minutes < 1 or 60 % bin_minutes != 0):
+            raise ValueError('bin_minutes must divide an hour, ex: 1, 5, 10')
+
+        self.bin_minutes = bin_minutes
+        self.variables = list(variables or FLASH_VARS + GROUP_VARS + EVENT_VARS)
+        self.outdir = outdir
+        self.on_bin = on_bin
+        self.files_per_bin = bin_minutes * FILES_PER_MINUTE
+        # (satellite, bin start) -> {'files': [filepath, ...], 'buffers': {name: GrowableArray}}
+        self._bins = OrderedDict()
+        self._pending = []
+        self._emitted = set()
+        # (satellite, bin start) -> names of the files added to the bin
+        self._added = {}
+        # Workers are spawned rather than forked, since this is usually fed by
+        # download threads & HDF5 isn't fork safe
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                mp_context=multiprocessing.get_context('spawn'))
+
+        if (outdir is not None and not os.path.isdir(outdir)):
+            os.makedirs(outdir)
+
+
+
+    def add(self, localgoesfile):
+        """
+        Queues a downloaded LCFA file for decoding. Can be used as the
+        download() callback
+
+        Parameters
+        ----------
+        localgoesfile : LocalGoesFile
+        """
+        bin_key = (localgoesfile.satellite, self._bin_start(localgoesfile.start_time))
+        if (bin_key in self._emitted):
+            print('Dropping {}, its {} bin has already been emitted'.format(
+                    localgoesfile.filename, bin_key[1]))
+            return
+
+        added = self._added.setdefault(bin_key, set())
+        if (localgoesfile.filename in added):
+            print('Dropping {}, it has already been added'.format(localgoesfile.filename))
+            return
+        added.add(localgoesfile.filename)
+
+        future = self._executor.submit(read_lcfa, localgoesfile.filepath, self.variables)
+        self._pending.append((future, bin_key, localgoesfile.filepath))
+        self._collect(wait=False)
+
+
+
+    def close(self):
+        """
+        Waits for the queued files, emits every remaining bin, & shuts the
+        process pool down
+        """
+        try:
+            self._collect(wait=True)
+            for bin_key in list(self._bins):
+                self._emit(bin_key)
+        finally:
+            self._executor.shutdown()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+    def _bin_start(self, start_time):
+        minute = start_time.minute - start_time.minute % self.bin_minutes
+        return start_time.replace(minute=minute, second=0, microsecond=0)
+
+
+
+    def _collect(self, wait):
+        """
+        Appends the decoded files to their bins, in the order they were added
+        """
+        while (self._pending):
+            future, bin_key, filepath = self._pending[0]
+            if (not wait and not future.done()):
+                break
+            self._pending.pop(0)
+            if (bin_key in self._emitted):
+                # Queued before its bin was filled by the files ahead of it
+                print('Dropping {}, its {} bin has already been emitted'.format(
+                        os.path.basename(filepath), bin_key[1]))
+                continue
+            try:
+                arrays = future.result()
+            except Exception as exc:
+                # Still counted, so the rest of its bin is emitted on time
+                print('Failed to read {}: {}'.format(filepath, exc))
+                arrays = {}
+            self._append(bin_key, filepath, arrays)
+
+
+
+    def _append(self, bin_key, filepath, arrays):
+        time_bin = self._bins.get(bin_key)
+        if (time_bin is None):
+            time_bin = self._bins[bin_key] = {'files': [], 'buffers': {}}
+
+        file_index = len(time_bin['files'])
+        time_bin['files'].append(filepath)
+        buffers = time_bin['buffers']
+
+        for name, values in arrays.items():
+            if (name not in buffers):
+                buffers[name] = GrowableArray(values.dtype)
+            buffers[name].extend(values)
+
+        for prefix in DIMENSIONS:
+            name = prefix + '_file'
+            if (name not in buffers):
+                buffers[name] = GrowableArray(np.int16)
+            count = max([len(v) for k, v in arrays.items() if k.startswith(prefix + '_')] or [0])
+            buffers[name].extend(np.full(count, file_index, dtype=np.int16))
+
+        if (len(time_bin['files']) >= self.files_per_bin):
+            self._emit(bin_key)
+
+
+
+    def _emit(self, bin_key):
+        satellite, bin_start = bin_key
+        time_bin = self._bins.pop(bin_key)
+        self._emitted.add(bin_key)
+        self._added.pop(bin_key, None)
+        arrays = {name: buffer.values for name, buffer in time_bin['buffers'].items()}
+
+        if (self.outdir is not None):
+            fname = 'GLM-LCFA_{}_{}_{}min.nc'.format(satellite, bin_start.strftime('%Y%m%d%H%M'),
+                                                     self.bin_minutes)
+            write_bin(os.path.join(self.outdir, fname), bin_start, self.bin_minutes, arrays,
+                      time_bin['files'])
+
+        if (self.on_bin is not None):
+            self.on_bin(satellite, bin_start, arrays)
+
+
+
+def read_lcfa(filepath, variables):
+    """
+    Reads the flash, group, & event variables of an LCFA file. Time offsets
+    are converted to datetime64[ms] & fill values of float variables to NaN
+
+    Parameters
+    ----------
+    filepath : str
+    variables : list of str
+
+    Returns
+    -------
+    dict
+        Variable name -> 1-D numpy array. Variables missing from the file are
+        left out
+    """
+    arrays = {}
+
+    with Dataset(filepath, 'r') as ds:
+        for name in variables:
+            if (name not in ds.variables):
+                continue
+
+            var = ds.variables[name]
+            values = var[:]
+
+            if ('time_offset' in name):
+                origin = _time_origin(var.units)
+                millis = np.ma.filled(values.astype(np.float64) * 1000., np.nan)
+                values = np.full(len(millis), np.datetime64('NaT'), dtype='datetime64[ms]')
+                valid = np.isfinite(millis)
+                values[valid] = origin + np.rint(millis[valid]).astype('timedelta64[ms]')
+            elif (np.ma.isMaskedArray(values)):
+                if (values.dtype.kind == 'f'):
+                    values = values.filled(np.nan)
+                else:
+                    values = values.data
+
+            arrays[name] = np.asarray(values).reshape(-1)
+
+    return arrays
+
+
+
+def write_bin(filepath, bin_start, bin_minutes, arrays, source_files=None):
+    """
+    Writes the arrays of a time bin to a netCDF file, with the LCFA
+    dimension names
+
+    Parameters
+    ----------
+    filepath : str
+    bin_start : datetime
+    bin_minutes : int
+    arrays : dict
+        Variable name -> 1-D numpy array
+    source_files : list of str, optional
+        Written to the 'source_files' attribute. Default: None
+    """
+    tmp_path = filepath + '.tmp'
+
+    with Dataset(tmp_path, 'w') as ds:
+        ds.time_coverage_start = bin_start.strftime('%Y-%m-%dT%H:%M:%SZ')
+        ds.time_coverage_end = (bin_start + timedelta(minutes=bin_minutes)).strftime(
+                                '%Y-%m-%dT%H:%M:%SZ')
+        if (source_files is not None):
+            ds.source_files = ' '.join(os.path.basename(x) for x in source_files)
+
+        for prefix, dim in DIMENSIONS.items():
+            names = [x for x in arrays if x.startswith(prefix + '_')]
+            ds.createDimension(dim, max([len(arrays[x]) for x in names] or [0]))
+
+        for name, values in arrays.items():
+            dim = DIMENSIONS[name.split('_')[0]]
+            if (values.dtype.kind == 'M'):
+                var = ds.createVariable(name, 'i8', (dim,), zlib=True)
+                var.units = 'milliseconds since 1970-01-01 00:00:00'
+                var[:] = values.astype('datetime64[ms]').astype(np.int64)
+            else:
+                var = ds.createVariable(name, values.dtype, (dim,), zlib=True)
+                var[:] = values
+
+    os.replace(tmp_path, filepath)
+
+
+
+def _time_origin(units):
+    """
+    Parses the origin of CF time units. Ex: 'seconds since 2019-09-01 16:00:00.000'
+    """
+    origin = units.split('since', 1)[1].strip().rstrip('Z').replace(' ', 'T', 1)
+    return np.datetime64(origin, 'ms')
@@ -11,15 +11,42 @@ Example usage
 > python goes_aws_dl.py --start '09-01-2019-00:00' --end '09-01-2019-00:15' -p 'CMIP' --sector 'M1' --chan '02' -dl -o 'path/to/download'
 > python goes_aws_dl.py --start '09-01-2019-00:00' --end '09-01-2019-00:15' -p 'MCMIP' --sector 'C' -dl -o 'path/to/download'
 > python goes_aws_dl.py --start '09-01-2019-00:00' --end '09-01-2019-00:15' -p 'MCMIP' --sector 'C' -dl -o 'path/to/download' --kill_aws_struct
+> python goes_aws_dl.py --sat goes16 goes17 --start '09-01-2019-00:00' --end '09-01-2019-00:15' -p 'CMIP' --sector 'C' --chan '13' -dl -o 'path/to/download'
 
 GLM:
 > python goes_aws_dl.py -i 'glm' --start '09-01-2019-16:00' --end '09-01-2019-16:30'
 > python goes_aws_dl.py -i 'glm' --start '09-01-2019-16:00' --end '09-01-2019-16:30' -dl -o 'path/to/download'
+
+Manifests:
+> python goes_aws_dl.py --manifest 'queries.yaml' --resolved 'plan.json'
+> python goes_aws_dl.py --resolved 'plan.json' -dl -o 'path/to/download'
+> python goes_aws_dl.py --manifest 'queries.csv' -dl -o 'path/to/download' --threads 16
+
+Checkpointed backfill (re-run the same command to resume):
+> python goes_aws_dl.py --backfill 'backfill.db' --start '06-01-2019-00:00' --end '09-01-2019-00:00' -p 'CMIP' --sector 'C' --chan '13' -dl -o 'path/to/download'
+> python goes_aws_dl.py --backfill 'backfill.db' --progress
+
+Local inventory (hours already downloaded in full are not listed again):
+> python goes_aws_dl.py --inventory 'inventory.db' --start '09-01-2019-00:00' --end '09-01-2019-03:00' -p 'CMIP' --sector 'C' --chan '13' -dl -o 'path/to/download'
+
+Subset to a lat/lon box as the files are downloaded (lat_min lat_max lon_min lon_max):
+> python goes_aws_dl.py --subset 25 35 -100 -85 --start '09-01-2019-00:00' --end '09-01-2019-01:00' -p 'CMIP' --sector 'F' --chan '13' -dl -o 'path/to/download'
+
+Sharded downloads (run one per node, then merge):
+> python goes_aws_dl.py --resolved 'plan.json' --shard 0/4 --journal_dir 'journals' -dl -o 'path/to/download'
+> python goes_aws_dl.py --resolved 'plan.json' --merge_journals --journal_dir 'journals'
 """
 
 import argparse
+import os
+from datetime import timedelta
 
+import backfill
 import goesawsinterface
+import inventory
+import manifest
+import sharding
+import subset
 
 parse_desc = """A Package to download GOES-R series (GOES-16 & -17) from NOAA's
 Amazon Web Service (AWS) bucket.
@@ -30,18 +57,35 @@ def create_arg_parser():
     Command line argument parser
 
     Arguments
+        --backfill; optional
+            Journal (SQLite database) of a checkpointed backfill. The range query
+            is listed & downloaded through the journal so an interrupted run can
+            be resumed by re-running the same command
+            Default is None. Stored as args.backfill
         -c, --chan; optional (required for ABI files)
             ABI imagery channel
             Default is None. Stored as args.channel
         -d, --dl; optional (required to dowlnoad files)
             File download flag
             Default is False. Stored as args.dl
-        --end
+        --end; optional (required unless --manifest or --resolved is given)
             End datetime string. Format: MM-DD-YYYY-HH:MM (UTC)
             Stored at args.end
         -i, --instr; optional
             Instrument to pull data from ('abi' or 'glm')
             Default is 'abi'. Stored as args.instr
+        --inventory; optional
+            Local file inventory (SQLite database). Downloaded files are recorded
+            in it, and hours whose files are all downloaded already are not
+            listed again
+            Default is None. Stored as args.inventory
+        --journal_dir; optional (required with --shard & --merge_journals)
+            Directory holding the per-shard completion journals
+            Default is None. Stored as args.journal_dir
+        --manifest; optional
+            Query manifest (.json, .yaml, or .csv) listing several queries to
+            plan & download together
+            Default is None. Stored as args.manifest
         --kill_aws_struct; optional
             If passed (False), the files will be downloaded directly into the directory
             specified by out_dir. If not passed (True), the files will be downloaded
@@ -50,24 +94,49 @@ def create_arg_parser():
         -o, --out_dir; optional (required to dowlnoad files)
             Directory to download files to
             Stored as args.out_dir
+        --progress; optional
+            If passed with --backfill, the progress & ETA of the backfill are
+            printed and nothing is downloaded
+            Default is False. Stored as args.progress
         -p, --prod; optional (required for ABI files)
             ABI imagery product
             Default is None. Stored as args.prod
+        --merge_journals; optional
+            If passed, the shard journals in journal_dir are checked against the
+            resolved manifest and the missing files are reported
+            Default is False. Stored as args.merge_journals
+        --resolved; optional
+            Resolved file manifest (.json). Written to if --manifest is given,
+            otherwise the files it lists are downloaded
+            Default is None. Stored as args.resolved
+        --subset; optional
+            Lat/lon box (lat_min lat_max lon_min lon_max) the downloaded ABI
+            files are subset to, see subset.py
+            Default is None. Stored as args.subset
         -s, --sector; optional (required for ABI files)
             ABI scan sector
             Default is None. Stored as args.sector
         --sat; optional
-            Satellite to pull data from.
-            Default is 'goes16'. Stored as args.sat
-        --start
+            Satellite(s) to pull data from. Several satellites may be given,
+            ex: --sat goes16 goes17
+            Default is 'goes16'. Stored as args.sat (list)
+        --shard; optional
+            Only download this node's share of the resolved manifest.
+            Format: i/N, where i is the zero-based shard index
+            Default is None. Stored as args.shard
+        --start; optional (required unless --manifest or --resolved is given)
             Start datetime string. Format: MM-DD-YYYY-HH:MM (UTC)
             Stored at args.start
+        -t, --threads; optional
+            Number of threads used to list & download files
+            Default is 6. Stored as args.threads
 
     """
     parser = argparse.ArgumentParser(description=parse_desc)
 
-    parser.add_argument('--sat', metavar='satellite', required=False,
-                        dest='sat', default='goes16', action='store')
+    parser.add_argument('--sat', metavar='satellite', required=False, nargs='+',
+                        dest='sat', default=['goes16'], action='store',
+                        help='Satellite(s), e.g., goes16 goes17')
 
     parser.add_argument('-i', '--instr', metavar='instrument', required=False,
                         dest='instr', action='store', type=str, default='abi',
@@ -88,12 +157,50 @@ def create_arg_parser():
     parser.add_argument('-o', '--output_dir', metavar='directory', dest='out_dir',
                         required=False, type=str, action='store', help='Directory to download files to')
 
-    parser.add_argument('--start', metavar='start time', dest='start', required=True,
+    parser.add_argument('--start', metavar='start time', dest='start', required=False,
                         action='store', type=str, help='Start time')
 
-    parser.add_argument('--end', metavar='end time', dest='end', required=True,
+    parser.add_argument('--end', metavar='end time', dest='end', required=False,
                         action='store', type=str, help='End time')
 
+    parser.add_argument('--manifest', metavar='query manifest', dest='manifest',
+                        required=False, action='store', type=str, default=None,
+                        help='Query manifest file (.json, .yaml, .csv)')
+
+    parser.add_argument('--resolved', metavar='resolved manifest', dest='resolved',
+                        required=False, action='store', type=str, default=None,
+                        help='Resolved file manifest to write (with --manifest) or download')
+
+    parser.add_argument('--shard', metavar='i/N', dest='shard', required=False,
+                        action='store', type=str, default=None,
+                        help='Download shard i of N of the resolved manifest')
+
+    parser.add_argument('--journal_dir', metavar='directory', dest='journal_dir',
+                        required=False, action='store', type=str, default=None,
+                        help='Directory holding the shard completion journals')
+
+    parser.add_argument('--merge_journals', dest='merge_journals', default=False,
+                        action='store_true', help='Report files missing from the shard journals')
+
+    parser.add_argument('--backfill', metavar='journal', dest='backfill', required=False,
+                        action='store', type=str, default=None,
+                        help='Backfill journal to record progress in & resume from')
+
+    parser.add_argument('--inventory', metavar='inventory', dest='inventory', required=False,
+                        action='store', type=str, default=None,
+                        help='Local file inventory to record downloads in & query')
+
+    parser.add_argument('--subset', metavar='bound', dest='subset', required=False, nargs=4,
+                        action='store', type=float, default=None,
+                        help='Subset downloads to lat_min lat_max lon_min lon_max')
+
+    parser.add_argument('--progress', dest='progress', default=False, action='store_true',
+                        help='Print the progress of the --backfill journal')
+
+    parser.add_argument('-t', '--threads', metavar='threads', dest='threads',
+                        required=False, action='store', type=int, default=6,
+                        help='Number of listing & download threads')
+
     parser.add_argument('-d', '--dl', dest='dl', default=False, action='store_true',
                         help='File download flag')
 
@@ -108,18 +215,99 @@ def main():
     parser = create_arg_parser()
     args = parser.parse_args()
 
-    conn = goesawsinterface.GoesAWSInterface()
-
-    imgs = conn.get_avail_images_in_range(args.sat, args.instr, args.start, args.end,
-                                          product=args.prod, sector=args.sector,
-                                          channel=args.channel)
+    if (args.progress):
+        if (args.backfill is None):
+            parser.error('--backfill is required with --progress')
+
+        journal = backfill.BackfillJournal(args.backfill)
+        prog = journal.progress()
+        journal.close()
+
+        print('Hours listed: {} of {}'.format(prog['hours_listed'], prog['hours_planned']))
+        print('Files completed: {} of {} ({:.1f} of {:.1f} MB)'.format(
+              prog['files_completed'], prog['files_total'],
+              prog['bytes_completed'] / 1e6, prog['bytes_total'] / 1e6))
+        if (prog['eta_sec'] is not None):
+            print('Rate: {:.2f} MB/s, ETA: {}'.format(prog['bytes_per_sec'] / 1e6,
+                                                      timedelta(seconds=int(prog['eta_sec']))))
+        return
+
+    if (args.manifest is None and args.resolved is None):
+        if (args.start is None or args.end is None):
+            parser.error('--start and --end are required unless --manifest or --resolved is given')
+
+    if ((args.shard or args.merge_journals) and args.journal_dir is None):
+        parser.error('--journal_dir is required with --shard and --merge_journals')
+
+    if (args.merge_journals):
+        if (args.resolved is None):
+            parser.error('--resolved is required with --merge_journals')
+
+        imgs = manifest.read_resolved_manifest(args.resolved)
+        result = sharding.merge_shard_journals(imgs, args.journal_dir)
+
+        for x in result.iter_failed():
+            print('Missing {}'.format(x.filename))
+        print('{} out of {} files completed...{} missing'.format(result.success_count,
+                                                                 result.total,
+                                                                 result.failed_count))
+
+        if (result.failed_count > 0):
+            missing_path = os.path.join(args.journal_dir, 'missing.json')
+            manifest.write_resolved_manifest(missing_path, result.failed)
+            print('Missing files written to {}'.format(missing_path))
+        return
+
+    if (args.inventory is not None):
+        local_inventory = inventory.LocalInventory(args.inventory)
+    else:
+        local_inventory = None
+
+    conn = goesawsinterface.GoesAWSInterface(max_pool_connections=max(10, args.threads),
+                                             inventory=local_inventory)
+
+    if (len(args.sat) == 1):
+        sat = args.sat[0]
+    else:
+        sat = args.sat
+
+    if (args.backfill is not None):
+        if (not (args.dl and args.out_dir)):
+            parser.error('--backfill requires -d and -o')
+
+        runner = backfill.BackfillRunner(conn, args.backfill)
+        result = runner.run(sat, args.instr, args.start, args.end, args.out_dir,
+                            product=args.prod, sector=args.sector, channel=args.channel,
+                            keep_aws_folders=args.kill_aws_struct, threads=args.threads)
+        runner.close()
+        return
+
+    if (args.manifest is not None):
+        queries = manifest.read_manifest(args.manifest)
+        imgs = conn.plan_queries(queries, threads=args.threads)
+
+        if (args.resolved is not None):
+            manifest.write_resolved_manifest(args.resolved, imgs)
+    elif (args.resolved is not None):
+        imgs = manifest.read_resolved_manifest(args.resolved)
+    else:
+        imgs = conn.get_avail_images_in_range(sat, args.instr, args.start, args.end,
+                                              product=args.prod, sector=args.sector,
+                                              channel=args.channel)
 
     for img in imgs:
         print('{} --> {}'.format(img.scan_time, img.filename))
 
     if (args.dl and args.out_dir):
-        result = conn.download('goes16', imgs, args.out_dir, keep_aws_folders=args.kill_aws_struct,
-                               threads=6)
+        if (args.shard is not None):
+            result = sharding.download_shard(conn, imgs, args.shard, args.out_dir,
+                                             args.journal_dir,
+                                             keep_aws_folders=args.kill_aws_struct,
+                                             threads=args.threads)
+        else:
+            postprocess = subset.Subsetter(args.subset) if args.subset is not None else None
+            result = conn.download(sat, imgs, args.out_dir, keep_aws_folders=args.kill_aws_struct,
+                                   threads=args.threads, postprocess=postprocess)
 
         for x in result._successfiles:
             print(x.filepath)
@@ -24,20 +24,87 @@ Notes
             'ABI-L2-FDCC', 'ABI-L2-FDCF', 'ABI-L2-MCMIPC',
             'ABI-L2-MCMIPF', 'ABI-L2-MCMIPM'
 """
+import functools
+import hashlib
+import multiprocessing
 import os
+import pickle
 import re
 import sys
+from contextlib import contextmanager
 from datetime import timedelta, datetime
 
 import boto3
 import errno
+import numpy as np
 import pytz
+from botocore.config import Config
 from botocore.handlers import disable_signing
 import concurrent.futures
 
 from awsgoesfile import AwsGoesFile
 from downloadresults import DownloadResults
+from downloadlock import fetch_once
 from localgoesfile import LocalGoesFile
+from scanindex import ScanIndex, floor_hour, merge_join, to_datetime64
+
+
+# Maps satellite names to their NOAA Open Data bucket. New satellites can be
+# added at runtime with register_satellite()
+SATELLITE_BUCKETS = {'goes16': 'noaa-goes16',
+                     'goes17': 'noaa-goes17',
+                     'goes18': 'noaa-goes18',
+                     'goes19': 'noaa-goes19'}
+
+# How long after the end of an hour its listing is treated as final. Files can
+# show up in the bucket several minutes after their scan ends
+HOUR_SETTLE_TIME = timedelta(minutes=30)
+
+
+
+def register_satellite(satellite, bucket):
+    """
+    Adds a satellite to the bucket registry, or points an existing one at a
+    different bucket
+
+    Parameters
+    ----------
+    satellite : str
+        Satellite name. Ex: 'goes19'
+    bucket : str
+        Name of the AWS S3 bucket holding the satellite's data. Ex: 'noaa-goes19'
+    """
+    SATELLITE_BUCKETS[satellite] = bucket
+
+
+
+def postprocess_path(filepath, postprocess):
+    """
+    Gets the path download() writes the output of a postprocess stage to. The
+    name holds a fingerprint of the stage & its settings, so downloaded files
+    are never changed & outputs of different settings don't collide
+
+    Parameters
+    ----------
+    filepath : str
+        Downloaded file
+    postprocess : callable
+        Picklable postprocess stage, ex: subset.Subsetter. Stages writing
+        something other than a netCDF file give its extension in an
+        'extension' attribute, ex: '.zarr'
+
+    Returns
+    -------
+    str
+        Ex: 'path/to/OR_ABI-L2-CMIPC-M6C13_G16_s2019..._c2019....3f9a1c20.nc'
+    """
+    fingerprint = hashlib.sha1(pickle.dumps(postprocess)).hexdigest()[:8]
+    root, ext = os.path.splitext(filepath)
+    ext = getattr(postprocess, 'extension', None) or ext
+
+    return '{}.{}{}'.format(root, fingerprint, ext)
+
+
 
 class GoesAWSInterface(object):
     """
@@ -49,7 +116,7 @@ class GoesAWSInterface(object):
     """
 
 
-    def __init__(self):
+    def __init__(self, max_pool_connections=10, lock_stale_after=600, inventory=None, hedge=None):
         super(GoesAWSInterface, self).__init__()
         self._year_re = re.compile(r'/(\d{4})/')
         self._day_re = re.compile(r'/\d{4}/(\d{3})/')
@@ -59,10 +126,22 @@ class GoesAWSInterface(object):
         self._scan_re_glm = re.compile(r'(OR_GLM-L2-LCFA)_G\d{2}_s\d{7}(\d{6})\d{1}')
         self._scan_re_mcmip_m = re.compile(r'(\w{3,4}M\d-M\d)_G\d{2}_s\d{7}(\d{4})\d{3}')
         self._scan_re_mcmip_c = re.compile(r'(\w{4,5}-M\d)_G\d{2}_s\d{7}(\d{4})\d{3}')
-        self._s3conn = boto3.resource('s3')
+        # A single client (and its connection pool) is shared by every listing
+        # & download, regardless of which satellite bucket is being accessed
+        self._s3conn = boto3.resource('s3', config=Config(max_pool_connections=max_pool_connections))
         self._s3conn.meta.client.meta.events.register('choose-signer.s3.*', disable_signing)
-        self._bucket_16 = self._s3conn.Bucket('noaa-goes16')
-        self._bucket_17 = self._s3conn.Bucket('noaa-goes17')
+        self._s3client = self._s3conn.meta.client
+        # Seconds without progress after which another process' in-flight
+        # download of the same file is considered abandoned
+        self._lock_stale_after = lock_stale_after
+        # Optional LocalInventory that downloads are recorded in & that hours
+        # already downloaded in full are answered from
+        self._inventory = inventory
+        if (inventory is not None and inventory._conn is None):
+            inventory._conn = self
+        # Optional HedgePolicy that slow listings, ranged GETs, & downloads
+        # are duplicated by
+        self._hedge = hedge
 
 
 
@@ -74,7 +153,7 @@ class GoesAWSInterface(object):
         ----------
         satellite : str
             The satellite to fetch available products for.
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         sensor : str, optional
             Sensor that produced the data. Valid: 'abi' or 'glm'. Default = None
 
@@ -122,7 +201,7 @@ class GoesAWSInterface(object):
         ----------
         satellite : str
             The satellite to fetch available products for.
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         sensor : str
             Sensor that produced the data. Valid: 'abi' or 'glm'
         product : str, optional
@@ -171,7 +250,7 @@ class GoesAWSInterface(object):
         ----------
         satellite : str
             The satellite to fetch available products for.
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         sensor : str
             Sensor that produced the data. Valid: 'abi' or 'glm'
         year : str or int
@@ -204,7 +283,7 @@ class GoesAWSInterface(object):
         ----------
         satellite : str
             The satellite to fetch available products for.
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         sensor : str
             Sensor that produced the data. Valid: 'abi' or 'glm'
         year : str or int
@@ -257,7 +336,7 @@ class GoesAWSInterface(object):
         ----------
         satellite : str
             The satellite to fetch available products for.
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         sensor : str
             Sensor that produced the data. Valid: 'abi' or 'glm'
         date : str
@@ -308,9 +387,10 @@ class GoesAWSInterface(object):
 
         Parameters
         ----------
-        satellite : str
-            The satellite to fetch available products for.
-            Valid: 'goes16' & 'goes17'
+        satellite : str or list of str
+            The satellite(s) to fetch available products for. If a list is given,
+            each satellite is queried concurrently and the results are merged.
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         sensor : str
             Which sensor (ABI or GLM) to get data from
             Valid: 'abi' & 'glm'
@@ -329,89 +409,32 @@ class GoesAWSInterface(object):
         Returns
         -------
         images : list of AwsGoesFile objects
-            AwsGoesFile objects representing available data files
+            AwsGoesFile objects representing available data files, tagged with
+            the satellite they came from
         """
-        images = []
-        abi_sector_dict = {'C': self._scan_c_re,
-                           'M1': self._scan_m_re,
-                           'M2': self._scan_m_re
-        }
-        mcmip_sector_dict = {'C': self._scan_re_mcmip_c,
-                             'M1': self._scan_re_mcmip_m,
-                             'M2': self._scan_re_mcmip_m}
+        if (isinstance(satellite, (list, tuple))):
+            return self._query_satellites(self.get_avail_images, satellite, sensor, date,
+                                          product=product, sector=sector, channel=channel)
 
         if (not isinstance(date, datetime)):
             date = datetime.strptime(date, '%m-%d-%Y-%H')
 
-        if (sensor != 'glm' and not self._validate_product(product)):
-            raise ValueError('Invalid product parameter')
-
-        year = date.year
-        hour = date.hour
-        jul_day = date.timetuple().tm_yday
-
-        if (sensor == 'abi'):
-            trim_prod = self._trim_product_sector(product)
-            try:
-                # setting the scan_re variable also acts to validate the sector
-                # parameter
-                if (trim_prod == 'MCMIP'):
-                    scan_re = mcmip_sector_dict[sector]
-                else:
-                    scan_re = abi_sector_dict[sector]
-            except KeyError:
-                raise ValueError("Must provide sector parameter ('M1', 'M2', or 'C') when accessing ABI data")
+        prefix = self._build_prefix_images(sensor, date, product=product, sector=sector)
+        match = lambda contents: self._match_images(contents, satellite, sensor, date,
+                                                    product=product, sector=sector,
+                                                    channel=channel)
 
-            prefix = self._build_prefix_abi(product=product, year=year, julian_day=jul_day,
-                                            hour=hour, sector=sector)
+        if (self._inventory is not None):
+            images = self._inventory.get_complete_listing(satellite, prefix, match)
+            if (images is not None):
+                return images
 
-            resp = self._get_sat_bucket(satellite, prefix)
+        contents = self._list_hour(satellite, prefix, date)
 
-            if ('Contents' not in list(resp.keys())):
-                raise KeyError("'Contents' not in AWS response")
+        if (contents is None):
+            raise KeyError("'Contents' not in AWS response")
 
-            if (trim_prod == 'MCMIP'):
-                for each in list(resp['Contents']):
-                    match = scan_re.search(each['Key'])
-                    if (match is not None):
-                        if (sector in match.group(1)):
-                            time = match.group(2)
-                            dt = datetime.strptime('{} {} {}'.format(year, jul_day, time), '%Y %j %H%M')
-                            dt = dt.strftime('%m-%d-%Y-%H:%M')
-                            images.append(AwsGoesFile(each['Key'], '{} {}'.format(match.group(1), dt), dt))
-            else:
-                for each in list(resp['Contents']):
-                    match = scan_re.search(each['Key'])
-                    # print(each['Key'])
-                    if (match is not None):
-                        if (sector in match.group(1) and channel in match.group(1)):
-                            time = match.group(2)
-                            dt = datetime.strptime('{} {} {}'.format(year, jul_day, time), '%Y %j %H%M')
-                            dt = dt.strftime('%m-%d-%Y-%H:%M')
-                            images.append(AwsGoesFile(each['Key'], '{} {}'.format(match.group(1), dt), dt))
-
-        elif (sensor == 'glm'):
-            scan_re = self._scan_re_glm
-            prefix = self._build_prefix_glm(year=year, julian_day=jul_day, hour=hour)
-
-            resp = self._get_sat_bucket(satellite, prefix)
-
-            if ('Contents' not in list(resp.keys())):
-                raise KeyError("'Contents' not in AWS response")
-
-            for each in list(resp['Contents']):
-
-                match = scan_re.search(each['Key'])
-                if (match is not None):
-                        time = match.group(2)
-                        dt = datetime.strptime('{} {} {}'.format(year, jul_day, time), '%Y %j %H%M%S')
-                        dt = dt.strftime('%m-%d-%Y-%H:%M:%S')
-                        images.append(AwsGoesFile(each['Key'], '{} {}'.format(match.group(1), dt), dt))
-
-        else:
-            raise ValueError("Invalid sensor parameter, must be 'abi' or 'glm'")
-
-        return images
+        return match(contents)
 
 
 
@@ -421,9 +444,10 @@ class GoesAWSInterface(object):
 
         Parameters
         ----------
-        satellite : str
-            The satellite to fetch available products for.
-            Valid: 'goes16' & 'goes17'
+        satellite : str or list of str
+            The satellite(s) to fetch available products for. If a list is given,
+            each satellite is queried concurrently and the results are merged.
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         sensor : str
             Which sensor (ABI or GLM) to get data from
             Valid: 'abi' & 'glm'
@@ -453,95 +477,311 @@ class GoesAWSInterface(object):
           for a future time (ex: its currently 1230, end can be set to 1300)
         * To get only one file, 'start' & 'end' can both be set to the time
           of the desired file
+        * When querying several satellites, the merged list is ordered by scan
+          start time and each file's 'satellite' attribute identifies its source
         """
-        images = []
-        added = []
+        if (isinstance(satellite, (list, tuple))):
+            return self._query_satellites(self.get_avail_images_in_range, satellite, sensor,
+                                          start, end, product=product, sector=sector,
+                                          channel=channel)
 
         start_dt = datetime.strptime(start, '%m-%d-%Y-%H:%M')
         end_dt = datetime.strptime(end, '%m-%d-%Y-%H:%M')
 
-        prev_hour = start_dt.hour
-        first = True
+        avail_imgs = []
 
         if (sensor == 'abi'):
+            for hour in self._hour_range(start_dt, end_dt):
+                avail_imgs.extend(self.get_avail_images(satellite, sensor, hour,
+                                                        product=product, sector=sector,
+                                                        channel=channel))
+        elif (sensor == 'glm'):
+            # The three GLM files for the end minute begin after 'end_dt'
+            for hour in self._hour_range(start_dt, end_dt + timedelta(minutes=1)):
+                avail_imgs.extend(self.get_avail_images(satellite, sensor, hour))
+        else:
+            raise ValueError("Invalid sensor parameter, must be 'abi' or 'glm'")
 
-            for day in self._datetime_range(start_dt, end_dt):
-                curr_hour = day.hour
-
-                if (prev_hour != curr_hour):
-                    first = True
-
-                if (first):
-                    first = False
-                    # avail_imgs = self.get_avail_images(satellite, sensor, product, day,
-                    #                                    sector, channel)
-                    avail_imgs = self.get_avail_images(satellite, sensor, day,
-                                                       product=product, sector=sector,
-                                                       channel=channel)
-
-                    for img in avail_imgs:
-                        scan_dt = datetime.strptime(img.scan_time, '%m-%d-%Y-%H:%M')
-
-                        if (self._is_within_range(start_dt, end_dt, scan_dt) == 0):
-                            if (img.shortfname not in added):
-                                added.append(img.shortfname)
-                                images.append(img)
-                        elif (self._is_within_range(start_dt, end_dt, scan_dt) == 1):
-                            # If the current scan time has surpassed the end
-                            # of the desired time span
-                            break
-                prev_hour = curr_hour
+        return self._filter_images_in_range(avail_imgs, sensor, start_dt, end_dt)
 
-        elif (sensor == 'glm'):
 
-            # Increment the end datetime by 1 minute as the three datafiles for
-            # the original end minute technically occur after
-            # Ex: end_dt = 21:30, 21:30:20 & 21:30:40 files wouldn't be included
-            end_dt += timedelta(minutes=1)
 
-            for day in self._datetime_range(start_dt, end_dt):
-                curr_hour = day.hour
+    def plan_queries(self, queries, threads=6):
+        """
+        Resolves many image queries together. The hour prefixes needed by all
+        of the queries are pooled so each one is listed only once, and files
+        requested by more than one query are only returned once. Like
+        get_avail_images(), hours the inventory holds completely aren't
+        listed.
 
-                if (prev_hour != curr_hour):
-                    first = True
+        Parameters
+        ----------
+        queries : list of dict
+            Each dict holds the get_avail_images_in_range parameters of one query:
+            'satellite' (str or list of str), 'sensor', 'start', 'end', and for
+            ABI data 'product', 'sector', & 'channel'. See manifest.read_manifest()
+        threads : int, optional
+            Number of threads used to list the hour prefixes. Default is 6
 
-                if (first):
-                    first = False
-                    avail_imgs = self.get_avail_images(satellite, sensor, day)
+        Returns
+        -------
+        images : list of AwsGoesFile objects
+            Every file matched by at least one query, ordered by scan start time
+        """
+        listings = {}
+        planned_queries = []
 
-                    for img in avail_imgs:
-                        scan_dt = datetime.strptime(img.scan_time, '%m-%d-%Y-%H:%M:%S')
-                        if (self._is_within_range(start_dt, end_dt, scan_dt) == 0):
-                            if (img.shortfname not in added):
-                                added.append(img.shortfname)
-                                images.append(img)
-                        elif (self._is_within_range(start_dt, end_dt, scan_dt) == 1):
-                            # If the current scan time has surpassed the end
-                            # of the desired time span
-                            break
-                prev_hour = curr_hour
+        for query in queries:
+            satellites = query['satellite']
+            if (not isinstance(satellites, (list, tuple))):
+                satellites = [satellites]
 
-            # Remove the last file since it contains data from beyond the desired
-            # time spand
-            images = images[:-1]
-        else:
-            logger = logging.getLogger(__name__)
-            logger.error("Invalid sensor parameter %s", sensor)
-            raise ValueError("Invalid sensor parameter, must be 'abi' or 'glm'")
+            sensor = query.get('sensor', 'abi')
+            start_dt = datetime.strptime(query['start'], '%m-%d-%Y-%H:%M')
+            end_dt = datetime.strptime(query['end'], '%m-%d-%Y-%H:%M')
 
-        return images
+            if (sensor == 'glm'):
+                # The three GLM files for the end minute begin after 'end_dt'
+                hours = list(self._hour_range(start_dt, end_dt + timedelta(minutes=1)))
+            else:
+                hours = list(self._hour_range(start_dt, end_dt))
+
+            for satellite in satellites:
+                # Validate the satellite before any listing is made
+                self._get_bucket_name(satellite)
+                hour_prefixes = []
+
+                for hour in hours:
+                    prefix = self._build_prefix_images(sensor, hour, product=query.get('product'),
+                                                       sector=query.get('sector'))
+                    match = functools.partial(self._match_images, satellite=satellite,
+                                              sensor=sensor, date=hour,
+                                              product=query.get('product'),
+                                              sector=query.get('sector'),
+                                              channel=query.get('channel'))
+
+                    hour_images = None
+                    if (self._inventory is not None):
+                        hour_images = self._inventory.get_complete_listing(satellite, prefix, match)
+                    if (hour_images is None):
+                        listings[(satellite, prefix)] = hour
+                    hour_prefixes.append((satellite, prefix, match, hour_images))
+
+                planned_queries.append((sensor, start_dt, end_dt, hour_prefixes))
+
+        contents = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            future_listing = {executor.submit(self._list_hour, satellite, prefix, hour):
+                                (satellite, prefix) for (satellite, prefix), hour in listings.items()}
+
+            for future in concurrent.futures.as_completed(future_listing):
+                contents[future_listing[future]] = future.result() or []
+
+        images = {}
+        for sensor, start_dt, end_dt, hour_prefixes in planned_queries:
+            avail_imgs = []
+            for satellite, prefix, match, hour_images in hour_prefixes:
+                if (hour_images is None):
+                    hour_images = match(contents[(satellite, prefix)])
+                avail_imgs.extend(hour_images)
+
+            for img in self._filter_images_in_range(avail_imgs, sensor, start_dt, end_dt):
+                images.setdefault((img.satellite, img.key), img)
+
+        return sorted(images.values(), key=lambda x: (x.start_time or datetime.min,
+                                                      x.satellite, x.key))
 
 
 
-    def download(self, satellite, awsgoesfiles, basepath, keep_aws_folders=False, threads=6):
+    def get_nearest_images(self, satellite, sensor, times, product=None, sector=None,
+            channel=None, how='nearest', max_delta=timedelta(minutes=15), threads=6):
         """
-        Downloads GOES data files from the AWS bucket
+        Resolves a batch of timestamps to available data files. Each hour prefix
+        needed by the batch is only listed once, no matter how many timestamps
+        fall within it.
 
         Parameters
         ----------
         satellite : str
             The satellite to fetch available products for.
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
+        sensor : str
+            Which sensor (ABI or GLM) to get data from
+            Valid: 'abi' & 'glm'
+        times : array-like of datetime, str, or numpy.datetime64
+            Timestamps to resolve. Strings may be formatted as MM-DD-YYYY-HH:MM,
+            MM-DD-YYYY-HH:MM:SS, or ISO 8601
+        product : str, optional
+            Imagery product. Required to pull ABI data. Default = None
+        sector : str, optional
+            Satellite scan sector. Required to pull ABI data. Default = None
+        channel : int, optional
+            ABI channel. Required to pull ABI data. Default = None
+        how : str, optional
+            'nearest' - file with the closest scan start time
+            'previous' - most recent file that started at or before the timestamp
+            'covering' - file whose scan start/end window contains the timestamp
+            Default = 'nearest'
+        max_delta : timedelta, optional
+            Largest allowed offset between a timestamp and its matched file's
+            scan start time. Also controls how far into neighboring hours the
+            search reaches. Default = 15 minutes
+        threads : int, optional
+            Number of threads used to list the hour prefixes. Default is 6
+
+        Returns
+        -------
+        images : list of AwsGoesFile objects
+            Index-aligned with 'times'. None where no file matched
+        """
+        if (how not in ['nearest', 'previous', 'covering']):
+            raise ValueError("Invalid how parameter. Must be 'nearest', 'previous', or 'covering'")
+
+        times = to_datetime64(times)
+        delta = np.timedelta64(int(max_delta.total_seconds() * 1000), 'ms')
+
+        # A scan that started in the previous hour may be the closest match, or
+        # may still be running at the timestamp
+        hour_sets = [floor_hour(times), floor_hour(times - delta)]
+        if (how == 'nearest'):
+            hour_sets.append(floor_hour(times + delta))
+        hours = np.unique(np.concatenate(hour_sets))
+
+        avail_imgs = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            future_list = [executor.submit(self._get_avail_images_safe, satellite, sensor,
+                                           hour.astype('datetime64[s]').astype(datetime),
+                                           product, sector, channel)
+                           for hour in hours]
+
+            for future in future_list:
+                avail_imgs.extend(future.result())
+
+        index = ScanIndex(avail_imgs)
+
+        if (how == 'covering'):
+            return index.lookup(times, how=how)
+
+        return index.lookup(times, how=how, max_delta=max_delta)
+
+
+
+    def get_colocated_images(self, satellite, start, end, product, sector, channel=None,
+            how='within', basepath=None, keep_aws_folders=False, threads=6):
+        """
+        Pairs each ABI scan in the time range with the GLM files that fall within
+        the scan's start/end window. The ABI & GLM listings run concurrently and
+        are merge-joined on the scan times parsed from the filenames.
+
+        Parameters
+        ----------
+        satellite : str
+            The satellite to fetch available products for.
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
+        start : str
+            Start date & time of the data. Format: MM-DD-YYYY-HH:MM
+        end : str
+            End date & time of the data. Format: MM-DD-YYYY-HH:MM
+        product : str
+            ABI imagery product
+        sector : str
+            ABI scan sector. 'M1' = mesoscale 1, 'M2' = mesoscale 2, 'C' = CONUS
+        channel : int, optional
+            ABI channel. Not needed for MCMIP. Default = None
+        how : str, optional
+            'within' - GLM file must start & end inside the ABI scan window
+            'overlap' - GLM file only has to overlap the ABI scan window
+            Default = 'within'
+        basepath : str, optional
+            If given, the paired files are downloaded here in a single batch and
+            LocalGoesFile pairs are returned. Default = None
+        keep_aws_folders : bool, optional
+            Passed through to download(). Default is False
+        threads : int, optional
+            Number of threads used to download the files. Default is 6
+
+        Returns
+        -------
+        pairs : list of (AwsGoesFile, list of AwsGoesFile) tuples
+            One tuple per ABI scan, ordered by scan start time. If 'basepath' is
+            given, see download_colocated()
+        """
+        # The last ABI scan in the range may run past 'end', so the GLM listing
+        # is padded by the longest ABI scan duration
+        glm_end = datetime.strptime(end, '%m-%d-%Y-%H:%M') + timedelta(minutes=10)
+        glm_end = glm_end.strftime('%m-%d-%Y-%H:%M')
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            abi_future = executor.submit(self.get_avail_images_in_range, satellite, 'abi',
+                                         start, end, product=product, sector=sector,
+                                         channel=channel)
+            glm_future = executor.submit(self.get_avail_images_in_range, satellite, 'glm',
+                                         start, glm_end)
+
+        pairs = merge_join(abi_future.result(), glm_future.result(), how=how)
+
+        if (basepath is not None):
+            return self.download_colocated(satellite, pairs, basepath,
+                                           keep_aws_folders=keep_aws_folders, threads=threads)
+
+        return pairs
+
+
+
+    def download_colocated(self, satellite, pairs, basepath, keep_aws_folders=False, threads=6):
+        """
+        Downloads the files of a get_colocated_images() result in one batch
+
+        Parameters
+        ----------
+        satellite : str
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
+        pairs : list of (AwsGoesFile, list of AwsGoesFile) tuples
+            Result of get_colocated_images()
+        basepath : str
+            Path to download the data files to
+        keep_aws_folders : bool, optional
+            Passed through to download(). Default is False
+        threads : int, optional
+            Number of threads used to download the files. Default is 6
+
+        Returns
+        -------
+        local_pairs : list of (LocalGoesFile, list of LocalGoesFile) tuples
+            Same layout as 'pairs'. The ABI entry is None if it failed to download,
+            and failed GLM files are left out of their group
+        """
+        awsgoesfiles = {}
+        for abi_file, glm_files in pairs:
+            awsgoesfiles[abi_file.key] = abi_file
+            for glm_file in glm_files:
+                awsgoesfiles[glm_file.key] = glm_file
+
+        results = self.download(satellite, list(awsgoesfiles.values()), basepath,
+                                keep_aws_folders=keep_aws_folders, threads=threads)
+        localfiles = {x.key: x for x in results.iter_success()}
+
+        local_pairs = []
+        for abi_file, glm_files in pairs:
+            local_glm = [localfiles[x.key] for x in glm_files if x.key in localfiles]
+            local_pairs.append((localfiles.get(abi_file.key), local_glm))
+
+        return local_pairs
+
+
+
+    def download(self, satellite, awsgoesfiles, basepath, keep_aws_folders=False, threads=6,
+            callback=None, cache=None, postprocess=None, postprocess_workers=None):
+        """
+        Downloads GOES data files from the AWS bucket. Files from several
+        satellites can be downloaded in a single call; they share one thread
+        pool and one connection pool.
+
+        Parameters
+        ----------
+        satellite : str, list of str, or None
+            The satellite to download files from. Only used for AwsGoesFile
+            objects that are not tagged with their satellite
         awsgoesfiles : list of AwsGoesFile objects
             AwsGoesFile objects to download
         basepath : str
@@ -551,6 +791,27 @@ class GoesAWSInterface(object):
             the 'basepath' directory. Default is False
         threads : int, optional
             Number of threads used to download the files. Default is 6
+        callback : callable, optional
+            Called with each LocalGoesFile as soon as its download completes,
+            from the calling thread. Default is None
+        cache : FileCache, optional
+            Size-bounded cache to download the files into. Files already in the
+            cache are served from its index, downloaded files are added to it,
+            and older files are evicted to stay under its quota. The files of
+            this call are pinned until it returns. If 'basepath' is None the
+            cache directory is used. Default is None
+        postprocess : callable, optional
+            Called with the path of each downloaded file & the path to write
+            its output to (see postprocess_path()) in a process pool, while
+            the other files are still downloading. Returns the path of the
+            processed file. The downloaded file must be left unchanged, so the
+            cache & inventory keep pointing at the file in the bucket, &
+            outputs already on disk are reused. The returned LocalGoesFile
+            objects point at the outputs, which can be directories, ex: Zarr
+            stores. Must be picklable, ex: subset.Subsetter. Files it fails
+            on are counted as errors. Default is None
+        postprocess_workers : int, optional
+            Number of postprocess processes. Default is None (number of CPUs)
 
         Returns
         -------
@@ -561,21 +822,10 @@ class GoesAWSInterface(object):
         if type(awsgoesfiles) == AwsGoesFile:
             awsgoesfiles = [awsgoesfiles]
 
-        localfiles = []
-        errors = []
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
-            future_download = {executor.submit(self._download,goesfile,basepath,keep_aws_folders,satellite):
-                                            goesfile for goesfile in awsgoesfiles}
-
-            for future in concurrent.futures.as_completed(future_download):
-                try:
-                    result = future.result()
-                    localfiles.append(result)
-                    print("Downloaded {}".format(result.filename))
-                except GoesAwsDownloadError:
-                    error = future.exception()
-                    errors.append(error.awsgoesfile)
+        with self.cached_batch(cache, awsgoesfiles, basepath) as basepath:
+            localfiles, errors = self._download_batch(satellite, awsgoesfiles, basepath,
+                                                      keep_aws_folders, threads, callback, cache,
+                                                      postprocess, postprocess_workers)
 
         # Sort returned list of LocalGoesFile objects by the scan_time
         localfiles.sort(key=lambda x:x.scan_time)
@@ -587,6 +837,340 @@ class GoesAWSInterface(object):
 
 
 
+    def fetch(self, awsgoesfile, basepath, keep_aws_folders=False, satellite=None, cache=None):
+        """
+        Downloads a single file like download() does, from the calling
+        thread, & records it in the inventory. The inventory records the file
+        as downloaded, not the output of a postprocess stage
+
+        Parameters
+        ----------
+        awsgoesfile : AwsGoesFile object
+        basepath : str
+        keep_aws_folders : bool, optional
+            Default is False
+        satellite : str, optional
+            Only used if the AwsGoesFile has not been tagged with its
+            satellite. Default is None
+        cache : FileCache, optional
+            Default is None
+
+        Returns
+        -------
+        LocalGoesFile object
+        """
+        localgoesfile = self._download(awsgoesfile, basepath, keep_aws_folders, satellite, cache)
+        if (self._inventory is not None):
+            self._inventory.add(localgoesfile)
+
+        return localgoesfile
+
+
+
+    @contextmanager
+    def cached_batch(self, cache, awsgoesfiles, basepath):
+        """
+        Context manager around the download of a batch of files into a
+        cache: the files are pinned until it exits, & the cache index is
+        saved then. Yields the path to download to, the cache directory if
+        'basepath' is None
+
+        >>> with conn.cached_batch(cache, imgs, None) as basepath:
+        >>>     localfiles = [conn.fetch(x, basepath, cache=cache) for x in imgs]
+        """
+        if (cache is None):
+            yield basepath
+            return
+
+        with cache.pinned(awsgoesfiles):
+            try:
+                yield cache.basepath if basepath is None else basepath
+            finally:
+                cache.save()
+
+
+
+    def read_headers(self, awsgoesfiles, satellite=None, threads=6, initial_size=65536):
+        """
+        Reads the netCDF headers of files in the bucket without downloading
+        them. See AwsGoesFile.read_header()
+
+        Parameters
+        ----------
+        awsgoesfiles : list of AwsGoesFile objects
+        satellite : str, optional
+            Only used for AwsGoesFile objects that are not tagged with their
+            satellite. Default is None
+        threads : int, optional
+            Number of files read concurrently. Default is 6
+        initial_size : int, optional
+            Size of the first ranged GET of each file. Default is 64 KB
+
+        Returns
+        -------
+        headers : list of HDF5Header objects
+            In the order of 'awsgoesfiles'
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            future_list = [executor.submit(x.read_header, self, satellite=satellite,
+                                           initial_size=initial_size) for x in awsgoesfiles]
+
+            return [future.result() for future in future_list]
+
+
+
+    def _build_prefix_images(self, sensor, date, product=None, sector=None):
+        """
+        Validates the image query parameters & constructs the prefix of the
+        hour directory holding the matching files
+
+        Parameters
+        ----------
+        sensor : str
+            Valid: 'abi' & 'glm'
+        date : datetime object
+        product : str, optional
+        sector : str, optional
+
+        Returns
+        -------
+        prefix : str
+        """
+        if (sensor != 'glm' and not self._validate_product(product)):
+            raise ValueError('Invalid product parameter')
+
+        year = date.year
+        hour = date.hour
+        jul_day = date.timetuple().tm_yday
+
+        if (sensor == 'abi'):
+            # Validates the sector parameter
+            self._get_scan_re(sensor, product, sector)
+            prefix = self._build_prefix_abi(product=product, year=year, julian_day=jul_day,
+                                            hour=hour, sector=sector)
+        elif (sensor == 'glm'):
+            prefix = self._build_prefix_glm(year=year, julian_day=jul_day, hour=hour)
+        else:
+            raise ValueError("Invalid sensor parameter, must be 'abi' or 'glm'")
+
+        return prefix
+
+
+
+    def _get_scan_re(self, sensor, product=None, sector=None):
+        """
+        Gets the regular expression used to pick image files out of an AWS
+        listing
+
+        Parameters
+        ----------
+        sensor : str
+            Valid: 'abi' & 'glm'
+        product : str, optional
+        sector : str, optional
+
+        Returns
+        -------
+        scan_re : compiled regular expression
+        """
+        abi_sector_dict = {'C': self._scan_c_re,
+                           'M1': self._scan_m_re,
+                           'M2': self._scan_m_re
+        }
+        mcmip_sector_dict = {'C': self._scan_re_mcmip_c,
+                             'M1': self._scan_re_mcmip_m,
+                             'M2': self._scan_re_mcmip_m}
+
+        if (sensor == 'glm'):
+            return self._scan_re_glm
+
+        try:
+            if (self._trim_product_sector(product) == 'MCMIP'):
+                return mcmip_sector_dict[sector]
+            else:
+                return abi_sector_dict[sector]
+        except KeyError:
+            raise ValueError("Must provide sector parameter ('M1', 'M2', or 'C') when accessing ABI data")
+
+
+
+    def _match_images(self, contents, satellite, sensor, date, product=None, sector=None,
+            channel=None):
+        """
+        Creates AwsGoesFile objects for the keys in an hour listing that match
+        the query parameters
+
+        Parameters
+        ----------
+        contents : list of dict
+            'Contents' entries of a list_objects_v2 response
+        satellite : str
+        sensor : str
+            Valid: 'abi' & 'glm'
+        date : datetime object
+            Hour the listing was made for
+        product : str, optional
+        sector : str, optional
+        channel : str, optional
+
+        Returns
+        -------
+        images : list of AwsGoesFile objects
+        """
+        images = []
+        scan_re = self._get_scan_re(sensor, product, sector)
+
+        year = date.year
+        jul_day = date.timetuple().tm_yday
+
+        if (sensor == 'abi'):
+            is_mcmip = (self._trim_product_sector(product) == 'MCMIP')
+            time_fmt = '%Y %j %H%M'
+            scan_fmt = '%m-%d-%Y-%H:%M'
+        else:
+            time_fmt = '%Y %j %H%M%S'
+            scan_fmt = '%m-%d-%Y-%H:%M:%S'
+
+        for each in list(contents):
+            match = scan_re.search(each['Key'])
+            if (match is None):
+                continue
+
+            if (sensor == 'abi'):
+                if (sector not in match.group(1)):
+                    continue
+                if (not is_mcmip and channel not in match.group(1)):
+                    continue
+
+            time = match.group(2)
+            dt = datetime.strptime('{} {} {}'.format(year, jul_day, time), time_fmt)
+            dt = dt.strftime(scan_fmt)
+            images.append(AwsGoesFile(each['Key'], '{} {}'.format(match.group(1), dt), dt,
+                                      satellite=satellite, size=each.get('Size')))
+
+        return images
+
+
+
+    def _filter_images_in_range(self, avail_imgs, sensor, start_dt, end_dt):
+        """
+        Keeps the images whose scan time lies between start_dt & end_dt,
+        inclusive, dropping duplicates
+
+        Parameters
+        ----------
+        avail_imgs : list of AwsGoesFile objects
+            Files from the hour listings covering the range, in listing order
+        sensor : str
+            Valid: 'abi' & 'glm'
+        start_dt : datetime object
+        end_dt : datetime object
+
+        Returns
+        -------
+        images : list of AwsGoesFile objects
+        """
+        images = []
+        added = set()
+
+        if (sensor == 'glm'):
+            # Increment the end datetime by 1 minute as the three datafiles for
+            # the original end minute technically occur after
+            # Ex: end_dt = 21:30, 21:30:20 & 21:30:40 files wouldn't be included
+            end_dt += timedelta(minutes=1)
+            scan_fmt = '%m-%d-%Y-%H:%M:%S'
+        else:
+            scan_fmt = '%m-%d-%Y-%H:%M'
+
+        for img in avail_imgs:
+            scan_dt = datetime.strptime(img.scan_time, scan_fmt)
+
+            if (self._is_within_range(start_dt, end_dt, scan_dt) == 0):
+                if (img.shortfname not in added):
+                    added.add(img.shortfname)
+                    images.append(img)
+
+        if (sensor == 'glm'):
+            # Remove the last file since it contains data from beyond the desired
+            # time span
+            images = images[:-1]
+
+        return images
+
+
+
+    def _hour_range(self, start, end):
+        """
+        Creates a range of datetime objects, one per hour, covering the period
+        defined by start & end. Each datetime is truncated to the hour
+        """
+        hour = start.replace(minute=0, second=0, microsecond=0)
+
+        while (hour <= end):
+            yield hour
+            hour += timedelta(hours=1)
+
+
+
+    def _list_hour(self, satellite, prefix, date):
+        """
+        Lists an hour prefix & records the listing in the inventory
+
+        Parameters
+        ----------
+        satellite : str
+        prefix : str
+        date : datetime object
+            Hour of the prefix
+
+        Returns
+        -------
+        contents : list of dict or None
+            See _get_prefix_contents()
+        """
+        contents = self._get_prefix_contents(satellite, prefix)
+
+        if (contents is not None and self._inventory is not None):
+            self._inventory.record_listing(satellite, prefix, date, contents)
+
+        return contents
+
+
+
+    def _get_prefix_contents(self, satellite, prefix):
+        """
+        Lists every key under a prefix, following continuation tokens past the
+        1000 key limit of a single list_objects_v2 call
+
+        Parameters
+        ----------
+        satellite : str
+        prefix : str
+
+        Returns
+        -------
+        contents : list of dict or None
+            'Contents' entries of the responses. None if the prefix holds no keys
+        """
+        contents = None
+        resp = self._get_sat_bucket(satellite, prefix)
+
+        while True:
+            if ('Contents' in resp):
+                if (contents is None):
+                    contents = []
+                contents.extend(resp['Contents'])
+
+            if (not resp.get('IsTruncated')):
+                break
+
+            resp = self._get_sat_bucket(satellite, prefix,
+                                        continuation_token=resp['NextContinuationToken'])
+
+        return contents
+
+
+
     def _build_prefix_abi(self, product=None, year=None, julian_day=None, hour=None, sector=None):
         """
         Constructs a prefix for the aws bucket
@@ -752,14 +1336,17 @@ class GoesAWSInterface(object):
 
 
 
-    def _get_sat_bucket(self, satellite, prefix):
+    def _get_sat_bucket(self, satellite, prefix, continuation_token=None):
         """
 
         Parameters
         ----------
         satellite : str
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         prefix : str
+        continuation_token : str, optional
+            NextContinuationToken of the previous, truncated, response.
+            Default: None
 
         Returns
         -------
@@ -777,16 +1364,65 @@ class GoesAWSInterface(object):
         https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.list_objects
         https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.list_objects_v2
         """
-        resp = None
+        bucket = self._get_bucket_name(satellite)
 
-        if (satellite == 'goes16'):
-            resp = self._bucket_16.meta.client.list_objects_v2(Bucket='noaa-goes16', Prefix=prefix, Delimiter='/')
-        elif (satellite == 'goes17'):
-            resp = self._bucket_17.meta.client.list_objects_v2(Bucket='noaa-goes17', Prefix=prefix, Delimiter='/')
-        else:
-            raise ValueError("Invalid satallite parameter. Must be either 'goes16' or 'goes17'")
+        kwargs = {'Bucket': bucket, 'Prefix': prefix, 'Delimiter': '/'}
+        if (continuation_token is not None):
+            kwargs['ContinuationToken'] = continuation_token
+
+        if (self._hedge is not None):
+            return self._hedge.call('list', self._s3client.list_objects_v2, **kwargs)
+
+        return self._s3client.list_objects_v2(**kwargs)
+
+
+
+    def _get_object_range(self, satellite, key, start, end):
+        """
+        Reads a byte range of a file in the bucket with a ranged GET
+
+        Parameters
+        ----------
+        satellite : str
+        key : str
+        start : int
+            Offset of the first byte
+        end : int
+            Offset of the last byte, inclusive
+
+        Returns
+        -------
+        bytes
+        """
+        bucket = self._get_bucket_name(satellite)
+        get = lambda: self._s3client.get_object(Bucket=bucket, Key=key,
+                                                Range='bytes={}-{}'.format(start, end))['Body'].read()
 
-        return resp
+        if (self._hedge is not None):
+            return self._hedge.call('get_range', get)
+
+        return get()
+
+
+
+    def _get_bucket_name(self, satellite):
+        """
+        Looks up the AWS bucket for a satellite in the SATELLITE_BUCKETS registry
+
+        Parameters
+        ----------
+        satellite : str
+            Ex: 'goes16'
+
+        Returns
+        -------
+        bucket : str
+        """
+        try:
+            return SATELLITE_BUCKETS[satellite]
+        except (KeyError, TypeError):
+            raise ValueError("Invalid satallite parameter. Must be one of {}".format(
+                             ', '.join(sorted(SATELLITE_BUCKETS))))
 
 
 
@@ -843,7 +1479,7 @@ class GoesAWSInterface(object):
         Parameters
         ----------
         satellite : str
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         product : str
             Satellite product
         sector : str
@@ -896,7 +1532,7 @@ class GoesAWSInterface(object):
         Parameters
         ----------
         satellite : str
-            Valid: 'goes16' & 'goes17'
+            Valid: any satellite in SATELLITE_BUCKETS, ex: 'goes16' & 'goes17'
         date : datetime object apparently
 
         Returns
@@ -986,10 +1622,102 @@ class GoesAWSInterface(object):
 
 
 
-    def _download(self, awsgoesfile, basepath, keep_aws_folders, satellite):
+    def _download_batch(self, satellite, awsgoesfiles, basepath, keep_aws_folders, threads,
+                        callback, cache, postprocess, postprocess_workers):
+        """
+        Downloads & postprocesses the files of download()
+
+        Returns
+        -------
+        localfiles : list of LocalGoesFile objects
+        errors : list of AwsGoesFile objects
+        """
+        localfiles = []
+        errors = []
+
+        # Cache keys of the postprocess outputs, pinned until this returns
+        post_keys = []
+
+        def finish(result):
+            localfiles.append(result)
+            print("Downloaded {}".format(result.filename))
+            if (callback is not None):
+                callback(result)
+
+        def finish_post(goesfile, out_path):
+            if (cache is not None):
+                post_key = '{}#{}'.format(goesfile.key, os.path.basename(out_path))
+                cache.pin(post_key)
+                post_keys.append(post_key)
+                cache.add(post_key, out_path)
+            finish(LocalGoesFile(goesfile, out_path))
+
+        post_executor = None
+        if (postprocess is not None):
+            # Workers are spawned rather than forked, since the download threads
+            # are running & HDF5 isn't fork safe
+            post_executor = concurrent.futures.ProcessPoolExecutor(max_workers=postprocess_workers,
+                                    mp_context=multiprocessing.get_context('spawn'))
+        future_post = {}
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+                future_download = {executor.submit(self.fetch,goesfile,basepath,keep_aws_folders,satellite,cache):
+                                                goesfile for goesfile in awsgoesfiles}
+                pending = set(future_download)
+
+                # Downloads & postprocessing are waited on together, so files
+                # are processed while the rest of the batch is still downloading
+                while (pending):
+                    done, pending = concurrent.futures.wait(pending,
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        if (future in future_post):
+                            goesfile = future_post.pop(future)
+                            try:
+                                out_path = future.result()
+                            except Exception as exc:
+                                print('Postprocess failed for {}: {}'.format(goesfile.filename, exc))
+                                errors.append(goesfile)
+                                continue
+                            finish_post(goesfile, out_path)
+                            continue
+
+                        try:
+                            result = future.result()
+                        except GoesAwsDownloadError:
+                            error = future.exception()
+                            errors.append(error.awsgoesfile)
+                            continue
+
+                        if (post_executor is None):
+                            finish(result)
+                            continue
+
+                        goesfile = future_download[future]
+                        out_path = postprocess_path(result.filepath, postprocess)
+                        if (os.path.exists(out_path)):
+                            finish_post(goesfile, out_path)
+                        else:
+                            post_future = post_executor.submit(postprocess, result.filepath,
+                                                               out_path)
+                            future_post[post_future] = goesfile
+                            pending.add(post_future)
+        finally:
+            if (post_executor is not None):
+                post_executor.shutdown()
+            for post_key in post_keys:
+                cache.unpin(post_key)
+
+        return localfiles, errors
+
+
+
+    def _download(self, awsgoesfile, basepath, keep_aws_folders, satellite, cache=None):
         """
         Download helper func. If the file already exists in the specified path,
-        it is not re-downloaded.
+        it is not re-downloaded. If another process is already downloading the
+        file into the same path, this waits for it to finish instead.
 
         Parameters
         ----------
@@ -1000,13 +1728,21 @@ class GoesAWSInterface(object):
         keep_aws_folders : bool
             Whether or not to keep the AWS file structure
         satellite : str
-            Satellite that created the data
+            Satellite that created the data. Only used if the AwsGoesFile has
+            not been tagged with its satellite
+        cache : FileCache, optional
+            Cache to look the file up in & add it to. Default is None
 
         Returns
         -------
         LocalGoesFile object
         """
 
+        if (cache is not None):
+            cached_path = cache.get(awsgoesfile.key)
+            if (cached_path is not None):
+                return LocalGoesFile(awsgoesfile, cached_path)
+
         dirpath, filepath = awsgoesfile._create_filepath(basepath, keep_aws_folders)
 
         try:
@@ -1019,22 +1755,76 @@ class GoesAWSInterface(object):
 
         if (not os.path.exists(filepath)):
             try:
-                s3 = boto3.client('s3')
-                s3.meta.events.register('choose-signer.s3.*', disable_signing)
-                if (satellite == 'goes16'):
-                    bucket = 'noaa-goes16'
-                elif (satellite == 'goes17'):
-                    bucket = 'noaa-goes17'
+                # Files tagged with their satellite take precedence so that a
+                # single batch can span several buckets
+                if (awsgoesfile.satellite is not None):
+                    satellite = awsgoesfile.satellite
+                bucket = self._get_bucket_name(satellite)
+
+                # The data is written to a .part file claimed with O_EXCL and
+                # renamed into place, so concurrent workers sharing 'basepath'
+                # never fetch the same file twice or leave a torn file behind
+                if (self._hedge is not None):
+                    fetch = lambda fileobj: self._hedge.download(self._s3client, bucket,
+                                                                 awsgoesfile.key, fileobj)
                 else:
-                    raise ValueError("Invalid satellite parameter. Must be 'goes16' or 'goes17'")
-
-                s3.download_file(bucket, awsgoesfile.key, filepath)
-                return LocalGoesFile(awsgoesfile, filepath)
+                    fetch = lambda fileobj: self._s3client.download_fileobj(bucket, awsgoesfile.key,
+                                                                            fileobj)
+                fetch_once(filepath, fetch, stale_after=self._lock_stale_after)
             except:
                 message = 'Download failed for {}'.format(awsgoesfile.shortfname)
                 raise GoesAwsDownloadError(message, awsgoesfile)
-        else:
-            return LocalGoesFile(awsgoesfile, filepath)
+
+        if (cache is not None):
+            cache.add(awsgoesfile.key, filepath)
+
+        return LocalGoesFile(awsgoesfile, filepath)
+
+
+
+    def _query_satellites(self, func, satellites, *args, **kwargs):
+        """
+        Runs a query function for each satellite concurrently and merges the
+        results
+
+        Parameters
+        ----------
+        func : callable
+            Query method that takes the satellite as its first argument and
+            returns a list of AwsGoesFile objects
+        satellites : list of str
+
+        Returns
+        -------
+        images : list of AwsGoesFile objects
+            Ordered by scan start time, then satellite
+        """
+        images = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(satellites)) as executor:
+            future_list = [executor.submit(func, sat, *args, **kwargs) for sat in satellites]
+
+            for future in future_list:
+                images.extend(future.result())
+
+        images.sort(key=lambda x: (x.start_time or datetime.min, x.satellite))
+
+        return images
+
+
+
+    def _get_avail_images_safe(self, satellite, sensor, date, product, sector, channel):
+        """
+        Wrapper for get_avail_images that returns an empty list for hours that
+        have no data in the bucket instead of raising a KeyError
+        """
+        try:
+            if (sensor == 'glm'):
+                return self.get_avail_images(satellite, sensor, date)
+            return self.get_avail_images(satellite, sensor, date, product=product,
+                                         sector=sector, channel=channel)
+        except KeyError:
+            return []
 
 
 
@@ -0,0 +1,993 @@
+"""
+Author: Matt Nicholson
+
+Minimal reader of the HDF5 metadata of netCDF4 files, for reading the header
+of a file in the AWS bucket without downloading it.
+
+Only the metadata structures needed to list the global attributes, the
+datasets (netCDF variables & dimensions), and their shapes, datatypes,
+storage layouts, filters, & attributes are parsed:
+
+    * Superblock versions 0 - 3
+    * Object header versions 1 & 2, including continuation blocks
+    * Old style groups (symbol table, v1 B-tree, local heap)
+    * New style groups & dense attribute storage (link & attribute info
+      messages, fractal heap, v2 B-tree)
+    * Fixed & variable length (global heap) string attributes
+
+The bytes are read through a RangeReader, which issues ranged reads that grow
+each time the parser runs past the data read so far. A netCDF4 header is
+usually read in a handful of requests, regardless of the file size.
+
+>>> header = awsgoesfile.read_header(conn)
+>>> header.attrs['timeline_id']
+>>> header.dimensions
+>>> header.variables['CMI'].shape
+"""
+import struct
+
+import numpy as np
+
+
+SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+# Object header message types
+MSG_DATASPACE = 0x01
+MSG_LINK_INFO = 0x02
+MSG_DATATYPE = 0x03
+MSG_FILL_VALUE = 0x05
+MSG_LINK = 0x06
+MSG_LAYOUT = 0x08
+MSG_FILTERS = 0x0B
+MSG_ATTRIBUTE = 0x0C
+MSG_CONTINUATION = 0x10
+MSG_SYMBOL_TABLE = 0x11
+MSG_ATTRIBUTE_INFO = 0x15
+
+# Value of the NAME attribute of netCDF dimensions without a coordinate variable
+_NC_DIM_WITHOUT_VAR = 'This is a netCDF dimension but not a netCDF variable'
+
+# Attributes the netCDF4 library uses internally & hides from its users
+_NC_HIDDEN_ATTRS = set(['_NCProperties', '_Netcdf4Coordinates', '_Netcdf4Dimid', '_nc3_strict',
+                        '_IsNetcdf4', 'CLASS', 'NAME', 'DIMENSION_LIST', 'REFERENCE_LIST'])
+
+
+
+class HDF5FormatError(Exception):
+    pass
+
+
+
+class RangeReader(object):
+    """
+    Reads byte ranges of an object through a fetch function, caching what it
+    has read. Each time a read isn't covered by the cache, the next request
+    is made twice as large as the previous one, up to 'max_size'
+
+    Parameters
+    ----------
+    fetch : callable
+        Called with (start, end) & returns the bytes of the inclusive range
+    size : int, optional
+        Size of the object. Requests are clipped to it. Default: None
+    initial_size : int, optional
+        Size of the first request. Default: 64 KB
+    max_size : int, optional
+        Largest request made, unless a single read is larger. Default: 4 MB
+    """
+
+    def __init__(self, fetch, size=None, initial_size=65536, max_size=4194304):
+        super(RangeReader, self).__init__()
+        self.fetch = fetch
+        self.size = size
+        self.max_size = max_size
+        self.requests = 0
+        self.bytes_fetched = 0
+        self._next_size = initial_size
+        self._segments = []
+
+
+
+    def read(self, offset, length):
+        """
+        Returns 'length' bytes starting at 'offset'
+        """
+        start = offset
+        for seg_start, data in self._segments:
+            seg_end = seg_start + len(data)
+            if (seg_start <= offset and offset + length <= seg_end):
+                return data[offset - seg_start:offset - seg_start + length]
+            if (seg_start <= offset < seg_end):
+                # Only fetch what follows the bytes already read
+                start = seg_end
+
+        request = max(offset + length - start, self._next_size)
+        self._next_size = min(self._next_size * 2, self.max_size)
+
+        end = start + request - 1
+        if (self.size is not None):
+            end = min(end, self.size - 1)
+        for seg_start, _ in self._segments:
+            if (offset + length <= seg_start <= end):
+                # Stop where the bytes already read begin
+                end = seg_start - 1
+
+        data = self.fetch(start, end)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        self._add_segment(start, data)
+
+        for seg_start, data in self._segments:
+            if (seg_start <= offset and offset + length <= seg_start + len(data)):
+                return data[offset - seg_start:offset - seg_start + length]
+
+        raise HDF5FormatError('Read past the end of the file at offset {}'.format(offset))
+
+
+
+    def _add_segment(self, start, data):
+        """
+        Adds fetched bytes to the cache, merging segments that touch
+        """
+        segments = sorted(self._segments + [(start, data)], key=lambda x: x[0])
+        merged = [segments[0]]
+
+        for seg_start, seg_data in segments[1:]:
+            last_start, last_data = merged[-1]
+            last_end = last_start + len(last_data)
+            if (seg_start <= last_end):
+                overlap = last_end - seg_start
+                merged[-1] = (last_start, last_data + seg_data[overlap:])
+            else:
+                merged.append((seg_start, seg_data))
+
+        self._segments = merged
+
+
+
+class HDF5Variable(object):
+    """
+    A dataset of the file
+
+    Attributes
+    ----------
+    name : str
+    shape : tuple of int
+    dtype : numpy dtype or None
+        None for datatypes that aren't numeric or string
+    attrs : dict
+        netCDF attributes
+    hdf5_attrs : dict
+        Every HDF5 attribute, including those used internally by netCDF4
+    chunks : tuple of int or None
+        Chunk shape, None unless the dataset is chunked
+    filters : list of (int, tuple of int)
+        Filter ID & parameters of each filter in the pipeline, in order.
+        Ex: (2, (2,)) shuffle, (1, (4,)) deflate level 4
+    layout : dict
+        'class' ('compact', 'contiguous', or 'chunked'), and 'address', 'size',
+        or 'data' depending on the class
+    fill_value : numpy scalar or None
+        Value of the elements of chunks that were never written
+    """
+
+    def __init__(self, name, shape, dtype, hdf5_attrs, layout, filters, fill_value=None):
+        super(HDF5Variable, self).__init__()
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.hdf5_attrs = hdf5_attrs
+        self.attrs = _hide_nc_attrs(hdf5_attrs)
+        self.layout = layout
+        self.filters = filters
+        self.chunks = layout.get('chunks')
+        self.fill_value = fill_value
+
+
+
+    def __repr__(self):
+        return '<HDF5Variable {} {} {}>'.format(self.name, self.shape, self.dtype)
+
+
+
+class HDF5Header(object):
+    """
+    Header of an HDF5 (netCDF4) file
+
+    Parameters
+    ----------
+    reader : RangeReader
+
+    Attributes
+    ----------
+    attrs : dict
+        Global attributes
+    variables : dict
+        Name -> HDF5Variable of every netCDF variable in the root group. Read
+        on first access
+    dimensions : dict
+        Name -> size of every netCDF dimension. Read on first access
+    """
+
+    def __init__(self, reader):
+        super(HDF5Header, self).__init__()
+        self._reader = reader
+        self._global_heaps = {}
+        self._datasets = None
+
+        self._parse_superblock()
+        self._root_messages = self._read_object_header(self._root_address)
+        self.attrs = _hide_nc_attrs(self._get_attrs(self._root_messages))
+
+
+
+    @property
+    def variables(self):
+        datasets = self._get_datasets()
+        return {name: var for name, var in datasets.items()
+                if (not str(var.hdf5_attrs.get('NAME', '')).startswith(_NC_DIM_WITHOUT_VAR))}
+
+
+
+    @property
+    def dimensions(self):
+        datasets = self._get_datasets()
+        return {name: var.shape[0] for name, var in datasets.items()
+                if (var.hdf5_attrs.get('CLASS') == 'DIMENSION_SCALE' and len(var.shape) == 1)}
+
+
+
+    def read(self, address, length):
+        """
+        Reads bytes at an address relative to the base address of the file
+        """
+        return self._reader.read(self._base_address + address, length)
+
+
+
+    def unpack_offset(self, data, pos):
+        return _unpack_uint(data, pos, self.offset_size)
+
+
+
+    def unpack_length(self, data, pos):
+        return _unpack_uint(data, pos, self.length_size)
+
+
+
+    def is_undefined(self, address):
+        return address == (1 << (8 * self.offset_size)) - 1
+
+
+
+    def _get_datasets(self):
+        if (self._datasets is None):
+            self._datasets = {}
+            for name, address in self._get_links(self._root_messages):
+                messages = self._read_object_header(address)
+                types = set(x[0] for x in messages)
+                if (MSG_DATASPACE in types and MSG_DATATYPE in types):
+                    self._datasets[name] = self._build_variable(name, messages)
+
+        return self._datasets
+
+
+
+    def _parse_superblock(self):
+        data = self._reader.read(0, 128)
+
+        if (data[:8] != SIGNATURE):
+            raise HDF5FormatError('Not an HDF5 file')
+
+        version = data[8]
+        if (version in (0, 1)):
+            self.offset_size = data[13]
+            self.length_size = data[14]
+            pos = 24 if version == 0 else 28
+            self._base_address = self.unpack_offset(data, pos)
+            # Free-space, end of file, & driver info addresses, then the root
+            # group symbol table entry (link name offset, object header address)
+            pos += 5 * self.offset_size
+            self._root_address = self.unpack_offset(data, pos)
+        elif (version in (2, 3)):
+            self.offset_size = data[9]
+            self.length_size = data[10]
+            self._base_address = self.unpack_offset(data, 12)
+            # Superblock extension & end of file addresses
+            self._root_address = self.unpack_offset(data, 12 + 3 * self.offset_size)
+        else:
+            raise HDF5FormatError('Unsupported superblock version {}'.format(version))
+
+
+
+    def _read_object_header(self, address):
+        """
+        Reads every message of an object header, following continuations
+
+        Returns
+        -------
+        list of (int, int, bytes)
+            Type, flags, & data of each message
+        """
+        prefix = self.read(address, 16)
+
+        if (prefix[:4] == b'OHDR'):
+            flags = prefix[5]
+            pos = 6
+            if (flags & 0x20):
+                pos += 16
+            if (flags & 0x10):
+                pos += 4
+            size_len = 1 << (flags & 0x03)
+            chunk = self.read(address, pos + size_len)
+            chunk_size = _unpack_uint(chunk, pos, size_len)
+            start = pos + size_len
+            blocks = [(address + start, chunk_size)]
+            crt_order = bool(flags & 0x04)
+            version = 2
+        elif (prefix[0] == 1):
+            # Messages start after the 12 byte prefix, padded to 8 bytes
+            blocks = [(address + 16, _unpack_uint(prefix, 8, 4))]
+            crt_order = False
+            version = 1
+        else:
+            raise HDF5FormatError('Unsupported object header at {}'.format(address))
+
+        messages = []
+        while (blocks):
+            block_address, block_size = blocks.pop(0)
+            block = self.read(block_address, block_size)
+
+            for msg in self._parse_messages(block, version, crt_order):
+                if (msg[0] == MSG_CONTINUATION):
+                    cont_address = self.unpack_offset(msg[2], 0)
+                    cont_size = self.unpack_length(msg[2], self.offset_size)
+                    if (version == 2):
+                        # Skip the 'OCHK' signature & trailing checksum
+                        blocks.append((cont_address + 4, cont_size - 8))
+                    else:
+                        blocks.append((cont_address, cont_size))
+                else:
+                    messages.append(msg)
+
+        return messages
+
+
+
+    def _parse_messages(self, block, version, crt_order):
+        messages = []
+        pos = 0
+
+        if (version == 1):
+            while (pos + 8 <= len(block)):
+                msg_type, size, flags = struct.unpack_from('<HHB', block, pos)
+                messages.append((msg_type, flags, block[pos + 8:pos + 8 + size]))
+                pos += 8 + size
+        else:
+            header_len = 6 if crt_order else 4
+            # The block may end with a gap smaller than a message header
+            while (pos + header_len <= len(block)):
+                msg_type, size, flags = struct.unpack_from('<BHB', block, pos)
+                pos += header_len
+                messages.append((msg_type, flags, block[pos:pos + size]))
+                pos += size
+
+        return messages
+
+
+
+    def _get_links(self, messages):
+        """
+        Gets the (name, object header address) of every hard link of a group
+        """
+        links = []
+
+        for msg_type, _, data in messages:
+            if (msg_type == MSG_LINK):
+                link = self._parse_link(data)
+                if (link is not None):
+                    links.append(link)
+            elif (msg_type == MSG_LINK_INFO):
+                flags = data[1]
+                pos = 2 + (8 if flags & 0x01 else 0)
+                heap_address = self.unpack_offset(data, pos)
+                btree_address = self.unpack_offset(data, pos + self.offset_size)
+                if (not self.is_undefined(heap_address)):
+                    heap = FractalHeap(self, heap_address)
+                    for record in read_btree2(self, btree_address):
+                        # Link name records: hash, then heap ID
+                        link = self._parse_link(heap.get(record[4:]))
+                        if (link is not None):
+                            links.append(link)
+            elif (msg_type == MSG_SYMBOL_TABLE):
+                btree_address = self.unpack_offset(data, 0)
+                heap_address = self.unpack_offset(data, self.offset_size)
+                links.extend(self._read_symbol_table(btree_address, heap_address))
+
+        return links
+
+
+
+    def _parse_link(self, data):
+        flags = data[1]
+        pos = 2
+        link_type = 0
+
+        if (flags & 0x08):
+            link_type = data[pos]
+            pos += 1
+        if (flags & 0x04):
+            pos += 8
+        if (flags & 0x10):
+            pos += 1
+
+        name_len_size = 1 << (flags & 0x03)
+        name_len = _unpack_uint(data, pos, name_len_size)
+        pos += name_len_size
+        name = data[pos:pos + name_len].decode('utf-8')
+        pos += name_len
+
+        if (link_type != 0):
+            # Soft & external links aren't followed
+            return None
+
+        return name, self.unpack_offset(data, pos)
+
+
+
+    def _read_symbol_table(self, btree_address, heap_address):
+        heap = self.read(heap_address, 8 + 2 * self.length_size + self.offset_size)
+        if (heap[:4] != b'HEAP'):
+            raise HDF5FormatError('Bad local heap at {}'.format(heap_address))
+        heap_size = self.unpack_length(heap, 8)
+        heap_data = self.read(self.unpack_offset(heap, 8 + 2 * self.length_size), heap_size)
+
+        links = []
+        entry_size = 2 * self.offset_size + 24
+
+        for snod_address in read_btree1(self, btree_address, key_size=self.length_size):
+            snod = self.read(snod_address, 8)
+            if (snod[:4] != b'SNOD'):
+                raise HDF5FormatError('Bad symbol table node at {}'.format(snod_address))
+            count = _unpack_uint(snod, 6, 2)
+            entries = self.read(snod_address + 8, count * entry_size)
+
+            for i in range(count):
+                pos = i * entry_size
+                name_offset = self.unpack_offset(entries, pos)
+                address = self.unpack_offset(entries, pos + self.offset_size)
+                name_end = heap_data.index(b'\0', name_offset)
+                links.append((heap_data[name_offset:name_end].decode('utf-8'), address))
+
+        return links
+
+
+
+    def _get_attrs(self, messages):
+        attrs = {}
+
+        for msg_type, _, data in messages:
+            if (msg_type == MSG_ATTRIBUTE):
+                name, value = self._parse_attribute(data)
+                attrs[name] = value
+            elif (msg_type == MSG_ATTRIBUTE_INFO):
+                flags = data[1]
+                pos = 2 + (2 if flags & 0x01 else 0)
+                heap_address = self.unpack_offset(data, pos)
+                btree_address = self.unpack_offset(data, pos + self.offset_size)
+                if (not self.is_undefined(heap_address)):
+                    heap = FractalHeap(self, heap_address)
+                    for record in read_btree2(self, btree_address):
+                        # Attribute name records: heap ID, flags, order, hash
+                        name, value = self._parse_attribute(heap.get(record[:8]))
+                        attrs[name] = value
+
+        return attrs
+
+
+
+    def _parse_attribute(self, data):
+        version = data[0]
+        name_size, dt_size, ds_size = struct.unpack_from('<HHH', data, 2)
+
+        if (version == 1):
+            pad = lambda x: (x + 7) & ~7
+            pos = 8
+        elif (version in (2, 3)):
+            pad = lambda x: x
+            pos = 8 if version == 2 else 9
+        else:
+            raise HDF5FormatError('Unsupported attribute message version {}'.format(version))
+
+        name = data[pos:pos + name_size].rstrip(b'\0').decode('utf-8')
+        pos += pad(name_size)
+        datatype = _parse_datatype(data[pos:pos + dt_size])
+        pos += pad(dt_size)
+        shape = self._parse_dataspace(data[pos:pos + ds_size])
+        pos += pad(ds_size)
+
+        return name, self._decode_value(data[pos:], datatype, shape)
+
+
+
+    def _parse_dataspace(self, data):
+        """
+        Returns
+        -------
+        shape : tuple of int or None
+            None for a null dataspace (no elements)
+        """
+        version, ndims, _ = data[0], data[1], data[2]
+
+        if (version == 1):
+            pos = 8
+        else:
+            if (data[3] == 2):
+                return None
+            pos = 4
+
+        return tuple(self.unpack_length(data, pos + i * self.length_size) for i in range(ndims))
+
+
+
+    def _decode_value(self, raw, datatype, shape):
+        kind, dtype, size = datatype
+
+        if (shape is None):
+            return '' if kind in ('string', 'vlen_string') else np.array([], dtype=dtype)
+
+        count = int(np.prod(shape)) if shape else 1
+
+        if (kind == 'numeric'):
+            value = np.frombuffer(raw, dtype=dtype, count=count).reshape(shape)
+            return value.reshape(())[()] if count == 1 else value
+
+        if (kind == 'string'):
+            values = [raw[i * size:(i + 1) * size].split(b'\0', 1)[0].decode('utf-8', 'replace')
+                      for i in range(count)]
+        elif (kind == 'vlen_string'):
+            # Length, then global heap collection address & object index
+            item_size = 8 + self.offset_size
+            values = []
+            for i in range(count):
+                pos = i * item_size
+                length = _unpack_uint(raw, pos, 4)
+                collection = self.unpack_offset(raw, pos + 4)
+                index = _unpack_uint(raw, pos + 4 + self.offset_size, 4)
+                obj = self._get_global_heap(collection).get(index, b'')
+                values.append(obj[:length].decode('utf-8', 'replace'))
+        else:
+            return None
+
+        return values[0] if count == 1 else values
+
+
+
+    def _get_global_heap(self, address):
+        if (address not in self._global_heaps):
+            head = self.read(address, 8 + self.length_size)
+            if (head[:4] != b'GCOL'):
+                raise HDF5FormatError('Bad global heap collection at {}'.format(address))
+            size = self.unpack_length(head, 8)
+            data = self.read(address, size)
+
+            objects = {}
+            pos = 8 + self.length_size
+            while (pos + 8 + self.length_size <= size):
+                index = _unpack_uint(data, pos, 2)
+                if (index == 0):
+                    # Free space runs to the end of the collection
+                    break
+                obj_size = self.unpack_length(data, pos + 8)
+                pos += 8 + self.length_size
+                objects[index] = data[pos:pos + obj_size]
+                pos += (obj_size + 7) & ~7
+
+            self._global_heaps[address] = objects
+
+        return self._global_heaps[address]
+
+
+
+    def _build_variable(self, name, messages):
+        shape = ()
+        datatype = ('other', None, 0)
+        layout = {}
+        filters = []
+        fill = None
+
+        for msg_type, _, data in messages:
+            if (msg_type == MSG_DATASPACE):
+                shape = self._parse_dataspace(data) or ()
+            elif (msg_type == MSG_DATATYPE):
+                datatype = _parse_datatype(data)
+            elif (msg_type == MSG_LAYOUT):
+                layout = self._parse_layout(data)
+            elif (msg_type == MSG_FILTERS):
+                filters = _parse_filters(data)
+            elif (msg_type == MSG_FILL_VALUE):
+                fill = _parse_fill_value(data)
+
+        if (datatype[0] == 'numeric'):
+            dtype = datatype[1]
+        elif (datatype[0] == 'string'):
+            dtype = np.dtype('S{}'.format(datatype[2]))
+        else:
+            dtype = None
+
+        fill_value = None
+        if (fill is not None and dtype is not None and len(fill) == dtype.itemsize):
+            fill_value = np.frombuffer(fill, dtype=dtype)[0]
+
+        return HDF5Variable(name, shape, dtype, self._get_attrs(messages), layout, filters,
+                            fill_value=fill_value)
+
+
+
+    def _parse_layout(self, data):
+        version = data[0]
+        if (version != 3):
+            # Versions 1 & 2 predate HDF5 1.6, version 4 needs the chunk
+            # indexes of HDF5 1.10, neither of which netCDF4 writes by default
+            return {'class': 'unsupported', 'version': version}
+
+        layout_class = data[1]
+        if (layout_class == 0):
+            size = _unpack_uint(data, 2, 2)
+            return {'class': 'compact', 'data': data[4:4 + size]}
+        if (layout_class == 1):
+            return {'class': 'contiguous', 'address': self.unpack_offset(data, 2),
+                    'size': self.unpack_length(data, 2 + self.offset_size)}
+
+        ndims = data[2]
+        address = self.unpack_offset(data, 3)
+        pos = 3 + self.offset_size
+        dims = [_unpack_uint(data, pos + 4 * i, 4) for i in range(ndims)]
+
+        # The last dimension is the size of a dataset element
+        return {'class': 'chunked', 'address': address, 'chunks': tuple(dims[:-1]),
+                'element_size': dims[-1]}
+
+
+
+class FractalHeap(object):
+    """
+    Managed objects of a fractal heap, located by heap ID
+    """
+
+    def __init__(self, header, address):
+        super(FractalHeap, self).__init__()
+        self._header = header
+        o = header.offset_size
+        l = header.length_size
+
+        size = 4 + 1 + 2 + 2 + 1 + 4 + l + o + l + o + 8 * l + 2 + l + l + 2 + 2 + o + 2
+        data = header.read(address, size)
+        if (data[:4] != b'FRHP'):
+            raise HDF5FormatError('Bad fractal heap at {}'.format(address))
+
+        self.id_length, filter_length = struct.unpack_from('<HH', data, 5)
+        self.flags = data[9]
+        self.max_managed_size = _unpack_uint(data, 10, 4)
+        pos = 14 + l + o + l + o + 8 * l
+        self.table_width = _unpack_uint(data, pos, 2)
+        self.start_block_size = _unpack_uint(data, pos + 2, l)
+        self.max_direct_size = _unpack_uint(data, pos + 2 + l, l)
+        max_heap_bits = _unpack_uint(data, pos + 2 + 2 * l, 2)
+        pos += 2 + 2 * l + 2 + 2
+        self.root_address = header.unpack_offset(data, pos)
+        self.root_rows = _unpack_uint(data, pos + o, 2)
+        self.filtered = filter_length > 0
+
+        self.offset_bytes = (max_heap_bits + 7) // 8
+        self.length_bytes = min(_bytes_for_size(self.max_direct_size),
+                                _limit_enc_size(self.max_managed_size))
+        self.max_direct_rows = (_log2(self.max_direct_size) - _log2(self.start_block_size) + 2)
+        self.has_checksum = bool(self.flags & 0x02)
+
+
+
+    def get(self, heap_id):
+        """
+        Returns the object identified by a heap ID
+        """
+        id_type = (heap_id[0] >> 4) & 0x03
+
+        if (id_type == 2):
+            # Tiny objects are stored in the ID itself
+            length = (heap_id[0] & 0x0F) + 1
+            return heap_id[1:1 + length]
+        if (id_type != 0):
+            raise HDF5FormatError('Huge fractal heap objects are not supported')
+
+        offset = _unpack_uint(heap_id, 1, self.offset_bytes)
+        length = _unpack_uint(heap_id, 1 + self.offset_bytes, self.length_bytes)
+
+        if (self.root_rows == 0):
+            address = self.root_address + offset
+        else:
+            address = self._locate(self.root_address, self.root_rows, offset)
+
+        return self._header.read(address, length)
+
+
+
+    def _block_size(self, row):
+        if (row == 0):
+            return self.start_block_size
+        return self.start_block_size * (1 << (row - 1))
+
+
+
+    def _locate(self, block_address, nrows, offset):
+        """
+        Finds the address of a heap offset below an indirect block
+        """
+        o = self._header.offset_size
+        entry_size = o + (self._header.length_size + 4 if self.filtered else 0)
+        # Signature, version, heap header address, & block offset
+        head_size = 5 + o + self.offset_bytes
+        nentries = sum(self.table_width * (entry_size if row < self.max_direct_rows else o)
+                       for row in range(nrows))
+
+        data = self._header.read(block_address, head_size + nentries)
+        if (data[:4] != b'FHIB'):
+            raise HDF5FormatError('Bad fractal heap indirect block at {}'.format(block_address))
+        block_offset = _unpack_uint(data, 5 + o, self.offset_bytes)
+
+        pos = head_size
+        entry_offset = block_offset
+        for row in range(nrows):
+            block_size = self._block_size(row)
+            direct = row < self.max_direct_rows
+            for _ in range(self.table_width):
+                child = self._header.unpack_offset(data, pos)
+                pos += entry_size if direct else o
+
+                if (entry_offset <= offset < entry_offset + block_size):
+                    if (direct):
+                        return child + (offset - entry_offset)
+                    child_rows = (_log2(block_size) -
+                                  _log2(self.start_block_size * self.table_width) + 1)
+                    return self._locate(child, child_rows, offset)
+
+                entry_offset += block_size
+
+        raise HDF5FormatError('Heap offset {} not found'.format(offset))
+
+
+
+def read_btree1(header, address, key_size):
+    """
+    Walks a version 1 B-tree, yielding the address of every leaf child
+
+    Parameters
+    ----------
+    header : HDF5Header
+    address : int
+        Address of the root node
+    key_size : int
+        Size of the keys in bytes
+    """
+    o = header.offset_size
+    node = header.read(address, 8 + 2 * o)
+    if (node[:4] != b'TREE'):
+        raise HDF5FormatError('Bad v1 B-tree node at {}'.format(address))
+
+    level = node[5]
+    entries = _unpack_uint(node, 6, 2)
+    body = header.read(address + 8 + 2 * o, entries * (key_size + o) + key_size)
+
+    for i in range(entries):
+        child = header.unpack_offset(body, i * (key_size + o) + key_size)
+        if (level == 0):
+            yield child
+        else:
+            for leaf in read_btree1(header, child, key_size):
+                yield leaf
+
+
+
+def read_btree1_chunks(header, address, ndims):
+    """
+    Walks a version 1 B-tree of raw data chunks
+
+    Parameters
+    ----------
+    header : HDF5Header
+    address : int
+        Address of the root node
+    ndims : int
+        Dimensionality of the dataset
+
+    Yields
+    ------
+    tuple of (tuple of int, int, int, int)
+        Chunk offset (in elements), address, stored size, & filter mask
+    """
+    o = header.offset_size
+    key_size = 8 + 8 * (ndims + 1)
+    node = header.read(address, 8 + 2 * o)
+    if (node[:4] != b'TREE'):
+        raise HDF5FormatError('Bad v1 B-tree node at {}'.format(address))
+
+    level = node[5]
+    entries = _unpack_uint(node, 6, 2)
+    body = header.read(address + 8 + 2 * o, entries * (key_size + o) + key_size)
+
+    for i in range(entries):
+        pos = i * (key_size + o)
+        child = header.unpack_offset(body, pos + key_size)
+        if (level == 0):
+            size, mask = struct.unpack_from('<II', body, pos)
+            offset = struct.unpack_from('<{}Q'.format(ndims), body, pos + 8)
+            yield tuple(offset), child, size, mask
+        else:
+            for chunk in read_btree1_chunks(header, child, ndims):
+                yield chunk
+
+
+
+def read_btree2(header, address):
+    """
+    Walks a version 2 B-tree, yielding every record in order
+    """
+    o = header.offset_size
+    head = header.read(address, 16 + o + 2 + header.length_size)
+    if (head[:4] != b'BTHD'):
+        raise HDF5FormatError('Bad v2 B-tree header at {}'.format(address))
+
+    node_size = _unpack_uint(head, 6, 4)
+    record_size = _unpack_uint(head, 10, 2)
+    depth = _unpack_uint(head, 12, 2)
+    root = header.unpack_offset(head, 16)
+    root_records = _unpack_uint(head, 16 + o, 2)
+
+    if (header.is_undefined(root) or root_records == 0):
+        return
+
+    # Widths of the child record counts in internal nodes (see H5B2__hdr_init)
+    max_leaf = (node_size - 10) // record_size
+    max_nrec_size = _limit_enc_size(max_leaf)
+    cum_max = [max_leaf]
+    cum_size = [0]
+    for d in range(1, depth + 1):
+        ptr_size = o + max_nrec_size + cum_size[d - 1]
+        max_nrec = (node_size - (10 + ptr_size)) // (record_size + ptr_size)
+        cum_max.append((max_nrec + 1) * cum_max[d - 1] + max_nrec)
+        cum_size.append(_limit_enc_size(cum_max[d]))
+
+    def walk(node_address, nrec, node_depth):
+        data = header.read(node_address, node_size)
+        records = [data[6 + i * record_size:6 + (i + 1) * record_size] for i in range(nrec)]
+
+        if (node_depth == 0):
+            for record in records:
+                yield record
+            return
+
+        pos = 6 + nrec * record_size
+        children = []
+        for _ in range(nrec + 1):
+            child = header.unpack_offset(data, pos)
+            child_nrec = _unpack_uint(data, pos + o, max_nrec_size)
+            pos += o + max_nrec_size
+            if (node_depth > 1):
+                pos += cum_size[node_depth - 1]
+            children.append((child, child_nrec))
+
+        for i, (child, child_nrec) in enumerate(children):
+            for record in walk(child, child_nrec, node_depth - 1):
+                yield record
+            if (i < nrec):
+                yield records[i]
+
+    for record in walk(root, root_records, depth):
+        yield record
+
+
+
+def _parse_datatype(data):
+    """
+    Returns
+    -------
+    tuple of (str, numpy dtype or None, int)
+        Kind ('numeric', 'string', 'vlen_string', or 'other'), dtype, & size
+    """
+    dt_class = data[0] & 0x0F
+    bits = data[1]
+    size = _unpack_uint(data, 4, 4)
+    order = '>' if bits & 0x01 else '<'
+
+    if (dt_class == 0):
+        kind = 'i' if bits & 0x08 else 'u'
+        return 'numeric', np.dtype('{}{}{}'.format(order, kind, size)), size
+    if (dt_class == 1):
+        return 'numeric', np.dtype('{}f{}'.format(order, size)), size
+    if (dt_class == 3):
+        return 'string', None, size
+    if (dt_class == 9 and (bits & 0x0F) == 1):
+        return 'vlen_string', None, size
+
+    return 'other', None, size
+
+
+
+def _parse_fill_value(data):
+    """
+    Returns
+    -------
+    bytes or None
+        Encoded fill value, None if the fill value is undefined
+    """
+    version = data[0]
+
+    if (version in (1, 2)):
+        defined = data[3]
+        pos = 4
+    elif (version == 3):
+        defined = data[1] & 0x20
+        pos = 2
+    else:
+        return None
+
+    if (not defined):
+        return None
+
+    size = _unpack_uint(data, pos, 4)
+    return data[pos + 4:pos + 4 + size]
+
+
+
+def _parse_filters(data):
+    version = data[0]
+    count = data[1]
+    pos = 8 if version == 1 else 2
+    filters = []
+
+    for _ in range(count):
+        filter_id = _unpack_uint(data, pos, 2)
+        pos += 2
+        name_len = 0
+        if (version == 1 or filter_id >= 256):
+            name_len = _unpack_uint(data, pos, 2)
+            pos += 2
+        nvalues = _unpack_uint(data, pos + 2, 2)
+        pos += 4
+        if (version == 1):
+            name_len = (name_len + 7) & ~7
+        pos += name_len
+        values = struct.unpack_from('<{}I'.format(nvalues), data, pos)
+        pos += 4 * nvalues
+        if (version == 1 and nvalues % 2):
+            pos += 4
+        filters.append((filter_id, values))
+
+    return filters
+
+
+
+def _hide_nc_attrs(attrs):
+    return {name: value for name, value in attrs.items() if name not in _NC_HIDDEN_ATTRS}
+
+
+
+def _unpack_uint(data, pos, size):
+    return int.from_bytes(data[pos:pos + size], 'little')
+
+
+
+def _log2(value):
+    return value.bit_length() - 1
+
+
+
+def _limit_enc_size(value):
+    # Bytes needed to encode 'value' (H5VM_limit_enc_size)
+    return (_log2(value) // 8) + 1
+
+
+
+def _bytes_for_size(value):
+    # Bytes needed to encode an offset within a block of 'value' bytes
+    return (_log2(value) + 7) // 8
@@ -0,0 +1,347 @@
+"""
+Author: Matt Nicholson
+
+Hedged S3 requests, to cut the tail latency of listings & downloads.
+
+The latency of each operation type ('list', 'get_range', 'download') is
+tracked over a window of recent requests. When a request runs longer than a
+percentile of those latencies, a duplicate is sent, the first response wins,
+& the other one is cancelled. Hedges are capped by a budget, a fraction of
+the requests, so a slow S3 can't double the traffic:
+
+>>> hedge = HedgePolicy(percentile=95., budget=0.05)
+>>> conn = GoesAWSInterface(hedge=hedge)
+>>> conn.download('goes16', imgs, 'path/to/download')
+>>> hedge.metrics['download']
+{'requests': 240, 'hedged': 9, 'hedge_wins': 7, 'threshold': 1.84}
+
+A listing that lost can't be interrupted, its response is dropped. A
+download that lost is cancelled at its next write, so the two never write to
+the same file: the primary writes to the destination, the hedge to a
+temporary file that is copied over the destination if it wins.
+"""
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+
+import concurrent.futures
+import numpy as np
+
+
+OPERATIONS = ('list', 'get_range', 'download')
+
+
+
+class HedgeCancelled(Exception):
+    """
+    Raised in the request that lost a race, at its next write
+    """
+    pass
+
+
+
+class HedgePolicy(object):
+    """
+    Parameters
+    ----------
+    percentile : float, optional
+        Percentile of the recent latencies of an operation after which a
+        request is hedged. Default: 95.
+    budget : float, optional
+        Largest fraction of the requests of an operation that are hedged.
+        Default: 0.05
+    window : int, optional
+        Number of recent latencies kept per operation. Default: 500
+    min_samples : int, optional
+        Latencies needed before the percentile is used. Default: 20
+    default_threshold : float, optional
+        Seconds after which requests are hedged until 'min_samples'
+        latencies are known. Default: None (no hedging until then)
+    max_workers : int, optional
+        Number of threads running the requests. Losers keep a thread until
+        they return. Default: 32
+    tmpdir : str, optional
+        Directory of the temporary files of hedged downloads. Default: None
+        (the system temporary directory)
+    """
+
+    def __init__(self, percentile=95., budget=0.05, window=500, min_samples=20,
+                 default_threshold=None, max_workers=32, tmpdir=None):
+        super(HedgePolicy, self).__init__()
+        if (not 0 < percentile < 100):
+            raise ValueError('percentile must be between 0 & 100')
+        if (not 0 <= budget <= 1):
+            raise ValueError('budget must be between 0 & 1')
+
+        self.percentile = percentile
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self.default_threshold = default_threshold
+        self.tmpdir = tmpdir
+
+        self._latencies = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+
+
+    def threshold(self, op):
+        """
+        Gets the seconds after which a request of an operation is hedged
+
+        Parameters
+        ----------
+        op : str
+            Operation type. Ex: 'list'
+
+        Returns
+        -------
+        float or None
+            None if requests of 'op' aren't hedged yet
+        """
+        with self._lock:
+            latencies = self._latencies.get(op)
+            if (latencies is None or len(latencies) < self.min_samples):
+                return self.default_threshold
+            return float(np.percentile(latencies, self.percentile))
+
+
+
+    def record(self, op, seconds):
+        """
+        Adds the latency of a completed request
+        """
+        with self._lock:
+            if (op not in self._latencies):
+                self._latencies[op] = deque(maxlen=self.window)
+            self._latencies[op].append(seconds)
+
+
+
+    @property
+    def metrics(self):
+        """
+        dict
+            Operation -> 'requests', 'hedged', 'hedge_wins', & the current
+            'threshold' in seconds
+        """
+        with self._lock:
+            ops = list(self._stats)
+            stats = {op: dict(self._stats[op]) for op in ops}
+        for op in ops:
+            stats[op]['threshold'] = self.threshold(op)
+
+        return stats
+
+
+
+    def call(self, op, func, *args, **kwargs):
+        """
+        Runs a request, hedging it if it is slow
+
+        Parameters
+        ----------
+        op : str
+            Operation type
+        func : callable
+            The request, ex: client.list_objects_v2. Must be safe to call
+            twice at once
+
+        Returns
+        -------
+        The result of the first request that succeeded
+        """
+        attempt = lambda: func(*args, **kwargs)
+        _, result, _ = self._race(op, [attempt, attempt])
+
+        return result
+
+
+
+    def download(self, client, bucket, key, fileobj):
+        """
+        Hedged client.download_fileobj()
+
+        Parameters
+        ----------
+        client : boto3 S3 client
+        bucket : str
+        key : str
+        fileobj : file object
+            Seekable binary file to write to
+        """
+        primary = _GuardedWriter(fileobj)
+        hedge = []
+
+        def prepare_hedge():
+            # Made before the hedge is submitted, so it can be cancelled even
+            # if the primary wins before the hedge starts
+            tmp = tempfile.TemporaryFile(dir=self.tmpdir)
+            hedge.append((tmp, _GuardedWriter(tmp)))
+
+        def download_primary():
+            client.download_fileobj(bucket, key, primary)
+
+        def download_hedge():
+            tmp, writer = hedge[0]
+            try:
+                client.download_fileobj(bucket, key, writer)
+            except:
+                tmp.close()
+                raise
+            return tmp
+
+        winner, result, futures = self._race('download', [download_primary, download_hedge],
+                                             prepare_hedge=prepare_hedge)
+
+        if (winner == 0):
+            for tmp, writer in hedge:
+                writer.cancel()
+                # Also closed if the hedge was cancelled before it started
+                futures[1].add_done_callback(lambda future, tmp=tmp: tmp.close())
+            return
+
+        # No write of the primary can happen once it is cancelled, so the
+        # destination can be overwritten with the hedge's data
+        primary.cancel()
+        try:
+            fileobj.seek(0)
+            fileobj.truncate()
+            result.seek(0)
+            shutil.copyfileobj(result, fileobj)
+        finally:
+            result.close()
+
+
+
+    def _race(self, op, attempts, prepare_hedge=None):
+        """
+        Runs the primary request & the hedge, if the primary is slower than
+        the threshold & the budget allows it. 'prepare_hedge' is called from
+        the calling thread right before the hedge is submitted
+
+        Returns
+        -------
+        winner : int
+            0 for the primary, 1 for the hedge
+        result
+        futures : list of concurrent.futures.Future
+        """
+        with self._lock:
+            stats = self._stats.setdefault(op, {'requests': 0, 'hedged': 0, 'hedge_wins': 0})
+            stats['requests'] += 1
+
+        threshold = self.threshold(op)
+        started = []
+        started_event = threading.Event()
+
+        def primary():
+            started.append(time.time())
+            started_event.set()
+            return self._timed(op, attempts[0])
+
+        futures = [self._executor.submit(primary)]
+
+        if (threshold is not None):
+            # The clock starts when the primary does: time spent queued for a
+            # thread of the pool isn't latency of the request
+            started_event.wait()
+            timeout = max(started[0] + threshold - time.time(), 0.)
+            done, _ = concurrent.futures.wait(futures, timeout=timeout)
+            if (not done and self._take_budget(stats)):
+                if (prepare_hedge is not None):
+                    prepare_hedge()
+                futures.append(self._executor.submit(self._timed, op, attempts[1]))
+
+        pending = set(futures)
+        while (pending):
+            done, pending = concurrent.futures.wait(pending,
+                                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in sorted(done, key=futures.index):
+                if (future.exception() is not None):
+                    continue
+                for other in pending:
+                    other.cancel()
+                winner = futures.index(future)
+                if (winner == 1):
+                    with self._lock:
+                        stats['hedge_wins'] += 1
+                return winner, future.result(), futures
+
+        raise futures[0].exception()
+
+
+
+    def _take_budget(self, stats):
+        with self._lock:
+            if (stats['hedged'] + 1 > self.budget * stats['requests']):
+                return False
+            stats['hedged'] += 1
+            return True
+
+
+
+    def _timed(self, op, attempt):
+        start = time.time()
+        result = attempt()
+        self.record(op, time.time() - start)
+
+        return result
+
+
+
+class _GuardedWriter(object):
+    """
+    File object wrapper that can be cancelled: once cancel() returns, no
+    write reaches the file & every call raises HedgeCancelled
+    """
+
+    def __init__(self, fileobj):
+        super(_GuardedWriter, self).__init__()
+        self._fileobj = fileobj
+        self._lock = threading.Lock()
+        self.cancelled = False
+
+
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+
+
+
+    def write(self, data):
+        return self._call('write', data)
+
+
+
+    def seek(self, *args):
+        return self._call('seek', *args)
+
+
+
+    def tell(self):
+        return self._call('tell')
+
+
+
+    def seekable(self):
+        return self._fileobj.seekable()
+
+
+
+    def flush(self):
+        return self._call('flush')
+
+
+
+    def _call(self, name, *args):
+        with self._lock:
+            if (self.cancelled):
+                raise HedgeCancelled()
+            return getattr(self._fileobj, name)(*args)
+
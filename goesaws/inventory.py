@@ -0,0 +1,433 @@
+"""
+Author: Matt Nicholson
+
+SQLite inventory of downloaded GOES files.
+
+Every file is indexed by its AWS key, along with its satellite, size, and
+local path. The inventory is updated by download() when it is passed
+to GoesAWSInterface, and can be rebuilt at any time by scanning the download
+directories, since the AWS key of a file can be reconstructed from its name.
+
+Files are looked up with the same prefix queries used against the AWS bucket,
+so get_avail_images() & get_avail_images_in_range() return the same files as
+their GoesAWSInterface counterparts, entirely offline.
+
+GoesAWSInterface also records the hour listings it makes in the inventory.
+Once an hour is over (see goesawsinterface.HOUR_SETTLE_TIME) and every file of its
+listing matching a query is downloaded, that hour is answered from the
+inventory instead of being listed again.
+
+>>> inventory = LocalInventory('inventory.db')
+>>> conn = GoesAWSInterface(inventory=inventory)
+>>> conn.download('goes16', conn.get_avail_images_in_range(...), 'path/to/download')
+>>> imgs = inventory.get_avail_images_in_range('goes16', 'abi', '09-01-2019-00:00',
+>>>                                            '09-01-2019-00:15', product='CMIP',
+>>>                                            sector='C', channel='13')
+"""
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from awsgoesfile import AwsGoesFile, _parse_fname_times
+from goesawsinterface import HOUR_SETTLE_TIME, GoesAWSInterface
+from localgoesfile import LocalGoesFile
+
+
+# Matches a GOES-R series filename, capturing the product & sector of its
+# bucket directory. Ex: OR_ABI-L2-CMIPM2-M6C13_G16_s2019...
+_fname_abi_re = re.compile(r'^OR_(ABI-L\w+?-[A-Za-z]+?)(M1|M2|C|F)-M(\d)(?:C(\d{2}))?_G(\d{2})_s\d')
+_fname_glm_re = re.compile(r'^OR_(GLM-L2-LCFA)_G(\d{2})_s\d')
+# Files as named in the bucket end with their creation time. Postprocess
+# outputs (see goesawsinterface.postprocess_path) have a suffix after it
+_fname_end_re = re.compile(r'_c\d{14}\.nc$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY,
+    satellite TEXT NOT NULL,
+    size INTEGER,
+    filepath TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_query ON files (satellite, key);
+CREATE TABLE IF NOT EXISTS listings (
+    satellite TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    key TEXT NOT NULL,
+    size INTEGER,
+    PRIMARY KEY (satellite, prefix, key)
+);
+CREATE TABLE IF NOT EXISTS closed_listings (
+    satellite TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    PRIMARY KEY (satellite, prefix)
+);
+"""
+
+
+
+class LocalInventory(object):
+    """
+    Parameters
+    ----------
+    path : str
+        Path of the SQLite database. Created if it doesn't exist
+    conn : GoesAWSInterface, optional
+        Interface whose query validation & filename matching is used. No
+        requests are made through it. Default: None (a new one is created)
+    """
+
+    def __init__(self, path, conn=None):
+        super(LocalInventory, self).__init__()
+        self.path = path
+        self._conn = conn
+        # Shared by the listing & download threads of GoesAWSInterface
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        _drop_filename_columns(self._db)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+
+
+
+    def close(self):
+        self._db.close()
+
+
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+
+
+    def add(self, localgoesfile, size=None):
+        """
+        Adds a downloaded file to the inventory
+
+        Parameters
+        ----------
+        localgoesfile : LocalGoesFile
+        size : int, optional
+            Size of the file in bytes. Read from disk if not given
+        """
+        if (size is None):
+            size = os.path.getsize(localgoesfile.filepath)
+
+        row = _parse_row(localgoesfile.key, localgoesfile.filepath, size)
+        if (row is None):
+            return
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', row)
+            self._db.commit()
+
+
+
+    def rebuild(self, basepaths):
+        """
+        Replaces the file index with the GOES files found under one or more
+        directories. Partial downloads (.part files) are skipped
+
+        Parameters
+        ----------
+        basepaths : str or list of str
+
+        Returns
+        -------
+        int
+            Number of files indexed
+        """
+        if (isinstance(basepaths, str)):
+            basepaths = [basepaths]
+
+        rows = []
+        for basepath in basepaths:
+            for dirpath, _, fnames in os.walk(basepath):
+                for fname in fnames:
+                    if (fname.endswith('.part')):
+                        continue
+
+                    key = key_from_filename(fname)
+                    if (key is None):
+                        continue
+
+                    filepath = os.path.join(dirpath, fname)
+                    rows.append(_parse_row(key, filepath, os.path.getsize(filepath)))
+
+        with self._lock:
+            self._db.execute('DELETE FROM files')
+            self._db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                 rows)
+            self._db.commit()
+
+        return len(rows)
+
+
+
+    def get_avail_images(self, satellite, sensor, date, product=None, sector=None, channel=None):
+        """
+        Offline counterpart of GoesAWSInterface.get_avail_images
+
+        Parameters
+        ----------
+        satellite : str or list of str
+        sensor : str
+            Valid: 'abi' & 'glm'
+        date : str or datetime object
+            Format: MM-DD-YYYY-HH
+        product : str, optional
+        sector : str, optional
+        channel : str, optional
+
+        Returns
+        -------
+        images : list of LocalGoesFile objects
+        """
+        if (isinstance(satellite, (list, tuple))):
+            images = []
+            for sat in satellite:
+                images.extend(self.get_avail_images(sat, sensor, date, product=product,
+                                                    sector=sector, channel=channel))
+            images.sort(key=lambda x: (x.start_time or datetime.min, x.satellite))
+            return images
+
+        if (not isinstance(date, datetime)):
+            date = datetime.strptime(date, '%m-%d-%Y-%H')
+
+        conn = self._get_conn()
+        prefix = conn._build_prefix_images(sensor, date, product=product, sector=sector)
+        filepaths = {}
+        contents = []
+
+        with self._lock:
+            rows = self._db.execute('SELECT key, size, filepath FROM files WHERE satellite = ? AND '
+                                    'key >= ? AND key < ? ORDER BY key',
+                                    (satellite, prefix, _prefix_end(prefix))).fetchall()
+
+        for key, size, filepath in rows:
+            filepaths[key] = filepath
+            contents.append({'Key': key, 'Size': size})
+
+        if (sensor == 'glm'):
+            images = conn._match_images(contents, satellite, sensor, date)
+        else:
+            images = conn._match_images(contents, satellite, sensor, date, product=product,
+                                        sector=sector, channel=channel)
+
+        return [LocalGoesFile(x, filepaths[x.key]) for x in images]
+
+
+
+    def get_avail_images_in_range(self, satellite, sensor, start, end, product=None,
+            sector=None, channel=None):
+        """
+        Offline counterpart of GoesAWSInterface.get_avail_images_in_range
+
+        Parameters
+        ----------
+        satellite : str or list of str
+        sensor : str
+            Valid: 'abi' & 'glm'
+        start : str
+            Format: MM-DD-YYYY-HH:MM
+        end : str
+            Format: MM-DD-YYYY-HH:MM
+        product : str, optional
+        sector : str, optional
+        channel : str, optional
+
+        Returns
+        -------
+        images : list of LocalGoesFile objects
+            Local files between the start and end date & times, inclusive
+        """
+        if (isinstance(satellite, (list, tuple))):
+            images = []
+            for sat in satellite:
+                images.extend(self.get_avail_images_in_range(sat, sensor, start, end,
+                                                             product=product, sector=sector,
+                                                             channel=channel))
+            images.sort(key=lambda x: (x.start_time or datetime.min, x.satellite))
+            return images
+
+        conn = self._get_conn()
+        start_dt = datetime.strptime(start, '%m-%d-%Y-%H:%M')
+        end_dt = datetime.strptime(end, '%m-%d-%Y-%H:%M')
+
+        if (sensor == 'glm'):
+            hours = conn._hour_range(start_dt, end_dt + timedelta(minutes=1))
+        elif (sensor == 'abi'):
+            hours = conn._hour_range(start_dt, end_dt)
+        else:
+            raise ValueError("Invalid sensor parameter, must be 'abi' or 'glm'")
+
+        avail_imgs = []
+        for hour in hours:
+            avail_imgs.extend(self.get_avail_images(satellite, sensor, hour, product=product,
+                                                    sector=sector, channel=channel))
+
+        return conn._filter_images_in_range(avail_imgs, sensor, start_dt, end_dt)
+
+
+
+    def record_listing(self, satellite, prefix, date, contents):
+        """
+        Records the result of an hour listing made against the bucket. Only
+        listings of hours that are over are kept, as later listings of an
+        hour still in progress would return more files
+
+        Parameters
+        ----------
+        satellite : str
+        prefix : str
+            Prefix the listing was made for
+        date : datetime object
+            Hour the listing was made for
+        contents : list of dict
+            'Contents' entries of the listing
+        """
+        if (date.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1) >
+                datetime.utcnow() - HOUR_SETTLE_TIME):
+            return
+
+        with self._lock:
+            self._db.executemany('INSERT OR IGNORE INTO listings VALUES (?, ?, ?, ?)',
+                                 [(satellite, prefix, x['Key'], x.get('Size')) for x in contents])
+            self._db.execute('INSERT OR IGNORE INTO closed_listings VALUES (?, ?)',
+                             (satellite, prefix))
+            self._db.commit()
+
+
+
+    def get_complete_listing(self, satellite, prefix, match):
+        """
+        Returns the recorded listing of an hour if every file in it selected
+        by 'match' is downloaded & still on disk
+
+        Parameters
+        ----------
+        satellite : str
+        prefix : str
+        match : callable
+            Called with the listing contents, returns the AwsGoesFile objects
+            matching the query
+
+        Returns
+        -------
+        images : list of AwsGoesFile objects or None
+            None if the hour has no closed listing or isn't complete locally
+        """
+        with self._lock:
+            closed = self._db.execute('SELECT 1 FROM closed_listings WHERE satellite = ? AND '
+                                      'prefix = ?', (satellite, prefix)).fetchone()
+            if (closed is None):
+                return None
+
+            contents = [{'Key': key, 'Size': size} for key, size in
+                        self._db.execute('SELECT key, size FROM listings WHERE satellite = ? AND '
+                                         'prefix = ? ORDER BY key', (satellite, prefix))]
+            local = dict(self._db.execute('SELECT l.key, f.filepath FROM listings l JOIN files f '
+                                          'ON f.key = l.key WHERE l.satellite = ? AND l.prefix = ?',
+                                          (satellite, prefix)).fetchall())
+
+        images = match(contents)
+        for image in images:
+            if (image.key not in local or not os.path.exists(local[image.key])):
+                return None
+
+        return images
+
+
+
+    def _get_conn(self):
+        if (self._conn is None):
+            self._conn = GoesAWSInterface()
+        return self._conn
+
+
+
+def key_from_filename(fname):
+    """
+    Reconstructs the AWS key of a GOES-R series file from its filename
+
+    Parameters
+    ----------
+    fname : str
+        Ex: OR_ABI-L2-CMIPC-M6C13_G16_s20192441601151_e20192441603524_c20192441604018.nc
+
+    Returns
+    -------
+    key : str or None
+        Ex: ABI-L2-CMIPC/2019/244/16/OR_ABI-L2-CMIPC-M6C13_G16_s20192441601151_e2019...
+        None if the filename isn't a GOES-R series filename
+    """
+    if (_fname_end_re.search(fname) is None):
+        return None
+
+    match = _fname_abi_re.match(fname)
+    if (match is not None):
+        dirname = match.group(1) + match.group(2)[0]
+    else:
+        match = _fname_glm_re.match(fname)
+        if (match is None):
+            return None
+        dirname = match.group(1)
+
+    start, _ = _parse_fname_times(fname)
+    if (start is None):
+        return None
+
+    return '{}/{}/{}'.format(dirname, start.strftime('%Y/%j/%H'), fname)
+
+
+
+def _parse_row(key, filepath, size):
+    """
+    Builds the files table row of a file from its AWS key. None if the key
+    isn't a GOES-R series file
+    """
+    awsgoesfile = AwsGoesFile(key, None, None)
+    fname = awsgoesfile.filename
+
+    if (_fname_abi_re.match(fname) is None and _fname_glm_re.match(fname) is None):
+        return None
+
+    return (key, awsgoesfile.satellite, size, filepath)
+
+
+
+def _drop_filename_columns(db):
+    """
+    Migrates a files table made by earlier versions, which also held the
+    product, sector, scan mode, channel, & scan times parsed from the
+    filenames. None of them were queried
+    """
+    columns = [x[1] for x in db.execute('PRAGMA table_info(files)').fetchall()]
+    if ('product' not in columns):
+        return
+
+    db.executescript("""
+        DROP INDEX IF EXISTS files_query;
+        ALTER TABLE files RENAME TO files_old;
+        CREATE TABLE files (
+            key TEXT PRIMARY KEY,
+            satellite TEXT NOT NULL,
+            size INTEGER,
+            filepath TEXT NOT NULL
+        );
+        INSERT INTO files SELECT key, satellite, size, filepath FROM files_old;
+        DROP TABLE files_old;
+    """)
+    db.commit()
+
+
+
+def _prefix_end(prefix):
+    """
+    Smallest string greater than every string starting with 'prefix', so a
+    prefix query is a range scan of the primary key index
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
@@ -1,16 +1,144 @@
 import os
+
+import numpy as np
 from netCDF4 import Dataset
 
+import calibrate
+from fixedgrid import read_geometry, scan_to_latlon
+from metaindex import read_metadata
+
 
 class LocalGoesFile(object):
 
-    def __init__(self, awsgoesfile, localfilepath):
+    def __init__(self, awsgoesfile, localfilepath, metaindex=None):
         super(LocalGoesFile, self).__init__()
         self.key = awsgoesfile.key
         self.shortfname = awsgoesfile.shortfname
         self.filename = awsgoesfile.filename
         self.scan_time = awsgoesfile.scan_time
+        self.satellite = awsgoesfile.satellite
+        self.start_time = awsgoesfile.start_time
+        self.end_time = awsgoesfile.end_time
         self.filepath = localfilepath
+        # MetadataIndex the header attributes are looked up in
+        self._metaindex = metaindex
+        self._metadata = None
+        self._geometry = None
+
+
+    @property
+    def metadata(self):
+        """
+        Global attributes & DQF summaries of the file (see metaindex.py). Taken
+        from the MetadataIndex if the file is indexed, otherwise the header is
+        read once
+        """
+        if (self._metadata is None):
+            if (self._metaindex is not None):
+                self._metadata = self._metaindex.lookup(self.filepath)
+
+            if (self._metadata is None):
+                self._metadata = read_metadata(self.filepath)
+
+        return self._metadata
+
+
+    @property
+    def time_coverage_start(self):
+        return self.metadata.get('time_coverage_start')
+
+
+    @property
+    def time_coverage_end(self):
+        return self.metadata.get('time_coverage_end')
+
+
+    @property
+    def scene_id(self):
+        return self.metadata.get('scene_id')
+
+
+    @property
+    def timeline_id(self):
+        return self.metadata.get('timeline_id')
+
+
+    @property
+    def geometry(self):
+        """
+        Fixed grid geometry of the file (see fixedgrid.py). Read once
+        """
+        if (self._geometry is None):
+            with Dataset(self.filepath, 'r') as ds:
+                self._geometry = read_geometry(ds)
+
+        return self._geometry
+
+
+    def latlon(self, cache=None):
+        """
+        Gets the latitude & longitude of every pixel of the file
+
+        Parameters
+        ----------
+        cache : LatLonCache, optional
+            Cache of the lat/lon arrays of each grid, see geolocation.py.
+            Default: None (computed for this call only)
+
+        Returns
+        -------
+        lat, lon : numpy arrays
+            Of shape (y, x), in degrees. NaN off the Earth's disk
+        """
+        if (cache is not None):
+            return cache.get(self.geometry, satellite=self.satellite)
+
+        geometry = self.geometry
+        x = geometry.x_offset + geometry.x_scale * np.arange(geometry.nx)
+        y = geometry.y_offset + geometry.y_scale * np.arange(geometry.ny)
+
+        return scan_to_latlon(geometry, x[np.newaxis, :], y[:, np.newaxis])
+
+
+    def regrid(self, name, regridder, fill_value=np.nan):
+        """
+        Regrids a variable of the file to a lat/lon grid. Only the source
+        rows each block of target pixels falls on are read at a time, see
+        Regridder.regrid_variable()
+
+        Parameters
+        ----------
+        name : str
+            Variable on the fixed grid. Ex: 'CMI'
+        regridder : Regridder
+            Target grid & method, see regrid.py
+        fill_value : scalar, optional
+            Value of the target pixels outside the file's grid. Default: NaN
+
+        Returns
+        -------
+        numpy array
+        """
+        with Dataset(self.filepath, 'r') as ds:
+            return regridder.regrid_variable(ds.variables[name], self.geometry,
+                                             fill_value=fill_value)
+
+
+    def calibrate(self, out=None):
+        """
+        Converts the radiances of an L1b file to reflectance (bands 1 - 6) or
+        brightness temperature (bands 7 - 16), see calibrate.py
+
+        Parameters
+        ----------
+        out : numpy array, optional
+            float32 array of the shape of Rad to write to. Default: None
+
+        Returns
+        -------
+        numpy array
+        """
+        return calibrate.calibrate(self.filepath, out=out)
 
 
     def __repr__(self):
@@ -0,0 +1,161 @@
+"""
+Author: Matt Nicholson
+
+Reading & writing of query manifests and resolved file manifests.
+
+A query manifest lists the queries of a batch job, one per entry, using the
+same parameters as GoesAWSInterface.get_avail_images_in_range. It may be
+written as JSON, YAML, or CSV.
+
+JSON/YAML
+---------
+    queries:
+      - satellite: [goes16, goes17]
+        sensor: abi
+        product: CMIP
+        sector: C
+        channel: 13
+        start: 09-01-2019-00:00
+        end: 09-01-2019-06:00
+      - satellite: goes16
+        sensor: glm
+        start: 09-01-2019-00:00
+        end: 09-01-2019-01:00
+
+CSV
+---
+    satellite,sensor,product,sector,channel,start,end
+    goes16 goes17,abi,CMIP,C,13,09-01-2019-00:00,09-01-2019-06:00
+
+A resolved manifest is the output of GoesAWSInterface.plan_queries: the
+exact list of files to download. It is written as JSON so it can be inspected,
+copied to other machines, and executed separately from the planning step.
+"""
+import csv
+import json
+import os
+
+from awsgoesfile import AwsGoesFile
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+QUERY_FIELDS = ['satellite', 'sensor', 'product', 'sector', 'channel', 'start', 'end']
+
+
+
+def read_manifest(path):
+    """
+    Reads a query manifest
+
+    Parameters
+    ----------
+    path : str
+        Path to a .json, .yaml/.yml, or .csv manifest
+
+    Returns
+    -------
+    queries : list of dict
+        Queries ready to be passed to GoesAWSInterface.plan_queries()
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    with open(path, 'r') as f:
+        if (ext == '.json'):
+            entries = json.load(f)
+        elif (ext in ['.yaml', '.yml']):
+            if (yaml is None):
+                raise ImportError('PyYAML is required to read YAML manifests')
+            entries = yaml.safe_load(f)
+        elif (ext == '.csv'):
+            entries = list(csv.DictReader(f))
+        else:
+            raise ValueError('Invalid manifest file type. Must be .json, .yaml, .yml, or .csv')
+
+    if (isinstance(entries, dict)):
+        entries = entries.get('queries', [])
+
+    return [_normalize_query(x) for x in entries]
+
+
+
+def write_resolved_manifest(path, awsgoesfiles):
+    """
+    Writes the files resolved from a query manifest
+
+    Parameters
+    ----------
+    path : str
+        Path of the JSON file to write
+    awsgoesfiles : list of AwsGoesFile objects
+    """
+    files = []
+    for awsgoesfile in awsgoesfiles:
+        files.append({'satellite': awsgoesfile.satellite,
+                      'key': awsgoesfile.key,
+                      'size': awsgoesfile.size,
+                      'scan_time': awsgoesfile.scan_time,
+                      'shortfname': awsgoesfile.shortfname})
+
+    with open(path, 'w') as f:
+        json.dump({'files': files}, f, indent=1)
+
+
+
+def read_resolved_manifest(path):
+    """
+    Reads a resolved file manifest
+
+    Parameters
+    ----------
+    path : str
+        Path of a JSON file written by write_resolved_manifest()
+
+    Returns
+    -------
+    awsgoesfiles : list of AwsGoesFile objects
+    """
+    with open(path, 'r') as f:
+        files = json.load(f)['files']
+
+    return [AwsGoesFile(x['key'], x['shortfname'], x['scan_time'], satellite=x['satellite'],
+                        size=x.get('size')) for x in files]
+
+
+
+def _normalize_query(entry):
+    """
+    Cleans up a single manifest entry. CSV & YAML values are converted to the
+    types the query methods expect, and empty values are dropped
+    """
+    unknown = set(entry) - set(QUERY_FIELDS)
+    if (unknown):
+        raise ValueError('Invalid manifest field(s): {}'.format(', '.join(sorted(unknown))))
+
+    query = {}
+    for field, value in entry.items():
+        if (value is None or value == ''):
+            continue
+        query[field] = value
+
+    for field in ['satellite', 'start', 'end']:
+        if (field not in query):
+            raise ValueError('Manifest query is missing the {} field'.format(field))
+
+    satellite = query['satellite']
+    if (isinstance(satellite, str)):
+        satellite = satellite.replace(';', ' ').replace(',', ' ').split()
+    query['satellite'] = list(satellite)
+
+    query['sensor'] = str(query.get('sensor', 'abi')).lower()
+
+    if ('channel' in query):
+        channel = str(query['channel'])
+        if (channel.isdigit()):
+            channel = channel.zfill(2)
+        query['channel'] = channel
+
+    return query
@@ -0,0 +1,198 @@
+"""
+Author: Matt Nicholson
+
+Stacking of ABI L2 MCMIP files into a memory-mapped (time, band, y, x) cube.
+
+The cube is one preallocated float32 .npy file. Each file is decoded by a
+worker process, which writes its slice of the cube straight into the memory
+map, so the bands never go through the pool. A JSON sidecar records the
+filename, scan time, & time coverage of each time step & the DQF summaries of
+each band, & the DQF arrays can be stacked into a second uint8 cube:
+
+>>> cube, sidecar = build_cube(localgoesfiles, 'day.npy', bands=[2, 8, 13], dqf=True)
+
+Training jobs can then open the cube without parsing any netCDF:
+
+>>> cube, sidecar = open_cube('day.npy')
+>>> cube[:, sidecar['bands'].index(13)]
+"""
+import json
+import multiprocessing
+import os
+
+import concurrent.futures
+import numpy as np
+from netCDF4 import Dataset
+
+from metaindex import DQF_FIELDS
+
+
+ALL_BANDS = list(range(1, 17))
+
+# Value of the DQF cube where a file couldn't be read
+DQF_MISSING = 255
+
+
+
+def build_cube(localgoesfiles, path, bands=None, dqf=False, workers=None):
+    """
+    Writes the bands of a sequence of MCMIP files into a memory-mapped cube
+
+    Parameters
+    ----------
+    localgoesfiles : list of LocalGoesFile objects
+        MCMIP files of one sector, in the order of the time axis
+    path : str
+        Path of the .npy cube. The sidecar is written next to it as .json &
+        the DQF cube as .dqf.npy
+    bands : list of int, optional
+        ABI bands to stack. Default: None (all 16)
+    dqf : bool, optional
+        If True, the DQF_Cxx variables are stacked into a uint8 cube of the
+        same shape. Default: False
+    workers : int, optional
+        Number of decoding processes. Default: None (number of CPUs)
+
+    Returns
+    -------
+    cube : numpy memmap
+        Read-only float32 array of shape (time, band, y, x). Time steps whose
+        file couldn't be read are NaN
+    sidecar : dict
+        See open_cube()
+    """
+    if (not path.endswith('.npy')):
+        raise ValueError('The cube path must end with .npy')
+    if (not localgoesfiles):
+        raise ValueError('No files to stack')
+
+    bands = list(bands or ALL_BANDS)
+    with Dataset(localgoesfiles[0].filepath, 'r') as ds:
+        shape = ds.variables[_cmi_name(bands[0])].shape
+    shape = (len(localgoesfiles), len(bands)) + tuple(shape)
+
+    tmp_path = path[:-len('.npy')] + '.tmp.npy'
+    cube = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+    cube.flush()
+    del cube
+
+    dqf_path = dqf_tmp_path = None
+    if (dqf):
+        dqf_path = path[:-len('.npy')] + '.dqf.npy'
+        dqf_tmp_path = path[:-len('.npy')] + '.dqf.tmp.npy'
+        dqf_cube = np.lib.format.open_memmap(dqf_tmp_path, mode='w+', dtype=np.uint8, shape=shape)
+        dqf_cube.flush()
+        del dqf_cube
+
+    n = len(localgoesfiles)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                mp_context=multiprocessing.get_context('spawn')) as executor:
+        steps = list(executor.map(_write_step, [x.filepath for x in localgoesfiles], range(n),
+                                  [bands] * n, [tmp_path] * n, [dqf_tmp_path] * n))
+
+    for localgoesfile, step in zip(localgoesfiles, steps):
+        step['filename'] = localgoesfile.filename
+        step['scan_time'] = _to_str(localgoesfile.scan_time)
+        step['start_time'] = _to_str(localgoesfile.start_time)
+
+    sidecar = {'bands': bands, 'shape': list(shape), 'dqf': dqf, 'steps': steps}
+
+    os.replace(tmp_path, path)
+    if (dqf):
+        os.replace(dqf_tmp_path, dqf_path)
+    _save_sidecar(path[:-len('.npy')] + '.json', sidecar)
+
+    return np.load(path, mmap_mode='r'), sidecar
+
+
+
+def open_cube(path, dqf=False):
+    """
+    Opens a cube written by build_cube()
+
+    Parameters
+    ----------
+    path : str
+    dqf : bool, optional
+        If True, the DQF cube is opened too. Default: False
+
+    Returns
+    -------
+    cube : numpy memmap
+        Read-only float32 array of shape (time, band, y, x)
+    sidecar : dict
+        'bands', 'shape', 'dqf', & 'steps', one dict per time step holding
+        'filename', 'scan_time', 'start_time', 'time_coverage_start', &
+        'error' (None if the file was read), & per band lists of the
+        DQF summaries (ex: 'percent_good_pixel_qf')
+    dqf_cube : numpy memmap
+        Only returned if 'dqf' is True
+    """
+    with open(path[:-len('.npy')] + '.json', 'r') as f:
+        sidecar = json.load(f)
+
+    cube = np.load(path, mmap_mode='r')
+    if (dqf):
+        return cube, sidecar, np.load(path[:-len('.npy')] + '.dqf.npy', mmap_mode='r')
+
+    return cube, sidecar
+
+
+
+def _write_step(filepath, t, bands, cube_path, dqf_path):
+    """
+    Writes the bands of one file into time step 't' of the cube. Runs in a
+    worker process
+    """
+    cube = np.load(cube_path, mmap_mode='r+')
+    dqf_cube = np.load(dqf_path, mmap_mode='r+') if dqf_path is not None else None
+    step = {'time_coverage_start': None, 'error': None}
+    for name in DQF_FIELDS:
+        step[name] = [None] * len(bands)
+
+    try:
+        with Dataset(filepath, 'r') as ds:
+            if ('time_coverage_start' in ds.ncattrs()):
+                step['time_coverage_start'] = ds.time_coverage_start
+
+            for i, band in enumerate(bands):
+                cube[t, i] = np.ma.filled(ds.variables[_cmi_name(band)][:], np.nan)
+
+                dqf_var = ds.variables.get('DQF_C{:02}'.format(band))
+                if (dqf_var is None):
+                    continue
+                for name in DQF_FIELDS:
+                    if (name in dqf_var.ncattrs()):
+                        step[name][i] = float(dqf_var.getncattr(name))
+                if (dqf_cube is not None):
+                    dqf_var.set_auto_maskandscale(False)
+                    dqf_cube[t, i] = dqf_var[:]
+    except (OSError, RuntimeError, KeyError, ValueError) as exc:
+        step['error'] = str(exc)
+        cube[t] = np.nan
+        if (dqf_cube is not None):
+            dqf_cube[t] = DQF_MISSING
+
+    cube.flush()
+    if (dqf_cube is not None):
+        dqf_cube.flush()
+
+    return step
+
+
+
+def _cmi_name(band):
+    return 'CMI_C{:02}'.format(band)
+
+
+
+def _to_str(value):
+    return None if value is None else str(value)
+
+
+
+def _save_sidecar(path, sidecar):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(sidecar, f, indent=1)
+    os.replace(tmp_path, path)
@@ -0,0 +1,285 @@
+"""
+Author: Matt Nicholson
+
+Columnar index of the global attributes & DQF summaries of local GOES netCDF
+files.
+
+Only the file headers are read. netCDF4 doesn't read variable data until it
+is accessed, and the DQF summaries are attributes of the DQF variables
+('percent_good_pixel_qf', ...). The headers are read in a process pool, and
+the table is saved as one .npz file holding one array per column, so it loads
+quickly and can be filtered with numpy:
+
+>>> index = MetadataIndex('metadata.npz')
+>>> index.update('path/to/archive')
+>>> bad = index.columns['percent_good_pixel_qf'] < 99
+>>> index.columns['filepath'][bad]
+
+Calling update() again only reads the headers of files that are new or whose
+mtime or size changed, and drops the files that no longer exist.
+"""
+import multiprocessing
+import os
+
+import concurrent.futures
+import numpy as np
+from netCDF4 import Dataset
+
+
+# Global attributes indexed as strings
+ATTR_FIELDS = ['scene_id', 'timeline_id']
+
+# Global attributes indexed as datetime64[ms]
+TIME_FIELDS = ['time_coverage_start', 'time_coverage_end']
+
+# DQF variable attributes indexed as float64. For products with one DQF
+# variable per band (MCMIP), the mean over the bands is used
+DQF_FIELDS = ['percent_good_pixel_qf', 'percent_conditionally_usable_pixel_qf',
+              'percent_out_of_range_pixel_qf', 'percent_no_value_pixel_qf']
+
+
+
+class MetadataIndex(object):
+    """
+    Parameters
+    ----------
+    path : str
+        Path of the .npz file holding the table. Loaded if it exists
+    """
+
+    def __init__(self, path):
+        super(MetadataIndex, self).__init__()
+        self.path = path
+        self.columns = _empty_columns()
+        self._rows = None
+
+        if (os.path.exists(path)):
+            with np.load(path) as table:
+                self.columns = {name: table[name] for name in table.files}
+
+
+
+    def __len__(self):
+        return len(self.columns['filepath'])
+
+
+
+    def update(self, basepaths, workers=None, chunksize=64):
+        """
+        Brings the index up to date with the .nc files under one or more
+        directories, then saves it
+
+        Parameters
+        ----------
+        basepaths : str or list of str
+        workers : int, optional
+            Number of header reading processes. Default: None (number of CPUs)
+        chunksize : int, optional
+            Number of files sent to a worker process at a time. Default: 64
+
+        Returns
+        -------
+        int
+            Number of headers read
+        """
+        if (isinstance(basepaths, str)):
+            basepaths = [basepaths]
+
+        stats = {}
+        for basepath in basepaths:
+            _scan_nc_files(basepath, stats)
+
+        old = self._get_rows()
+        keep = []
+        to_read = []
+
+        for filepath, (mtime, size) in stats.items():
+            i = old.get(filepath)
+            if (i is not None and self.columns['mtime'][i] == mtime and
+                    self.columns['size'][i] == size):
+                keep.append(i)
+            else:
+                to_read.append(filepath)
+
+        headers = []
+        if (to_read):
+            # Workers are spawned rather than forked, since this may run next
+            # to download threads & HDF5 isn't fork safe
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                    mp_context=multiprocessing.get_context('spawn')) as executor:
+                headers = list(executor.map(read_header, to_read, chunksize=chunksize))
+
+        columns = {name: values[keep] for name, values in self.columns.items()}
+        new = _build_columns([(x, stats[x][0], stats[x][1], h) for x, h in zip(to_read, headers)])
+
+        # Kept sorted by filepath so lookups & diffs against the archive are stable
+        merged = {name: np.concatenate([columns[name], new[name]]) for name in columns}
+        order = np.argsort(merged['filepath'], kind='stable')
+        self.columns = {name: values[order] for name, values in merged.items()}
+        self._rows = None
+        self.save()
+
+        return len(to_read)
+
+
+
+    def save(self):
+        """
+        Writes the table to disk. The write is atomic, so a crash can't leave
+        a torn table behind
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **self.columns)
+        os.replace(tmp_path, self.path)
+
+
+
+    def lookup(self, filepath):
+        """
+        Gets the indexed metadata of a file
+
+        Parameters
+        ----------
+        filepath : str
+
+        Returns
+        -------
+        metadata : dict or None
+            Column name -> value. None if the file isn't indexed
+        """
+        i = self._get_rows().get(os.path.abspath(filepath))
+        if (i is None):
+            return None
+
+        return {name: values[i] for name, values in self.columns.items()}
+
+
+
+    def attach(self, localgoesfiles):
+        """
+        Makes LocalGoesFile objects read their metadata from this index
+
+        Parameters
+        ----------
+        localgoesfiles : list of LocalGoesFile objects
+
+        Returns
+        -------
+        localgoesfiles : list of LocalGoesFile objects
+        """
+        for localgoesfile in localgoesfiles:
+            localgoesfile._metaindex = self
+
+        return localgoesfiles
+
+
+
+    def _get_rows(self):
+        # Filepath -> row number, built on first use
+        if (self._rows is None):
+            self._rows = {x: i for i, x in enumerate(self.columns['filepath'].tolist())}
+        return self._rows
+
+
+
+def read_header(filepath):
+    """
+    Reads the indexed attributes of a netCDF file. Variable data isn't read
+
+    Parameters
+    ----------
+    filepath : str
+
+    Returns
+    -------
+    header : dict or None
+        Attribute name -> value, missing attributes are None. None if the file
+        couldn't be read
+    """
+    header = {}
+
+    try:
+        with Dataset(filepath, 'r') as ds:
+            attrs = ds.ncattrs()
+            for name in ATTR_FIELDS + TIME_FIELDS:
+                header[name] = ds.getncattr(name) if name in attrs else None
+
+            if ('DQF' in ds.variables):
+                dqf_vars = [ds.variables['DQF']]
+            else:
+                dqf_vars = [var for name, var in ds.variables.items() if name.startswith('DQF')]
+
+            for name in DQF_FIELDS:
+                values = [float(var.getncattr(name)) for var in dqf_vars if name in var.ncattrs()]
+                header[name] = sum(values) / len(values) if values else None
+    except (OSError, RuntimeError):
+        return None
+
+    return header
+
+
+
+def read_metadata(filepath):
+    """
+    Reads the metadata of a file that isn't indexed, in the same form as
+    MetadataIndex.lookup()
+
+    Parameters
+    ----------
+    filepath : str
+
+    Returns
+    -------
+    metadata : dict
+    """
+    st = os.stat(filepath)
+    columns = _build_columns([(os.path.abspath(filepath), st.st_mtime, st.st_size,
+                               read_header(filepath))])
+
+    return {name: values[0] for name, values in columns.items()}
+
+
+
+def _scan_nc_files(basepath, stats):
+    """
+    Collects the mtime & size of every .nc file under 'basepath', skipping
+    partial downloads
+    """
+    for entry in os.scandir(basepath):
+        if (entry.is_dir(follow_symlinks=False)):
+            _scan_nc_files(entry.path, stats)
+        elif (entry.name.endswith('.nc')):
+            st = entry.stat()
+            stats[os.path.abspath(entry.path)] = (st.st_mtime, st.st_size)
+
+
+
+def _build_columns(rows):
+    """
+    Builds the table columns from (filepath, mtime, size, header) tuples
+    """
+    columns = {'filepath': np.array([x[0] for x in rows], dtype=str),
+               'mtime': np.array([x[1] for x in rows], dtype=np.float64),
+               'size': np.array([x[2] for x in rows], dtype=np.int64),
+               'readable': np.array([x[3] is not None for x in rows], dtype=bool)}
+    headers = [x[3] or {} for x in rows]
+
+    for name in ATTR_FIELDS:
+        columns[name] = np.array([h.get(name) or '' for h in headers], dtype=str)
+
+    for name in TIME_FIELDS:
+        # numpy doesn't parse the trailing 'Z' of the ISO 8601 timestamps
+        columns[name] = np.array([(h.get(name) or 'NaT').rstrip('Z') for h in headers],
+                                 dtype='datetime64[ms]')
+
+    for name in DQF_FIELDS:
+        columns[name] = np.array([np.nan if h.get(name) is None else h[name] for h in headers],
+                                 dtype=np.float64)
+
+    return columns
+
+
+
+def _empty_columns():
+    return _build_columns([])
@@ -0,0 +1,343 @@
+"""
+Author: Matt Nicholson
+
+Pipelined download -> decode -> transform processing.
+
+Each stage has its own concurrency & the stages are connected by bounded
+queues, so files are decoded & processed while the rest of the batch is
+still downloading. When a later stage falls behind, its input queue fills &
+the stage before it blocks, so no more files are downloaded than can be
+processed (backpressure).
+
+    fetch      threads, see GoesAWSInterface.download()
+    decode     process pool running a picklable callable on the local file
+               path, ex: ReadVariables(['CMI', 'DQF'])
+    transform  threads running a callable on (LocalGoesFile, decoded)
+
+>>> pipeline = Pipeline(conn, decode=ReadVariables(['CMI']), transform=my_func,
+>>>                     fetch_threads=8, decode_workers=4)
+>>> for localgoesfile, result in pipeline.run('goes16', imgs, 'path/to/download'):
+>>>     ...
+>>> pipeline.metrics['decode']['busy_time']
+
+Results are yielded in the order they complete. Files that fail in any stage
+are left out & listed in Pipeline.failed.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+
+import concurrent.futures
+import numpy as np
+from netCDF4 import Dataset
+
+
+# Marks the end of a stage's input
+_DONE = object()
+
+# Seconds between checks of the stop flag while waiting on a queue
+_POLL_INTERVAL = 0.1
+
+
+
+class ReadVariables(object):
+    """
+    Decoder reading whole variables of a netCDF file. Picklable, so it can
+    run in the decode process pool
+
+    Parameters
+    ----------
+    names : list of str
+        Variables to read. Masked values are filled with NaN for float
+        variables
+    """
+
+    def __init__(self, names):
+        super(ReadVariables, self).__init__()
+        self.names = list(names)
+
+
+
+    def __call__(self, filepath):
+        arrays = {}
+        with Dataset(filepath, 'r') as ds:
+            for name in self.names:
+                values = ds.variables[name][:]
+                if (np.ma.isMaskedArray(values)):
+                    values = values.filled(np.nan) if values.dtype.kind == 'f' else values.data
+                arrays[name] = values
+
+        return arrays
+
+
+
+class StageMetrics(object):
+    """
+    Counters of one pipeline stage
+
+    Attributes
+    ----------
+    concurrency : int
+        Number of workers of the stage
+    processed : int
+        Items that went through the stage
+    failed : int
+        Items the stage failed on
+    busy_time : float
+        Seconds spent working, summed over the workers
+    blocked_time : float
+        Seconds spent waiting for room in the next stage's queue. A large
+        value means a later stage is the bottleneck
+    max_queue : int
+        Largest number of items seen waiting in the stage's input queue
+    """
+
+    def __init__(self, name, concurrency):
+        super(StageMetrics, self).__init__()
+        self.name = name
+        self.concurrency = concurrency
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.
+        self.blocked_time = 0.
+        self.max_queue = 0
+        self._lock = threading.Lock()
+
+
+
+    def record(self, busy_time, blocked_time, ok, queue_size):
+        with self._lock:
+            if (ok):
+                self.processed += 1
+            else:
+                self.failed += 1
+            self.busy_time += busy_time
+            self.blocked_time += blocked_time
+            self.max_queue = max(self.max_queue, queue_size)
+
+
+
+    def as_dict(self):
+        with self._lock:
+            return {'concurrency': self.concurrency, 'processed': self.processed,
+                    'failed': self.failed, 'busy_time': self.busy_time,
+                    'blocked_time': self.blocked_time, 'max_queue': self.max_queue}
+
+
+
+class Pipeline(object):
+    """
+    Parameters
+    ----------
+    conn : GoesAWSInterface
+    decode : callable, optional
+        Called with the local file path in a worker process. Must be
+        picklable. Default: None (no decode stage, None is passed on)
+    transform : callable, optional
+        Called with (LocalGoesFile, decoded) in a worker thread. Its return
+        value is yielded. Default: None (the decoded value is yielded)
+    fetch_threads : int, optional
+        Number of download threads. Default: 6
+    decode_workers : int, optional
+        Number of decode processes. Default: None (number of CPUs)
+    transform_threads : int, optional
+        Number of transform threads. Default: 1
+    queue_size : int, optional
+        Capacity of each queue between two stages. Default: 8
+    """
+
+    def __init__(self, conn, decode=None, transform=None, fetch_threads=6, decode_workers=None,
+                 transform_threads=1, queue_size=8):
+        super(Pipeline, self).__init__()
+        if (queue_size < 1):
+            raise ValueError('queue_size must be at least 1')
+
+        self.conn = conn
+        self.decode = decode
+        self.transform = transform
+        self.fetch_threads = fetch_threads
+        self.decode_workers = decode_workers or multiprocessing.cpu_count()
+        self.transform_threads = transform_threads
+        self.queue_size = queue_size
+        self.failed = []
+        self._stages = {}
+
+
+
+    @property
+    def metrics(self):
+        """
+        dict
+            Stage name ('fetch', 'decode', 'transform') -> counters, see
+            StageMetrics
+        """
+        return {name: stage.as_dict() for name, stage in self._stages.items()}
+
+
+
+    def run(self, satellite, awsgoesfiles, basepath, keep_aws_folders=False, cache=None):
+        """
+        Runs the files through the pipeline
+
+        Parameters
+        ----------
+        satellite : str or None
+            Only used for AwsGoesFile objects that are not tagged with their
+            satellite
+        awsgoesfiles : list of AwsGoesFile objects
+        basepath : str
+            Path to download the files to. The cache directory if None & a
+            cache is given
+        keep_aws_folders : bool, optional
+            Default: False
+        cache : FileCache, optional
+            See GoesAWSInterface.download(). The files are pinned until the
+            run ends & the cache index is saved then. Default: None
+
+        Yields
+        ------
+        (LocalGoesFile, result) tuples
+            As they complete
+        """
+        awsgoesfiles = list(awsgoesfiles)
+        with self.conn.cached_batch(cache, awsgoesfiles, basepath) as basepath:
+            # Closed explicitly, so the workers are stopped before the files
+            # are unpinned when the caller stops early
+            items = self._run(satellite, awsgoesfiles, basepath, keep_aws_folders, cache)
+            try:
+                for item in items:
+                    yield item
+            finally:
+                items.close()
+
+
+
+    def _run(self, satellite, awsgoesfiles, basepath, keep_aws_folders, cache):
+        self.failed = []
+        self._stop = threading.Event()
+        executor = None
+        if (self.decode is not None):
+            # Workers are spawned rather than forked, since the fetch threads
+            # are running & HDF5 isn't fork safe
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.decode_workers,
+                                    mp_context=multiprocessing.get_context('spawn'))
+
+        def fetch(awsgoesfile):
+            return self.conn.fetch(awsgoesfile, basepath, keep_aws_folders, satellite, cache)
+
+        def decode(localgoesfile):
+            if (executor is None):
+                return localgoesfile, None
+            return localgoesfile, executor.submit(self.decode, localgoesfile.filepath).result()
+
+        def transform(item):
+            if (self.transform is None):
+                return item
+            return item[0], self.transform(*item)
+
+        queues = [queue.Queue()] + [queue.Queue(maxsize=self.queue_size) for _ in range(3)]
+        stages = [('fetch', fetch, self.fetch_threads),
+                  ('decode', decode, self.decode_workers if executor is not None else 1),
+                  ('transform', transform, self.transform_threads)]
+        self._stages = {name: StageMetrics(name, n) for name, _, n in stages}
+
+        for awsgoesfile in awsgoesfiles:
+            queues[0].put(awsgoesfile)
+        for _ in range(self.fetch_threads):
+            queues[0].put(_DONE)
+
+        threads = []
+        for i, (name, func, n) in enumerate(stages):
+            # Ends of the next stage's input, one per worker of that stage
+            n_next = stages[i + 1][2] if i + 1 < len(stages) else 1
+            remaining = [n]
+            lock = threading.Lock()
+            for _ in range(n):
+                thread = threading.Thread(target=self._worker,
+                                          args=(name, func, queues[i], queues[i + 1], remaining,
+                                                lock, n_next))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+        try:
+            while (True):
+                item = self._get(queues[-1])
+                if (item is _DONE or item is None):
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            if (executor is not None):
+                executor.shutdown(cancel_futures=True)
+
+
+
+    def _worker(self, name, func, in_q, out_q, remaining, lock, n_next):
+        """
+        Runs one worker of a stage until its input ends or the pipeline is
+        stopped
+        """
+        metrics = self._stages[name]
+
+        while (True):
+            queue_size = in_q.qsize()
+            item = self._get(in_q)
+            if (item is _DONE or item is None):
+                break
+
+            start = time.time()
+            try:
+                result = func(item)
+            except Exception as exc:
+                goesfile = item[0] if isinstance(item, tuple) else item
+                self.failed.append((goesfile, name, exc))
+                print('{} failed for {}: {}'.format(name.capitalize(), goesfile.filename, exc))
+                metrics.record(time.time() - start, 0., False, queue_size)
+                continue
+            busy_time = time.time() - start
+
+            blocked_start = time.time()
+            if (not self._put(out_q, result)):
+                break
+            metrics.record(busy_time, time.time() - blocked_start, True, queue_size)
+
+        # The last worker of the stage ends the next stage's input
+        with lock:
+            remaining[0] -= 1
+            last = (remaining[0] == 0)
+        if (last):
+            for _ in range(n_next):
+                if (not self._put(out_q, _DONE)):
+                    break
+
+
+
+    def _get(self, q):
+        """
+        Gets the next item of a queue. None if the pipeline was stopped
+        """
+        while (not self._stop.is_set()):
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return None
+
+
+
+    def _put(self, q, item):
+        """
+        Puts an item in a queue, waiting for room. False if the pipeline was
+        stopped
+        """
+        while (not self._stop.is_set()):
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
@@ -0,0 +1,272 @@
+"""
+Author: Matt Nicholson
+
+Prefetching iterator for consumers walking through files in order.
+
+While the consumer handles file N, files N+1 to N+k are downloaded in the
+background. 'k' follows the measured time the consumer spends on a file &
+the time a download takes, so downloads start far enough ahead to be done
+before they are needed, without fetching more of the batch than that:
+
+    k = ceil(fetch time / consume time) + 1
+
+>>> with Prefetcher(conn, imgs, cache=cache) as files:
+>>>     for localgoesfile in files:
+>>>         ...
+>>>         if (skip):
+>>>             files.seek(i + 10)
+
+Prefetches that haven't started are cancelled when the consumer seeks away
+or closes the iterator; downloads already in flight finish into the cache.
+Files are pinned in the cache from the time they are queued until the
+consumer moves past them, so eviction never removes a file about to be used.
+"""
+import math
+import threading
+import time
+
+import concurrent.futures
+
+
+# Weight of the latest measurement in the moving averages
+SMOOTHING = 0.3
+
+
+
+class Prefetcher(object):
+    """
+    Parameters
+    ----------
+    conn : GoesAWSInterface
+    awsgoesfiles : list of AwsGoesFile objects
+        Files in the order they are consumed, ex: from
+        get_avail_images_in_range()
+    basepath : str, optional
+        Path to download the files to. Default: None (the cache directory)
+    cache : FileCache, optional
+        Cache the files are looked up in & downloaded into. Default: None
+    satellite : str, optional
+        Only used for AwsGoesFile objects that are not tagged with their
+        satellite. Default: None
+    keep_aws_folders : bool, optional
+        Default: False
+    threads : int, optional
+        Number of download threads. Default: 4
+    min_ahead : int, optional
+        Smallest number of files fetched ahead of the consumer. Default: 1
+    max_ahead : int, optional
+        Largest number of files fetched ahead of the consumer. Default: 16
+    """
+
+    def __init__(self, conn, awsgoesfiles, basepath=None, cache=None, satellite=None,
+                 keep_aws_folders=False, threads=4, min_ahead=1, max_ahead=16):
+        super(Prefetcher, self).__init__()
+        if (basepath is None and cache is None):
+            raise ValueError('basepath or cache must be given')
+        if (not 1 <= min_ahead <= max_ahead):
+            raise ValueError('min_ahead must be at least 1 & at most max_ahead')
+
+        self.conn = conn
+        self.awsgoesfiles = list(awsgoesfiles)
+        self.basepath = basepath if basepath is not None else cache.basepath
+        self.cache = cache
+        self.satellite = satellite
+        self.keep_aws_folders = keep_aws_folders
+        self.min_ahead = min_ahead
+        self.max_ahead = max_ahead
+        self.ahead = min_ahead
+
+        self.fetch_time = None
+        self.consume_time = None
+        self.waits = 0
+        self.wait_time = 0.
+        self.cancelled = 0
+
+        self._position = 0
+        # Index -> future of the LocalGoesFile
+        self._futures = {}
+        # Index of the file last returned to the consumer
+        self._current = None
+        self._returned_at = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
+
+
+    def __len__(self):
+        return len(self.awsgoesfiles)
+
+
+
+    def __iter__(self):
+        return self
+
+
+
+    def __next__(self):
+        """
+        Returns
+        -------
+        LocalGoesFile
+            The next file, once it is downloaded. Raises GoesAwsDownloadError
+            if its download failed
+        """
+        now = time.time()
+        if (self._returned_at is not None):
+            self._update_consume_time(now - self._returned_at)
+        self._release_current()
+
+        if (self._closed or self._position >= len(self.awsgoesfiles)):
+            raise StopIteration
+
+        index = self._position
+        self._position += 1
+        self._fill(index)
+
+        future = self._futures.pop(index)
+        if (not future.done()):
+            self.waits += 1
+        try:
+            result = future.result()
+        finally:
+            self._current = index
+            self.wait_time += time.time() - now
+
+        self._fill(self._position)
+        self._returned_at = time.time()
+
+        return result
+
+
+
+    @property
+    def metrics(self):
+        """
+        dict
+            'ahead' (current k), 'fetch_time' & 'consume_time' (moving
+            averages, in seconds per file), 'waits' (files the consumer
+            waited for), 'wait_time' (seconds), & 'cancelled' (prefetches
+            cancelled)
+        """
+        return {'ahead': self.ahead, 'fetch_time': self.fetch_time,
+                'consume_time': self.consume_time, 'waits': self.waits,
+                'wait_time': self.wait_time, 'cancelled': self.cancelled}
+
+
+
+    def seek(self, index):
+        """
+        Moves to a file. Prefetches outside of the new window are cancelled
+
+        Parameters
+        ----------
+        index : int
+            Index of the file the next iteration returns
+        """
+        if (not 0 <= index <= len(self.awsgoesfiles)):
+            raise ValueError('index must be between 0 & {}'.format(len(self.awsgoesfiles)))
+
+        self._position = index
+        # The time spent before the seek isn't time spent on one file
+        self._returned_at = None
+        self._release_current()
+        self._cancel([i for i in self._futures if not index <= i < index + self.ahead])
+        self._fill(index)
+
+
+
+    def close(self):
+        """
+        Cancels the prefetches that haven't started & shuts the download
+        threads down
+        """
+        if (self._closed):
+            return
+
+        self._closed = True
+        self._release_current()
+        self._cancel(list(self._futures))
+        self._executor.shutdown(wait=True)
+        if (self.cache is not None):
+            self.cache.save()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+    def _fill(self, start):
+        """
+        Queues the downloads of the window of files starting at 'start'
+        """
+        stop = min(start + self.ahead, len(self.awsgoesfiles))
+        for index in range(start, stop):
+            if (index not in self._futures):
+                awsgoesfile = self.awsgoesfiles[index]
+                if (self.cache is not None):
+                    self.cache.pin(awsgoesfile.key)
+                self._futures[index] = self._executor.submit(self._fetch, awsgoesfile)
+
+
+
+    def _fetch(self, awsgoesfile):
+        start = time.time()
+        result = self.conn.fetch(awsgoesfile, self.basepath, self.keep_aws_folders,
+                                 self.satellite, self.cache)
+        with self._lock:
+            self.fetch_time = _smooth(self.fetch_time, time.time() - start)
+            self._adapt()
+
+        return result
+
+
+
+    def _update_consume_time(self, seconds):
+        with self._lock:
+            self.consume_time = _smooth(self.consume_time, seconds)
+            self._adapt()
+
+
+
+    def _adapt(self):
+        """
+        Sets how many files are fetched ahead, so a download started when the
+        consumer begins a file is done by the time it is needed
+        """
+        if (self.fetch_time is None or self.consume_time is None):
+            return
+
+        ahead = int(math.ceil(self.fetch_time / max(self.consume_time, 1e-3))) + 1
+        self.ahead = max(self.min_ahead, min(self.max_ahead, ahead))
+
+
+
+    def _release_current(self):
+        if (self._current is not None and self.cache is not None):
+            self.cache.unpin(self.awsgoesfiles[self._current].key)
+        self._current = None
+
+
+
+    def _cancel(self, indices):
+        for index in indices:
+            future = self._futures.pop(index)
+            if (future.cancel()):
+                self.cancelled += 1
+            if (self.cache is not None):
+                self.cache.unpin(self.awsgoesfiles[index].key)
+
+
+
+def _smooth(average, value):
+    if (average is None):
+        return value
+    return (1 - SMOOTHING) * average + SMOOTHING * value
@@ -0,0 +1,374 @@
+"""
+Author: Matt Nicholson
+
+PNG previews of downloaded ABI CMIP & Rad files.
+
+The image is downsampled while it is read, a block of chunk rows at a time,
+either with block means or by striding, so the full resolution array is never
+held. Values are scaled to 0 - 255 & colored with a per-band uint8 lookup
+table, & the PNG is written with zlib, so no imaging library is needed.
+
+QuicklookService renders files in a process pool as they are downloaded.
+Previews are memoized by the key of their source file, in memory & on disk,
+so a file is rendered once:
+
+>>> service = QuicklookService('path/to/png', max_size=1000)
+>>> conn.download('goes16', imgs, 'path/to/download', callback=service.add)
+>>> service.close()
+>>> service.get(imgs[0].key)
+'path/to/png/OR_ABI-L2-CMIPC-M6C13_G16_s20191431201379_e20191431204152_c20191431204227.png'
+
+>>> render_quicklook('path/to/file.nc', 'preview.png', max_size=500, method='stride')
+"""
+import functools
+import math
+import multiprocessing
+import os
+import struct
+import zlib
+
+import concurrent.futures
+import numpy as np
+from netCDF4 import Dataset
+
+from downsample import downsample
+
+
+METHODS = ('mean', 'stride')
+
+# Variables rendered when none is given, in order of preference
+IMAGE_VARS = ['CMI', 'Rad']
+
+# Highest band shown as reflectance. Higher bands are brightness temperatures
+MAX_REFLECTIVE_BAND = 6
+
+# Band -> (min, max) of the CMI values mapped to 0 - 255
+CMI_RANGES = {7: (200., 340.), 8: (190., 260.), 9: (190., 270.), 10: (190., 280.)}
+REFLECTANCE_RANGE = (0., 1.)
+BRIGHTNESS_TEMP_RANGE = (180., 320.)
+
+# Percentiles of the values mapped to 0 - 255 when there is no fixed range
+PERCENTILES = (1., 99.)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+
+class QuicklookService(object):
+    """
+    Parameters
+    ----------
+    outdir : str
+        Directory the previews are written to, as '<outdir>/<filename>.png'
+    max_size : int, optional
+        Largest width or height of the previews, in pixels. Default: 1000
+    method : str, optional
+        'mean' (block means) or 'stride' (every n-th pixel). Default: 'mean'
+    variable : str, optional
+        Variable to render. Default: None ('CMI' or 'Rad')
+    workers : int, optional
+        Number of rendering processes. Default: None (number of CPUs)
+    """
+
+    def __init__(self, outdir, max_size=1000, method='mean', variable=None, workers=None):
+        super(QuicklookService, self).__init__()
+        if (method not in METHODS):
+            raise ValueError('Invalid method {}. Valid: {}'.format(method, METHODS))
+        if (max_size < 1):
+            raise ValueError('max_size must be at least 1')
+
+        self.outdir = outdir
+        self.max_size = max_size
+        self.method = method
+        self.variable = variable
+        # Source key -> future of the preview path
+        self._futures = {}
+        # Workers are spawned rather than forked, since this is usually fed by
+        # download threads & HDF5 isn't fork safe
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                mp_context=multiprocessing.get_context('spawn'))
+
+        if (not os.path.isdir(outdir)):
+            os.makedirs(outdir)
+
+
+
+    def add(self, localgoesfile):
+        """
+        Queues a downloaded file for rendering. Can be used as the download()
+        callback. Files whose preview was already made are not rendered again
+
+        Parameters
+        ----------
+        localgoesfile : LocalGoesFile
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to the path of the preview
+        """
+        future = self._futures.get(localgoesfile.key)
+        if (future is not None):
+            return future
+
+        png_path = self.png_path(localgoesfile.key)
+        if (os.path.exists(png_path)):
+            future = concurrent.futures.Future()
+            future.set_result(png_path)
+        else:
+            future = self._executor.submit(render_quicklook, localgoesfile.filepath, png_path,
+                                           self.max_size, self.method, self.variable)
+        self._futures[localgoesfile.key] = future
+
+        return future
+
+
+
+    def get(self, key):
+        """
+        Gets the preview of a source file, waiting for it if it is being
+        rendered
+
+        Parameters
+        ----------
+        key : str
+            Key of the source file in the bucket
+
+        Returns
+        -------
+        str or None
+            Path of the preview. None if it wasn't made or failed
+        """
+        future = self._futures.get(key)
+        if (future is None):
+            png_path = self.png_path(key)
+            return png_path if os.path.exists(png_path) else None
+
+        try:
+            return future.result()
+        except Exception as exc:
+            print('Failed to render {}: {}'.format(os.path.basename(key), exc))
+            return None
+
+
+
+    def png_path(self, key):
+        return os.path.join(self.outdir, os.path.splitext(os.path.basename(key))[0] + '.png')
+
+
+
+    def close(self):
+        """
+        Waits for the queued files & shuts the process pool down
+        """
+        self._executor.shutdown(wait=True)
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+def render_quicklook(filepath, png_path, max_size=1000, method='mean', variable=None):
+    """
+    Writes the PNG preview of a file
+
+    Parameters
+    ----------
+    filepath : str
+    png_path : str
+    max_size : int, optional
+        Largest width or height of the preview. Default: 1000
+    method : str, optional
+        'mean' or 'stride'. Default: 'mean'
+    variable : str, optional
+        Default: None ('CMI' or 'Rad')
+
+    Returns
+    -------
+    png_path : str
+    """
+    with Dataset(filepath, 'r') as ds:
+        if (variable is None):
+            variable = next((x for x in IMAGE_VARS if x in ds.variables), None)
+            if (variable is None):
+                raise ValueError('{} has no {} variable'.format(filepath, ' or '.join(IMAGE_VARS)))
+
+        band = None
+        if ('band_id' in ds.variables):
+            band = int(np.ravel(ds.variables['band_id'][:])[0])
+
+        image = read_downsampled(ds.variables[variable], max_size, method)
+
+    if (variable == 'CMI' and band is not None):
+        vmin, vmax = value_range(band)
+    else:
+        vmin, vmax = _percentile_range(image)
+
+    write_png(png_path, colorize(image, vmin, vmax, band))
+
+    return png_path
+
+
+
+def read_downsampled(var, max_size, method='mean'):
+    """
+    Reads a 2-D variable downsampled by the integer factor that brings its
+    largest side to 'max_size' or less. Trailing rows & columns that don't
+    fill a block are dropped
+
+    Parameters
+    ----------
+    var : netCDF4 Variable
+    max_size : int
+    method : str, optional
+        'mean' reads a block of chunk rows at a time & averages each
+        factor x factor block, ignoring missing pixels. 'stride' reads every
+        factor-th pixel. Default: 'mean'
+
+    Returns
+    -------
+    numpy array
+        float32, NaN where missing
+    """
+    ny, nx = var.shape
+    factor = max(1, int(math.ceil(max(ny, nx) / float(max_size))))
+    if (method == 'stride' or factor == 1):
+        return np.ma.filled(var[::factor, ::factor].astype(np.float32), np.nan)
+
+    return downsample(var, factor)
+
+
+
+@functools.lru_cache(maxsize=None)
+def colormap_lut(band=None):
+    """
+    Lookup table of a band, cached per process
+
+    Parameters
+    ----------
+    band : int, optional
+        ABI band. Reflective bands get a gray scale brightened with a square
+        root (gamma 0.5), emissive bands an inverted gray scale so cold cloud
+        tops are white. Default: None (gray scale)
+
+    Returns
+    -------
+    numpy array
+        Read-only (256, 3) uint8 array of RGB colors
+    """
+    ramp = np.linspace(0., 1., 256)
+    if (band is not None and band <= MAX_REFLECTIVE_BAND):
+        ramp = np.sqrt(ramp)
+    elif (band is not None):
+        ramp = 1. - ramp
+
+    lut = np.repeat(np.round(ramp * 255).astype(np.uint8)[:, np.newaxis], 3, axis=1)
+    lut.flags.writeable = False
+
+    return lut
+
+
+
+def value_range(band):
+    """
+    Range of the CMI values of a band mapped to 0 - 255
+
+    Returns
+    -------
+    (float, float)
+    """
+    if (band <= MAX_REFLECTIVE_BAND):
+        return REFLECTANCE_RANGE
+    return CMI_RANGES.get(band, BRIGHTNESS_TEMP_RANGE)
+
+
+
+def colorize(image, vmin, vmax, band=None):
+    """
+    Scales an image to 0 - 255 & applies the lookup table of its band
+
+    Parameters
+    ----------
+    image : numpy array
+        2-D float array, NaN where missing
+    vmin, vmax : float
+        Values mapped to 0 & 255
+    band : int, optional
+        Default: None
+
+    Returns
+    -------
+    numpy array
+        (y, x, 3) uint8 RGB array. Missing pixels are black
+    """
+    scale = 255. / (vmax - vmin) if vmax > vmin else 0.
+    index = np.empty(image.shape, dtype=np.float32)
+    np.subtract(image, np.float32(vmin), out=index)
+    index *= np.float32(scale)
+    np.clip(index, 0, 255, out=index)
+    index = np.nan_to_num(index, nan=0.).astype(np.uint8)
+
+    rgb = colormap_lut(band)[index]
+    rgb[np.isnan(image)] = 0
+
+    return rgb
+
+
+
+def write_png(path, image, compresslevel=6):
+    """
+    Writes an 8-bit gray scale or RGB PNG. The file is written to a temporary
+    path & moved, so readers never see a partial file
+
+    Parameters
+    ----------
+    path : str
+    image : numpy array
+        (y, x) or (y, x, 3) uint8 array
+    compresslevel : int, optional
+        zlib compression level. Default: 6
+    """
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    if (image.ndim == 2):
+        color_type = 0
+        image = image[:, :, np.newaxis]
+    elif (image.ndim == 3 and image.shape[2] == 3):
+        color_type = 2
+    else:
+        raise ValueError('image must be a (y, x) or (y, x, 3) array')
+
+    height, width = image.shape[:2]
+    # Each row starts with its filter type, 0 (none)
+    raw = np.zeros((height, 1 + width * image.shape[2]), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, -1)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        f.write(_png_chunk(b'IHDR', header))
+        f.write(_png_chunk(b'IDAT', zlib.compress(raw.tobytes(), compresslevel)))
+        f.write(_png_chunk(b'IEND', b''))
+    os.replace(tmp_path, path)
+
+
+
+def _percentile_range(image):
+    valid = image[~np.isnan(image)]
+    if (valid.size == 0):
+        return 0., 1.
+    vmin, vmax = np.percentile(valid, PERCENTILES)
+    return float(vmin), float(vmax)
+
+
+
+def _png_chunk(chunk_type, data):
+    return (struct.pack('>I', len(data)) + chunk_type + data +
+            struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
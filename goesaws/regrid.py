@@ -0,0 +1,304 @@
+"""
+Author: Matt Nicholson
+
+Regridding of ABI fixed grid data to regular lat/lon grids.
+
+Where each target pixel falls on the source grid only depends on the two
+grids, so the source indices & weights of every target pixel are computed
+once per (source grid, target grid, method), saved as memory-mapped .npy
+files, & reused. Regridding a file is then a vectorized gather, done a block
+of target pixels at a time to bound the memory used. Variables of a file are
+read a band of source rows per block, see Regridder.regrid_variable().
+
+>>> target = LatLonGrid(25., 50., -125., -65., 0.02)
+>>> regridder = Regridder('path/to/luts', target, method='bilinear')
+>>> cmi = localgoesfile.regrid('CMI', regridder)
+"""
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from fixedgrid import latlon_to_scan
+from geolocation import grid_name
+
+
+METHODS = ('nearest', 'bilinear')
+
+# Target pixels gathered at a time
+PIXELS_PER_BLOCK = 1 << 20
+
+
+
+class LatLonGrid(namedtuple('LatLonGrid', ['lat_min', 'lat_max', 'lon_min', 'lon_max',
+                                           'resolution'])):
+    """
+    Regular lat/lon grid. Rows run from north to south & the coordinates are
+    those of the pixel centers
+
+    Parameters
+    ----------
+    lat_min, lat_max, lon_min, lon_max : float
+        Edges of the grid in degrees
+    resolution : float
+        Pixel size in degrees
+    """
+    __slots__ = ()
+
+    @property
+    def shape(self):
+        return (int(round((self.lat_max - self.lat_min) / self.resolution)),
+                int(round((self.lon_max - self.lon_min) / self.resolution)))
+
+
+    @property
+    def lats(self):
+        return self.lat_max - self.resolution * (np.arange(self.shape[0]) + 0.5)
+
+
+    @property
+    def lons(self):
+        return self.lon_min + self.resolution * (np.arange(self.shape[1]) + 0.5)
+
+
+    @property
+    def name(self):
+        return 'lat{:g}_{:g}_lon{:g}_{:g}_res{:g}'.format(*self)
+
+
+
+class Regridder(object):
+    """
+    Regrids fixed grid data to a lat/lon grid, with lookup tables cached per
+    source grid
+
+    Parameters
+    ----------
+    cachedir : str
+        Directory the lookup tables are saved in
+    target : LatLonGrid
+    method : str, optional
+        'nearest' or 'bilinear'. Default: 'nearest'
+    """
+
+    def __init__(self, cachedir, target, method='nearest'):
+        super(Regridder, self).__init__()
+        if (method not in METHODS):
+            raise ValueError('Invalid regrid method {}. Valid: {}'.format(method, METHODS))
+
+        self.cachedir = cachedir
+        self.target = target
+        self.method = method
+        self._luts = {}
+        self._lock = threading.Lock()
+
+        if (not os.path.isdir(cachedir)):
+            os.makedirs(cachedir)
+
+
+
+    def get_lut(self, geometry):
+        """
+        Gets the lookup table from a source grid to the target grid, building
+        it on first use
+
+        Parameters
+        ----------
+        geometry : FixedGridGeometry
+
+        Returns
+        -------
+        index : numpy array
+            int32, of shape (k, n_target). Flat source index of each of the k
+            neighbours (1 for 'nearest', 4 for 'bilinear') of each target pixel
+        weights : numpy array
+            float32, same shape as 'index'. All 0 for target pixels outside
+            the source grid
+        """
+        name = '{}_{}_{}'.format(grid_name(geometry), self.target.name, self.method)
+
+        with self._lock:
+            lut = self._luts.get(name)
+        if (lut is not None):
+            return lut
+
+        index_path = os.path.join(self.cachedir, name + '.index.npy')
+        weights_path = os.path.join(self.cachedir, name + '.weights.npy')
+
+        # The index is written last, so the table is complete if it exists
+        if (not os.path.exists(index_path)):
+            index, weights = build_lut(geometry, self.target, self.method)
+            _save_atomic(weights_path, weights)
+            _save_atomic(index_path, index)
+
+        lut = (np.load(index_path, mmap_mode='r'), np.load(weights_path, mmap_mode='r'))
+        with self._lock:
+            self._luts[name] = lut
+
+        return lut
+
+
+
+    def regrid(self, data, geometry, fill_value=np.nan):
+        """
+        Parameters
+        ----------
+        data : numpy array
+            Of shape (ny, nx) on the source grid. Masked arrays are filled
+            with NaN first
+        geometry : FixedGridGeometry
+            Geometry of the source grid
+        fill_value : scalar, optional
+            Value of the target pixels outside the source grid. Default: NaN
+
+        Returns
+        -------
+        numpy array
+            Of shape target.shape. float32 (float64 for float64 data), except
+            nearest neighbour regridding of integer data with an integer
+            'fill_value', which keeps the data type
+        """
+        if (data.shape != (geometry.ny, geometry.nx)):
+            raise ValueError('Data of shape {} is not on a {}x{} grid'.format(data.shape,
+                                                                             geometry.ny,
+                                                                             geometry.nx))
+
+        return self._regrid_rows(lambda start, stop: data[start:stop], geometry, fill_value)
+
+
+
+    def regrid_variable(self, var, geometry, fill_value=np.nan):
+        """
+        Like regrid(), for a netCDF variable on the source grid. Each block
+        of target pixels only reads the band of source rows its pixels fall
+        on, so the variable is never read whole
+
+        Parameters
+        ----------
+        var : netCDF4 Variable
+            Of shape (ny, nx). Read with the dataset's masking & scaling
+        geometry : FixedGridGeometry
+        fill_value : scalar, optional
+            Default: NaN
+
+        Returns
+        -------
+        numpy array
+        """
+        if (var.shape != (geometry.ny, geometry.nx)):
+            raise ValueError('Data of shape {} is not on a {}x{} grid'.format(var.shape,
+                                                                             geometry.ny,
+                                                                             geometry.nx))
+
+        return self._regrid_rows(lambda start, stop: var[start:stop], geometry, fill_value)
+
+
+
+    def _regrid_rows(self, read_rows, geometry, fill_value):
+        """
+        Gathers the target pixels a block at a time, reading the source rows
+        each block needs with read_rows(start, stop)
+        """
+        index, weights = self.get_lut(geometry)
+        out = None
+
+        for start in range(0, index.shape[1], PIXELS_PER_BLOCK):
+            stop = min(start + PIXELS_PER_BLOCK, index.shape[1])
+            block_index = index[:, start:stop]
+            block_weights = weights[:, start:stop]
+            valid = block_weights.any(axis=0)
+
+            # Pixels outside the source grid are gathered from the first row
+            # read & replaced by 'fill_value'
+            row0, row1 = 0, 1
+            if (valid.any()):
+                rows = block_index[:, valid] // geometry.nx
+                row0, row1 = int(rows.min()), int(rows.max()) + 1
+
+            data = read_rows(row0, row1)
+            if (np.ma.isMaskedArray(data)):
+                data = data.astype(np.result_type(data.dtype, np.float32)).filled(np.nan)
+            flat = data.reshape(-1)
+            local = np.where(valid, block_index - row0 * geometry.nx, 0)
+
+            if (out is None):
+                if (self.method == 'nearest' and (data.dtype.kind == 'f' or
+                                                  not np.isnan(fill_value))):
+                    dtype = data.dtype
+                else:
+                    dtype = np.result_type(data.dtype, np.float32)
+                out = np.empty(index.shape[1], dtype=dtype)
+
+            if (self.method == 'nearest'):
+                values = flat[local[0]]
+            else:
+                values = np.zeros(stop - start, dtype=out.dtype)
+                for k in range(index.shape[0]):
+                    values += block_weights[k] * flat[local[k]]
+
+            out[start:stop] = np.where(valid, values, fill_value)
+
+        return out.reshape(self.target.shape)
+
+
+
+def build_lut(geometry, target, method):
+    """
+    Computes the source indices & weights of every target pixel. See
+    Regridder.get_lut()
+    """
+    lats = target.lats
+    lons = target.lons
+    nlat, nlon = target.shape
+    k = 1 if method == 'nearest' else 4
+
+    index = np.zeros((k, nlat * nlon), dtype=np.int32)
+    weights = np.zeros((k, nlat * nlon), dtype=np.float32)
+
+    rows_per_block = max(1, PIXELS_PER_BLOCK // max(nlon, 1))
+    for start in range(0, nlat, rows_per_block):
+        stop = min(start + rows_per_block, nlat)
+        x, y = latlon_to_scan(geometry, lats[start:stop, np.newaxis], lons[np.newaxis, :])
+        # Fractional column & row of each target pixel on the source grid
+        col = ((x - geometry.x_offset) / geometry.x_scale).ravel()
+        row = ((y - geometry.y_offset) / geometry.y_scale).ravel()
+        pixels = slice(start * nlon, stop * nlon)
+
+        with np.errstate(invalid='ignore'):
+            if (method == 'nearest'):
+                valid = ((col >= -0.5) & (col < geometry.nx - 0.5) &
+                         (row >= -0.5) & (row < geometry.ny - 0.5))
+                col0 = np.where(valid, np.rint(col), 0).astype(np.int64)
+                row0 = np.where(valid, np.rint(row), 0).astype(np.int64)
+                index[0, pixels] = row0 * geometry.nx + col0
+                weights[0, pixels] = valid
+            else:
+                valid = (col >= 0) & (col <= geometry.nx - 1) & (row >= 0) & (row <= geometry.ny - 1)
+                col = np.where(valid, col, 0)
+                row = np.where(valid, row, 0)
+                # The last column & row are interpolated from the one before
+                col0 = np.clip(np.floor(col), 0, max(geometry.nx - 2, 0)).astype(np.int64)
+                row0 = np.clip(np.floor(row), 0, max(geometry.ny - 2, 0)).astype(np.int64)
+                col1 = np.minimum(col0 + 1, geometry.nx - 1)
+                row1 = np.minimum(row0 + 1, geometry.ny - 1)
+                fc = col - col0
+                fr = row - row0
+
+                index[0, pixels] = row0 * geometry.nx + col0
+                index[1, pixels] = row0 * geometry.nx + col1
+                index[2, pixels] = row1 * geometry.nx + col0
+                index[3, pixels] = row1 * geometry.nx + col1
+                weights[0, pixels] = valid * (1 - fr) * (1 - fc)
+                weights[1, pixels] = valid * (1 - fr) * fc
+                weights[2, pixels] = valid * fr * (1 - fc)
+                weights[3, pixels] = valid * fr * fc
+
+    return index, weights
+
+
+
+def _save_atomic(path, array):
+    tmp_path = '{}.{}.{}.tmp.npy'.format(path[:-len('.npy')], os.getpid(), threading.get_ident())
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
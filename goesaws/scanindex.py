@@ -0,0 +1,276 @@
+"""
+Author: Matt Nicholson
+
+Sorted time index over a collection of GOES files. Used to resolve large
+batches of timestamps to the nearest, previous, or covering scan without a
+separate bucket query per timestamp.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+class ScanIndex(object):
+    """
+    Sorted index of scan start & end times for a list of AwsGoesFile (or
+    LocalGoesFile) objects. Files without parsable start/end times are dropped,
+    as are duplicate keys.
+
+    >>> index = ScanIndex(awsgoesfiles)
+    >>> matches = index.lookup(times, how='nearest')
+    """
+
+    def __init__(self, goesfiles):
+        super(ScanIndex, self).__init__()
+        unique = {}
+
+        for goesfile in goesfiles:
+            if (goesfile.start_time is not None and goesfile.key not in unique):
+                unique[goesfile.key] = goesfile
+
+        self.files = sorted(unique.values(), key=lambda x: (x.start_time, x.key))
+        self.starts = np.array([x.start_time for x in self.files], dtype='datetime64[ms]')
+        self.ends = np.array([x.end_time for x in self.files], dtype='datetime64[ms]')
+
+
+
+    def __len__(self):
+        return len(self.files)
+
+
+
+    def nearest(self, times, max_delta=None):
+        """
+        Finds the file whose scan start time is closest to each timestamp
+
+        Parameters
+        ----------
+        times : array-like of datetime, str, or numpy.datetime64
+        max_delta : timedelta, optional
+            Matches further than this from the timestamp are discarded.
+            Default: None (no limit)
+
+        Returns
+        -------
+        idx : numpy.ndarray of int
+            Index into self.files for each timestamp, -1 where there is no match
+        """
+        times = to_datetime64(times)
+        idx = np.full(times.shape, -1, dtype=np.int64)
+
+        if (len(self.files) == 0):
+            return idx
+
+        right = np.searchsorted(self.starts, times, side='left')
+        left = np.clip(right - 1, 0, len(self.starts) - 1)
+        right = np.clip(right, 0, len(self.starts) - 1)
+
+        left_diff = np.abs(times - self.starts[left])
+        right_diff = np.abs(self.starts[right] - times)
+        idx = np.where(right_diff < left_diff, right, left)
+        diff = np.minimum(left_diff, right_diff)
+
+        return self._apply_max_delta(idx, diff, max_delta)
+
+
+
+    def previous(self, times, max_delta=None):
+        """
+        Finds the most recent file whose scan started at or before each timestamp
+
+        Parameters
+        ----------
+        times : array-like of datetime, str, or numpy.datetime64
+        max_delta : timedelta, optional
+            Matches further than this from the timestamp are discarded.
+            Default: None (no limit)
+
+        Returns
+        -------
+        idx : numpy.ndarray of int
+            Index into self.files for each timestamp, -1 where there is no match
+        """
+        times = to_datetime64(times)
+
+        if (len(self.files) == 0):
+            return np.full(times.shape, -1, dtype=np.int64)
+
+        idx = np.searchsorted(self.starts, times, side='right') - 1
+        diff = times - self.starts[np.clip(idx, 0, None)]
+        idx = self._apply_max_delta(idx, diff, max_delta)
+
+        return idx
+
+
+
+    def covering(self, times):
+        """
+        Finds the file whose scan start/end window contains each timestamp
+
+        Parameters
+        ----------
+        times : array-like of datetime, str, or numpy.datetime64
+
+        Returns
+        -------
+        idx : numpy.ndarray of int
+            Index into self.files for each timestamp, -1 where there is no match
+        """
+        times = to_datetime64(times)
+
+        if (len(self.files) == 0):
+            return np.full(times.shape, -1, dtype=np.int64)
+
+        idx = np.searchsorted(self.starts, times, side='right') - 1
+        safe = np.clip(idx, 0, None)
+        idx[(idx < 0) | (self.ends[safe] < times)] = -1
+
+        return idx
+
+
+
+    def lookup(self, times, how='nearest', max_delta=None):
+        """
+        Resolves each timestamp to a file
+
+        Parameters
+        ----------
+        times : array-like of datetime, str, or numpy.datetime64
+        how : str, optional
+            'nearest', 'previous', or 'covering'. Default: 'nearest'
+        max_delta : timedelta, optional
+            Ignored when how='covering'. Default: None
+
+        Returns
+        -------
+        list of AwsGoesFile objects
+            Index-aligned with 'times'. None where there is no match
+        """
+        if (how == 'nearest'):
+            idx = self.nearest(times, max_delta=max_delta)
+        elif (how == 'previous'):
+            idx = self.previous(times, max_delta=max_delta)
+        elif (how == 'covering'):
+            idx = self.covering(times)
+        else:
+            raise ValueError("Invalid how parameter. Must be 'nearest', 'previous', or 'covering'")
+
+        return [self.files[i] if i >= 0 else None for i in idx.tolist()]
+
+
+
+    def _apply_max_delta(self, idx, diff, max_delta):
+        if (max_delta is not None):
+            idx = idx.copy()
+            idx[np.abs(diff) > _to_timedelta64(max_delta)] = -1
+
+        return idx
+
+
+
+def to_datetime64(times):
+    """
+    Converts a sequence of timestamps to a numpy datetime64[ms] array
+
+    Parameters
+    ----------
+    times : datetime, str, numpy.datetime64, or array-like of those
+        Strings may be formatted as MM-DD-YYYY-HH:MM, MM-DD-YYYY-HH:MM:SS,
+        or ISO 8601
+
+    Returns
+    -------
+    numpy.ndarray of datetime64[ms]
+    """
+    if (isinstance(times, np.ndarray) and np.issubdtype(times.dtype, np.datetime64)):
+        return times.astype('datetime64[ms]')
+
+    if (isinstance(times, (str, datetime, np.datetime64))):
+        times = [times]
+
+    converted = []
+    for t in times:
+        if (isinstance(t, str)):
+            t = _parse_time_str(t)
+        converted.append(np.datetime64(t, 'ms'))
+
+    return np.array(converted, dtype='datetime64[ms]')
+
+
+
+def floor_hour(times):
+    """
+    Truncates a datetime64 array to the hour
+    """
+    return times.astype('datetime64[h]')
+
+
+
+def _parse_time_str(time_str):
+    for fmt in ('%m-%d-%Y-%H:%M', '%m-%d-%Y-%H:%M:%S'):
+        try:
+            return datetime.strptime(time_str, fmt)
+        except ValueError:
+            pass
+
+    return datetime.fromisoformat(time_str)
+
+
+
+def _to_timedelta64(delta):
+    if (isinstance(delta, timedelta)):
+        return np.timedelta64(int(delta.total_seconds() * 1000), 'ms')
+
+    return np.timedelta64(delta, 'ms')
+
+
+
+def merge_join(left, right, how='within'):
+    """
+    Pairs each file in 'left' with the files in 'right' that fall inside its
+    scan start/end window. Both lists are sorted by start time and walked
+    once, so the join is O(n + m) for non-overlapping scan windows.
+
+    Parameters
+    ----------
+    left : list of AwsGoesFile objects
+        Files that define the windows, e.g. ABI scans
+    right : list of AwsGoesFile objects
+        Files to assign to the windows, e.g. GLM 20-second files
+    how : str, optional
+        'within' - right file's start & end must both be inside the window
+        'overlap' - right file only has to overlap the window
+        Default: 'within'
+
+    Returns
+    -------
+    pairs : list of (AwsGoesFile, list of AwsGoesFile) tuples
+        One tuple per left file, ordered by start time
+    """
+    if (how == 'within'):
+        before = lambda r, l: r.start_time < l.start_time
+    elif (how == 'overlap'):
+        before = lambda r, l: r.end_time < l.start_time
+    else:
+        raise ValueError("Invalid how parameter. Must be 'within' or 'overlap'")
+
+    left = ScanIndex(left).files
+    right = ScanIndex(right).files
+
+    pairs = []
+    j = 0
+
+    for l in left:
+        while (j < len(right) and before(right[j], l)):
+            j += 1
+
+        matched = []
+        k = j
+        while (k < len(right) and right[k].start_time <= l.end_time):
+            if (how == 'overlap' or right[k].end_time <= l.end_time):
+                matched.append(right[k])
+            k += 1
+
+        pairs.append((l, matched))
+
+    return pairs
@@ -0,0 +1,242 @@
+"""
+Author: Matt Nicholson
+
+Splits a resolved file manifest across several independent download nodes.
+
+Every node reads the same resolved manifest and computes the same partition,
+so no coordinator is needed and no file is assigned to two nodes. Each node
+appends the files it finishes to its own completion journal. Once all nodes
+are done, merge_shard_journals() compares the journals against the manifest
+and reports anything that is still missing.
+
+Example
+-------
+On node i of N:
+> python goesaws.py --resolved 'plan.json' --shard i/N --journal_dir 'journals' -dl -o 'path/to/download'
+
+Once every node has finished:
+> python goesaws.py --resolved 'plan.json' --merge_journals --journal_dir 'journals'
+"""
+import heapq
+import json
+import os
+
+from downloadresults import DownloadResults
+from localgoesfile import LocalGoesFile
+
+
+def parse_shard_spec(spec):
+    """
+    Parses a shard specification
+
+    Parameters
+    ----------
+    spec : str
+        Format: 'i/N', where N is the number of shards and i is this node's
+        zero-based shard index. Ex: '0/4'
+
+    Returns
+    -------
+    tuple of (int, int)
+        Shard index & number of shards
+    """
+    try:
+        index, count = [int(x) for x in spec.split('/')]
+    except (AttributeError, ValueError):
+        raise ValueError("Invalid shard parameter. Format: 'i/N', ex: '0/4'")
+
+    if (count < 1 or index < 0 or index >= count):
+        raise ValueError('Invalid shard parameter. Shard index must be between 0 and N - 1')
+
+    return index, count
+
+
+
+def partition_files(awsgoesfiles, count):
+    """
+    Splits files into 'count' shards of roughly equal total size. Files are
+    assigned largest first to the least loaded shard, with ties broken by key
+    and shard index, so the result only depends on the files themselves and
+    not on their order.
+
+    Parameters
+    ----------
+    awsgoesfiles : list of AwsGoesFile objects
+    count : int
+        Number of shards
+
+    Returns
+    -------
+    shards : list of list of AwsGoesFile objects
+        Files of each shard, ordered by scan start time
+    """
+    sizes = [x.size for x in awsgoesfiles if x.size is not None]
+    if (sizes):
+        default_size = sum(sizes) // len(sizes)
+    else:
+        default_size = 1
+
+    ordered = sorted(awsgoesfiles,
+                     key=lambda x: (-(x.size if x.size is not None else default_size), x.key))
+
+    shards = [[] for _ in range(count)]
+    loads = [(0, i) for i in range(count)]
+    heapq.heapify(loads)
+    seen = set()
+
+    for awsgoesfile in ordered:
+        if (awsgoesfile.key in seen):
+            continue
+        seen.add(awsgoesfile.key)
+
+        load, i = heapq.heappop(loads)
+        shards[i].append(awsgoesfile)
+        size = awsgoesfile.size if awsgoesfile.size is not None else default_size
+        heapq.heappush(loads, (load + size, i))
+
+    for shard in shards:
+        shard.sort(key=lambda x: (x.start_time is None, x.start_time, x.key))
+
+    return shards
+
+
+
+def get_journal_path(journal_dir, index, count):
+    """
+    Builds the path of a shard's completion journal
+    """
+    return os.path.join(journal_dir, 'shard-{:04d}-of-{:04d}.jsonl'.format(index, count))
+
+
+
+def read_journal(path):
+    """
+    Reads a completion journal
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    completed : dict
+        Key -> journal entry dict ('key', 'satellite', 'filepath') for every
+        completed file. A partially written last line is ignored
+    """
+    completed = {}
+
+    if (not os.path.exists(path)):
+        return completed
+
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            completed[entry['key']] = entry
+
+    return completed
+
+
+
+def download_shard(conn, awsgoesfiles, shard, basepath, journal_dir, keep_aws_folders=False,
+        threads=6):
+    """
+    Downloads this node's share of a resolved manifest. Completed files are
+    appended to the shard's journal as they finish, and files already in the
+    journal are skipped, so an interrupted node can simply be restarted.
+
+    Parameters
+    ----------
+    conn : GoesAWSInterface
+    awsgoesfiles : list of AwsGoesFile objects
+        Every file in the resolved manifest
+    shard : str or tuple of (int, int)
+        Shard spec, ex: '0/4', or (index, count)
+    basepath : str
+        Path to download the data files to
+    journal_dir : str
+        Directory holding the shard journals. Must be visible to the node that
+        runs merge_shard_journals()
+    keep_aws_folders : bool, optional
+        Passed through to download(). Default is False
+    threads : int, optional
+        Number of threads used to download the files. Default is 6
+
+    Returns
+    -------
+    downloadresults : DownloadResults
+        Results of the files downloaded by this call
+    """
+    if (isinstance(shard, str)):
+        index, count = parse_shard_spec(shard)
+    else:
+        index, count = shard
+
+    if (not os.path.isdir(journal_dir)):
+        os.makedirs(journal_dir)
+
+    journal_path = get_journal_path(journal_dir, index, count)
+    completed = read_journal(journal_path)
+
+    files = partition_files(awsgoesfiles, count)[index]
+    pending = [x for x in files if x.key not in completed]
+
+    print('Shard {}/{}: {} files, {} already completed'.format(index, count, len(files),
+                                                               len(files) - len(pending)))
+
+    with open(journal_path, 'a') as journal:
+        def record(localgoesfile):
+            entry = {'key': localgoesfile.key,
+                     'satellite': localgoesfile.satellite,
+                     'filepath': localgoesfile.filepath}
+            journal.write(json.dumps(entry) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        downloadresults = conn.download(None, pending, basepath, keep_aws_folders=keep_aws_folders,
+                                        threads=threads, callback=record)
+
+    return downloadresults
+
+
+
+def merge_shard_journals(awsgoesfiles, journal_dir):
+    """
+    Checks every shard journal against the resolved manifest
+
+    Parameters
+    ----------
+    awsgoesfiles : list of AwsGoesFile objects
+        Every file in the resolved manifest
+    journal_dir : str
+        Directory holding the shard journals
+
+    Returns
+    -------
+    downloadresults : DownloadResults
+        'success' holds a LocalGoesFile for every journaled file and 'failed'
+        holds the AwsGoesFile of every file missing from all journals
+    """
+    completed = {}
+
+    for fname in sorted(os.listdir(journal_dir)):
+        if (fname.startswith('shard-') and fname.endswith('.jsonl')):
+            completed.update(read_journal(os.path.join(journal_dir, fname)))
+
+    localfiles = []
+    missing = []
+    seen = set()
+
+    for awsgoesfile in awsgoesfiles:
+        if (awsgoesfile.key in seen):
+            continue
+        seen.add(awsgoesfile.key)
+
+        if (awsgoesfile.key in completed):
+            localfiles.append(LocalGoesFile(awsgoesfile, completed[awsgoesfile.key]['filepath']))
+        else:
+            missing.append(awsgoesfile)
+
+    return DownloadResults(localfiles, missing)
@@ -0,0 +1,163 @@
+"""
+Author: Matt Nicholson
+
+Spatial subsetting of ABI files to a lat/lon box.
+
+The box is mapped to a row/column window of the fixed grid (see
+fixedgrid.py), and a reduced netCDF holding only that window of every
+variable on the 'y' & 'x' dimensions is written. Variables without those
+dimensions (projection, band metadata, ...) are copied whole, and the
+compression & chunking of the source are kept.
+
+Subsetter can be given to GoesAWSInterface.download() to subset the files as
+they are downloaded. The subsets are written next to the downloaded files,
+which are left unchanged:
+
+>>> conn.download('goes16', imgs, 'path/to/download', postprocess=Subsetter((25., 35., -100., -85.)))
+"""
+import os
+import shutil
+
+import numpy as np
+from netCDF4 import Dataset
+
+from fixedgrid import bbox_window, read_geometry
+
+
+
+class Subsetter(object):
+    """
+    Post-download stage that writes the subset of a file. Picklable, so it
+    can run in a process pool
+
+    Parameters
+    ----------
+    bbox : tuple of float
+        (lat_min, lat_max, lon_min, lon_max) in degrees
+
+    Files the box doesn't overlap, ex: a mesoscale sector that moved away,
+    raise a ValueError, so download() counts them as errors rather than
+    returning files holding none of the box
+    """
+
+    def __init__(self, bbox):
+        super(Subsetter, self).__init__()
+        if (len(bbox) != 4):
+            raise ValueError('bbox must be (lat_min, lat_max, lon_min, lon_max)')
+        self.bbox = tuple(float(x) for x in bbox)
+
+
+
+    def __call__(self, filepath, out_path=None):
+        """
+        Parameters
+        ----------
+        filepath : str
+            Downloaded file
+        out_path : str, optional
+            Path to write the subset to. Default: None ('filepath' is
+            replaced by its subset)
+
+        Returns
+        -------
+        out_path : str
+        """
+        out_path = out_path or filepath
+        tmp_path = out_path + '.subset'
+        try:
+            if (subset_file(filepath, tmp_path, self.bbox)):
+                os.replace(tmp_path, out_path)
+            elif (out_path != filepath):
+                # Copied through the temporary path too, download() reuses
+                # any output it finds
+                shutil.copyfile(filepath, tmp_path)
+                os.replace(tmp_path, out_path)
+        finally:
+            if (os.path.exists(tmp_path)):
+                os.remove(tmp_path)
+
+        return out_path
+
+
+
+def subset_file(src_path, dst_path, bbox):
+    """
+    Writes the part of an ABI file inside a lat/lon box to a new file
+
+    Parameters
+    ----------
+    src_path : str
+    dst_path : str
+    bbox : tuple of float
+        (lat_min, lat_max, lon_min, lon_max) in degrees
+
+    Returns
+    -------
+    bool
+        False if 'src_path' is already a subset to 'bbox' and nothing was
+        written, True otherwise
+    """
+    bbox = tuple(float(x) for x in bbox)
+
+    with Dataset(src_path, 'r') as src:
+        if ('subset_bbox' in src.ncattrs() and
+                tuple(np.atleast_1d(src.getncattr('subset_bbox')).tolist()) == bbox):
+            return False
+
+        rows, cols = bbox_window(read_geometry(src), bbox)
+        windows = {'y': rows, 'x': cols}
+
+        with Dataset(dst_path, 'w', format=src.data_model) as dst:
+            dst.setncatts({name: src.getncattr(name) for name in src.ncattrs()})
+            dst.subset_bbox = np.array(bbox)
+            dst.subset_window = np.array([rows.start, rows.stop, cols.start, cols.stop],
+                                         dtype=np.int32)
+
+            for name, dim in src.dimensions.items():
+                if (dim.isunlimited()):
+                    size = None
+                elif (name in windows):
+                    size = windows[name].stop - windows[name].start
+                else:
+                    size = len(dim)
+                dst.createDimension(name, size)
+
+            for name, var in src.variables.items():
+                _copy_variable(var, dst, windows)
+
+    return True
+
+
+
+def _copy_variable(var, dst, windows):
+    """
+    Copies the window of a variable, keeping its attributes, compression,
+    & chunking
+    """
+    kwargs = {}
+    filters = var.filters()
+    if (filters is not None):
+        kwargs.update(zlib=filters['zlib'], complevel=filters['complevel'],
+                      shuffle=filters['shuffle'], fletcher32=filters['fletcher32'])
+
+    chunking = var.chunking()
+    if (chunking is not None and chunking != 'contiguous'):
+        sizes = [windows[d].stop - windows[d].start if d in windows else len(var.get_dims()[i])
+                 for i, d in enumerate(var.dimensions)]
+        kwargs['chunksizes'] = [max(1, min(c, n)) for c, n in zip(chunking, sizes)]
+
+    attrs = {name: var.getncattr(name) for name in var.ncattrs()}
+    fill_value = attrs.pop('_FillValue', None)
+
+    out = dst.createVariable(var.name, var.datatype, var.dimensions, fill_value=fill_value,
+                             **kwargs)
+    out.setncatts(attrs)
+
+    var.set_auto_maskandscale(False)
+    out.set_auto_maskandscale(False)
+
+    if (not var.dimensions):
+        out.assignValue(var.getValue())
+    else:
+        index = tuple(windows.get(d, slice(None)) for d in var.dimensions)
+        out[:] = var[index]
@@ -0,0 +1,269 @@
+"""
+Author: Matt Nicholson
+
+Extraction of pixel time series at points from many ABI files.
+
+The fixed grid row & column of every point are computed once per grid, & only
+the chunks holding the points are read from each file, so the work per file
+grows with the number of points rather than the size of the image. Local
+files are read in a process pool, & files in the bucket with ranged GETs of
+the chunks (see chunkindex.py), so they are never downloaded:
+
+>>> points = PointSeries(lats, lons)
+>>> times, cmi = points.extract(localgoesfiles, 'CMI')
+>>> times, cmi = points.extract_remote(conn, awsgoesfiles, 'CMI', cachedir='path/to/refs')
+
+'cmi' is a (time, point) array, NaN where a point is off the grid.
+"""
+import multiprocessing
+
+import concurrent.futures
+import numpy as np
+from netCDF4 import Dataset
+
+import chunkindex
+from fixedgrid import FixedGridGeometry, latlon_to_scan, read_geometry, PROJECTION_VAR
+
+
+
+class PointSeries(object):
+    """
+    Parameters
+    ----------
+    lats : list or numpy array of float
+        Latitude of the points in degrees
+    lons : list or numpy array of float
+        Longitude of the points in degrees
+    """
+
+    def __init__(self, lats, lons):
+        super(PointSeries, self).__init__()
+        self.lats = np.asarray(lats, dtype=np.float64).reshape(-1)
+        self.lons = np.asarray(lons, dtype=np.float64).reshape(-1)
+        if (self.lats.shape != self.lons.shape):
+            raise ValueError('lats & lons must have the same length')
+
+        # FixedGridGeometry -> (rows, cols, valid)
+        self._indices = {}
+
+
+
+    def __len__(self):
+        return len(self.lats)
+
+
+
+    def indices(self, geometry):
+        """
+        Gets the grid row & column of each point. Computed once per grid
+
+        Parameters
+        ----------
+        geometry : FixedGridGeometry
+
+        Returns
+        -------
+        rows, cols : numpy arrays of int
+            0 for points off the grid
+        valid : numpy array of bool
+            False for points off the grid
+        """
+        indices = self._indices.get(geometry)
+        if (indices is None):
+            indices = self._indices[geometry] = point_indices(geometry, self.lats, self.lons)
+
+        return indices
+
+
+
+    def extract(self, localgoesfiles, name, workers=None):
+        """
+        Reads a variable at the points from local files
+
+        Parameters
+        ----------
+        localgoesfiles : list of LocalGoesFile objects
+        name : str
+            Variable on the fixed grid. Ex: 'CMI'
+        workers : int, optional
+            Number of processes reading files. Default: None (number of CPUs)
+
+        Returns
+        -------
+        times : numpy array of datetime64[ms]
+            Scan start time of each file
+        values : numpy array
+            float32 (time, point) array, scaled, with NaN for missing pixels,
+            points off the grid, & files that couldn't be read
+        """
+        values = np.full((len(localgoesfiles), len(self)), np.nan, dtype=np.float32)
+        if (not localgoesfiles):
+            return _to_times(localgoesfiles), values
+
+        # The indices of the first grid are sent along, so workers only
+        # compute them for files on another grid (ex: a moved mesoscale sector)
+        with Dataset(localgoesfiles[0].filepath, 'r') as ds:
+            geometry = read_geometry(ds)
+        known = (geometry,) + self.indices(geometry)
+
+        n = len(localgoesfiles)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                    mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = executor.map(_sample_file, [x.filepath for x in localgoesfiles], [name] * n,
+                                   [self.lats] * n, [self.lons] * n, [known] * n)
+            for t, result in enumerate(results):
+                if (result is not None):
+                    values[t] = result
+
+        return _to_times(localgoesfiles), values
+
+
+
+    def extract_remote(self, conn, awsgoesfiles, name, cachedir=None, threads=8, chunk_threads=4):
+        """
+        Reads a variable at the points from files in the bucket, fetching only
+        the chunks holding the points
+
+        Parameters
+        ----------
+        conn : GoesAWSInterface
+        awsgoesfiles : list of AwsGoesFile objects
+        name : str
+            Variable on the fixed grid. Ex: 'CMI'
+        cachedir : str, optional
+            Directory the chunk indexes are cached in. Default: None
+        threads : int, optional
+            Number of files read concurrently. Default: 8
+        chunk_threads : int, optional
+            Number of concurrent chunk GETs per file. Default: 4
+
+        Returns
+        -------
+        times, values
+            See extract()
+        """
+        values = np.full((len(awsgoesfiles), len(self)), np.nan, dtype=np.float32)
+
+        def sample(awsgoesfile):
+            index = chunkindex.get_chunk_index(conn, awsgoesfile, cachedir=cachedir)
+            rows, cols, valid = self.indices(index_geometry(conn, index))
+            return index.read_points(conn, name, (rows[valid], cols[valid]), threads=chunk_threads,
+                                     mask_and_scale=True), valid
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            future_list = [executor.submit(sample, x) for x in awsgoesfiles]
+            for t, future in enumerate(future_list):
+                try:
+                    result, valid = future.result()
+                except Exception as exc:
+                    print('Failed to read {}: {}'.format(awsgoesfiles[t].filename, exc))
+                    continue
+                values[t, valid] = result
+
+        return _to_times(awsgoesfiles), values
+
+
+
+def point_indices(geometry, lats, lons):
+    """
+    Computes the nearest grid row & column of points
+
+    Parameters
+    ----------
+    geometry : FixedGridGeometry
+    lats, lons : numpy arrays of float
+
+    Returns
+    -------
+    rows, cols, valid
+        See PointSeries.indices()
+    """
+    x, y = latlon_to_scan(geometry, lats, lons)
+    with np.errstate(invalid='ignore'):
+        cols = np.rint((x - geometry.x_offset) / geometry.x_scale)
+        rows = np.rint((y - geometry.y_offset) / geometry.y_scale)
+        valid = (cols >= 0) & (cols < geometry.nx) & (rows >= 0) & (rows < geometry.ny)
+
+    rows = np.where(valid, rows, 0).astype(np.int64)
+    cols = np.where(valid, cols, 0).astype(np.int64)
+
+    return rows, cols, valid
+
+
+
+def index_geometry(conn, index):
+    """
+    Builds the fixed grid geometry of a file in the bucket from its chunk
+    index, reading only its x & y coordinates
+
+    Parameters
+    ----------
+    conn : GoesAWSInterface
+    index : ChunkIndex
+
+    Returns
+    -------
+    FixedGridGeometry
+    """
+    proj = index.variables[PROJECTION_VAR]['attrs']
+    x = index.read(conn, 'x', mask_and_scale=True).astype(np.float64)
+    y = index.read(conn, 'y', mask_and_scale=True).astype(np.float64)
+
+    return FixedGridGeometry(lon_0=float(proj['longitude_of_projection_origin']),
+                             height=float(proj['perspective_point_height'] + proj['semi_major_axis']),
+                             semi_major=float(proj['semi_major_axis']),
+                             semi_minor=float(proj['semi_minor_axis']),
+                             x_offset=float(x[0]),
+                             x_scale=float((x[-1] - x[0]) / (len(x) - 1)) if len(x) > 1 else 0.,
+                             nx=len(x),
+                             y_offset=float(y[0]),
+                             y_scale=float((y[-1] - y[0]) / (len(y) - 1)) if len(y) > 1 else 0.,
+                             ny=len(y))
+
+
+
+def _sample_file(filepath, name, lats, lons, known):
+    """
+    Reads a variable at the points from one file, one chunk at a time. Runs
+    in a worker process
+
+    Returns
+    -------
+    numpy array or None
+        None if the file couldn't be read
+    """
+    try:
+        with Dataset(filepath, 'r') as ds:
+            geometry = read_geometry(ds)
+            if (geometry == known[0]):
+                rows, cols, valid = known[1:]
+            else:
+                rows, cols, valid = point_indices(geometry, lats, lons)
+
+            var = ds.variables[name]
+            values = np.full(len(lats), np.nan, dtype=np.float32)
+            chunking = var.chunking()
+            if (chunking == 'contiguous'):
+                chunking = var.shape
+
+            # Points are grouped by chunk, & each chunk is read once as the
+            # window spanning its points
+            pos = np.stack([rows // chunking[0], cols // chunking[1]], axis=-1)[valid]
+            points = np.nonzero(valid)[0]
+            for chunk_pos in np.unique(pos, axis=0):
+                sel = points[(pos == chunk_pos).all(axis=1)]
+                r0, r1 = rows[sel].min(), rows[sel].max() + 1
+                c0, c1 = cols[sel].min(), cols[sel].max() + 1
+                window = np.ma.filled(var[r0:r1, c0:c1].astype(np.float32), np.nan)
+                values[sel] = window[rows[sel] - r0, cols[sel] - c0]
+    except (OSError, RuntimeError, KeyError, ValueError) as exc:
+        print('Failed to read {}: {}'.format(filepath, exc))
+        return None
+
+    return values
+
+
+
+def _to_times(goesfiles):
+    return np.array([np.datetime64(x.start_time, 'ms') if x.start_time is not None else
+                     np.datetime64('NaT') for x in goesfiles], dtype='datetime64[ms]')
@@ -0,0 +1,404 @@
+"""
+Author: Matt Nicholson
+
+Rewriting of downloaded files with the chunking & compression of the
+analysis that reads them.
+
+GOES files are chunked for reading whole images, so reading a region or a
+time series of a few pixels decompresses far more data than it uses.
+Transcoder rewrites a file as netCDF4 (zlib & shuffle) or Zarr with chunk
+sizes per dimension, & can also append the image variables of every file to
+one Zarr store along a 'time' dimension. It can be given to
+GoesAWSInterface.download() to transcode files as they are downloaded:
+
+>>> transcoder = Transcoder(chunks={'y': 256, 'x': 256}, complevel=4)
+>>> conn.download('goes16', imgs, 'path/to/download', postprocess=transcoder)
+
+>>> transcoder = Transcoder(format='zarr', chunks={'y': 512, 'x': 512}, zarr_store='day.zarr')
+
+Files are appended to the store in the order they finish downloading; the
+'time' array of the store holds the scan start time (ms since 1970) of each
+step. Zarr is optional & only needs to be installed to write Zarr; zarr 2
+(zarr<3) & numcodecs are required.
+
+Given to download(), the Zarr output is a '.zarr' directory next to the
+downloaded file, which is kept, & the returned LocalGoesFile points at it.
+"""
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+from netCDF4 import Dataset
+
+try:
+    import zarr
+    import numcodecs
+    # The zarr 2 API is used (create_dataset() with a numcodecs compressor)
+    if (int(zarr.__version__.split('.')[0]) >= 3):
+        zarr = None
+except ImportError:
+    zarr = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+FORMATS = ('netcdf', 'zarr')
+
+# Dimensions of the image variables appended to a time-concatenated store
+IMAGE_DIMS = ('y', 'x')
+
+
+
+class Transcoder(object):
+    """
+    Post-download stage that rewrites a file. Picklable, so it can run in a
+    process pool
+
+    Parameters
+    ----------
+    format : str, optional
+        'netcdf' (the file is rewritten, to 'out_path' or in place) or
+        'zarr' (a '.zarr' directory is written at 'out_path', or replaces
+        the file if it isn't given). Default: 'netcdf'
+    chunks : dict, optional
+        Dimension name -> chunk size. Dimensions left out keep the chunk size
+        of the source file. Default: None
+    complevel : int, optional
+        zlib compression level, 0 - 9. 0 turns compression off. Default: 4
+    shuffle : bool, optional
+        Apply the shuffle filter before compressing. Default: True
+    variables : list of str, optional
+        Variables to keep. Default: None (all)
+    zarr_store : str, optional
+        Zarr store the image variables of every file are appended to along
+        a 'time' dimension. Default: None
+    """
+
+    def __init__(self, format='netcdf', chunks=None, complevel=4, shuffle=True, variables=None,
+                 zarr_store=None):
+        super(Transcoder, self).__init__()
+        if (format not in FORMATS):
+            raise ValueError('Invalid format {}. Valid: {}'.format(format, FORMATS))
+        if (not 0 <= complevel <= 9):
+            raise ValueError('complevel must be between 0 & 9')
+        if ((format == 'zarr' or zarr_store is not None) and zarr is None):
+            raise ImportError('zarr<3 & numcodecs are required to write Zarr')
+
+        self.format = format
+        self.chunks = dict(chunks or {})
+        self.complevel = complevel
+        self.shuffle = shuffle
+        self.variables = list(variables) if variables is not None else None
+        self.zarr_store = zarr_store
+
+
+
+    @property
+    def extension(self):
+        """
+        Extension of the output, used by download() to name it. None for
+        netCDF
+        """
+        return '.zarr' if self.format == 'zarr' else None
+
+
+
+    @property
+    def settings(self):
+        """
+        JSON string of the settings, stored in the transcoded files so they
+        aren't transcoded twice
+        """
+        return json.dumps({'chunks': self.chunks, 'complevel': self.complevel,
+                           'shuffle': self.shuffle, 'variables': self.variables},
+                          sort_keys=True)
+
+
+
+    def __call__(self, filepath, out_path=None):
+        """
+        Parameters
+        ----------
+        filepath : str
+            Downloaded netCDF file
+        out_path : str, optional
+            Path to write the transcoded file, or Zarr directory, to.
+            Default: None ('filepath' is replaced)
+
+        Returns
+        -------
+        filepath : str
+            Path of the transcoded file or Zarr directory
+        """
+        if (self.format == 'netcdf'):
+            out_path = out_path or filepath
+            tmp_path = out_path + '.transcode'
+            try:
+                # Files transcoded on an earlier run are left alone, so they
+                # aren't appended to the store twice either
+                if (transcode_netcdf(filepath, tmp_path, self.chunks, self.complevel,
+                                     self.shuffle, self.variables, self.settings)):
+                    os.replace(tmp_path, out_path)
+                    self._append(out_path)
+                elif (out_path != filepath):
+                    # Copied through the temporary path too, download()
+                    # reuses any output it finds
+                    shutil.copyfile(filepath, tmp_path)
+                    os.replace(tmp_path, out_path)
+            finally:
+                if (os.path.exists(tmp_path)):
+                    os.remove(tmp_path)
+            return out_path
+
+        zarr_path = out_path or os.path.splitext(filepath)[0] + '.zarr'
+        tmp_path = zarr_path + '.transcode'
+        try:
+            transcode_zarr(filepath, tmp_path, self.chunks, self.complevel, self.variables)
+            if (os.path.isdir(zarr_path)):
+                shutil.rmtree(zarr_path)
+            os.replace(tmp_path, zarr_path)
+        finally:
+            if (os.path.isdir(tmp_path)):
+                shutil.rmtree(tmp_path)
+        self._append(filepath)
+        if (out_path is None):
+            os.remove(filepath)
+
+        return zarr_path
+
+
+
+    def _append(self, filepath):
+        if (self.zarr_store is not None):
+            append_to_store(filepath, self.zarr_store, chunks=self.chunks,
+                            complevel=self.complevel, variables=self.variables)
+
+
+
+def transcode_netcdf(src_path, dst_path, chunks=None, complevel=4, shuffle=True, variables=None,
+                     settings=None):
+    """
+    Rewrites a netCDF file with new chunk sizes & compression
+
+    Parameters
+    ----------
+    src_path : str
+    dst_path : str
+    chunks : dict, optional
+        Dimension name -> chunk size. Default: None
+    complevel : int, optional
+        Default: 4
+    shuffle : bool, optional
+        Default: True
+    variables : list of str, optional
+        Variables to keep. Default: None (all)
+    settings : str, optional
+        Stored as the 'transcode_settings' attribute. If the source already
+        has the same value, nothing is written. Default: None
+
+    Returns
+    -------
+    bool
+        False if the file was already transcoded with 'settings'
+    """
+    chunks = chunks or {}
+
+    with Dataset(src_path, 'r') as src:
+        if (settings is not None and 'transcode_settings' in src.ncattrs() and
+                src.getncattr('transcode_settings') == settings):
+            return False
+
+        with Dataset(dst_path, 'w', format='NETCDF4') as dst:
+            dst.setncatts({name: src.getncattr(name) for name in src.ncattrs()})
+            if (settings is not None):
+                dst.transcode_settings = settings
+
+            for name, dim in src.dimensions.items():
+                dst.createDimension(name, None if dim.isunlimited() else len(dim))
+
+            for name, var in src.variables.items():
+                if (variables is not None and name not in variables):
+                    continue
+
+                kwargs = {}
+                if (var.dimensions and var.dtype != str):
+                    kwargs.update(zlib=complevel > 0, complevel=max(complevel, 1), shuffle=shuffle,
+                                  chunksizes=_chunk_sizes(var, chunks))
+
+                attrs = {x: var.getncattr(x) for x in var.ncattrs()}
+                out = dst.createVariable(name, var.datatype, var.dimensions,
+                                         fill_value=attrs.pop('_FillValue', None), **kwargs)
+                out.setncatts(attrs)
+
+                var.set_auto_maskandscale(False)
+                out.set_auto_maskandscale(False)
+                if (var.dimensions):
+                    out[:] = var[:]
+                else:
+                    out.assignValue(var.getValue())
+
+    return True
+
+
+
+def transcode_zarr(src_path, dst_path, chunks=None, complevel=4, variables=None):
+    """
+    Writes a netCDF file as a Zarr group. Variables keep their packed values
+    & attributes, & their dimension names are stored in '_ARRAY_DIMENSIONS'
+    like xarray does
+
+    Parameters
+    ----------
+    src_path : str
+    dst_path : str
+        Path of the Zarr directory
+    chunks : dict, optional
+        Dimension name -> chunk size. Default: None
+    complevel : int, optional
+        Default: 4
+    variables : list of str, optional
+        Variables to keep. Default: None (all)
+    """
+    chunks = chunks or {}
+    group = zarr.open_group(dst_path, mode='w')
+
+    with Dataset(src_path, 'r') as src:
+        group.attrs.update(_json_attrs(src))
+
+        for name, var in src.variables.items():
+            if (variables is not None and name not in variables):
+                continue
+            if (var.dtype == str):
+                continue
+
+            var.set_auto_maskandscale(False)
+            data = var[:] if var.dimensions else np.asarray(var.getValue())
+            attrs = _json_attrs(var)
+            fill_value = attrs.pop('_FillValue', None)
+
+            arr = group.create_dataset(name, data=np.asarray(data),
+                                       chunks=tuple(_chunk_sizes(var, chunks)) or None,
+                                       compressor=_compressor(complevel), fill_value=fill_value)
+            attrs['_ARRAY_DIMENSIONS'] = list(var.dimensions)
+            arr.attrs.update(attrs)
+
+
+
+def append_to_store(src_path, store_path, chunks=None, complevel=4, variables=None):
+    """
+    Appends the image variables (on the 'y' & 'x' dimensions) of a netCDF
+    file to a Zarr store, along a leading 'time' dimension. The 'x' & 'y'
+    coordinates are written with the first file. Appends from several
+    processes are serialized with a lock file
+
+    Parameters
+    ----------
+    src_path : str
+    store_path : str
+    chunks : dict, optional
+        Dimension name -> chunk size. The time chunk size is 1. Default: None
+    complevel : int, optional
+        Default: 4
+    variables : list of str, optional
+        Image variables to append. Default: None (all)
+    """
+    chunks = chunks or {}
+
+    with Dataset(src_path, 'r') as src, _store_lock(store_path):
+        start = src.time_coverage_start if 'time_coverage_start' in src.ncattrs() else None
+        group = zarr.open_group(store_path, mode='a')
+
+        if ('time' not in group):
+            times = group.create_dataset('time', shape=(0,), chunks=(1024,), dtype='i8')
+            times.attrs.update({'units': 'milliseconds since 1970-01-01 00:00:00',
+                                '_ARRAY_DIMENSIONS': ['time']})
+            for name in IMAGE_DIMS:
+                if (name in src.variables):
+                    coord = src.variables[name]
+                    coord.set_auto_maskandscale(False)
+                    arr = group.create_dataset(name, data=coord[:])
+                    attrs = _json_attrs(coord)
+                    attrs['_ARRAY_DIMENSIONS'] = [name]
+                    arr.attrs.update(attrs)
+
+        for name, var in src.variables.items():
+            if (variables is not None and name not in variables):
+                continue
+            if (var.dimensions[-2:] != IMAGE_DIMS or name in IMAGE_DIMS):
+                continue
+
+            var.set_auto_maskandscale(False)
+            data = var[:]
+            if (name not in group):
+                attrs = _json_attrs(var)
+                arr = group.create_dataset(name, shape=(0,) + data.shape, dtype=data.dtype,
+                                           chunks=(1,) + tuple(_chunk_sizes(var, chunks)),
+                                           compressor=_compressor(complevel),
+                                           fill_value=attrs.pop('_FillValue', None))
+                attrs['_ARRAY_DIMENSIONS'] = ['time'] + list(var.dimensions)
+                arr.attrs.update(attrs)
+            elif (group[name].shape[1:] != data.shape):
+                raise ValueError('{} of {} is {}, the store holds {}'.format(
+                                 name, src_path, data.shape, group[name].shape[1:]))
+            group[name].append(np.asarray(data)[np.newaxis], axis=0)
+
+        millis = -2 ** 63
+        if (start is not None):
+            millis = int(np.datetime64(start.rstrip('Z'), 'ms').astype(np.int64))
+        group['time'].append(np.array([millis], dtype=np.int64))
+
+
+
+def _chunk_sizes(var, chunks):
+    """
+    Chunk sizes of a variable: the requested size of each dimension, or the
+    source chunk size, clipped to the dimension length
+    """
+    shape = var.shape
+    current = var.chunking()
+    if (current is None or current == 'contiguous'):
+        current = shape
+
+    return [max(1, min(chunks.get(dim, c), n)) if n > 0 else max(1, chunks.get(dim, c))
+            for dim, c, n in zip(var.dimensions, current, shape)]
+
+
+
+def _compressor(complevel):
+    return numcodecs.Zlib(level=complevel) if complevel > 0 else None
+
+
+
+def _json_attrs(obj):
+    """
+    Attributes of a netCDF dataset or variable as JSON types
+    """
+    attrs = {}
+    for name in obj.ncattrs():
+        value = obj.getncattr(name)
+        if (isinstance(value, (np.ndarray, np.generic))):
+            value = value.tolist()
+        attrs[name] = value
+
+    return attrs
+
+
+
+@contextmanager
+def _store_lock(store_path):
+    """
+    Holds an exclusive lock on '<store_path>.lock' across processes
+    """
+    with open(store_path + '.lock', 'a') as f:
+        if (fcntl is not None):
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if (fcntl is not None):
+                fcntl.flock(f, fcntl.LOCK_UN)
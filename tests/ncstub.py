@@ -0,0 +1,41 @@
+"""
+Small netCDF files shaped like the GOES products, used by the tests that
+need real files to read
+"""
+import numpy as np
+from netCDF4 import Dataset
+
+
+def write_abi_like(filepath, ny=150, nx=250, step=0.00056):
+    """
+    Writes a coarse GOES-16 CONUS-like file on the ABI fixed grid
+    """
+    with Dataset(filepath, 'w') as ds:
+        ds.scene_id = 'CONUS'
+        ds.createDimension('y', ny)
+        ds.createDimension('x', nx)
+        ds.createDimension('band', 1)
+
+        proj = ds.createVariable('goes_imager_projection', 'i4', ())
+        proj.longitude_of_projection_origin = -75.
+        proj.perspective_point_height = 35786023.
+        proj.semi_major_axis = 6378137.
+        proj.semi_minor_axis = 6356752.31414
+
+        y = ds.createVariable('y', 'i2', ('y',))
+        y.scale_factor = -step
+        y.add_offset = 0.12824
+        y[:] = 0.12824 - step * np.arange(ny)
+
+        x = ds.createVariable('x', 'i2', ('x',))
+        x.scale_factor = step
+        x.add_offset = -0.10136
+        x[:] = -0.10136 + step * np.arange(nx)
+
+        cmi = ds.createVariable('CMI', 'i2', ('y', 'x'), zlib=True, chunksizes=(50, 50),
+                                fill_value=-1)
+        cmi.scale_factor = np.float32(0.1)
+        cmi.set_auto_maskandscale(False)
+        cmi[:] = np.arange(ny * nx).reshape(ny, nx) % 4096
+
+        ds.createVariable('band_id', 'u1', ('band',))[:] = 13
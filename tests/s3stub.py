@@ -0,0 +1,69 @@
+"""
+Offline stand-in for the boto3 S3 client, used by the tests that don't need
+to reach the real bucket
+"""
+from datetime import datetime, timedelta
+import io
+
+
+def _fname_times(year, jday, hour, minute, second, duration):
+    start = datetime.strptime('{} {}'.format(year, jday), '%Y %j')
+    start += timedelta(hours=hour, minutes=minute, seconds=second)
+    end = start + timedelta(seconds=duration)
+    return start.strftime('%Y%j%H%M%S') + '0', end.strftime('%Y%j%H%M%S') + '0'
+
+
+
+def abi_key(sat, product, sector, channel, jday, hour, minute, second=0, year=2019):
+    prod_prefix = 'ABI-L1b' if product == 'Rad' else 'ABI-L2'
+    s, e = _fname_times(year, jday, hour, minute, second, 30)
+    return '{0}-{1}{2}/{3}/{4:03}/{5:02}/OR_{0}-{1}{6}-M6C{7}_G{8}_s{9}_e{10}_c{10}.nc'.format(
+            prod_prefix, product, sector[0], year, jday, hour, sector, channel, sat, s, e)
+
+
+
+def glm_key(sat, jday, hour, minute, second, year=2019):
+    s, e = _fname_times(year, jday, hour, minute, second, 20)
+    return 'GLM-L2-LCFA/{}/{:03}/{:02}/OR_GLM-L2-LCFA_G{}_s{}_e{}_c{}.nc'.format(
+            year, jday, hour, sat, s, e, e)
+
+
+
+class FakeS3Client(object):
+    """
+    Serves listings from a dict of bucket -> keys and records every listing
+    & download made. Objects whose content is set in 'objects' (key -> bytes)
+    can also be read with ranged GETs
+    """
+    def __init__(self, buckets, size=100):
+        self.buckets = buckets
+        self.size = size
+        self.objects = {}
+        self.list_calls = []
+        self.downloads = []
+        self.range_calls = []
+
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter='/', **kwargs):
+        self.list_calls.append((Bucket, Prefix))
+        keys = [x for x in self.buckets.get(Bucket, []) if x.startswith(Prefix)]
+        if (not keys):
+            return {}
+        return {'Contents': [{'Key': x, 'Size': len(self.objects.get(x, b'')) or self.size}
+                             for x in keys]}
+
+
+    def download_file(self, bucket, key, filepath, **kwargs):
+        with open(filepath, 'wb') as f:
+            self.download_fileobj(bucket, key, f)
+
+
+    def download_fileobj(self, bucket, key, fileobj, **kwargs):
+        self.downloads.append((bucket, key))
+        fileobj.write(self.objects.get(key, b'\0' * self.size))
+
+
+    def get_object(self, Bucket, Key, Range, **kwargs):
+        start, end = [int(x) for x in Range[len('bytes='):].split('-')]
+        self.range_calls.append((Key, start, end))
+        return {'Body': io.BytesIO(self.objects[Key][start:end + 1])}
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import goesawsinterface
+from backfill import BackfillRunner
+from tests.s3stub import FakeS3Client, abi_key
+
+
+class FlakyS3Client(FakeS3Client):
+    def __init__(self, buckets, fail_keys):
+        super(FlakyS3Client, self).__init__(buckets)
+        self.fail_keys = set(fail_keys)
+
+
+    def download_fileobj(self, bucket, key, fileobj, **kwargs):
+        if (key in self.fail_keys):
+            raise IOError('connection reset')
+        super(FlakyS3Client, self).download_fileobj(bucket, key, fileobj, **kwargs)
+
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.keys = [abi_key(16, 'CMIP', 'C', '13', 244, hour, minute)
+                     for hour in range(3) for minute in range(1, 60, 5)]
+        self.conn = goesawsinterface.GoesAWSInterface()
+        self.client = FlakyS3Client({'noaa-goes16': self.keys}, self.keys[::4])
+        self.conn._s3client = self.client
+        self.journal = os.path.join(self.tmpdir, 'backfill.db')
+        self.args = ('goes16', 'abi', '09-01-2019-00:00', '09-01-2019-02:59',
+                     os.path.join(self.tmpdir, 'data'))
+        self.kwargs = {'product': 'CMIP', 'sector': 'C', 'channel': '13'}
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_resume(self):
+        runner = BackfillRunner(self.conn, self.journal)
+        results = runner.run(*self.args, **self.kwargs)
+        self.assertEqual(results.success_count, 27)
+        self.assertEqual(results.failed_count, 9)
+
+        prog = runner.progress()
+        self.assertEqual(prog['hours_planned'], 3)
+        self.assertEqual(prog['hours_listed'], 3)
+        self.assertEqual(prog['files_total'], 36)
+        self.assertEqual(prog['files_completed'], 27)
+        self.assertEqual(prog['bytes_completed'], 2700)
+        runner.close()
+
+        # Restart: the closed hours aren't listed again and only the failed
+        # files are downloaded
+        self.client.fail_keys = set()
+        self.client.list_calls = []
+        self.client.downloads = []
+        runner = BackfillRunner(self.conn, self.journal)
+        results = runner.run(*self.args, **self.kwargs)
+        self.assertEqual(self.client.list_calls, [])
+        self.assertEqual(sorted(x[1] for x in self.client.downloads), sorted(self.keys[::4]))
+        self.assertEqual(runner.progress()['files_completed'], 36)
+        self.assertEqual(runner.progress()['eta_sec'], 0)
+        runner.close()
+
+
+
+    def test_progress_mid_hour_range(self):
+        self.client.fail_keys = set()
+        runner = BackfillRunner(self.conn, self.journal)
+        results = runner.run('goes16', 'abi', '09-01-2019-00:10', '09-01-2019-02:50',
+                             os.path.join(self.tmpdir, 'data'), **self.kwargs)
+        self.assertEqual(results.success_count, 32)
+
+        # The hours are journaled whole, only the files in range are counted
+        prog = runner.progress()
+        self.assertEqual(prog['files_total'], 32)
+        self.assertEqual(prog['files_completed'], 32)
+        self.assertEqual(prog['bytes_total'], prog['bytes_completed'])
+        self.assertEqual(prog['eta_sec'], 0)
+        runner.close()
+
+
+
+    def test_different_query_rejected(self):
+        runner = BackfillRunner(self.conn, self.journal)
+        runner.run(*self.args, **self.kwargs)
+        runner.close()
+
+        runner = BackfillRunner(self.conn, self.journal)
+        with self.assertRaises(ValueError):
+            runner.run(*self.args, product='CMIP', sector='C', channel='02')
+        runner.close()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+from awsgoesfile import AwsGoesFile
+from calibrate import calibrate, calibrate_files
+from localgoesfile import LocalGoesFile
+from tests.s3stub import abi_key
+
+
+PLANCK = {'planck_fk1': 13432.1, 'planck_fk2': 1497.69, 'planck_bc1': 0.0936, 'planck_bc2': 0.99969}
+
+
+def write_rad(filepath, band, shape=(300, 200)):
+    with Dataset(filepath, 'w') as ds:
+        ds.createDimension('y', shape[0])
+        ds.createDimension('x', shape[1])
+        ds.createDimension('band', 1)
+
+        rad = ds.createVariable('Rad', 'i2', ('y', 'x'), fill_value=1023, zlib=True)
+        rad.scale_factor = np.float32(0.1)
+        rad.add_offset = np.float32(1.)
+        rad.set_auto_maskandscale(False)
+        raw = (np.arange(shape[0] * shape[1]).reshape(shape) % 1000).astype(np.int16)
+        raw[0, :5] = 1023
+        rad[:] = raw
+
+        ds.createVariable('band_id', 'i1', ('band',))[:] = band
+        ds.createVariable('kappa0', 'f4', ())[:] = 0.0019
+        for name, value in PLANCK.items():
+            ds.createVariable(name, 'f4', ())[:] = value
+
+    return np.where(raw == 1023, np.nan, raw * np.float32(0.1) + np.float32(1.))
+
+
+
+class TestCalibrate(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_reflectance(self):
+        filepath = os.path.join(self.tmpdir, 'c02.nc')
+        rad = write_rad(filepath, 2)
+
+        refl = calibrate(filepath, rows_per_block=64)
+        self.assertEqual(refl.dtype, np.float32)
+        np.testing.assert_allclose(refl, rad * np.float32(0.0019), rtol=1e-5)
+        self.assertTrue(np.isnan(refl[0, :5]).all())
+
+
+
+    def test_brightness_temperature(self):
+        key = abi_key(16, 'Rad', 'C', '13', 143, 12, 0)
+        filepath = os.path.join(self.tmpdir, os.path.basename(key))
+        rad = write_rad(filepath, 13)
+        localfile = LocalGoesFile(AwsGoesFile(key, key, 0), filepath)
+
+        p = {k: np.float64(np.float32(v)) for k, v in PLANCK.items()}
+        expected = (p['planck_fk2'] / np.log(p['planck_fk1'] / rad + 1) - p['planck_bc1']) / p['planck_bc2']
+
+        out = np.lib.format.open_memmap(os.path.join(self.tmpdir, 'bt.npy'), mode='w+',
+                                        dtype=np.float32, shape=rad.shape)
+        bt = localfile.calibrate(out=out)
+        self.assertIs(bt, out)
+        np.testing.assert_allclose(bt, expected, rtol=1e-5)
+
+        with self.assertRaises(ValueError):
+            calibrate(filepath, out=np.empty((3, 3), dtype=np.float32))
+
+
+
+    def test_calibrate_files(self):
+        localfiles = []
+        for band in [1, 7, 14]:
+            key = abi_key(16, 'Rad', 'C', '{:02}'.format(band), 143, 12, 0)
+            filepath = os.path.join(self.tmpdir, os.path.basename(key))
+            write_rad(filepath, band, shape=(50, 40))
+            localfiles.append(LocalGoesFile(AwsGoesFile(key, key, 0), filepath))
+
+        outdir = os.path.join(self.tmpdir, 'npy')
+        paths = calibrate_files(localfiles, outdir, workers=2)
+        self.assertEqual([os.path.basename(x) for x in paths],
+                         [x.filename + '.npy' for x in localfiles])
+        for localfile, path in zip(localfiles, paths):
+            np.testing.assert_array_equal(np.load(path), calibrate(localfile.filepath))
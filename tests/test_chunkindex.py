@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+import chunkindex
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from tests.s3stub import FakeS3Client, abi_key
+
+
+class TestChunkIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        filepath = os.path.join(self.tmpdir, 'cmi.nc')
+        rand = np.random.RandomState(1)
+
+        with Dataset(filepath, 'w') as ds:
+            ds.createDimension('y', 500)
+            ds.createDimension('x', 600)
+            cmi = ds.createVariable('CMI', 'i2', ('y', 'x'), zlib=True, shuffle=True,
+                                    chunksizes=(226, 226), fill_value=-1)
+            cmi.scale_factor = np.float32(0.1)
+            cmi.add_offset = np.float32(150.)
+            cmi.set_auto_maskandscale(False)
+            cmi[:] = rand.randint(0, 4096, size=(500, 600))
+            cmi[10:20, 10:20] = -1
+
+            # Only the first rows are written, the other chunks don't exist
+            partial = ds.createVariable('partial', 'f4', ('y', 'x'), chunksizes=(100, 100),
+                                        fletcher32=True)
+            partial[:100, :] = rand.rand(100, 600)
+
+            plain = ds.createVariable('plain', 'f8', ('x',), contiguous=True)
+            plain[:] = np.arange(600) * 0.5
+
+            ds.createVariable('t', 'f8', ())[:] = 12.5
+
+        with Dataset(filepath, 'r') as ds:
+            ds.set_auto_maskandscale(False)
+            self.expected = {name: var[:] for name, var in ds.variables.items()}
+
+        with open(filepath, 'rb') as f:
+            self.data = f.read()
+
+        self.key = abi_key(16, 'CMIP', 'F', '13', 143, 12, 0)
+        self.conn = goesawsinterface.GoesAWSInterface()
+        self.client = FakeS3Client({'noaa-goes16': [self.key]})
+        self.client.objects[self.key] = self.data
+        self.conn._s3client = self.client
+        self.awsgoesfile = AwsGoesFile(self.key, None, None, size=len(self.data))
+        self.cachedir = os.path.join(self.tmpdir, 'refs')
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_read_windows(self):
+        index = chunkindex.get_chunk_index(self.conn, self.awsgoesfile, cachedir=self.cachedir)
+
+        for window in [(slice(0, 10), slice(0, 10)),
+                       (slice(220, 240), slice(200, 460)),
+                       (slice(490, None), slice(None, None, 7)),
+                       (slice(None), slice(None))]:
+            np.testing.assert_array_equal(index.read(self.conn, 'CMI', window),
+                                          self.expected['CMI'][window])
+
+        np.testing.assert_array_equal(index.read(self.conn, 'partial', (slice(50, 150), slice(0, 10))),
+                                      self.expected['partial'][50:150, :10])
+        np.testing.assert_array_equal(index.read(self.conn, 'plain', (slice(5, 9),)),
+                                      self.expected['plain'][5:9])
+        self.assertEqual(index.read(self.conn, 't'), 12.5)
+
+
+
+    def test_small_window_fetches_few_bytes(self):
+        chunkindex.get_chunk_index(self.conn, self.awsgoesfile, cachedir=self.cachedir)
+        self.client.range_calls = []
+
+        # The index is cached, so only the single overlapped chunk is fetched
+        cmi = self.awsgoesfile.read_variable(self.conn, 'CMI', (slice(300, 310), slice(300, 310)),
+                                             cachedir=self.cachedir)
+        np.testing.assert_array_equal(cmi, self.expected['CMI'][300:310, 300:310])
+        self.assertEqual(len(self.client.range_calls), 1)
+        fetched = sum(end - start + 1 for _, start, end in self.client.range_calls)
+        self.assertLess(fetched, len(self.data) // 5)
+
+
+
+    def test_mask_and_scale(self):
+        cmi = self.awsgoesfile.read_variable(self.conn, 'CMI', (slice(5, 25), slice(5, 25)),
+                                             mask_and_scale=True)
+        self.assertEqual(cmi.dtype, np.float32)
+        self.assertTrue(np.isnan(cmi[5:15, 5:15]).all())
+        np.testing.assert_allclose(cmi[0, 0], self.expected['CMI'][5, 5] * 0.1 + 150.,
+                                   rtol=1e-6)
+
+
+
+    def test_cold_cache_threads(self):
+        for attempt in range(5):
+            cachedir = os.path.join(self.cachedir, str(attempt))
+            barrier = threading.Barrier(8)
+            errors = []
+
+            def index():
+                barrier.wait()
+                try:
+                    chunkindex.get_chunk_index(self.conn, self.awsgoesfile, cachedir=cachedir)
+                except Exception as exc:
+                    errors.append(exc)
+
+            threads = [threading.Thread(target=index) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(errors, [])
+            self.assertEqual(os.listdir(cachedir), [self.awsgoesfile.filename + '.json'])
@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from downloadlock import FileClaim, FileClaimTimeout, fetch_once
+
+
+def slow_fetch(fileobj):
+    time.sleep(0.5)
+    fileobj.write(b'data')
+
+
+
+def worker(filepath, queue):
+    queue.put(fetch_once(filepath, slow_fetch, poll_interval=0.05))
+
+
+
+class TestDownloadLock(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, 'file.nc')
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_single_fetch_across_processes(self):
+        queue = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(self.filepath, queue))
+                 for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        results = [queue.get() for _ in procs]
+        self.assertEqual(results.count(True), 1)
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertFalse(os.path.exists(self.filepath + '.part'))
+
+
+
+    def test_failed_fetch_leaves_nothing(self):
+        def failing_fetch(fileobj):
+            fileobj.write(b'da')
+            raise IOError('connection reset')
+
+        with self.assertRaises(IOError):
+            fetch_once(self.filepath, failing_fetch)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+
+
+    def test_stale_part_is_recovered(self):
+        with open(self.filepath + '.part', 'wb') as f:
+            f.write(b'torn')
+        old = time.time() - 3600
+        os.utime(self.filepath + '.part', (old, old))
+
+        self.assertTrue(fetch_once(self.filepath, lambda f: f.write(b'data'), poll_interval=0.01))
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+
+
+
+    def test_dead_owner_is_recovered(self):
+        # Younger than stale_after, but nobody holds its lock
+        with open(self.filepath + '.part', 'wb') as f:
+            f.write(b'torn')
+        old = time.time() - 60
+        os.utime(self.filepath + '.part', (old, old))
+
+        claim = FileClaim(self.filepath)
+        stale = claim.is_stale()
+        self.assertIsNotNone(stale)
+        claim.break_stale(stale)
+        self.assertFalse(os.path.exists(self.filepath + '.part'))
+
+
+
+    def test_reclaimed_part_is_kept(self):
+        with open(self.filepath + '.part', 'wb') as f:
+            f.write(b'torn')
+        old = time.time() - 3600
+        os.utime(self.filepath + '.part', (old, old))
+
+        late = FileClaim(self.filepath)
+        stale = late.is_stale()
+        self.assertIsNotNone(stale)
+
+        # Another recoverer breaks the claim & claims the file first
+        first = FileClaim(self.filepath)
+        first.break_stale(first.is_stale())
+        self.assertTrue(first.acquire())
+
+        late.break_stale(stale)
+        self.assertTrue(os.path.exists(self.filepath + '.part'))
+        first.fileobj.write(b'data')
+        first.commit()
+        with open(self.filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+
+
+
+    def test_live_claim_is_waited_on(self):
+        owner = FileClaim(self.filepath)
+        self.assertTrue(owner.acquire())
+        self.assertFalse(FileClaim(self.filepath).acquire())
+
+        with self.assertRaises(FileClaimTimeout):
+            FileClaim(self.filepath).wait(poll_interval=0.01, timeout=0.1)
+
+        owner.fileobj.write(b'data')
+        owner.commit()
+        self.assertTrue(FileClaim(self.filepath).wait(poll_interval=0.01, timeout=0.1))
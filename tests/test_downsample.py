@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+from netCDF4 import Dataset
+
+import fixedgrid
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from downsample import Downsampler, downsample, downsample_factor, downsample_file
+from tests.ncstub import write_abi_like
+from tests.s3stub import FakeS3Client, abi_key
+
+
+def write_band2_like(filepath):
+    """
+    Writes a 150 x 250 band 2 file with missing pixels & a DQF variable
+    """
+    write_abi_like(filepath, step=0.000014)
+    with Dataset(filepath, 'a') as ds:
+        ds.variables['band_id'][:] = 2
+        cmi = ds.variables['CMI']
+        cmi.set_auto_maskandscale(False)
+        cmi[0:4, 0:4] = -1
+        cmi[4, 0:3] = -1
+
+        dqf = ds.createVariable('DQF', 'u1', ('y', 'x'), zlib=True, chunksizes=(50, 50),
+                                fill_value=255)
+        dqf.set_auto_maskandscale(False)
+        dqf[:] = (np.arange(150 * 250).reshape(150, 250) % 7 == 0).astype(np.uint8)
+
+
+
+class TestDownsample(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, 'band2.nc')
+        write_band2_like(self.filepath)
+
+        with Dataset(self.filepath, 'r') as ds:
+            self.cmi = np.ma.filled(ds.variables['CMI'][:].astype(np.float32), np.nan)
+            self.geometry = fixedgrid.read_geometry(ds)
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_factor(self):
+        self.assertEqual(downsample_factor(2), 4)
+        self.assertEqual(downsample_factor(1), 2)
+        self.assertEqual(downsample_factor(13), 1)
+        self.assertEqual(downsample_factor(2, target_km=1.), 2)
+        with self.assertRaises(ValueError):
+            downsample_factor(13, target_km=1.)
+        with self.assertRaises(ValueError):
+            downsample_factor(17)
+
+
+
+    def test_downsample(self):
+        out = np.empty((37, 62), dtype=np.float32)
+        with Dataset(self.filepath, 'r') as ds:
+            result = downsample(ds.variables['CMI'], 4, out=out)
+            with self.assertRaises(ValueError):
+                downsample(ds.variables['CMI'], 4, out=np.empty((37, 62)))
+
+        self.assertIs(result, out)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            expected = np.nanmean(self.cmi[:148, :248].reshape(37, 4, 62, 4), axis=(1, 3))
+        self.assertTrue(np.isnan(out[0, 0]))
+        np.testing.assert_allclose(out, expected, rtol=1e-5)
+
+
+
+    def test_downsample_file(self):
+        dst_path = os.path.join(self.tmpdir, 'band2_2km.nc')
+        self.assertTrue(downsample_file(self.filepath, dst_path))
+
+        with Dataset(dst_path, 'r') as ds:
+            self.assertEqual(ds.variables['CMI'].shape, (37, 62))
+            self.assertEqual(ds.variables['CMI'].dtype, np.float32)
+            self.assertEqual(ds.variables['DQF'][1, 1], 1)
+            self.assertEqual(ds.downsample_factor, 4)
+            geometry = fixedgrid.read_geometry(ds)
+
+        self.assertAlmostEqual(geometry.x_scale, 4 * self.geometry.x_scale)
+        self.assertAlmostEqual(geometry.x_offset, self.geometry.x_offset + 1.5 * self.geometry.x_scale)
+        self.assertEqual((geometry.ny, geometry.nx), (37, 62))
+        self.assertFalse(downsample_file(dst_path, os.path.join(self.tmpdir, 'again.nc')))
+
+
+
+    def test_download_postprocess(self):
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        keys = [abi_key(16, 'CMIP', 'C', '02', 143, 12, x) for x in range(0, 10, 5)]
+        client = FakeS3Client({'noaa-goes16': keys})
+        client.objects.update({key: data for key in keys})
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+
+        result = conn.download('goes16', [AwsGoesFile(key, key, i) for i, key in enumerate(keys)],
+                               os.path.join(self.tmpdir, 'out'), postprocess=Downsampler(),
+                               postprocess_workers=2)
+
+        self.assertEqual(result.success_count, 2)
+        for localfile in result.iter_success():
+            self.assertFalse(os.path.exists(localfile.filepath + '.downsample'))
+            with Dataset(localfile.filepath, 'r') as ds:
+                self.assertEqual(ds.variables['CMI'].shape, (37, 62))
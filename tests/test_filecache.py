@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from filecache import FileCache
+from tests.s3stub import FakeS3Client, glm_key
+
+
+def make_files(count):
+    files = []
+    for x in range(count):
+        key = glm_key(16, 143, 12, x // 3, 20 * (x % 3))
+        files.append(AwsGoesFile(key, key, '05-23-2019-12:00', size=100))
+    return files
+
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def write_file(self, name, size=100):
+        filepath = os.path.join(self.tmpdir, name)
+        with open(filepath, 'wb') as f:
+            f.write(b'\0' * size)
+        return filepath
+
+
+
+    def test_lru_eviction(self):
+        cache = FileCache(self.tmpdir, max_bytes=300)
+        paths = [self.write_file('f{}'.format(x)) for x in range(3)]
+        for x, path in enumerate(paths):
+            cache.add('k{}'.format(x), path)
+
+        # k0 becomes the most recently used, so k1 is evicted next
+        self.assertEqual(cache.get('k0'), paths[0])
+        cache.add('k3', self.write_file('f3'))
+
+        self.assertNotIn('k1', cache)
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertEqual(cache.total_bytes, 300)
+
+
+
+    def test_directory_entry(self):
+        cache = FileCache(self.tmpdir, max_bytes=300)
+        dirpath = os.path.join(self.tmpdir, 'store.zarr')
+        os.makedirs(os.path.join(dirpath, 'CMI'))
+        for name in ['.zgroup', os.path.join('CMI', '0.0')]:
+            with open(os.path.join(dirpath, name), 'wb') as f:
+                f.write(b'\0' * 100)
+
+        cache.add('k0', dirpath)
+        self.assertEqual(cache.total_bytes, 200)
+
+        cache.add('k1', self.write_file('f1', size=200))
+        self.assertNotIn('k0', cache)
+        self.assertFalse(os.path.exists(dirpath))
+
+
+
+    def test_age_policy_ignores_use(self):
+        cache = FileCache(self.tmpdir, max_bytes=200, policy='age')
+        cache.add('k0', self.write_file('f0'))
+        cache.add('k1', self.write_file('f1'))
+        cache.get('k0')
+        cache.add('k2', self.write_file('f2'))
+
+        self.assertNotIn('k0', cache)
+        self.assertIn('k1', cache)
+
+
+
+    def test_max_age(self):
+        cache = FileCache(self.tmpdir, max_bytes=10000, max_age=0.1)
+        cache.add('k0', self.write_file('f0'))
+        time.sleep(0.2)
+        cache.add('k1', self.write_file('f1'))
+
+        self.assertNotIn('k0', cache)
+        self.assertIn('k1', cache)
+
+
+
+    def test_pinned_files_are_kept(self):
+        cache = FileCache(self.tmpdir, max_bytes=100)
+        path = self.write_file('f0')
+        cache.add('k0', path)
+
+        cache.pin('k0')
+        cache.pin('k1')
+        cache.add('k1', self.write_file('f1'))
+        self.assertIn('k0', cache)
+        self.assertEqual(cache.total_bytes, 200)
+
+        cache.unpin('k0')
+        cache.unpin('k1')
+        self.assertEqual(cache.evict(), ['k0'])
+        self.assertFalse(os.path.exists(path))
+
+
+
+    def test_index_persists(self):
+        cache = FileCache(self.tmpdir, max_bytes=1000)
+        path = self.write_file('f0')
+        cache.add('k0', path)
+        cache.save()
+
+        cache = FileCache(self.tmpdir, max_bytes=1000)
+        self.assertEqual(cache.get('k0'), path)
+        self.assertEqual(cache.total_bytes, 100)
+
+        os.remove(path)
+        self.assertIsNone(cache.get('k0'))
+        self.assertEqual(cache.total_bytes, 0)
+
+
+
+    def test_download_with_cache(self):
+        files = make_files(6)
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = FakeS3Client({'noaa-goes16': [x.key for x in files]})
+        cache = FileCache(self.tmpdir, max_bytes=400)
+
+        results = conn.download('goes16', files[:3], None, cache=cache)
+        self.assertEqual(results.success_count, 3)
+        self.assertEqual(len(cache), 3)
+
+        # Cached files are served without touching the bucket
+        conn._s3client.downloads = []
+        conn.download('goes16', files[:3], None, cache=cache)
+        self.assertEqual(conn._s3client.downloads, [])
+
+        conn.download('goes16', files[3:], None, cache=cache)
+        self.assertEqual(len(cache), 4)
+        self.assertLessEqual(cache.total_bytes, 400)
+        for awsgoesfile in files[3:]:
+            self.assertIn(awsgoesfile.key, cache)
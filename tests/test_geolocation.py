@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import fixedgrid
+from awsgoesfile import AwsGoesFile
+from geolocation import LatLonCache
+from localgoesfile import LocalGoesFile
+from tests.ncstub import write_abi_like
+from tests.s3stub import abi_key
+
+
+class TestLatLonCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, 'latlon')
+        self.localfiles = []
+
+        for minute in [0, 5]:
+            key = abi_key(16, 'CMIP', 'C', '13', 143, 12, minute)
+            filepath = os.path.join(self.tmpdir, os.path.basename(key))
+            write_abi_like(filepath)
+            self.localfiles.append(LocalGoesFile(AwsGoesFile(key, key, minute), filepath))
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_cached_per_grid(self):
+        cache = LatLonCache(self.cachedir)
+        lat, lon = self.localfiles[0].latlon(cache)
+        ref_lat, ref_lon = self.localfiles[0].latlon()
+
+        self.assertEqual(lat.shape, (150, 250))
+        self.assertEqual(lat.dtype, np.float32)
+        np.testing.assert_allclose(lat, ref_lat, atol=1e-4)
+        np.testing.assert_allclose(lon, ref_lon, atol=1e-4)
+
+        # Same grid, so the open memory map is shared
+        lat2, lon2 = self.localfiles[1].latlon(cache)
+        self.assertTrue(np.shares_memory(lat, lat2))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(os.listdir(self.cachedir)), 1)
+        self.assertFalse(lat2.flags.writeable)
+
+        # A new cache reads the file rather than computing it again
+        cache = LatLonCache(self.cachedir)
+        np.testing.assert_array_equal(self.localfiles[1].latlon(cache)[1], lon)
+        self.assertEqual(cache.misses, 0)
+
+
+
+    def test_lru(self):
+        cache = LatLonCache(self.cachedir, max_entries=2)
+        geometry = self.localfiles[0].geometry
+        # Mesoscale sectors of the same size centered elsewhere
+        grids = [geometry._replace(x_offset=geometry.x_offset + 0.01 * i) for i in range(3)]
+
+        for grid in grids:
+            cache.get(grid, satellite='goes16')
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(len(os.listdir(self.cachedir)), 3)
+        self.assertEqual(len(cache._entries), 2)
+
+        lat, lon = cache.get(grids[2], satellite='goes16')
+        self.assertEqual(cache.hits, 1)
+        x = grids[2].x_offset + grids[2].x_scale * 7
+        y = grids[2].y_offset + grids[2].y_scale * 3
+        np.testing.assert_allclose((lat[3, 7], lon[3, 7]), fixedgrid.scan_to_latlon(grids[2], x, y),
+                                   atol=1e-4)
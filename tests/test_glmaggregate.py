@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+from awsgoesfile import AwsGoesFile
+from glmaggregate import GlmAggregator, GrowableArray
+from localgoesfile import LocalGoesFile
+from tests.s3stub import glm_key
+
+
+def write_lcfa(filepath, start, nflash):
+    """
+    Writes an LCFA-like file with 'nflash' flashes of 2 groups of 3 events each
+    """
+    with Dataset(filepath, 'w') as ds:
+        ds.createDimension('number_of_flashes', nflash)
+        ds.createDimension('number_of_groups', 2 * nflash)
+        ds.createDimension('number_of_events', 6 * nflash)
+
+        ds.createVariable('flash_id', 'i2', ('number_of_flashes',))[:] = np.arange(nflash)
+        lat = ds.createVariable('flash_lat', 'f4', ('number_of_flashes',), fill_value=-999.)
+        lat[:] = np.ma.masked_array(np.linspace(20, 40, nflash), mask=np.arange(nflash) == 0)
+        ds.createVariable('group_parent_flash_id', 'i2',
+                          ('number_of_groups',))[:] = np.repeat(np.arange(nflash), 2)
+
+        offset = ds.createVariable('event_time_offset', 'i2', ('number_of_events',))
+        offset.scale_factor = 0.001
+        offset.units = 'seconds since {}'.format(start.strftime('%Y-%m-%d %H:%M:%S.000'))
+        offset[:] = np.arange(6 * nflash) * 0.1
+        ds.createVariable('event_energy', 'f4', ('number_of_events',))[:] = 1.
+
+
+
+class TestGlmAggregator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.localfiles = []
+
+        # Two minutes of files, plus the first file of a third minute
+        for i in range(7):
+            key = glm_key(16, 244, 16, i // 3, 20 * (i % 3))
+            awsgoesfile = AwsGoesFile(key, key, i)
+            filepath = os.path.join(self.tmpdir, awsgoesfile.filename)
+            write_lcfa(filepath, awsgoesfile.start_time, nflash=i + 1)
+            self.localfiles.append(LocalGoesFile(awsgoesfile, filepath))
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_bins(self):
+        emitted = []
+        variables = ['flash_id', 'flash_lat', 'group_parent_flash_id', 'event_time_offset',
+                     'event_energy']
+        with GlmAggregator(bin_minutes=1, variables=variables, workers=2,
+                           on_bin=lambda sat, start, arrays: emitted.append((start, arrays))) as agg:
+            for localfile in reversed(self.localfiles[:6]):
+                agg.add(localfile)
+            agg._collect(wait=True)
+            self.assertEqual(len(emitted), 2)
+            agg.add(self.localfiles[6])
+
+        self.assertEqual([x[0].minute for x in emitted], [1, 0, 2])
+        start, arrays = emitted[1]
+        # Files 2, 1, 0 of the first minute, in the order they were added
+        self.assertEqual(arrays['flash_id'].tolist(), [0, 1, 2, 0, 1, 0])
+        self.assertEqual(arrays['flash_file'].tolist(), [0, 0, 0, 1, 1, 2])
+        self.assertEqual(len(arrays['group_file']), 12)
+        self.assertEqual(arrays['event_file'].dtype, np.int16)
+        self.assertTrue(np.isnan(arrays['flash_lat'][[0, 3, 5]]).all())
+
+        times = arrays['event_time_offset']
+        self.assertEqual(times.dtype, np.dtype('datetime64[ms]'))
+        self.assertEqual(times[0], np.datetime64('2019-09-01T16:00:40.000'))
+        self.assertEqual(times[-1], np.datetime64('2019-09-01T16:00:00.500'))
+
+        # The incomplete last bin is emitted on close
+        self.assertEqual(len(emitted[2][1]['flash_id']), 7)
+
+
+
+    def test_write_netcdf(self):
+        outdir = os.path.join(self.tmpdir, 'bins')
+        with GlmAggregator(bin_minutes=5, outdir=outdir, workers=2) as agg:
+            for localfile in self.localfiles:
+                agg.add(localfile)
+
+        self.assertEqual(os.listdir(outdir), ['GLM-LCFA_goes16_201909011600_5min.nc'])
+        with Dataset(os.path.join(outdir, 'GLM-LCFA_goes16_201909011600_5min.nc'), 'r') as ds:
+            self.assertEqual(len(ds.dimensions['number_of_flashes']), 28)
+            self.assertEqual(len(ds.dimensions['number_of_events']), 6 * 28)
+            self.assertEqual(ds.time_coverage_end, '2019-09-01T16:05:00Z')
+            self.assertEqual(ds.variables['event_file'][:].max(), 6)
+            self.assertEqual(len(ds.source_files.split()), 7)
+
+        with self.assertRaises(ValueError):
+            GlmAggregator(bin_minutes=7)
+
+
+
+    def test_satellites(self):
+        localfiles = list(self.localfiles[:3])
+        for i in range(3):
+            key = glm_key(17, 244, 16, 0, 20 * i)
+            awsgoesfile = AwsGoesFile(key, key, i)
+            filepath = os.path.join(self.tmpdir, awsgoesfile.filename)
+            write_lcfa(filepath, awsgoesfile.start_time, nflash=1)
+            localfiles.append(LocalGoesFile(awsgoesfile, filepath))
+
+        emitted = []
+        with GlmAggregator(bin_minutes=1, variables=['flash_id'], workers=2,
+                           on_bin=lambda sat, start, arrays: emitted.append((sat, arrays))) as agg:
+            # Files of both satellites interleaved, the same minute of each is
+            # a bin of its own
+            for localfile in localfiles[::3] + localfiles[1::3] + localfiles[2::3]:
+                agg.add(localfile)
+            agg._collect(wait=True)
+            self.assertEqual(sorted(x[0] for x in emitted), ['goes16', 'goes17'])
+
+            # A late file & a file added twice are dropped
+            agg.add(localfiles[0])
+            agg.add(self.localfiles[3])
+            agg.add(self.localfiles[3])
+
+        counts = {sat: len(arrays['flash_id']) for sat, arrays in emitted[:2]}
+        self.assertEqual(counts, {'goes16': 6, 'goes17': 3})
+        self.assertEqual(len(emitted), 3)
+        self.assertEqual(emitted[2][1]['flash_file'].tolist(), [0, 0, 0, 0])
+
+
+
+    def test_extra_files_queued(self):
+        # A 4th file of the first minute, queued before the bin is collected
+        key = glm_key(16, 244, 16, 0, 50)
+        awsgoesfile = AwsGoesFile(key, key, 0)
+        filepath = os.path.join(self.tmpdir, awsgoesfile.filename)
+        write_lcfa(filepath, awsgoesfile.start_time, nflash=1)
+        extra = LocalGoesFile(awsgoesfile, filepath)
+
+        emitted = []
+        outdir = os.path.join(self.tmpdir, 'bins')
+        with GlmAggregator(bin_minutes=1, variables=['flash_id'], workers=1, outdir=outdir,
+                           on_bin=lambda sat, start, arrays: emitted.append(arrays)) as agg:
+            for localfile in self.localfiles[:3] + [extra]:
+                agg.add(localfile)
+
+        self.assertEqual(len(emitted), 1)
+        self.assertEqual(len(emitted[0]['flash_id']), 6)
+        with Dataset(os.path.join(outdir, os.listdir(outdir)[0]), 'r') as ds:
+            self.assertEqual(len(ds.source_files.split()), 3)
+
+
+
+    def test_growable_array(self):
+        buffer = GrowableArray(np.float32, capacity=2)
+        for i in range(10):
+            buffer.extend(np.arange(i))
+        self.assertEqual(len(buffer), 45)
+        self.assertEqual(buffer.values[-3:].tolist(), [6., 7., 8.])
+        self.assertGreaterEqual(len(buffer._data), 45)
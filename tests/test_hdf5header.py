@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from hdf5header import HDF5Header, RangeReader
+from tests.s3stub import FakeS3Client, abi_key
+
+
+# Written by h5py with libver='earliest': superblock v0, v1 object headers &
+# old style groups (symbol table, local heap, v1 B-tree). 'CMI' is chunked,
+# shuffled & deflated, & has 'y' & 'x' as dimension scales
+V0_FIXTURE = os.path.join(os.path.dirname(__file__), 'data', 'hdf5_superblock_v0.nc')
+
+
+def write_goes_like(filepath, nattrs=30, nvars=12, size=(100, 120)):
+    rand = np.random.RandomState(0)
+
+    with Dataset(filepath, 'w') as ds:
+        ds.scene_id = 'Full Disk'
+        ds.timeline_id = 'ABI Mode 6'
+        ds.time_coverage_start = '2019-05-23T12:00:21.6Z'
+        for i in range(nattrs):
+            ds.setncattr('attr{}'.format(i), 'value{}'.format(i))
+        ds.setncattr_string('keywords', ['a', 'bc'])
+
+        ds.createDimension('y', size[0])
+        ds.createDimension('x', size[1])
+        ds.createDimension('band', 1)
+        y = ds.createVariable('y', 'i2', ('y',))
+        y[:] = np.arange(size[0])
+
+        for i in range(nvars):
+            var = ds.createVariable('v{}'.format(i), 'i2', ('y', 'x'), zlib=True, shuffle=True,
+                                    chunksizes=(25, 30), fill_value=-1)
+            var.scale_factor = np.float32(0.5)
+            var.add_offset = np.float32(100.)
+            var.valid_range = np.array([0, 4095], dtype='i2')
+            var.units = 'K'
+            var[:] = rand.randint(0, 4096, size=size)
+
+        dqf = ds.createVariable('DQF', 'u1', ('y', 'x'))
+        dqf.percent_good_pixel_qf = 99.5
+
+
+
+class TestHDF5Header(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def read_local(self, filepath, initial_size=4096):
+        f = open(filepath, 'rb')
+        self.addCleanup(f.close)
+
+        def fetch(start, end):
+            f.seek(start)
+            return f.read(end - start + 1)
+
+        reader = RangeReader(fetch, size=os.path.getsize(filepath), initial_size=initial_size)
+        return HDF5Header(reader), reader
+
+
+
+    def check_against_netcdf4(self, filepath):
+        header, _ = self.read_local(filepath)
+
+        with Dataset(filepath, 'r') as ds:
+            self.assertEqual(set(header.attrs), set(ds.ncattrs()))
+            for name in ds.ncattrs():
+                np.testing.assert_array_equal(header.attrs[name], ds.getncattr(name))
+
+            self.assertEqual(header.dimensions, {k: len(v) for k, v in ds.dimensions.items()})
+            self.assertEqual(set(header.variables), set(ds.variables))
+
+            for name, var in ds.variables.items():
+                hvar = header.variables[name]
+                self.assertEqual(hvar.shape, var.shape)
+                self.assertEqual(hvar.dtype, var.dtype)
+                self.assertEqual(hvar.chunks, None if var.chunking() == 'contiguous'
+                                 else tuple(var.chunking()))
+                for attr in var.ncattrs():
+                    np.testing.assert_array_equal(hvar.attrs[attr], var.getncattr(attr))
+
+        return header
+
+
+
+    def test_dense_storage(self):
+        filepath = os.path.join(self.tmpdir, 'dense.nc')
+        write_goes_like(filepath)
+        header = self.check_against_netcdf4(filepath)
+
+        self.assertEqual(header.attrs['keywords'], ['a', 'bc'])
+        self.assertEqual(header.variables['v0'].filters, [(2, (2,)), (1, (4,))])
+        self.assertNotIn('band', header.variables)
+
+
+
+    def test_compact_storage(self):
+        filepath = os.path.join(self.tmpdir, 'compact.nc')
+        write_goes_like(filepath, nattrs=0, nvars=1)
+        self.check_against_netcdf4(filepath)
+
+
+
+    def test_superblock_v0(self):
+        header, reader = self.read_local(V0_FIXTURE, initial_size=512)
+        self.assertEqual(reader.read(8, 1)[0], 0)
+
+        self.assertEqual(header.attrs, {'scene_id': 'Full Disk', 'spatial_resolution': 2.})
+        self.assertEqual(header.dimensions, {'y': 4, 'x': 6})
+        self.assertEqual(set(header.variables), set(['CMI', 'DQF', 'x', 'y']))
+
+        cmi = header.variables['CMI']
+        self.assertEqual(cmi.shape, (4, 6))
+        self.assertEqual(cmi.dtype, np.dtype('i2'))
+        self.assertEqual(cmi.chunks, (2, 3))
+        self.assertEqual(cmi.filters, [(2, (2,)), (1, (4,))])
+        self.assertEqual(cmi.fill_value, -1)
+        self.assertEqual(cmi.attrs['units'], 'K')
+        self.assertEqual(cmi.attrs['scale_factor'], np.float32(0.5))
+        np.testing.assert_array_equal(cmi.attrs['valid_range'], [0, 4095])
+
+        self.assertEqual(header.variables['DQF'].dtype, np.dtype('u1'))
+        self.assertIsNone(header.variables['DQF'].chunks)
+        self.assertEqual(header.variables['x'].shape, (6,))
+
+
+
+    def test_remote_header(self):
+        filepath = os.path.join(self.tmpdir, 'large.nc')
+        write_goes_like(filepath, nvars=2, size=(1000, 1200))
+        with open(filepath, 'rb') as f:
+            data = f.read()
+
+        key = abi_key(16, 'CMIP', 'F', '13', 143, 12, 0)
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = FakeS3Client({'noaa-goes16': [key]})
+        conn._s3client.objects[key] = data
+        awsgoesfile = AwsGoesFile(key, None, None, size=len(data))
+
+        header = awsgoesfile.read_header(conn, initial_size=16384)
+        self.assertEqual(header.attrs['scene_id'], 'Full Disk')
+        self.assertEqual(header.dimensions['x'], 1200)
+        self.assertEqual(header.variables['v1'].attrs['units'], 'K')
+
+        fetched = sum(end - start + 1 for _, start, end in conn._s3client.range_calls)
+        self.assertLess(fetched, len(data) // 4)
+        self.assertEqual(conn._s3client.downloads, [])
+
+        headers = conn.read_headers([awsgoesfile, awsgoesfile])
+        self.assertEqual([x.attrs['timeline_id'] for x in headers], ['ABI Mode 6'] * 2)
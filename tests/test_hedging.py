@@ -0,0 +1,178 @@
+import io
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+import hedging
+from hedging import HedgePolicy
+from tests.s3stub import FakeS3Client, abi_key
+
+
+class StallingS3Client(FakeS3Client):
+    """
+    The first request of each key or prefix stalls, later ones are served
+    right away
+    """
+    def __init__(self, buckets, stall):
+        super(StallingS3Client, self).__init__(buckets)
+        self.stall = stall
+        self._seen = set()
+        self._lock = threading.Lock()
+
+
+    def _first(self, name):
+        with self._lock:
+            first = name not in self._seen
+            self._seen.add(name)
+        return first
+
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter='/', **kwargs):
+        if (self._first(Prefix)):
+            time.sleep(self.stall)
+        return super(StallingS3Client, self).list_objects_v2(Bucket, Prefix, Delimiter, **kwargs)
+
+
+    def download_fileobj(self, bucket, key, fileobj, **kwargs):
+        if (self._first(key)):
+            # Half of the data is written before the stall
+            fileobj.write(self.objects[key][:5])
+            time.sleep(self.stall)
+        super(StallingS3Client, self).download_fileobj(bucket, key, fileobj, **kwargs)
+
+
+class TestHedging(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 15, 5)]
+        self.client = StallingS3Client({'noaa-goes16': self.keys}, stall=1.)
+        self.client.objects.update({key: key.encode()[-10:] for key in self.keys})
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def _conn(self, hedge):
+        conn = goesawsinterface.GoesAWSInterface(hedge=hedge)
+        conn._s3client = self.client
+        return conn
+
+
+
+    def test_download(self):
+        hedge = HedgePolicy(budget=1., default_threshold=0.05)
+        conn = self._conn(hedge)
+
+        start = time.time()
+        result = conn.download('goes16', [AwsGoesFile(key, key, i) for i, key in enumerate(self.keys)],
+                               self.tmpdir)
+        self.assertLess(time.time() - start, 0.9)
+
+        self.assertEqual(result.success_count, 3)
+        for localfile in result.iter_success():
+            with open(localfile.filepath, 'rb') as f:
+                self.assertEqual(f.read(), self.client.objects[localfile.key])
+
+        metrics = hedge.metrics['download']
+        self.assertEqual(metrics['requests'], 3)
+        self.assertEqual(metrics['hedged'], 3)
+        self.assertEqual(metrics['hedge_wins'], 3)
+
+
+
+    def test_listing(self):
+        hedge = HedgePolicy(budget=1., default_threshold=0.05)
+        conn = self._conn(hedge)
+        prefix = self.keys[0].rsplit('/', 1)[0] + '/'
+
+        start = time.time()
+        resp = conn._get_sat_bucket('goes16', prefix)
+        self.assertLess(time.time() - start, 0.9)
+        self.assertEqual(len(resp['Contents']), 3)
+        self.assertEqual(hedge.metrics['list']['hedge_wins'], 1)
+
+
+
+    def test_queued_requests(self):
+        # Requests waiting for one of the 2 threads aren't slow, they're queued
+        hedge = HedgePolicy(budget=1., default_threshold=0.3, max_workers=2)
+        client = FakeS3Client({'noaa-goes16': self.keys})
+        prefix = self.keys[0].rsplit('/', 1)[0] + '/'
+
+        def list_objects(**kwargs):
+            time.sleep(0.2)
+            return client.list_objects_v2(**kwargs)
+
+        callers = [threading.Thread(target=hedge.call,
+                                    args=('list', list_objects),
+                                    kwargs={'Bucket': 'noaa-goes16', 'Prefix': prefix})
+                   for _ in range(6)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+        self.assertEqual(hedge.metrics['list']['requests'], 6)
+        self.assertEqual(hedge.metrics['list']['hedged'], 0)
+        self.assertEqual(len(client.list_calls), 6)
+
+
+
+    def test_hedge_cancelled_before_start(self):
+        completed = []
+
+        class SlowClient(FakeS3Client):
+            def download_fileobj(self, bucket, key, fileobj, **kwargs):
+                time.sleep(0.2)
+                super(SlowClient, self).download_fileobj(bucket, key, fileobj, **kwargs)
+                completed.append(key)
+
+        client = SlowClient({'noaa-goes16': self.keys})
+        client.objects.update(self.client.objects)
+        hedge = HedgePolicy(budget=1., default_threshold=0.05)
+
+        # The hedge's temporary file is slow to create, the primary wins
+        # before the hedge starts
+        temporary_file = hedging.tempfile.TemporaryFile
+        def slow_temporary_file(*args, **kwargs):
+            time.sleep(0.3)
+            return temporary_file(*args, **kwargs)
+        hedging.tempfile.TemporaryFile = slow_temporary_file
+        self.addCleanup(setattr, hedging.tempfile, 'TemporaryFile', temporary_file)
+
+        fileobj = io.BytesIO()
+        hedge.download(client, 'noaa-goes16', self.keys[0], fileobj)
+        time.sleep(0.4)
+
+        self.assertEqual(fileobj.getvalue(), client.objects[self.keys[0]])
+        self.assertEqual(hedge.metrics['download']['hedge_wins'], 0)
+        # The losing hedge was cancelled at its first write
+        self.assertEqual(completed, [self.keys[0]])
+
+
+
+    def test_budget(self):
+        hedge = HedgePolicy(budget=0., default_threshold=0.05)
+        fileobj = io.BytesIO()
+        hedge.download(self.client, 'noaa-goes16', self.keys[0], fileobj)
+
+        self.assertEqual(fileobj.getvalue(), self.client.objects[self.keys[0]][:5] +
+                         self.client.objects[self.keys[0]])
+        self.assertEqual(hedge.metrics['download']['hedged'], 0)
+
+
+
+    def test_threshold(self):
+        hedge = HedgePolicy(percentile=50., min_samples=3)
+        self.assertIsNone(hedge.threshold('list'))
+        for seconds in [0.1, 0.2, 0.3, 10.]:
+            hedge.record('list', seconds)
+        self.assertAlmostEqual(hedge.threshold('list'), 0.25)
+        self.assertIsNone(hedge.threshold('download'))
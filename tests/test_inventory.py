@@ -0,0 +1,130 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import goesawsinterface
+from inventory import LocalInventory, key_from_filename
+from tests.s3stub import FakeS3Client, abi_key, glm_key
+
+
+class TestInventory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # 05-23-2019, 12:00 - 12:55 & 13:00 - 13:55, channels 13 & 14
+        self.keys = [abi_key(16, 'CMIP', 'C', chan, 143, hour, minute)
+                     for hour in [12, 13] for minute in range(0, 60, 5) for chan in ['13', '14']]
+        self.client = FakeS3Client({'noaa-goes16': self.keys + [glm_key(16, 143, 12, 0, 0)]})
+        self.inventory = LocalInventory(os.path.join(self.tmpdir, 'inventory.db'))
+        self.conn = goesawsinterface.GoesAWSInterface(inventory=self.inventory)
+        self.conn._s3client = self.client
+        self.outdir = os.path.join(self.tmpdir, 'data')
+
+
+
+    def tearDown(self):
+        self.inventory.close()
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def query(self, source, start='05-23-2019-12:10', end='05-23-2019-13:20'):
+        return source.get_avail_images_in_range('goes16', 'abi', start, end, product='CMIP',
+                                                sector='C', channel='13')
+
+
+
+    def test_key_from_filename(self):
+        for key in [self.keys[0], glm_key(16, 143, 12, 0, 20),
+                    abi_key(17, 'Rad', 'M1', '02', 200, 5, 30)]:
+            self.assertEqual(key_from_filename(os.path.basename(key)), key)
+
+        self.assertIsNone(key_from_filename('inventory.db'))
+        # Postprocess output
+        self.assertIsNone(key_from_filename(os.path.basename(self.keys[0])[:-3] + '.3f9a1c20.nc'))
+
+
+
+    def test_offline_query_matches_remote(self):
+        remote = self.query(self.conn)
+        self.conn.download('goes16', remote, self.outdir)
+        local = self.query(self.inventory)
+
+        self.assertEqual([x.key for x in local], [x.key for x in remote])
+        self.assertEqual([x.scan_time for x in local], [x.scan_time for x in remote])
+        for x in local:
+            self.assertTrue(os.path.exists(x.filepath))
+
+
+
+    def test_rebuild(self):
+        self.conn.download('goes16', self.query(self.conn), self.outdir, keep_aws_folders=True)
+        open(os.path.join(self.outdir, 'stray.part'), 'w').close()
+
+        inventory = LocalInventory(os.path.join(self.tmpdir, 'rebuilt.db'))
+        self.assertEqual(inventory.rebuild(self.outdir), len(self.inventory))
+        self.assertEqual([x.key for x in self.query(inventory)],
+                         [x.key for x in self.query(self.inventory)])
+        inventory.close()
+
+
+
+    def test_complete_hours_are_not_listed(self):
+        self.conn.download('goes16', self.query(self.conn, end='05-23-2019-13:55'), self.outdir)
+        self.client.list_calls = []
+
+        images = self.query(self.conn, start='05-23-2019-13:00', end='05-23-2019-13:55')
+        self.assertEqual(len(images), 12)
+        self.assertEqual(self.client.list_calls, [])
+
+        # Channel 14 was never downloaded
+        self.conn.get_avail_images_in_range('goes16', 'abi', '05-23-2019-13:00',
+                                            '05-23-2019-13:55', product='CMIP', sector='C',
+                                            channel='14')
+        self.assertEqual(len(self.client.list_calls), 1)
+
+        # A deleted file makes its hour incomplete again
+        os.remove(os.path.join(self.outdir, images[0].filename))
+        self.client.list_calls = []
+        self.query(self.conn, start='05-23-2019-13:00', end='05-23-2019-13:55')
+        self.assertEqual(len(self.client.list_calls), 1)
+
+
+
+    def test_plan_queries_use_inventory(self):
+        self.conn.download('goes16', self.query(self.conn, end='05-23-2019-13:55'), self.outdir)
+        self.client.list_calls = []
+
+        queries = [{'satellite': 'goes16', 'sensor': 'abi', 'product': 'CMIP', 'sector': 'C',
+                    'channel': '13', 'start': '05-23-2019-13:00', 'end': '05-23-2019-13:55'}]
+        images = self.conn.plan_queries(queries)
+        self.assertEqual(len(images), 12)
+        self.assertEqual(self.client.list_calls, [])
+
+        # Channel 14 was never downloaded, its hour is listed & recorded
+        queries.append(dict(queries[0], channel='14'))
+        images = self.conn.plan_queries(queries)
+        self.assertEqual(len(images), 24)
+        self.assertEqual(len(self.client.list_calls), 1)
+
+
+
+    def test_old_schema_is_migrated(self):
+        path = os.path.join(self.tmpdir, 'old.db')
+        db = sqlite3.connect(path)
+        db.execute('CREATE TABLE files (key TEXT PRIMARY KEY, satellite TEXT NOT NULL, '
+                   'product TEXT NOT NULL, sector TEXT, mode TEXT, channel TEXT, start TEXT, '
+                   'end TEXT, size INTEGER, filepath TEXT NOT NULL)')
+        db.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (self.keys[0], 'goes16', 'ABI-L2-CMIP', 'C', '6', '13', None, None, 100,
+                    '/data/file.nc'))
+        db.commit()
+        db.close()
+
+        inventory = LocalInventory(path)
+        self.assertEqual(len(inventory), 1)
+        images = inventory.get_avail_images('goes16', 'abi', '05-23-2019-12', product='CMIP',
+                                            sector='C', channel='13')
+        self.assertEqual([x.filepath for x in images], ['/data/file.nc'])
+        inventory.close()
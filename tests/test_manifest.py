@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import goesawsinterface
+import manifest
+from tests.s3stub import FakeS3Client, abi_key, glm_key
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        keys = []
+        for hour in [0, 1]:
+            for minute in range(1, 60, 5):
+                for channel in ['02', '13']:
+                    keys.append(abi_key(16, 'CMIP', 'C', channel, 244, hour, minute))
+        self.client = FakeS3Client({'noaa-goes16': keys})
+        self.conn = goesawsinterface.GoesAWSInterface()
+        self.conn._s3client = self.client
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def write(self, fname, text):
+        path = os.path.join(self.tmpdir, fname)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+
+
+    def test_read_csv(self):
+        path = self.write('q.csv', 'satellite,sensor,product,sector,channel,start,end\n'
+                                   'goes16 goes17,abi,CMIP,C,2,09-01-2019-00:00,09-01-2019-00:30\n'
+                                   'goes16,glm,,,,09-01-2019-00:00,09-01-2019-00:30\n')
+        queries = manifest.read_manifest(path)
+        self.assertEqual(queries[0]['satellite'], ['goes16', 'goes17'])
+        self.assertEqual(queries[0]['channel'], '02')
+        self.assertEqual(queries[1], {'satellite': ['goes16'], 'sensor': 'glm',
+                                      'start': '09-01-2019-00:00', 'end': '09-01-2019-00:30'})
+
+
+
+    def test_read_json_invalid_field(self):
+        path = self.write('q.json', json.dumps({'queries': [{'satellite': 'goes16',
+                                                             'start': '09-01-2019-00:00',
+                                                             'end': '09-01-2019-00:30',
+                                                             'band': 13}]}))
+        with self.assertRaises(ValueError):
+            manifest.read_manifest(path)
+
+
+
+    def test_plan_dedupes_prefixes_and_files(self):
+        queries = [{'satellite': ['goes16'], 'sensor': 'abi', 'product': 'CMIP', 'sector': 'C',
+                    'channel': '13', 'start': '09-01-2019-00:00', 'end': '09-01-2019-01:30'},
+                   {'satellite': ['goes16'], 'sensor': 'abi', 'product': 'CMIP', 'sector': 'C',
+                    'channel': '13', 'start': '09-01-2019-00:30', 'end': '09-01-2019-01:59'},
+                   {'satellite': ['goes16'], 'sensor': 'abi', 'product': 'CMIP', 'sector': 'C',
+                    'channel': '02', 'start': '09-01-2019-00:00', 'end': '09-01-2019-00:59'}]
+        images = self.conn.plan_queries(queries)
+
+        # Two hour prefixes are shared by all three queries
+        self.assertEqual(len(self.client.list_calls), 2)
+        self.assertEqual(len(images), 24 + 12)
+        self.assertEqual(len(set(x.key for x in images)), len(images))
+
+
+
+    def test_resolved_roundtrip(self):
+        queries = [{'satellite': ['goes16'], 'sensor': 'abi', 'product': 'CMIP', 'sector': 'C',
+                    'channel': '13', 'start': '09-01-2019-00:00', 'end': '09-01-2019-00:59'}]
+        images = self.conn.plan_queries(queries)
+        path = os.path.join(self.tmpdir, 'plan.json')
+        manifest.write_resolved_manifest(path, images)
+
+        resolved = manifest.read_resolved_manifest(path)
+        self.assertEqual([x.key for x in resolved], [x.key for x in images])
+        self.assertEqual(resolved[0].size, 100)
+        self.assertEqual(resolved[0].satellite, 'goes16')
+        self.assertEqual(resolved[0].start_time, images[0].start_time)
+
+        results = self.conn.download(None, resolved, self.tmpdir)
+        self.assertEqual(results.success_count, 12)
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+from awsgoesfile import AwsGoesFile
+from localgoesfile import LocalGoesFile
+from mcmipcube import DQF_MISSING, build_cube, open_cube
+from tests.s3stub import abi_key
+
+
+def write_mcmip(filepath, t, shape=(30, 40)):
+    with Dataset(filepath, 'w') as ds:
+        ds.time_coverage_start = '2019-05-23T12:{:02}:21.6Z'.format(t)
+        ds.createDimension('y', shape[0])
+        ds.createDimension('x', shape[1])
+        for band in range(1, 17):
+            cmi = ds.createVariable('CMI_C{:02}'.format(band), 'i2', ('y', 'x'), fill_value=-1)
+            cmi.scale_factor = np.float32(0.5)
+            cmi[:] = np.full(shape, 100 * t + band, dtype=np.float32)
+            cmi[0, 0] = np.ma.masked
+            dqf = ds.createVariable('DQF_C{:02}'.format(band), 'u1', ('y', 'x'))
+            dqf.percent_good_pixel_qf = 90. + band
+            dqf[:] = band % 4
+
+
+
+class TestMcmipCube(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.localfiles = []
+        for t in range(4):
+            key = abi_key(16, 'MCMIP', 'C', '', 143, 12, 5 * t)
+            filepath = os.path.join(self.tmpdir, os.path.basename(key))
+            if (t != 2):
+                write_mcmip(filepath, t)
+            else:
+                # Corrupt file
+                with open(filepath, 'wb') as f:
+                    f.write(b'not a netcdf')
+            self.localfiles.append(LocalGoesFile(AwsGoesFile(key, key, t), filepath))
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_build_cube(self):
+        path = os.path.join(self.tmpdir, 'cube.npy')
+        cube, sidecar = build_cube(self.localfiles, path, bands=[2, 13], dqf=True, workers=2)
+
+        self.assertEqual(cube.shape, (4, 2, 30, 40))
+        self.assertEqual(cube[3, 1, 5, 5], 313.)
+        self.assertEqual(cube[0, 0, 1, 1], 2.)
+        self.assertTrue(np.isnan(cube[1, :, 0, 0]).all())
+        self.assertTrue(np.isnan(cube[2]).all())
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'cube.tmp.npy')))
+
+        steps = sidecar['steps']
+        self.assertIsNone(steps[0]['error'])
+        self.assertIsNotNone(steps[2]['error'])
+        self.assertEqual(steps[1]['percent_good_pixel_qf'], [92., 103.])
+        self.assertEqual(steps[3]['time_coverage_start'], '2019-05-23T12:03:21.6Z')
+        self.assertEqual(steps[1]['filename'], self.localfiles[1].filename)
+
+        cube2, sidecar2, dqf = open_cube(path, dqf=True)
+        self.assertEqual(sidecar2, sidecar)
+        np.testing.assert_array_equal(cube2[3], cube[3])
+        self.assertEqual(dqf.dtype, np.uint8)
+        self.assertEqual(dqf[0, 1, 4, 4], 13 % 4)
+        self.assertTrue((dqf[2] == DQF_MISSING).all())
+
+        with self.assertRaises(ValueError):
+            build_cube(self.localfiles, os.path.join(self.tmpdir, 'cube.dat'))
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+from awsgoesfile import AwsGoesFile
+from localgoesfile import LocalGoesFile
+from metaindex import MetadataIndex
+from tests.s3stub import abi_key
+
+
+def write_nc(filepath, minute, good=99.5):
+    with Dataset(filepath, 'w') as ds:
+        ds.time_coverage_start = '2019-05-23T12:{:02}:21.6Z'.format(minute)
+        ds.time_coverage_end = '2019-05-23T12:{:02}:59.4Z'.format(minute + 2)
+        ds.scene_id = 'CONUS'
+        ds.timeline_id = 'ABI Mode 6'
+        ds.createDimension('y', 4)
+        dqf = ds.createVariable('DQF', 'u1', ('y',))
+        dqf.percent_good_pixel_qf = good
+        dqf.percent_no_value_pixel_qf = 100 - good
+
+
+
+class TestMetadataIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.datadir = os.path.join(self.tmpdir, 'data')
+        os.makedirs(os.path.join(self.datadir, '143'))
+        self.keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 30, 5)]
+        self.paths = []
+
+        for i, key in enumerate(self.keys):
+            filepath = os.path.join(self.datadir, '143', os.path.basename(key))
+            write_nc(filepath, 5 * i, good=90.0 + i)
+            self.paths.append(filepath)
+
+        open(os.path.join(self.datadir, 'partial.nc.part'), 'w').close()
+        self.index_path = os.path.join(self.tmpdir, 'metadata.npz')
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_update(self):
+        index = MetadataIndex(self.index_path)
+        self.assertEqual(index.update(self.datadir, workers=2), 6)
+        self.assertEqual(len(index), 6)
+
+        np.testing.assert_array_equal(index.columns['percent_good_pixel_qf'],
+                                      np.arange(90.0, 96.0))
+        self.assertTrue(np.isnan(index.columns['percent_out_of_range_pixel_qf']).all())
+        self.assertEqual(index.columns['time_coverage_start'][1],
+                         np.datetime64('2019-05-23T12:05:21.600'))
+        self.assertEqual(set(index.columns['scene_id']), {'CONUS'})
+
+
+
+    def test_incremental_update(self):
+        MetadataIndex(self.index_path).update(self.datadir, workers=2)
+
+        write_nc(self.paths[2], 10, good=50.0)
+        os.remove(self.paths[4])
+        os.utime(self.paths[0], (0, 0))
+
+        index = MetadataIndex(self.index_path)
+        self.assertEqual(index.update(self.datadir, workers=2), 2)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.lookup(self.paths[2])['percent_good_pixel_qf'], 50.0)
+        self.assertIsNone(index.lookup(self.paths[4]))
+
+        self.assertEqual(MetadataIndex(self.index_path).update(self.datadir, workers=2), 0)
+
+
+
+    def test_localgoesfile_metadata(self):
+        index = MetadataIndex(self.index_path)
+        index.update(self.datadir, workers=2)
+
+        localfile = LocalGoesFile(AwsGoesFile(self.keys[3], None, None), self.paths[3])
+        index.attach([localfile])
+        # Served from the index without opening the file
+        os.remove(self.paths[3])
+        self.assertEqual(localfile.scene_id, 'CONUS')
+        self.assertEqual(localfile.metadata['percent_good_pixel_qf'], 93.0)
+
+        # Files that aren't indexed have their header read
+        localfile = LocalGoesFile(AwsGoesFile(self.keys[1], None, None), self.paths[1])
+        self.assertEqual(localfile.time_coverage_end, np.datetime64('2019-05-23T12:07:59.400'))
+        self.assertEqual(localfile.timeline_id, 'ABI Mode 6')
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from filecache import FileCache
+from pipeline import Pipeline, ReadVariables
+from tests.ncstub import write_abi_like
+from tests.s3stub import FakeS3Client, abi_key
+
+
+def mean_cmi(localgoesfile, decoded):
+    return float(np.nanmean(decoded['CMI']))
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        filepath = os.path.join(self.tmpdir, 'full.nc')
+        write_abi_like(filepath)
+        with open(filepath, 'rb') as f:
+            self.data = f.read()
+        with Dataset(filepath, 'r') as ds:
+            self.mean = float(np.nanmean(ds.variables['CMI'][:]))
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def _conn(self, keys, objects):
+        client = FakeS3Client({'noaa-goes16': keys})
+        client.objects.update(objects)
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+        return conn, client
+
+
+
+    def test_run(self):
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 20, 5)]
+        # The last file isn't a netCDF file, so its decode fails
+        conn, client = self._conn(keys, {key: self.data for key in keys[:-1]})
+
+        pipeline = Pipeline(conn, decode=ReadVariables(['CMI']), transform=mean_cmi,
+                            fetch_threads=2, decode_workers=2, queue_size=2)
+        files = [AwsGoesFile(key, key, i) for i, key in enumerate(keys)]
+        results = list(pipeline.run('goes16', files, os.path.join(self.tmpdir, 'out')))
+
+        self.assertEqual(len(results), 3)
+        for localgoesfile, mean in results:
+            self.assertTrue(os.path.exists(localgoesfile.filepath))
+            self.assertAlmostEqual(mean, self.mean, places=4)
+
+        self.assertEqual(len(pipeline.failed), 1)
+        self.assertEqual(pipeline.failed[0][1], 'decode')
+        metrics = pipeline.metrics
+        self.assertEqual(metrics['fetch']['processed'], 4)
+        self.assertEqual(metrics['decode']['processed'], 3)
+        self.assertEqual(metrics['decode']['failed'], 1)
+        self.assertEqual(metrics['decode']['concurrency'], 2)
+        self.assertEqual(metrics['transform']['processed'], 3)
+
+
+
+    def test_backpressure(self):
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 60, 3)]
+        conn, client = self._conn(keys, {})
+        release = threading.Event()
+
+        def transform(localgoesfile, decoded):
+            release.wait()
+            return localgoesfile.filename
+
+        pipeline = Pipeline(conn, transform=transform, fetch_threads=2, queue_size=1)
+        files = [AwsGoesFile(key, key, i) for i, key in enumerate(keys)]
+        results = pipeline.run('goes16', files, os.path.join(self.tmpdir, 'out'))
+
+        collected = []
+        consumer = threading.Thread(target=collected.extend, args=(results,))
+        consumer.start()
+        time.sleep(0.5)
+        # 2 fetch threads + 1 queued + 1 decode thread + 1 queued + 1 transform
+        self.assertLessEqual(len(client.downloads), 6)
+
+        release.set()
+        consumer.join()
+        self.assertEqual(len(collected), len(keys))
+        self.assertEqual(len(client.downloads), len(keys))
+        self.assertGreater(pipeline.metrics['fetch']['blocked_time'], 0.)
+
+
+
+    def test_early_close(self):
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 60, 3)]
+        conn, client = self._conn(keys, {})
+
+        pipeline = Pipeline(conn, fetch_threads=2, queue_size=1)
+        files = [AwsGoesFile(key, key, i) for i, key in enumerate(keys)]
+        results = pipeline.run('goes16', files, os.path.join(self.tmpdir, 'out'))
+        next(results)
+        results.close()
+
+        self.assertLess(len(client.downloads), len(keys))
+
+
+
+    def test_cache(self):
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 20, 5)]
+        conn, client = self._conn(keys, {})
+        cache = FileCache(os.path.join(self.tmpdir, 'cache'), max_bytes=10 ** 8)
+        pinned = []
+
+        def transform(localgoesfile, decoded):
+            pinned.append(localgoesfile.key in cache._pins)
+            return localgoesfile.filepath
+
+        pipeline = Pipeline(conn, transform=transform, fetch_threads=2)
+        files = [AwsGoesFile(key, key, i) for i, key in enumerate(keys)]
+        # The cache directory is used when basepath is None
+        results = list(pipeline.run('goes16', files, None, cache=cache))
+
+        self.assertEqual(len(results), len(keys))
+        self.assertTrue(all(pinned))
+        for _, filepath in results:
+            self.assertTrue(filepath.startswith(cache.basepath))
+        self.assertEqual(len(cache._pins), 0)
+        # The index was saved, a new cache serves the files
+        reloaded = FileCache(cache.basepath, max_bytes=10 ** 8)
+        self.assertEqual(len(reloaded), len(keys))
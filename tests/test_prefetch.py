@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from filecache import FileCache
+from prefetch import Prefetcher
+from tests.s3stub import FakeS3Client, abi_key
+
+
+class SlowS3Client(FakeS3Client):
+    def __init__(self, buckets, delay):
+        super(SlowS3Client, self).__init__(buckets)
+        self.delay = delay
+
+
+    def download_fileobj(self, bucket, key, fileobj, **kwargs):
+        time.sleep(self.delay)
+        super(SlowS3Client, self).download_fileobj(bucket, key, fileobj, **kwargs)
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12 + x // 12, x % 12 * 5)
+                     for x in range(24)]
+        self.files = [AwsGoesFile(key, key, i) for i, key in enumerate(self.keys)]
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def _conn(self, delay):
+        self.client = SlowS3Client({'noaa-goes16': self.keys}, delay)
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = self.client
+        return conn
+
+
+
+    def test_sequential(self):
+        conn = self._conn(0.04)
+        cache = FileCache(os.path.join(self.tmpdir, 'cache'), max_bytes=10 ** 6)
+
+        with Prefetcher(conn, self.files, cache=cache, threads=4) as files:
+            seen = []
+            for localgoesfile in files:
+                seen.append(localgoesfile.key)
+                self.assertTrue(os.path.exists(localgoesfile.filepath))
+                time.sleep(0.02)
+            metrics = files.metrics
+
+        self.assertEqual(seen, self.keys)
+        self.assertGreaterEqual(metrics['ahead'], 3)
+        # Only the first files are waited for, until k has adapted
+        self.assertLessEqual(metrics['waits'], 4)
+        self.assertEqual(len(cache), len(self.keys))
+        self.assertFalse(cache._pins)
+
+
+
+    def test_seek(self):
+        conn = self._conn(0.02)
+        files = Prefetcher(conn, self.files, basepath=self.tmpdir, threads=1, min_ahead=4)
+        self.assertEqual(next(files).key, self.keys[0])
+
+        files.seek(20)
+        self.assertEqual(next(files).key, self.keys[20])
+        self.assertGreater(files.metrics['cancelled'], 0)
+        files.close()
+
+        downloaded = set(key for _, key in self.client.downloads)
+        self.assertIn(self.keys[20], downloaded)
+        self.assertLess(len(downloaded), len(self.keys))
+        self.assertRaises(StopIteration, next, files)
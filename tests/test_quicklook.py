@@ -0,0 +1,123 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+from netCDF4 import Dataset
+
+import goesawsinterface
+import quicklook
+from awsgoesfile import AwsGoesFile
+from quicklook import QuicklookService, read_downsampled, render_quicklook, write_png
+from tests.ncstub import write_abi_like
+from tests.s3stub import FakeS3Client, abi_key
+
+
+def read_png(path):
+    """
+    Reads an unfiltered 8-bit PNG written by write_png()
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:8] == quicklook.PNG_SIGNATURE
+
+    pos, idat = 8, b''
+    while (pos < len(data)):
+        length, = struct.unpack('>I', data[pos:pos + 4])
+        chunk_type = data[pos + 4:pos + 8]
+        body = data[pos + 8:pos + 8 + length]
+        crc, = struct.unpack('>I', data[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(chunk_type + body) & 0xffffffff
+        if (chunk_type == b'IHDR'):
+            width, height, _, color_type = struct.unpack('>IIBB', body[:10])
+        elif (chunk_type == b'IDAT'):
+            idat += body
+        pos += 12 + length
+
+    channels = 3 if color_type == 2 else 1
+    raw = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, -1)
+    assert (raw[:, 0] == 0).all()
+    return raw[:, 1:].reshape(height, width, channels)
+
+
+class TestQuicklook(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, 'full.nc')
+        write_abi_like(self.filepath)
+
+        with Dataset(self.filepath, 'r') as ds:
+            self.cmi = np.ma.filled(ds.variables['CMI'][:].astype(np.float32), np.nan)
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_read_downsampled(self):
+        with Dataset(self.filepath, 'r') as ds:
+            mean = read_downsampled(ds.variables['CMI'], 50, 'mean')
+            stride = read_downsampled(ds.variables['CMI'], 50, 'stride')
+
+        self.assertEqual(mean.shape, (30, 50))
+        self.assertEqual(mean.dtype, np.float32)
+        with np.errstate(invalid='ignore'):
+            expected = np.nanmean(self.cmi.reshape(30, 5, 50, 5), axis=(1, 3))
+        np.testing.assert_allclose(mean, expected, rtol=1e-5)
+        np.testing.assert_array_equal(stride, self.cmi[::5, ::5])
+
+
+
+    def test_write_png(self):
+        path = os.path.join(self.tmpdir, 'rgb.png')
+        image = np.random.randint(0, 256, (7, 11, 3)).astype(np.uint8)
+        write_png(path, image)
+        np.testing.assert_array_equal(read_png(path), image)
+
+        gray = image[:, :, 0]
+        write_png(path, gray)
+        np.testing.assert_array_equal(read_png(path)[:, :, 0], gray)
+
+
+
+    def test_render(self):
+        png_path = os.path.join(self.tmpdir, 'preview.png')
+        render_quicklook(self.filepath, png_path, max_size=50)
+
+        image = read_png(png_path)
+        self.assertEqual(image.shape, (30, 50, 3))
+        self.assertGreater(image.max(), 0)
+        self.assertIs(quicklook.colormap_lut(13), quicklook.colormap_lut(13))
+
+
+
+    def test_service(self):
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 15, 5)]
+        client = FakeS3Client({'noaa-goes16': keys})
+        client.objects.update({key: data for key in keys})
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+
+        outdir = os.path.join(self.tmpdir, 'png')
+        files = [AwsGoesFile(key, key, i) for i, key in enumerate(keys)]
+        with QuicklookService(outdir, max_size=50, workers=2) as service:
+            result = conn.download('goes16', files, os.path.join(self.tmpdir, 'out'),
+                                   callback=service.add)
+            localgoesfile = next(result.iter_success())
+            self.assertIs(service.add(localgoesfile), service.add(localgoesfile))
+
+        for key in keys:
+            png_path = service.get(key)
+            self.assertEqual(png_path, service.png_path(key))
+            self.assertEqual(read_png(png_path).shape, (30, 50, 3))
+
+        # Previews on disk are reused by a new service
+        with QuicklookService(outdir, max_size=50, workers=1) as service:
+            self.assertTrue(service.add(localgoesfile).done())
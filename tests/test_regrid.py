@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+import regrid
+
+from awsgoesfile import AwsGoesFile
+from fixedgrid import latlon_to_scan
+from localgoesfile import LocalGoesFile
+from regrid import LatLonGrid, Regridder
+from tests.ncstub import write_abi_like
+from tests.s3stub import abi_key
+
+
+TARGET = LatLonGrid(30., 40., -100., -85., 0.25)
+
+
+class TestRegrid(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, 'luts')
+        key = abi_key(16, 'CMIP', 'C', '13', 143, 12, 0)
+        filepath = os.path.join(self.tmpdir, os.path.basename(key))
+        write_abi_like(filepath)
+        self.localfile = LocalGoesFile(AwsGoesFile(key, key, 0), filepath)
+        self.geometry = self.localfile.geometry
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_nearest(self):
+        regridder = Regridder(self.cachedir, TARGET)
+        lat, lon = self.localfile.latlon()
+
+        # Regridding the source lat/lon lands each target pixel on the source
+        # pixel nearest to it
+        out_lat = regridder.regrid(lat, self.geometry)
+        out_lon = regridder.regrid(lon, self.geometry)
+        self.assertEqual(out_lat.shape, (40, 60))
+        np.testing.assert_allclose(out_lat, TARGET.lats[:, np.newaxis] + np.zeros((1, 60)), atol=0.15)
+        np.testing.assert_allclose(out_lon, TARGET.lons[np.newaxis, :] + np.zeros((40, 1)), atol=0.2)
+
+        # Integer data keeps its type with an integer fill
+        with Dataset(self.localfile.filepath, 'r') as ds:
+            ds.set_auto_maskandscale(False)
+            raw = ds.variables['CMI'][:]
+        self.assertEqual(regridder.regrid(raw, self.geometry, fill_value=-1).dtype, np.int16)
+
+
+
+    def test_bilinear_matches_linear_field(self):
+        regridder = Regridder(self.cachedir, TARGET, method='bilinear')
+        rows, cols = np.mgrid[:self.geometry.ny, :self.geometry.nx]
+        field = (3. * rows + 2. * cols).astype(np.float32)
+
+        out = regridder.regrid(field, self.geometry)
+        index, weights = regridder.get_lut(self.geometry)
+        self.assertEqual(index.shape, (4, 40 * 60))
+        np.testing.assert_allclose(weights.sum(axis=0), 1., rtol=1e-5)
+
+        # A linear field is reproduced exactly at the fractional source position
+        x, y = latlon_to_scan(self.geometry, TARGET.lats[:, np.newaxis], TARGET.lons[np.newaxis, :])
+        col = (x - self.geometry.x_offset) / self.geometry.x_scale
+        row = (y - self.geometry.y_offset) / self.geometry.y_scale
+        np.testing.assert_allclose(out, 3 * row + 2 * col, rtol=1e-4)
+
+
+
+    def test_lut_cached_and_fill(self):
+        # Only part of the target is on the source grid
+        target = LatLonGrid(45., 55., -100., -85., 0.5)
+        regridder = Regridder(self.cachedir, target)
+        out = self.localfile.regrid('CMI', regridder)
+        self.assertTrue(np.isnan(out[0]).all())
+        self.assertTrue(np.isfinite(out[-1]).all())
+        self.assertEqual(len(os.listdir(self.cachedir)), 2)
+
+        # A new regridder loads the tables from disk
+        regridder = Regridder(self.cachedir, target)
+        index, _ = regridder.get_lut(self.geometry)
+        self.assertIsInstance(index, np.memmap)
+        np.testing.assert_array_equal(self.localfile.regrid('CMI', regridder), out)
+
+        with self.assertRaises(ValueError):
+            Regridder(self.cachedir, target, method='cubic')
+
+
+
+    def test_variable_read_by_row_bands(self):
+        self.addCleanup(setattr, regrid, 'PIXELS_PER_BLOCK', regrid.PIXELS_PER_BLOCK)
+        regrid.PIXELS_PER_BLOCK = 300
+
+        for method in regrid.METHODS:
+            regridder = Regridder(self.cachedir, TARGET, method=method)
+            with Dataset(self.localfile.filepath, 'r') as ds:
+                expected = regridder.regrid(ds.variables['CMI'][:], self.geometry)
+
+                reads = []
+                var = ds.variables['CMI']
+
+                class RecordingVariable(object):
+                    shape = var.shape
+
+                    def __getitem__(self, rows):
+                        reads.append(rows.stop - rows.start)
+                        return var[rows]
+
+                out = regridder.regrid_variable(RecordingVariable(), self.geometry)
+
+            np.testing.assert_array_equal(out, expected)
+            np.testing.assert_array_equal(self.localfile.regrid('CMI', regridder), expected)
+            self.assertEqual(len(reads), 8)
+            self.assertLess(max(reads), self.geometry.ny)
@@ -0,0 +1,55 @@
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import goesawsinterface
+from tests.s3stub import FakeS3Client, glm_key
+
+
+class TestSatelliteRegistry(unittest.TestCase):
+    def setUp(self):
+        self.conn = goesawsinterface.GoesAWSInterface()
+        self.client = FakeS3Client({'noaa-goes16': [glm_key(16, 143, 12, 0, 0),
+                                                    glm_key(16, 143, 12, 0, 20)],
+                                    'noaa-goes18': [glm_key(18, 143, 12, 0, 0),
+                                                    glm_key(18, 143, 12, 0, 40)]})
+        self.conn._s3client = self.client
+        self.tmpdir = tempfile.mkdtemp()
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_invalid_satellite(self):
+        with self.assertRaises(ValueError):
+            self.conn.get_avail_images('g16', 'glm', '05-23-2019-12')
+
+
+
+    def test_register_satellite(self):
+        goesawsinterface.register_satellite('goes99', 'noaa-goes99')
+        self.assertEqual(self.conn._get_bucket_name('goes99'), 'noaa-goes99')
+        del goesawsinterface.SATELLITE_BUCKETS['goes99']
+
+
+
+    def test_multi_satellite_query(self):
+        images = self.conn.get_avail_images(['goes16', 'goes18'], 'glm', '05-23-2019-12')
+        self.assertEqual([x.satellite for x in images], ['goes16', 'goes18', 'goes16', 'goes18'])
+        self.assertEqual([x.start_time for x in images],
+                         [datetime(2019, 5, 23, 12, 0, 0)] * 2 + [datetime(2019, 5, 23, 12, 0, 20),
+                                                                  datetime(2019, 5, 23, 12, 0, 40)])
+
+
+
+    def test_multi_satellite_download(self):
+        images = self.conn.get_avail_images(['goes16', 'goes18'], 'glm', '05-23-2019-12')
+        results = self.conn.download(None, images, self.tmpdir)
+        self.assertEqual(results.success_count, 4)
+        self.assertEqual(sorted(x[0] for x in self.client.downloads),
+                         ['noaa-goes16', 'noaa-goes16', 'noaa-goes18', 'noaa-goes18'])
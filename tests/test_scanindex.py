@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+import unittest
+
+import numpy as np
+
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from scanindex import ScanIndex, merge_join
+
+
+def make_file(start, seconds=60, prefix='ABI-L1b-RadC/2019/143/12/'):
+    end = start + timedelta(seconds=seconds)
+    key = '{}OR_ABI-L1b-RadC-M6C13_G16_s{}{}_e{}{}_c{}{}.nc'.format(
+            prefix, start.strftime('%Y%j%H%M%S'), 0, end.strftime('%Y%j%H%M%S'), 0,
+            end.strftime('%Y%j%H%M%S'), 5)
+    return AwsGoesFile(key, 'RadC-M6C13 {}'.format(start), start.strftime('%m-%d-%Y-%H:%M'))
+
+
+class TestScanIndex(unittest.TestCase):
+    def setUp(self):
+        base = datetime(2019, 5, 23, 12, 1)
+        self.files = [make_file(base + timedelta(minutes=5 * x)) for x in range(12)]
+        self.index = ScanIndex(self.files)
+
+
+
+    def test_parse_fname_times(self):
+        f = self.files[0]
+        self.assertEqual(f.start_time, datetime(2019, 5, 23, 12, 1))
+        self.assertEqual(f.end_time, datetime(2019, 5, 23, 12, 2))
+
+
+
+    def test_dedupe_and_sort(self):
+        index = ScanIndex(self.files[::-1] + self.files[:3])
+        self.assertEqual(len(index), 12)
+        self.assertEqual(index.files, self.files)
+
+
+
+    def test_nearest(self):
+        times = [datetime(2019, 5, 23, 12, 3), datetime(2019, 5, 23, 12, 4),
+                 datetime(2019, 5, 23, 11, 0), '05-23-2019-12:56']
+        matches = self.index.lookup(times, how='nearest', max_delta=timedelta(minutes=10))
+        self.assertEqual(matches, [self.files[0], self.files[1], None, self.files[11]])
+
+
+
+    def test_previous(self):
+        times = [datetime(2019, 5, 23, 12, 0), datetime(2019, 5, 23, 12, 5, 59),
+                 datetime(2019, 5, 23, 12, 6)]
+        matches = self.index.lookup(times, how='previous')
+        self.assertEqual(matches, [None, self.files[0], self.files[1]])
+
+
+
+    def test_covering(self):
+        times = np.array(['2019-05-23T12:01:30', '2019-05-23T12:03:00'], dtype='datetime64[ms]')
+        matches = self.index.lookup(times, how='covering')
+        self.assertEqual(matches, [self.files[0], None])
+
+
+
+    def test_invalid_how(self):
+        with self.assertRaises(ValueError):
+            self.index.lookup([datetime(2019, 5, 23, 12, 0)], how='closest')
+
+
+
+class TestGetNearestImages(unittest.TestCase):
+    def setUp(self):
+        self.conn = goesawsinterface.GoesAWSInterface()
+        self.calls = []
+        base = datetime(2019, 5, 23, 11, 1)
+        self.files = [make_file(base + timedelta(minutes=5 * x)) for x in range(36)]
+
+        def fake_get_avail_images(satellite, sensor, date, product=None, sector=None,
+                                  channel=None):
+            self.calls.append(date)
+            return [f for f in self.files if f.start_time.replace(minute=0) == date]
+
+        self.conn.get_avail_images = fake_get_avail_images
+
+
+
+    def test_each_hour_listed_once(self):
+        times = [datetime(2019, 5, 23, 12, x) for x in range(60)] * 50
+        matches = self.conn.get_nearest_images('goes16', 'abi', times, product='RadC',
+                                               sector='C', channel='13')
+        self.assertEqual(len(matches), len(times))
+        self.assertEqual(sorted(self.calls), [datetime(2019, 5, 23, 11),
+                                              datetime(2019, 5, 23, 12),
+                                              datetime(2019, 5, 23, 13)])
+        self.assertEqual(matches[0], self.files[12])
+        self.assertEqual(matches[59], self.files[24])
+
+
+
+    def test_previous_reaches_prior_hour(self):
+        matches = self.conn.get_nearest_images('goes16', 'abi', [datetime(2019, 5, 23, 12, 0)],
+                                               product='RadC', sector='C', channel='13',
+                                               how='previous')
+        self.assertEqual(matches, [self.files[11]])
+
+
+
+class TestMergeJoin(unittest.TestCase):
+    def setUp(self):
+        base = datetime(2019, 5, 23, 12, 1)
+        self.abi = [make_file(base + timedelta(minutes=5 * x), seconds=60) for x in range(3)]
+        self.glm = [make_file(datetime(2019, 5, 23, 12, 0) + timedelta(seconds=20 * x),
+                              seconds=20, prefix='GLM-L2-LCFA/2019/143/12/')
+                    for x in range(45)]
+
+
+
+    def test_within(self):
+        pairs = merge_join(self.abi, self.glm)
+        self.assertEqual(len(pairs), 3)
+        for abi_file, glm_files in pairs:
+            self.assertEqual(len(glm_files), 3)
+            for glm_file in glm_files:
+                self.assertTrue(abi_file.start_time <= glm_file.start_time)
+                self.assertTrue(glm_file.end_time <= abi_file.end_time)
+
+
+
+    def test_overlap(self):
+        pairs = merge_join(self.abi, self.glm, how='overlap')
+        # Touching endpoints count as overlapping
+        self.assertEqual([len(x[1]) for x in pairs], [5, 5, 5])
+
+
+
+    def test_empty_right(self):
+        pairs = merge_join(self.abi, [])
+        self.assertEqual(pairs, [(x, []) for x in self.abi])
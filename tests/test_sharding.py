@@ -0,0 +1,77 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import goesawsinterface
+import sharding
+from awsgoesfile import AwsGoesFile
+from tests.s3stub import FakeS3Client, glm_key
+
+
+def make_files(count):
+    rand = random.Random(4)
+    files = []
+    for x in range(count):
+        key = glm_key(16, 143, 12, x // 3, 20 * (x % 3))
+        files.append(AwsGoesFile(key, key, '05-23-2019-12:00', size=rand.randint(100, 10000)))
+    return files
+
+
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = make_files(90)
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_parse_shard_spec(self):
+        self.assertEqual(sharding.parse_shard_spec('2/4'), (2, 4))
+        for spec in ['4/4', '-1/4', '1', 'a/b', '0/0']:
+            with self.assertRaises(ValueError):
+                sharding.parse_shard_spec(spec)
+
+
+
+    def test_partition_is_complete_disjoint_and_deterministic(self):
+        shards = sharding.partition_files(self.files, 4)
+        keys = [x.key for shard in shards for x in shard]
+        self.assertEqual(sorted(keys), sorted(x.key for x in self.files))
+
+        shuffled = list(self.files)
+        random.Random(1).shuffle(shuffled)
+        self.assertEqual([[x.key for x in s] for s in sharding.partition_files(shuffled, 4)],
+                         [[x.key for x in s] for s in shards])
+
+
+
+    def test_partition_is_size_balanced(self):
+        loads = [sum(x.size for x in shard) for shard in sharding.partition_files(self.files, 4)]
+        self.assertTrue(max(loads) - min(loads) <= max(x.size for x in self.files))
+
+
+
+    def test_download_and_merge(self):
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = FakeS3Client({'noaa-goes16': [x.key for x in self.files]})
+        journal_dir = os.path.join(self.tmpdir, 'journals')
+
+        for index in range(2):
+            sharding.download_shard(conn, self.files, (index, 3), self.tmpdir, journal_dir)
+
+        result = sharding.merge_shard_journals(self.files, journal_dir)
+        last_shard = sharding.partition_files(self.files, 3)[2]
+        self.assertEqual(sorted(x.key for x in result.failed), sorted(x.key for x in last_shard))
+        self.assertEqual(result.success_count, 90 - len(last_shard))
+
+        # A restarted shard skips the files already in its journal
+        conn._s3client.downloads = []
+        sharding.download_shard(conn, self.files, '0/3', self.tmpdir, journal_dir)
+        self.assertEqual(conn._s3client.downloads, [])
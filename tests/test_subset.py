@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+import fixedgrid
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from filecache import FileCache
+from subset import Subsetter, subset_file
+from tests.ncstub import write_abi_like
+from tests.s3stub import FakeS3Client, abi_key
+
+
+BBOX = (30., 40., -100., -85.)
+
+
+class TestSubset(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, 'full.nc')
+        write_abi_like(self.filepath)
+
+        with Dataset(self.filepath, 'r') as ds:
+            self.geometry = fixedgrid.read_geometry(ds)
+            ds.set_auto_maskandscale(False)
+            self.cmi = ds.variables['CMI'][:]
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_projection_roundtrip(self):
+        lat, lon = np.meshgrid(np.linspace(10, 50, 9), np.linspace(-120, -60, 9))
+        x, y = fixedgrid.latlon_to_scan(self.geometry, lat, lon)
+        lat2, lon2 = fixedgrid.scan_to_latlon(self.geometry, x, y)
+        np.testing.assert_allclose(lat2, lat, atol=1e-6)
+        np.testing.assert_allclose(lon2, lon, atol=1e-6)
+
+        # The far side of the Earth isn't visible
+        self.assertTrue(np.isnan(fixedgrid.latlon_to_scan(self.geometry, 0., 105.)[0]))
+
+
+
+    def test_window_covers_box(self):
+        rows, cols = fixedgrid.bbox_window(self.geometry, BBOX)
+        self.assertIs(fixedgrid.bbox_window(self.geometry, BBOX)[0], rows)
+
+        x = self.geometry.x_offset + self.geometry.x_scale * np.arange(self.geometry.nx)
+        y = self.geometry.y_offset + self.geometry.y_scale * np.arange(self.geometry.ny)
+        lat, lon = fixedgrid.scan_to_latlon(self.geometry, *np.meshgrid(x, y))
+        inside = (lat >= BBOX[0]) & (lat <= BBOX[1]) & (lon >= BBOX[2]) & (lon <= BBOX[3])
+        row_idx, col_idx = np.nonzero(inside)
+
+        # The window holds every pixel in the box, with at most one pixel of margin
+        self.assertTrue(0 <= row_idx.min() - rows.start <= 1)
+        self.assertTrue(0 <= rows.stop - 1 - row_idx.max() <= 1)
+        self.assertTrue(0 <= col_idx.min() - cols.start <= 1)
+        self.assertTrue(0 <= cols.stop - 1 - col_idx.max() <= 1)
+        self.assertLess((rows.stop - rows.start) * (cols.stop - cols.start), inside.size / 2)
+
+        with self.assertRaises(ValueError):
+            fixedgrid.bbox_window(self.geometry, (-50., -40., 100., 110.))
+
+
+
+    def test_subset_file(self):
+        dst_path = os.path.join(self.tmpdir, 'subset.nc')
+        self.assertTrue(subset_file(self.filepath, dst_path, BBOX))
+        rows, cols = fixedgrid.bbox_window(self.geometry, BBOX)
+
+        with Dataset(dst_path, 'r') as ds:
+            ds.set_auto_maskandscale(False)
+            np.testing.assert_array_equal(ds.variables['CMI'][:], self.cmi[rows, cols])
+            self.assertEqual(ds.variables['CMI'].filters()['zlib'], True)
+            self.assertEqual(ds.variables['CMI']._FillValue, -1)
+            self.assertEqual(ds.variables['band_id'][:].tolist(), [13])
+            self.assertEqual(ds.scene_id, 'CONUS')
+
+            # The subset is still on the fixed grid
+            geometry = fixedgrid.read_geometry(ds)
+        lat, lon = fixedgrid.scan_to_latlon(geometry, geometry.x_offset, geometry.y_offset)
+        ref = fixedgrid.scan_to_latlon(self.geometry,
+                                       self.geometry.x_offset + cols.start * self.geometry.x_scale,
+                                       self.geometry.y_offset + rows.start * self.geometry.y_scale)
+        np.testing.assert_allclose((lat, lon), ref, atol=1e-3)
+
+        # Already subset
+        self.assertFalse(subset_file(dst_path, os.path.join(self.tmpdir, 'again.nc'), BBOX))
+
+
+
+    def test_download_postprocess(self):
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 15, 5)]
+        client = FakeS3Client({'noaa-goes16': keys})
+        client.objects.update({key: data for key in keys})
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+
+        outdir = os.path.join(self.tmpdir, 'out')
+        seen = []
+        result = conn.download('goes16', [AwsGoesFile(key, key, i) for i, key in enumerate(keys)], outdir,
+                               keep_aws_folders=False, callback=seen.append,
+                               postprocess=Subsetter(BBOX), postprocess_workers=2)
+
+        self.assertEqual(result.success_count, 3)
+        self.assertEqual(len(seen), 3)
+        rows, cols = fixedgrid.bbox_window(self.geometry, BBOX)
+        for localfile in result.iter_success():
+            self.assertFalse(os.path.exists(localfile.filepath + '.subset'))
+            with Dataset(localfile.filepath, 'r') as ds:
+                ds.set_auto_maskandscale(False)
+                np.testing.assert_array_equal(ds.variables['CMI'][:], self.cmi[rows, cols])
+
+
+
+    def test_download_postprocess_cache(self):
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 10, 5)]
+        client = FakeS3Client({'noaa-goes16': keys})
+        client.objects.update({key: data for key in keys})
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+        cache = FileCache(os.path.join(self.tmpdir, 'cache'), max_bytes=10 ** 8)
+        files = [AwsGoesFile(key, key, i) for i, key in enumerate(keys)]
+
+        subset = conn.download('goes16', files, None, cache=cache, postprocess=Subsetter(BBOX),
+                               postprocess_workers=1)
+        plain = conn.download('goes16', files, None, cache=cache)
+        bbox = (32., 38., -95., -88.)
+        other = conn.download('goes16', files, None, cache=cache, postprocess=Subsetter(bbox),
+                              postprocess_workers=1)
+
+        # The cached downloads are never changed by the postprocess stage
+        self.assertEqual(len(client.downloads), 2)
+        for localfile in plain.iter_success():
+            self.assertEqual(cache.get(localfile.key), localfile.filepath)
+            with Dataset(localfile.filepath, 'r') as ds:
+                ds.set_auto_maskandscale(False)
+                np.testing.assert_array_equal(ds.variables['CMI'][:], self.cmi)
+
+        for result, box in [(subset, BBOX), (other, bbox)]:
+            rows, cols = fixedgrid.bbox_window(self.geometry, box)
+            for localfile in result.iter_success():
+                with Dataset(localfile.filepath, 'r') as ds:
+                    ds.set_auto_maskandscale(False)
+                    np.testing.assert_array_equal(ds.variables['CMI'][:], self.cmi[rows, cols])
+        self.assertNotEqual(subset.success[0].filepath, other.success[0].filepath)
+
+
+
+    def test_download_outside_box(self):
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        keys = [abi_key(16, 'CMIP', 'M1', '13', 143, 12, x) for x in range(0, 10, 5)]
+        client = FakeS3Client({'noaa-goes16': keys})
+        client.objects.update({key: data for key in keys})
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+        outdir = os.path.join(self.tmpdir, 'out')
+        files = [AwsGoesFile(key, key, i) for i, key in enumerate(keys)]
+
+        # The sector no longer covers the box
+        bbox = (10., 15., -60., -55.)
+        with self.assertRaises(ValueError):
+            Subsetter(bbox)(self.filepath, os.path.join(self.tmpdir, 'out.nc'))
+
+        result = conn.download('goes16', files, outdir, postprocess=Subsetter(bbox),
+                               postprocess_workers=1)
+        self.assertEqual(result.success_count, 0)
+        self.assertEqual(result.failed_count, 2)
+        # Nothing is left behind to be reused by a later run
+        self.assertEqual(sorted(os.listdir(outdir)),
+                         sorted(os.path.basename(x) for x in keys))
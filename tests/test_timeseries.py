@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+import goesawsinterface
+from awsgoesfile import AwsGoesFile
+from localgoesfile import LocalGoesFile
+from tests.ncstub import write_abi_like
+from tests.s3stub import FakeS3Client, abi_key
+from timeseries import PointSeries, point_indices
+
+
+# Two points in the grid, one off the grid & one off the Earth's disk
+LATS = [35., 32.5, 0., 10.]
+LONS = [-95., -90., -75., 120.]
+
+
+class TestPointSeries(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.localfiles = []
+        self.expected = []
+
+        for minute in range(3):
+            key = abi_key(16, 'CMIP', 'C', '13', 143, 12, 5 * minute)
+            filepath = os.path.join(self.tmpdir, os.path.basename(key))
+            write_abi_like(filepath)
+            with Dataset(filepath, 'a') as ds:
+                ds.variables['CMI'][:] = ds.variables['CMI'][:] + minute
+                self.expected.append(ds.variables['CMI'][:].astype(np.float32))
+            self.localfiles.append(LocalGoesFile(AwsGoesFile(key, key, minute), filepath))
+
+        self.points = PointSeries(LATS, LONS)
+        self.geometry = self.localfiles[0].geometry
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def check(self, times, values):
+        rows, cols, valid = self.points.indices(self.geometry)
+        self.assertEqual(valid.tolist(), [True, True, False, False])
+        self.assertEqual(values.shape, (3, 4))
+        self.assertEqual(times[1], np.datetime64('2019-05-23T12:05:00'))
+
+        for t in range(3):
+            np.testing.assert_allclose(values[t, :2], self.expected[t][rows[:2], cols[:2]],
+                                       rtol=1e-6)
+        self.assertTrue(np.isnan(values[:, 2:]).all())
+
+
+
+    def test_indices(self):
+        rows, cols, valid = point_indices(self.geometry, np.array(LATS), np.array(LONS))
+        lat, lon = self.localfiles[0].latlon()
+        np.testing.assert_allclose(lat[rows[:2], cols[:2]], LATS[:2], atol=0.2)
+        np.testing.assert_allclose(lon[rows[:2], cols[:2]], LONS[:2], atol=0.2)
+        self.assertIs(self.points.indices(self.geometry), self.points.indices(self.geometry))
+
+
+
+    def test_extract_local(self):
+        self.check(*self.points.extract(self.localfiles, 'CMI', workers=2))
+
+
+
+    def test_extract_remote(self):
+        client = FakeS3Client({'noaa-goes16': [x.key for x in self.localfiles]})
+        for localfile in self.localfiles:
+            with open(localfile.filepath, 'rb') as f:
+                client.objects[localfile.key] = f.read()
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+        awsgoesfiles = [AwsGoesFile(x.key, x.key, x.scan_time, size=len(client.objects[x.key]))
+                        for x in self.localfiles]
+        cachedir = os.path.join(self.tmpdir, 'refs')
+
+        self.check(*self.points.extract_remote(conn, awsgoesfiles, 'CMI', cachedir=cachedir))
+
+        # With the indexes cached, each file costs the x & y reads plus one
+        # GET per chunk holding a point
+        client.range_calls = []
+        self.points.extract_remote(conn, awsgoesfiles, 'CMI', cachedir=cachedir)
+        keys = [x[0] for x in client.range_calls]
+        self.assertEqual(keys.count(awsgoesfiles[0].key), 4)
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+import goesawsinterface
+import transcode
+from awsgoesfile import AwsGoesFile
+from filecache import FileCache, path_size as filecache_size
+from tests.ncstub import write_abi_like
+from tests.s3stub import FakeS3Client, abi_key
+from transcode import Transcoder
+
+
+class TestTranscode(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, 'full.nc')
+        write_abi_like(self.filepath)
+
+        with Dataset(self.filepath, 'r') as ds:
+            ds.set_auto_maskandscale(False)
+            self.cmi = ds.variables['CMI'][:]
+
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+
+    def test_netcdf(self):
+        transcoder = Transcoder(chunks={'y': 32, 'x': 1000}, complevel=6)
+        self.assertEqual(transcoder(self.filepath), self.filepath)
+
+        with Dataset(self.filepath, 'r') as ds:
+            cmi = ds.variables['CMI']
+            self.assertEqual(cmi.chunking(), [32, 250])
+            self.assertEqual(cmi.filters()['complevel'], 6)
+            self.assertTrue(cmi.filters()['shuffle'])
+            self.assertEqual(cmi._FillValue, -1)
+            cmi.set_auto_maskandscale(False)
+            np.testing.assert_array_equal(cmi[:], self.cmi)
+            self.assertEqual(ds.scene_id, 'CONUS')
+            self.assertEqual(ds.transcode_settings, transcoder.settings)
+
+        # Already transcoded with these settings
+        mtime = os.stat(self.filepath).st_mtime_ns
+        transcoder(self.filepath)
+        self.assertEqual(os.stat(self.filepath).st_mtime_ns, mtime)
+
+        with self.assertRaises(ValueError):
+            Transcoder(format='hdf4')
+
+
+
+    def test_download_postprocess(self):
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 10, 5)]
+        client = FakeS3Client({'noaa-goes16': keys})
+        client.objects.update({key: data for key in keys})
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+
+        result = conn.download('goes16', [AwsGoesFile(key, key, i) for i, key in enumerate(keys)],
+                               os.path.join(self.tmpdir, 'out'), keep_aws_folders=False,
+                               postprocess=Transcoder(chunks={'y': 16, 'x': 16}, variables=['CMI']),
+                               postprocess_workers=2)
+
+        self.assertEqual(result.success_count, 2)
+        for localfile in result.iter_success():
+            with Dataset(localfile.filepath, 'r') as ds:
+                self.assertEqual(list(ds.variables), ['CMI'])
+                self.assertEqual(ds.variables['CMI'].chunking(), [16, 16])
+
+
+
+    @unittest.skipIf(transcode.zarr is None, 'zarr is not installed')
+    def test_zarr(self):
+        import zarr
+
+        store = os.path.join(self.tmpdir, 'series.zarr')
+        transcoder = Transcoder(format='zarr', chunks={'y': 64, 'x': 64}, zarr_store=store)
+        for i in range(2):
+            filepath = os.path.join(self.tmpdir, '{}.nc'.format(i))
+            shutil.copy(self.filepath, filepath)
+            zarr_path = transcoder(filepath)
+            self.assertFalse(os.path.exists(filepath))
+
+        group = zarr.open_group(zarr_path, mode='r')
+        np.testing.assert_array_equal(group['CMI'][:], self.cmi)
+        self.assertEqual(group['CMI'].chunks, (64, 64))
+        self.assertEqual(group['CMI'].attrs['_ARRAY_DIMENSIONS'], ['y', 'x'])
+
+        series = zarr.open_group(store, mode='r')
+        self.assertEqual(series['CMI'].shape, (2,) + self.cmi.shape)
+        self.assertEqual(series['time'].shape, (2,))
+        np.testing.assert_array_equal(series['CMI'][1], self.cmi)
+
+
+
+    @unittest.skipIf(transcode.zarr is None, 'zarr<3 is not installed')
+    def test_zarr_download(self):
+        import zarr
+
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        keys = [abi_key(16, 'CMIP', 'C', '13', 143, 12, x) for x in range(0, 10, 5)]
+        client = FakeS3Client({'noaa-goes16': keys})
+        client.objects.update({key: data for key in keys})
+        conn = goesawsinterface.GoesAWSInterface()
+        conn._s3client = client
+        cache = FileCache(os.path.join(self.tmpdir, 'cache'), max_bytes=10 ** 8)
+
+        files = [AwsGoesFile(key, key, i) for i, key in enumerate(keys)]
+        result = conn.download('goes16', files, None, cache=cache,
+                               postprocess=Transcoder(format='zarr', chunks={'y': 64, 'x': 64}),
+                               postprocess_workers=1)
+
+        self.assertEqual(result.success_count, 2)
+        for localfile in result.iter_success():
+            self.assertTrue(localfile.filepath.endswith('.zarr'))
+            self.assertTrue(os.path.isdir(localfile.filepath))
+            np.testing.assert_array_equal(zarr.open_group(localfile.filepath, mode='r')['CMI'][:],
+                                          self.cmi)
+            # The download is kept & still cached
+            self.assertTrue(os.path.exists(cache.get(localfile.key)))
+
+        # Directory outputs are sized & evicted whole
+        self.assertEqual(cache.total_bytes, len(data) * 2 + sum(
+            filecache_size(x.filepath) for x in result.iter_success()))
+        cache.max_bytes = 0
+        cache.evict()
+        for localfile in result.iter_success():
+            self.assertFalse(os.path.exists(localfile.filepath))